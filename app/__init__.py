@@ -30,9 +30,18 @@ def create_app():
         format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
     )
     
+    # JSON响应使用紧凑格式，不排序键，中文不转义
+    app.json.compact = True
+    app.json.sort_keys = False
+    app.json.ensure_ascii = False
+    
     # 启用CORS
     CORS(app)
     
+    # 启用响应压缩（br/gzip）
+    from app.compression import init_compression
+    init_compression(app, min_size=int(os.environ.get('COMPRESSION_MIN_SIZE', 1024)))
+    
     # 注册蓝图
     from app.controllers.main import main_bp
     from app.controllers.api import api_bp
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+HTTP响应压缩，根据Accept-Encoding对较大的文本响应进行br或gzip压缩
+"""
+
+import gzip
+import logging
+
+from flask import request
+
+# 获取日志记录器
+logger = logging.getLogger(__name__)
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# 需要压缩的响应类型
+COMPRESSIBLE_MIMETYPES = (
+    "application/json",
+    "application/javascript",
+    "text/html",
+    "text/css",
+    "text/plain",
+    "text/csv",
+)
+
+
+def _accepted_encodings():
+    """解析请求的Accept-Encoding，返回客户端接受的编码集合"""
+    header = request.headers.get("Accept-Encoding", "")
+    encodings = set()
+    for item in header.split(","):
+        parts = item.strip().split(";")
+        name = parts[0].strip().lower()
+        if any(p.strip() in ("q=0", "q=0.0") for p in parts[1:]):
+            continue
+        if name:
+            encodings.add(name)
+    return encodings
+
+
+def init_compression(app, min_size=1024, gzip_level=6, brotli_quality=4):
+    """
+    为Flask应用注册响应压缩
+
+    优先使用brotli（需安装brotli包），否则使用gzip；流式响应、已编码响应和小于min_size的响应不压缩。
+
+    Args:
+        app (Flask): Flask应用
+        min_size (int): 压缩的最小响应字节数
+        gzip_level (int): gzip压缩级别
+        brotli_quality (int): brotli压缩质量
+    """
+
+    @app.after_request
+    def compress_response(response):
+        if (
+            response.direct_passthrough
+            or response.is_streamed
+            or response.status_code < 200
+            or response.status_code in (204, 206, 304)
+            or "Content-Encoding" in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES
+        ):
+            return response
+
+        data = response.get_data()
+        if len(data) < min_size:
+            return response
+
+        encodings = _accepted_encodings()
+        if brotli is not None and "br" in encodings:
+            compressed = brotli.compress(data, quality=brotli_quality)
+            encoding = "br"
+        elif "gzip" in encodings:
+            compressed = gzip.compress(data, compresslevel=gzip_level)
+            encoding = "gzip"
+        else:
+            return response
+
+        response.set_data(compressed)
+        response.headers["Content-Encoding"] = encoding
+        response.headers["Content-Length"] = str(len(compressed))
+        response.vary.add("Accept-Encoding")
+        return response
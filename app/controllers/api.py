@@ -5,10 +5,18 @@
 API控制器，提供REST API接口
 """
 
+import os
+import hmac
 import json
 import logging
-from flask import Blueprint, request, jsonify
-from app.services.query_service import QueryService
+import threading
+from contextlib import nullcontext
+from flask import Blueprint, Response, request, jsonify, stream_with_context
+from werkzeug.local import LocalProxy
+from app.services.row_encoding import ROW_FORMATS, normalize_row_format
+from app.mcp.servers.approximate import APPROX_METHODS
+from app.services.admission import PRIORITIES, AdmissionController, AdmissionRejected
+from app.services.profiling import PROFILE_MODES, MAX_SAMPLE_DURATION, ProfileStore, ProfilerBusy, RequestProfile
 
 # 创建蓝图
 api_bp = Blueprint('api', __name__)
@@ -16,8 +24,112 @@ api_bp = Blueprint('api', __name__)
 # 获取日志记录器
 logger = logging.getLogger(__name__)
 
-# 创建查询服务实例
-query_service = QueryService()
+# 查询服务实例（每个进程一个），首次使用时创建
+_query_service = None
+_query_service_pid = None
+_query_service_lock = threading.Lock()
+
+
+def get_query_service():
+    """
+    获取当前进程的查询服务实例，必要时创建
+
+    查询服务持有LLM客户端、数据库连接池与线程池，不能在进程间共享：
+    gunicorn预加载应用后fork出的工作进程会在首次使用时重新创建自己的实例。
+
+    Returns:
+        QueryService: 查询服务实例
+    """
+    global _query_service, _query_service_pid
+    with _query_service_lock:
+        if _query_service is None or _query_service_pid != os.getpid():
+            from app.services.query_service import QueryService
+            _query_service = QueryService()
+            _query_service_pid = os.getpid()
+        return _query_service
+
+
+query_service = LocalProxy(get_query_service)
+
+# 准入控制：限制同时执行的查询数，交互式请求优先于导出与批量请求
+admission = AdmissionController.from_env()
+
+# 性能分析结果（仅管理员可用）
+profiles = ProfileStore.from_env()
+
+# 分页查询每页最大行数
+MAX_PAGE_SIZE = 5000
+
+# 批量查询的最大问题数与最大并发数
+MAX_BATCH_QUESTIONS = 500
+MAX_BATCH_PARALLEL = 16
+
+
+def _admission_rejected(error):
+    """排队已满或超时时返回429，并通过Retry-After提示重试等待秒数"""
+    response = jsonify({
+        "status": "error",
+        "message": str(error),
+        "retry_after": error.retry_after
+    })
+    response.headers["Retry-After"] = str(error.retry_after)
+    return response, 429
+
+
+def _require_admin():
+    """
+    校验请求头X-Admin-Token中的管理员令牌
+
+    Returns:
+        tuple: 未通过时返回 (错误响应, 403)，通过时返回None
+    """
+    token = os.environ.get('ADMIN_TOKEN')
+    if not token:
+        return jsonify({
+            "status": "error",
+            "message": "未配置ADMIN_TOKEN，管理接口不可用"
+        }), 403
+    if not hmac.compare_digest(request.headers.get('X-Admin-Token', '').encode(), token.encode()):
+        return jsonify({
+            "status": "error",
+            "message": "管理员令牌无效"
+        }), 403
+    return None
+
+
+def _profile_mode(value):
+    """
+    解析请求中的profile参数
+
+    Args:
+        value: true（等同cprofile）、cprofile或sampling，为空时不分析
+
+    Returns:
+        str: 分析方式，不分析时返回None
+
+    Raises:
+        ValueError: 不支持的分析方式
+    """
+    if value in (None, False, ''):
+        return None
+    if value is True:
+        return "cprofile"
+    if value in PROFILE_MODES:
+        return value
+    raise ValueError(f"不支持的profile，可选: {', '.join(PROFILE_MODES)}")
+
+
+def _profiled(mode):
+    """按请求的分析方式返回上下文管理器，不分析时返回空的上下文"""
+    return RequestProfile(mode, label=request.path) if mode else nullcontext()
+
+
+def _profiled_response(response, profile):
+    """保存请求的分析结果，并通过响应头X-Profile-Id返回结果ID"""
+    if profile is not None:
+        response.headers["X-Profile-Id"] = profiles.save_request(profile)
+    return response
+
 
 @api_bp.route('/connect', methods=['POST'])
 def connect_database():
@@ -31,8 +143,16 @@ def connect_database():
         "user": "root",
         "password": "password",
         "database": "my_database",
-        "port": 3306
+        "port": 3306,
+        "schema_format": "compact",
+        "wait": false,
+        "replicas": [{"host": "replica1", "port": 3306}]
     }
+    
+    schema_format可选，支持verbose（默认）、compact、minimal；
+    replicas可选，只读副本列表，user、password、port默认与主库相同；
+    连接验证成功后立即返回，元数据在后台预热，进度通过 /api/connection/status 查询；
+    wait为true时等待预热完成并返回metadata与sample_data
     """
     try:
         # 获取请求数据
@@ -67,8 +187,22 @@ def connect_database():
                 "message": "缺少必要参数: host, user, database"
             }), 400
         
+        replicas = data.get('replicas')
+        if replicas:
+            if not isinstance(replicas, list) or not all(isinstance(r, dict) and r.get('host') for r in replicas):
+                return jsonify({
+                    "status": "error",
+                    "message": "replicas必须是包含host的对象列表"
+                }), 400
+            connection_params['replicas'] = replicas
+        
         # 连接数据库
-        result = query_service.connect_database(db_type, **connection_params)
+        result = query_service.connect_database(
+            db_type,
+            schema_format=data.get('schema_format'),
+            wait=bool(data.get('wait')),
+            **connection_params
+        )
         
         # 根据结果返回响应
         if result.get('status') == 'success':
@@ -83,6 +217,41 @@ def connect_database():
             "message": f"处理请求时出错: {str(e)}"
         }), 500
 
+@api_bp.route('/connection/status', methods=['GET'])
+def connection_status():
+    """
+    连接预热进度API
+    
+    查询参数:
+        connection_id: 数据库连接ID
+        include_metadata: 为1时在元数据就绪后返回metadata
+    """
+    try:
+        connection_id = request.args.get('connection_id')
+        
+        if not connection_id:
+            return jsonify({
+                "status": "error",
+                "message": "缺少必要参数: connection_id"
+            }), 400
+        
+        result = query_service.get_connection_status(
+            connection_id,
+            include_metadata=request.args.get('include_metadata') in ('1', 'true')
+        )
+        
+        if result.get('status') == 'success':
+            return jsonify(result), 200
+        else:
+            return jsonify(result), 404
+            
+    except Exception as e:
+        logger.error(f"获取连接状态API错误: {str(e)}")
+        return jsonify({
+            "status": "error",
+            "message": f"处理请求时出错: {str(e)}"
+        }), 500
+
 @api_bp.route('/query', methods=['POST'])
 def process_query():
     """
@@ -92,11 +261,17 @@ def process_query():
     {
         "connection_id": "mysql_localhost_my_database",
         "query": "查询所有用户",
+        "session_id": "可选，会话ID，用于缓存压缩后的对话历史",
+        "row_format": "可选，objects（默认）、arrays或columns",
+        "profile": "可选，cprofile或sampling，需要管理员令牌",
+        "approximate": "可选，为true时生成的聚合查询在抽样子集上近似执行",
         "conversation_history": [
             {"role": "user", "content": "..."},
-            {"role": "assistant", "content": "..."}
+            {"role": "assistant", "content": "...", "sql": "可选，该轮生成的SQL"}
         ]
     }
+    
+    指定profile时分析查询处理与响应序列化的耗时，结果ID通过响应头X-Profile-Id返回
     """
     try:
         # 获取请求数据
@@ -112,6 +287,20 @@ def process_query():
         connection_id = data.get('connection_id')
         query = data.get('query')
         conversation_history = data.get('conversation_history')
+        session_id = data.get('session_id')
+        row_format = normalize_row_format(data.get('row_format'))
+        
+        try:
+            profile_mode = _profile_mode(data.get('profile'))
+        except ValueError as e:
+            return jsonify({
+                "status": "error",
+                "message": str(e)
+            }), 400
+        if profile_mode:
+            denied = _require_admin()
+            if denied:
+                return denied
         
         # 验证必要参数
         if not connection_id:
@@ -126,19 +315,38 @@ def process_query():
                 "message": "缺少必要参数: query"
             }), 400
         
+        if not row_format:
+            return jsonify({
+                "status": "error",
+                "message": f"不支持的row_format，可选: {', '.join(ROW_FORMATS)}"
+            }), 400
+        
         # 处理查询
-        result = query_service.process_query(
-            connection_id=connection_id,
-            query=query,
-            conversation_history=conversation_history
-        )
+        with admission.admit(connection_id, "interactive"):
+            with _profiled(profile_mode) as profile:
+                result = query_service.process_query(
+                    connection_id=connection_id,
+                    query=query,
+                    conversation_history=conversation_history,
+                    session_id=session_id,
+                    row_format=row_format,
+                    approximate=bool(data.get('approximate'))
+                )
+                response = jsonify(result)
         
         # 根据结果返回响应
         if result.get('status') == 'success':
-            return jsonify(result), 200
+            return _profiled_response(response, profile), 200
         else:
-            return jsonify(result), 500
+            return _profiled_response(response, profile), 500
             
+    except AdmissionRejected as e:
+        return _admission_rejected(e)
+    except ProfilerBusy as e:
+        return jsonify({
+            "status": "error",
+            "message": str(e)
+        }), 409
     except Exception as e:
         logger.error(f"处理查询API错误: {str(e)}")
         return jsonify({
@@ -146,6 +354,93 @@ def process_query():
             "message": f"处理请求时出错: {str(e)}"
         }), 500
 
+@api_bp.route('/query/batch', methods=['POST'])
+def process_query_batch():
+    """
+    批量自然语言查询API，结果以NDJSON（每行一个JSON）按完成顺序流式返回
+    
+    请求体格式:
+    {
+        "connection_id": "mysql_localhost_my_database",
+        "questions": ["查询所有用户", {"id": "q2", "query": "统计订单数量"}],
+        "max_parallel": 4,
+        "row_format": "可选，objects（默认）、arrays或columns"
+    }
+    
+    每行结果包含index（问题序号）与id，最后一行为汇总 {"done": true, ...}；
+    各问题按批量优先级排队执行，批量队列已满时返回429
+    """
+    try:
+        data = request.json
+        
+        if not data:
+            return jsonify({
+                "status": "error",
+                "message": "缺少请求数据"
+            }), 400
+        
+        connection_id = data.get('connection_id')
+        questions = data.get('questions')
+        row_format = normalize_row_format(data.get('row_format'))
+        
+        if not connection_id:
+            return jsonify({
+                "status": "error",
+                "message": "缺少必要参数: connection_id"
+            }), 400
+        
+        if not isinstance(questions, list) or not questions:
+            return jsonify({
+                "status": "error",
+                "message": "questions必须是非空列表"
+            }), 400
+        
+        if len(questions) > MAX_BATCH_QUESTIONS:
+            return jsonify({
+                "status": "error",
+                "message": f"每批最多{MAX_BATCH_QUESTIONS}个问题"
+            }), 400
+        
+        if not row_format:
+            return jsonify({
+                "status": "error",
+                "message": f"不支持的row_format，可选: {', '.join(ROW_FORMATS)}"
+            }), 400
+        
+        try:
+            max_parallel = int(data.get('max_parallel') or 4)
+        except (TypeError, ValueError):
+            max_parallel = 0
+        if max_parallel < 1 or max_parallel > MAX_BATCH_PARALLEL:
+            return jsonify({
+                "status": "error",
+                "message": f"max_parallel必须在1到{MAX_BATCH_PARALLEL}之间"
+            }), 400
+        
+        admission.check("bulk")
+        result = query_service.process_query_batch(
+            connection_id, questions, row_format, max_parallel,
+            admit=lambda: admission.admit(connection_id, "bulk", reject=False)
+        )
+        
+        if result.get('status') != 'success':
+            return jsonify(result), 500
+        
+        def generate():
+            for item in result['stream']:
+                yield json.dumps(item, ensure_ascii=False, separators=(",", ":"), default=str) + "\n"
+        
+        return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+            
+    except AdmissionRejected as e:
+        return _admission_rejected(e)
+    except Exception as e:
+        logger.error(f"批量查询API错误: {str(e)}")
+        return jsonify({
+            "status": "error",
+            "message": f"处理请求时出错: {str(e)}"
+        }), 500
+
 @api_bp.route('/execute', methods=['POST'])
 def execute_sql():
     """
@@ -154,8 +449,25 @@ def execute_sql():
     请求体格式:
     {
         "connection_id": "mysql_localhost_my_database",
-        "sql": "SELECT * FROM users LIMIT 10"
+        "sql": "SELECT * FROM users LIMIT 10",
+        "page_size": 100,
+        "page_token": "上一页返回的next_page_token",
+        "row_format": "objects",
+        "priority": "interactive",
+        "profile": "cprofile",
+        "keep_result": false,
+        "approximate": false
     }
+    
+    page_size与page_token可选，提供时分页返回结果，results.next_page_token为空表示没有下一页；
+    keep_result可选（不能与分页参数同时使用），为true时保存完整结果，results.result_buffer.result_id
+    可用于 GET /api/result/<result_id> 翻页读取；
+    approximate可选（不能与分页参数、keep_result同时使用），为true或抽样方式（auto/range/modulo/sample_table）时
+    在抽样子集上近似执行单表聚合查询，results.approximation包含抽样比例与各行误差；
+    SQL已通过 /api/dashboard/register 注册且未使用上述参数时，只读取水位之后的新行并返回合并后的结果（results.dashboard）；
+    row_format可选，objects（默认，每行一个对象）、arrays（每行一个数组）或columns（按列数组）；
+    priority可选，interactive（默认）或bulk，后台任务应使用bulk以免影响交互式查询；
+    profile可选，cprofile或sampling，需要管理员令牌，分析结果ID通过响应头X-Profile-Id返回
     """
     try:
         # 获取请求数据
@@ -170,6 +482,26 @@ def execute_sql():
         # 提取参数
         connection_id = data.get('connection_id')
         sql = data.get('sql')
+        page_size = data.get('page_size')
+        page_token = data.get('page_token')
+        row_format = normalize_row_format(data.get('row_format'))
+        priority = data.get('priority') or 'interactive'
+        keep_result = bool(data.get('keep_result'))
+        approximate = data.get('approximate')
+        if approximate is True:
+            approximate = 'auto'
+        
+        try:
+            profile_mode = _profile_mode(data.get('profile'))
+        except ValueError as e:
+            return jsonify({
+                "status": "error",
+                "message": str(e)
+            }), 400
+        if profile_mode:
+            denied = _require_admin()
+            if denied:
+                return denied
         
         # 验证必要参数
         if not connection_id:
@@ -184,18 +516,80 @@ def execute_sql():
                 "message": "缺少必要参数: sql"
             }), 400
         
+        if not row_format:
+            return jsonify({
+                "status": "error",
+                "message": f"不支持的row_format，可选: {', '.join(ROW_FORMATS)}"
+            }), 400
+        
+        if priority not in PRIORITIES:
+            return jsonify({
+                "status": "error",
+                "message": f"不支持的priority，可选: {', '.join(PRIORITIES)}"
+            }), 400
+        
+        if page_size is not None:
+            try:
+                page_size = int(page_size)
+            except (TypeError, ValueError):
+                page_size = 0
+            if page_size < 1 or page_size > MAX_PAGE_SIZE:
+                return jsonify({
+                    "status": "error",
+                    "message": f"page_size必须在1到{MAX_PAGE_SIZE}之间"
+                }), 400
+        
+        if keep_result and (page_size or page_token):
+            return jsonify({
+                "status": "error",
+                "message": "keep_result不能与page_size、page_token同时使用"
+            }), 400
+        
+        if approximate:
+            if approximate not in APPROX_METHODS:
+                return jsonify({
+                    "status": "error",
+                    "message": f"不支持的approximate，可选: true或{', '.join(APPROX_METHODS)}"
+                }), 400
+            if keep_result or page_size or page_token:
+                return jsonify({
+                    "status": "error",
+                    "message": "approximate不能与page_size、page_token、keep_result同时使用"
+                }), 400
+        else:
+            approximate = None
+        
         # 执行SQL
-        result = query_service.execute_sql(
-            connection_id=connection_id,
-            sql=sql
-        )
+        with admission.admit(connection_id, priority):
+            with _profiled(profile_mode) as profile:
+                result = query_service.execute_sql(
+                    connection_id=connection_id,
+                    sql=sql,
+                    page_size=page_size,
+                    page_token=page_token,
+                    row_format=row_format,
+                    keep_result=keep_result,
+                    approximate=approximate
+                )
+                response = jsonify(result)
+        
+        # 续页令牌过期时返回410，客户端需重新执行查询
+        if result.get('page_token_expired'):
+            return _profiled_response(response, profile), 410
         
         # 根据结果返回响应
         if result.get('status') == 'success':
-            return jsonify(result), 200
+            return _profiled_response(response, profile), 200
         else:
-            return jsonify(result), 500
+            return _profiled_response(response, profile), 500
             
+    except AdmissionRejected as e:
+        return _admission_rejected(e)
+    except ProfilerBusy as e:
+        return jsonify({
+            "status": "error",
+            "message": str(e)
+        }), 409
     except Exception as e:
         logger.error(f"执行SQL API错误: {str(e)}")
         return jsonify({
@@ -203,15 +597,21 @@ def execute_sql():
             "message": f"处理请求时出错: {str(e)}"
         }), 500
 
-@api_bp.route('/disconnect', methods=['POST'])
-def disconnect_database():
+@api_bp.route('/export', methods=['POST'])
+def export_results():
     """
-    断开数据库连接API
+    以二进制列式格式流式导出查询结果API
     
     请求体格式:
     {
-        "connection_id": "mysql_localhost_my_database"
+        "connection_id": "mysql_localhost_my_database",
+        "sql": "SELECT * FROM users",
+        "format": "arrow",
+        "batch_size": 10000
     }
+    
+    format支持arrow（Arrow IPC流）与parquet，响应为二进制文件流；
+    导出按批量优先级排队，执行名额在响应传输完毕后释放
     """
     try:
         # 获取请求数据
@@ -225,26 +625,928 @@ def disconnect_database():
         
         # 提取参数
         connection_id = data.get('connection_id')
+        sql = data.get('sql')
+        export_format = (data.get('format') or 'arrow').lower()
         
         # 验证必要参数
+        if not connection_id or not sql:
+            return jsonify({
+                "status": "error",
+                "message": "缺少必要参数: connection_id, sql"
+            }), 400
+        
+        try:
+            batch_size = int(data.get('batch_size') or 10000)
+        except (TypeError, ValueError):
+            batch_size = 0
+        if batch_size < 1 or batch_size > 100000:
+            return jsonify({
+                "status": "error",
+                "message": "batch_size必须在1到100000之间"
+            }), 400
+        
+        # 导出结果（名额在响应关闭时释放）
+        ticket = admission.acquire(connection_id, "bulk")
+        try:
+            result = query_service.export_query(connection_id, sql, export_format, batch_size)
+        except Exception:
+            admission.release(ticket)
+            raise
+        
+        if result.get('status') != 'success':
+            admission.release(ticket)
+            return jsonify(result), 501 if result.get('not_implemented') else 500
+        
+        response = Response(
+            stream_with_context(result['stream']),
+            mimetype=result['mimetype'],
+            headers={"Content-Disposition": f"attachment; filename=result.{result['extension']}"}
+        )
+        response.call_on_close(lambda: admission.release(ticket))
+        return response
+            
+    except AdmissionRejected as e:
+        return _admission_rejected(e)
+    except Exception as e:
+        logger.error(f"导出结果API错误: {str(e)}")
+        return jsonify({
+            "status": "error",
+            "message": f"处理请求时出错: {str(e)}"
+        }), 500
+
+@api_bp.route('/result/<result_id>', methods=['GET'])
+def get_buffered_result(result_id):
+    """
+    从结果缓冲区翻页读取执行结果API
+    
+    查询参数:
+        connection_id: 数据库连接ID（必需）
+        offset: 起始行，默认0
+        limit: 行数，默认100
+        row_format: 行编码格式，默认objects
+    
+    results.next_offset为空表示没有更多行
+    """
+    try:
+        connection_id = request.args.get('connection_id')
         if not connection_id:
             return jsonify({
                 "status": "error",
                 "message": "缺少必要参数: connection_id"
             }), 400
         
-        # 断开连接
-        result = query_service.disconnect_database(connection_id)
+        try:
+            offset = int(request.args.get('offset', 0))
+            limit = int(request.args.get('limit', 100))
+        except (TypeError, ValueError):
+            offset, limit = -1, 0
+        if offset < 0 or limit < 1 or limit > MAX_PAGE_SIZE:
+            return jsonify({
+                "status": "error",
+                "message": f"offset不能为负数，limit必须在1到{MAX_PAGE_SIZE}之间"
+            }), 400
         
-        # 根据结果返回响应
-        if result.get('status') in ['success', 'warning']:
+        row_format = normalize_row_format(request.args.get('row_format'))
+        if not row_format:
+            return jsonify({
+                "status": "error",
+                "message": f"不支持的row_format，可选: {', '.join(ROW_FORMATS)}"
+            }), 400
+        
+        result = query_service.get_buffered_result(connection_id, result_id, offset, limit, row_format)
+        
+        if result.get('status') == 'success':
             return jsonify(result), 200
         else:
-            return jsonify(result), 500
+            return jsonify(result), 404
             
     except Exception as e:
-        logger.error(f"断开连接API错误: {str(e)}")
+        logger.error(f"读取结果API错误: {str(e)}")
+        return jsonify({
+            "status": "error",
+            "message": f"处理请求时出错: {str(e)}"
+        }), 500
+
+@api_bp.route('/result/<result_id>', methods=['DELETE'])
+def release_buffered_result(result_id):
+    """
+    删除结果缓冲区API
+    
+    查询参数:
+        connection_id: 数据库连接ID（必需）
+    """
+    try:
+        connection_id = request.args.get('connection_id')
+        if not connection_id:
+            return jsonify({
+                "status": "error",
+                "message": "缺少必要参数: connection_id"
+            }), 400
+        
+        result = query_service.release_buffered_result(connection_id, result_id)
+        
+        if result.get('status') == 'success':
+            return jsonify(result), 200
+        else:
+            return jsonify(result), 404
+            
+    except Exception as e:
+        logger.error(f"删除结果API错误: {str(e)}")
         return jsonify({
             "status": "error",
             "message": f"处理请求时出错: {str(e)}"
-        }), 500 
\ No newline at end of file
+        }), 500
+
+def _dashboard_options(data):
+    """解析仪表盘接口的max_rows与row_format，参数无效时返回错误响应"""
+    row_format = normalize_row_format(data.get('row_format'))
+    if not row_format:
+        return None, None, (jsonify({
+            "status": "error",
+            "message": f"不支持的row_format，可选: {', '.join(ROW_FORMATS)}"
+        }), 400)
+    try:
+        max_rows = int(data.get('max_rows') or 100)
+    except (TypeError, ValueError):
+        max_rows = 0
+    if max_rows < 1 or max_rows > MAX_PAGE_SIZE:
+        return None, None, (jsonify({
+            "status": "error",
+            "message": f"max_rows必须在1到{MAX_PAGE_SIZE}之间"
+        }), 400)
+    return max_rows, row_format, None
+
+@api_bp.route('/dashboard/register', methods=['POST'])
+def register_dashboard_query():
+    """
+    注册仪表盘查询API
+    
+    请求体格式:
+    {
+        "connection_id": "mysql_localhost_my_database",
+        "sql": "SELECT DATE(created_at) AS d, COUNT(*) AS n FROM orders GROUP BY d",
+        "watermark": "created_at",
+        "max_rows": 100,
+        "row_format": "objects"
+    }
+    
+    注册时完整执行一次并保存结果，之后 /api/dashboard/refresh 或 /api/execute 执行相同SQL时
+    只读取水位列之后的新行并合并到保存的结果中；
+    watermark可选，为空时自动选择自增列或创建时间列（DATETIME/TIMESTAMP）；
+    results.dashboard.mode为append（追加明细行）、aggregate（累加聚合值）或full（不能增量刷新，reason为原因）
+    """
+    try:
+        data = request.json
+        
+        if not data:
+            return jsonify({
+                "status": "error",
+                "message": "缺少请求数据"
+            }), 400
+        
+        connection_id = data.get('connection_id')
+        sql = data.get('sql')
+        if not connection_id or not sql:
+            return jsonify({
+                "status": "error",
+                "message": "缺少必要参数: connection_id 或 sql"
+            }), 400
+        
+        max_rows, row_format, error = _dashboard_options(data)
+        if error:
+            return error
+        
+        result = query_service.register_dashboard_query(
+            connection_id, sql, watermark=data.get('watermark') or None, max_rows=max_rows, row_format=row_format
+        )
+        
+        if result.get('status') == 'success':
+            return jsonify(result), 200
+        else:
+            return jsonify(result), 400
+            
+    except Exception as e:
+        logger.error(f"注册仪表盘查询API错误: {str(e)}")
+        return jsonify({
+            "status": "error",
+            "message": f"处理请求时出错: {str(e)}"
+        }), 500
+
+@api_bp.route('/dashboard/refresh', methods=['POST'])
+def refresh_dashboard_query():
+    """
+    刷新仪表盘查询API
+    
+    请求体格式:
+    {
+        "connection_id": "mysql_localhost_my_database",
+        "query_id": "注册时返回的query_id",
+        "full": false
+    }
+    
+    full为true时完整执行（数据被修改或删除后使用）；max_rows、row_format可选
+    """
+    try:
+        data = request.json
+        
+        if not data:
+            return jsonify({
+                "status": "error",
+                "message": "缺少请求数据"
+            }), 400
+        
+        connection_id = data.get('connection_id')
+        query_id = data.get('query_id')
+        if not connection_id or not query_id:
+            return jsonify({
+                "status": "error",
+                "message": "缺少必要参数: connection_id 或 query_id"
+            }), 400
+        
+        max_rows, row_format, error = _dashboard_options(data)
+        if error:
+            return error
+        
+        result = query_service.refresh_dashboard_query(
+            connection_id, query_id, full=bool(data.get('full')), max_rows=max_rows, row_format=row_format
+        )
+        
+        if result.get('status') == 'success':
+            return jsonify(result), 200
+        elif result.get('message', '').startswith('未找到'):
+            return jsonify(result), 404
+        else:
+            return jsonify(result), 500
+            
+    except Exception as e:
+        logger.error(f"刷新仪表盘查询API错误: {str(e)}")
+        return jsonify({
+            "status": "error",
+            "message": f"处理请求时出错: {str(e)}"
+        }), 500
+
+@api_bp.route('/dashboard', methods=['GET'])
+def list_dashboard_queries():
+    """
+    列出仪表盘查询API
+    
+    查询参数:
+        connection_id: 数据库连接ID（必需）
+    """
+    try:
+        connection_id = request.args.get('connection_id')
+        if not connection_id:
+            return jsonify({
+                "status": "error",
+                "message": "缺少必要参数: connection_id"
+            }), 400
+        
+        return jsonify(query_service.list_dashboard_queries(connection_id)), 200
+            
+    except Exception as e:
+        logger.error(f"列出仪表盘查询API错误: {str(e)}")
+        return jsonify({
+            "status": "error",
+            "message": f"处理请求时出错: {str(e)}"
+        }), 500
+
+@api_bp.route('/dashboard/<query_id>', methods=['DELETE'])
+def delete_dashboard_query(query_id):
+    """
+    取消注册仪表盘查询API
+    
+    查询参数:
+        connection_id: 数据库连接ID（必需）
+    """
+    try:
+        connection_id = request.args.get('connection_id')
+        if not connection_id:
+            return jsonify({
+                "status": "error",
+                "message": "缺少必要参数: connection_id"
+            }), 400
+        
+        result = query_service.delete_dashboard_query(connection_id, query_id)
+        
+        if result.get('status') == 'success':
+            return jsonify(result), 200
+        else:
+            return jsonify(result), 404
+            
+    except Exception as e:
+        logger.error(f"删除仪表盘查询API错误: {str(e)}")
+        return jsonify({
+            "status": "error",
+            "message": f"处理请求时出错: {str(e)}"
+        }), 500
+
+@api_bp.route('/disconnect', methods=['POST'])
+def disconnect_database():
+    """
+    断开数据库连接API
+    
+    请求体格式:
+    {
+        "connection_id": "mysql_localhost_my_database"
+    }
+    """
+    try:
+        # 获取请求数据
+        data = request.json
+        
+        if not data:
+            return jsonify({
+                "status": "error",
+                "message": "缺少请求数据"
+            }), 400
+        
+        # 提取参数
+        connection_id = data.get('connection_id')
+        
+        # 验证必要参数
+        if not connection_id:
+            return jsonify({
+                "status": "error",
+                "message": "缺少必要参数: connection_id"
+            }), 400
+        
+        # 断开连接
+        result = query_service.disconnect_database(connection_id)
+        
+        # 根据结果返回响应
+        if result.get('status') in ['success', 'warning']:
+            return jsonify(result), 200
+        else:
+            return jsonify(result), 500
+            
+    except Exception as e:
+        logger.error(f"断开连接API错误: {str(e)}")
+        return jsonify({
+            "status": "error",
+            "message": f"处理请求时出错: {str(e)}"
+        }), 500
+
+@api_bp.route('/group/connect', methods=['POST'])
+def create_connection_group():
+    """
+    创建连接组API（用于结构相同的多个分片）
+    
+    请求体格式:
+    {
+        "group_id": "orders_shards",
+        "connection_ids": ["mysql_shard1_orders", "mysql_shard2_orders"]
+    }
+    
+    成员连接需先通过 /api/connect 建立
+    """
+    try:
+        data = request.json
+        
+        if not data:
+            return jsonify({
+                "status": "error",
+                "message": "缺少请求数据"
+            }), 400
+        
+        group_id = data.get('group_id')
+        connection_ids = data.get('connection_ids')
+        
+        if not group_id:
+            return jsonify({
+                "status": "error",
+                "message": "缺少必要参数: group_id"
+            }), 400
+        
+        if not isinstance(connection_ids, list) or not connection_ids:
+            return jsonify({
+                "status": "error",
+                "message": "connection_ids必须是非空列表"
+            }), 400
+        
+        result = query_service.create_connection_group(group_id, connection_ids)
+        
+        if result.get('status') == 'success':
+            return jsonify(result), 200
+        else:
+            return jsonify(result), 400
+            
+    except Exception as e:
+        logger.error(f"创建连接组API错误: {str(e)}")
+        return jsonify({
+            "status": "error",
+            "message": f"处理请求时出错: {str(e)}"
+        }), 500
+
+@api_bp.route('/group/query', methods=['POST'])
+def process_group_query():
+    """
+    连接组自然语言查询API，生成一次SQL并在所有成员上并发执行，合并结果
+    
+    请求体格式:
+    {
+        "group_id": "orders_shards",
+        "query": "统计每个地区的订单数",
+        "session_id": "可选",
+        "row_format": "可选，objects（默认）、arrays或columns",
+        "conversation_history": []
+    }
+    """
+    try:
+        data = request.json
+        
+        if not data:
+            return jsonify({
+                "status": "error",
+                "message": "缺少请求数据"
+            }), 400
+        
+        group_id = data.get('group_id')
+        query = data.get('query')
+        row_format = normalize_row_format(data.get('row_format'))
+        
+        if not group_id:
+            return jsonify({
+                "status": "error",
+                "message": "缺少必要参数: group_id"
+            }), 400
+        
+        if not query:
+            return jsonify({
+                "status": "error",
+                "message": "缺少必要参数: query"
+            }), 400
+        
+        if not row_format:
+            return jsonify({
+                "status": "error",
+                "message": f"不支持的row_format，可选: {', '.join(ROW_FORMATS)}"
+            }), 400
+        
+        with admission.admit(group_id, "interactive"):
+            result = query_service.process_group_query(
+                group_id=group_id,
+                query=query,
+                conversation_history=data.get('conversation_history'),
+                session_id=data.get('session_id'),
+                row_format=row_format
+            )
+        
+        if result.get('status') == 'success':
+            return jsonify(result), 200
+        else:
+            return jsonify(result), 500
+            
+    except AdmissionRejected as e:
+        return _admission_rejected(e)
+    except Exception as e:
+        logger.error(f"连接组查询API错误: {str(e)}")
+        return jsonify({
+            "status": "error",
+            "message": f"处理请求时出错: {str(e)}"
+        }), 500
+
+@api_bp.route('/group/disconnect', methods=['POST'])
+def delete_connection_group():
+    """
+    删除连接组API（成员连接保持不变）
+    
+    请求体格式:
+    {
+        "group_id": "orders_shards"
+    }
+    """
+    try:
+        data = request.json
+        
+        if not data or not data.get('group_id'):
+            return jsonify({
+                "status": "error",
+                "message": "缺少必要参数: group_id"
+            }), 400
+        
+        result = query_service.delete_connection_group(data['group_id'])
+        return jsonify(result), 200
+            
+    except Exception as e:
+        logger.error(f"删除连接组API错误: {str(e)}")
+        return jsonify({
+            "status": "error",
+            "message": f"处理请求时出错: {str(e)}"
+        }), 500
+
+@api_bp.route('/schema/refresh', methods=['POST'])
+def refresh_schema():
+    """
+    刷新元数据API，默认只重新获取结构发生变化的表
+    
+    请求体格式:
+    {
+        "connection_id": "mysql_localhost_my_database",
+        "full": false
+    }
+    """
+    try:
+        # 获取请求数据
+        data = request.json
+        
+        if not data or not data.get('connection_id'):
+            return jsonify({
+                "status": "error",
+                "message": "缺少必要参数: connection_id"
+            }), 400
+        
+        result = query_service.refresh_schema(data.get('connection_id'), full=bool(data.get('full')))
+        
+        if result.get('status') == 'success':
+            return jsonify(result), 200
+        else:
+            return jsonify(result), 500
+            
+    except Exception as e:
+        logger.error(f"刷新元数据API错误: {str(e)}")
+        return jsonify({
+            "status": "error",
+            "message": f"处理请求时出错: {str(e)}"
+        }), 500
+
+@api_bp.route('/query/slow', methods=['GET'])
+def slow_queries():
+    """
+    慢查询日志API，返回执行时间超过SLOW_QUERY_THRESHOLD秒的语句与按模板聚合的统计
+    
+    查询参数:
+        connection_id: 数据库连接ID
+        limit: 可选，返回的最近慢查询条数，默认100
+    """
+    try:
+        connection_id = request.args.get('connection_id')
+        
+        if not connection_id:
+            return jsonify({
+                "status": "error",
+                "message": "缺少必要参数: connection_id"
+            }), 400
+        
+        try:
+            limit = max(1, int(request.args.get('limit', 100)))
+        except ValueError:
+            return jsonify({
+                "status": "error",
+                "message": "limit必须是正整数"
+            }), 400
+        
+        result = query_service.get_slow_queries(connection_id, limit=limit)
+        
+        if result.get('status') == 'success':
+            return jsonify(result), 200
+        else:
+            return jsonify(result), 404
+            
+    except Exception as e:
+        logger.error(f"获取慢查询日志API错误: {str(e)}")
+        return jsonify({
+            "status": "error",
+            "message": f"处理请求时出错: {str(e)}"
+        }), 500
+
+@api_bp.route('/schema/advise', methods=['GET'])
+def index_advice():
+    """
+    索引建议API，汇总慢查询执行计划中的全表扫描、文件排序与临时表，按估计节省时间给出组合索引
+    
+    查询参数:
+        connection_id: 数据库连接ID
+        limit: 可选，返回的建议数，默认20
+    """
+    try:
+        connection_id = request.args.get('connection_id')
+        
+        if not connection_id:
+            return jsonify({
+                "status": "error",
+                "message": "缺少必要参数: connection_id"
+            }), 400
+        
+        try:
+            limit = max(1, int(request.args.get('limit', 20)))
+        except ValueError:
+            return jsonify({
+                "status": "error",
+                "message": "limit必须是正整数"
+            }), 400
+        
+        result = query_service.get_index_advice(connection_id, limit=limit)
+        
+        if result.get('status') == 'success':
+            return jsonify(result), 200
+        else:
+            return jsonify(result), 500
+            
+    except Exception as e:
+        logger.error(f"索引建议API错误: {str(e)}")
+        return jsonify({
+            "status": "error",
+            "message": f"处理请求时出错: {str(e)}"
+        }), 500
+
+@api_bp.route('/schema/formats', methods=['POST'])
+def schema_formats():
+    """
+    结构描述格式API，统计各格式的token数，并可设置连接使用的格式
+    
+    请求体格式:
+    {
+        "connection_id": "mysql_localhost_my_database",
+        "schema_format": "compact"
+    }
+    
+    schema_format可选，提供时设置该连接使用的格式
+    """
+    try:
+        # 获取请求数据
+        data = request.json
+        
+        if not data or not data.get('connection_id'):
+            return jsonify({
+                "status": "error",
+                "message": "缺少必要参数: connection_id"
+            }), 400
+        
+        connection_id = data.get('connection_id')
+        
+        # 设置格式
+        if data.get('schema_format'):
+            result = query_service.set_schema_format(connection_id, data.get('schema_format'))
+            if result.get('status') != 'success':
+                return jsonify(result), 400
+        
+        # 统计各格式token数
+        result = query_service.measure_schema_formats(connection_id)
+        
+        if result.get('status') == 'success':
+            return jsonify(result), 200
+        else:
+            return jsonify(result), 500
+            
+    except Exception as e:
+        logger.error(f"结构描述格式API错误: {str(e)}")
+        return jsonify({
+            "status": "error",
+            "message": f"处理请求时出错: {str(e)}"
+        }), 500
+
+@api_bp.route('/mirror/enable', methods=['POST'])
+def enable_mirror():
+    """
+    启用本地列式镜像API，将热点表复制到本地DuckDB，涉及的表都已镜像的只读查询在本地执行
+    
+    请求体格式:
+    {
+        "connection_id": "mysql_localhost_my_database",
+        "tables": ["orders", {"name": "events", "watermark": "id"}]
+    }
+    
+    watermark为单调递增的列（自增主键或更新时间），用于增量复制，
+    未指定时每次表有更新都全量复制
+    """
+    try:
+        # 获取请求数据
+        data = request.json
+        
+        if not data or not data.get('connection_id') or not data.get('tables'):
+            return jsonify({
+                "status": "error",
+                "message": "缺少必要参数: connection_id 或 tables"
+            }), 400
+        
+        tables = data.get('tables')
+        if not isinstance(tables, list) or not all(
+            isinstance(t, str) or (isinstance(t, dict) and isinstance(t.get('name'), str)) for t in tables
+        ):
+            return jsonify({
+                "status": "error",
+                "message": "tables必须是表名或 {\"name\", \"watermark\"} 对象的列表"
+            }), 400
+        
+        result = query_service.enable_mirror(data.get('connection_id'), tables)
+        
+        if result.get('status') == 'success':
+            return jsonify(result), 200
+        else:
+            return jsonify(result), 501 if result.get('not_implemented') else 500
+            
+    except Exception as e:
+        logger.error(f"启用本地列式镜像API错误: {str(e)}")
+        return jsonify({
+            "status": "error",
+            "message": f"处理请求时出错: {str(e)}"
+        }), 500
+
+@api_bp.route('/mirror/disable', methods=['POST'])
+def disable_mirror():
+    """
+    停用本地列式镜像API
+    
+    请求体格式:
+    {
+        "connection_id": "mysql_localhost_my_database"
+    }
+    """
+    try:
+        # 获取请求数据
+        data = request.json
+        
+        if not data or not data.get('connection_id'):
+            return jsonify({
+                "status": "error",
+                "message": "缺少必要参数: connection_id"
+            }), 400
+        
+        result = query_service.disable_mirror(data.get('connection_id'))
+        
+        if result.get('status') == 'success':
+            return jsonify(result), 200
+        else:
+            return jsonify(result), 404
+            
+    except Exception as e:
+        logger.error(f"停用本地列式镜像API错误: {str(e)}")
+        return jsonify({
+            "status": "error",
+            "message": f"处理请求时出错: {str(e)}"
+        }), 500
+
+@api_bp.route('/llm/providers', methods=['GET'])
+def llm_provider_status():
+    """
+    LLM提供商状态API，返回各提供商的配置、健康状态与调用统计
+    """
+    try:
+        return jsonify({
+            "status": "success",
+            "providers": query_service.llm_service.registry.get_stats()
+        }), 200
+    except Exception as e:
+        logger.error(f"获取LLM提供商状态API错误: {str(e)}")
+        return jsonify({
+            "status": "error",
+            "message": f"处理请求时出错: {str(e)}"
+        }), 500
+
+@api_bp.route('/admission/stats', methods=['GET'])
+def admission_stats():
+    """
+    准入控制统计API，返回当前执行数、各优先级的排队数、排队时间与拒绝次数
+    """
+    try:
+        return jsonify({
+            "status": "success",
+            "admission": admission.stats()
+        }), 200
+    except Exception as e:
+        logger.error(f"获取准入控制统计API错误: {str(e)}")
+        return jsonify({
+            "status": "error",
+            "message": f"处理请求时出错: {str(e)}"
+        }), 500
+
+@api_bp.route('/profile', methods=['GET'])
+def list_profiles():
+    """
+    列出当前工作进程保存的性能分析结果（需要管理员令牌）
+    """
+    denied = _require_admin()
+    if denied:
+        return denied
+    try:
+        return jsonify({
+            "status": "success",
+            "pid": os.getpid(),
+            "profiles": profiles.list()
+        }), 200
+    except Exception as e:
+        logger.error(f"列出性能分析结果API错误: {str(e)}")
+        return jsonify({
+            "status": "error",
+            "message": f"处理请求时出错: {str(e)}"
+        }), 500
+
+@api_bp.route('/profile/sampling', methods=['POST'])
+def start_sampling():
+    """
+    对处理该请求的工作进程做限时采样（需要管理员令牌）
+    
+    请求体格式:
+    {
+        "duration": 10,
+        "interval": 0.01,
+        "wait": false
+    }
+    
+    duration为采样秒数（默认10，最多120），interval为采样间隔秒数（默认0.01）；
+    wait为true时等待采样结束后返回结果摘要，否则立即返回结果ID（202）
+    """
+    denied = _require_admin()
+    if denied:
+        return denied
+    try:
+        data = request.get_json(silent=True) or {}
+        
+        try:
+            duration = float(data.get('duration', 10))
+            interval = float(data.get('interval', 0.01))
+        except (TypeError, ValueError):
+            duration = interval = 0
+        if not 0 < duration <= MAX_SAMPLE_DURATION or interval <= 0:
+            return jsonify({
+                "status": "error",
+                "message": f"duration必须在0到{MAX_SAMPLE_DURATION}秒之间，interval必须大于0"
+            }), 400
+        
+        profile_id = profiles.start_sampling(duration, interval, label=data.get('label'))
+        
+        if not data.get('wait'):
+            return jsonify({
+                "status": "success",
+                "profile_id": profile_id,
+                "pid": os.getpid()
+            }), 202
+        
+        profiles.wait(profile_id, duration + 5)
+        return jsonify({
+            "status": "success",
+            "profile": profiles.summary(profiles.get(profile_id))
+        }), 200
+        
+    except ProfilerBusy as e:
+        return jsonify({
+            "status": "error",
+            "message": str(e)
+        }), 409
+    except Exception as e:
+        logger.error(f"进程采样API错误: {str(e)}")
+        return jsonify({
+            "status": "error",
+            "message": f"处理请求时出错: {str(e)}"
+        }), 500
+
+@api_bp.route('/profile/sampling/stop', methods=['POST'])
+def stop_sampling():
+    """
+    提前结束当前工作进程正在进行的采样（需要管理员令牌）
+    """
+    denied = _require_admin()
+    if denied:
+        return denied
+    return jsonify({
+        "status": "success",
+        "stopped": profiles.stop_sampling()
+    }), 200
+
+@api_bp.route('/profile/<profile_id>', methods=['GET'])
+def get_profile(profile_id):
+    """
+    获取性能分析结果（需要管理员令牌）
+    
+    查询参数:
+        format: json（默认，摘要）、collapsed（折叠栈，采样结果）、
+                text（pstats报告，cProfile结果）或pstats（原始数据，可用pstats/snakeviz打开）
+    """
+    denied = _require_admin()
+    if denied:
+        return denied
+    try:
+        entry = profiles.get(profile_id)
+        if entry is None:
+            return jsonify({
+                "status": "error",
+                "message": f"未找到分析结果: {profile_id}（结果只保存在生成它的工作进程中）"
+            }), 404
+        
+        output_format = request.args.get('format', 'json')
+        if output_format == 'json':
+            return jsonify({
+                "status": "success",
+                "profile": profiles.summary(entry)
+            }), 200
+        if output_format == 'collapsed' and entry.get('collapsed') is not None:
+            return Response(entry['collapsed'], mimetype='text/plain')
+        if output_format == 'text' and entry.get('pstats') is not None:
+            return Response(profiles.pstats_text(entry), mimetype='text/plain')
+        if output_format == 'pstats' and entry.get('pstats') is not None:
+            return Response(
+                entry['pstats'],
+                mimetype='application/octet-stream',
+                headers={"Content-Disposition": f"attachment; filename={profile_id}.prof"}
+            )
+        return jsonify({
+            "status": "error",
+            "message": f"该分析结果不支持format={output_format}"
+        }), 400
+        
+    except Exception as e:
+        logger.error(f"获取性能分析结果API错误: {str(e)}")
+        return jsonify({
+            "status": "error",
+            "message": f"处理请求时出错: {str(e)}"
+        }), 500
@@ -6,7 +6,6 @@ MCP模块初始化文件
 """
 
 import logging
-from app.mcp.servers.mysql_server import MySQLMCPServer
 
 # 获取日志记录器
 logger = logging.getLogger(__name__)
@@ -30,12 +29,16 @@ class MCPServerFactory:
         """
         try:
             if db_type.lower() == 'mysql':
+                # 首次创建连接时才导入SQLAlchemy等依赖，加快应用启动
+                from app.mcp.servers.mysql_server import MySQLMCPServer
                 return MySQLMCPServer(
                     host=kwargs.get('host', 'localhost'),
                     user=kwargs.get('user', 'root'),
                     password=kwargs.get('password', ''),
                     database=kwargs.get('database', ''),
-                    port=kwargs.get('port', 3306)
+                    port=kwargs.get('port', 3306),
+                    snapshot_store=kwargs.get('snapshot_store'),
+                    replicas=kwargs.get('replicas')
                 )
             elif db_type.lower() == 'postgresql':
                 # TODO: 实现PostgreSQL服务器
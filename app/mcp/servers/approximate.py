@@ -0,0 +1,513 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+近似查询：将单表聚合查询改写为只在抽样子集上执行，按抽样比例放大COUNT与SUM，
+并用若干个独立子样本之间的差异估计误差，超大表上的探索性问题可先快速得到近似结果
+"""
+
+import re
+import math
+import random
+from decimal import Decimal
+from statistics import stdev
+
+from app.mcp.servers.index_advisor import _TOKEN_PATTERN, _parse_tables
+
+# 抽样方式：auto按 抽样表 -> 主键范围 的顺序选择
+APPROX_METHODS = ("auto", "range", "modulo", "sample_table")
+
+# 95%置信区间对应的正态分位数
+CONFIDENCE_Z = 1.96
+
+# 可近似的聚合函数
+_AGGREGATES = frozenset({"COUNT", "SUM", "AVG"})
+
+# 改写后无法保持语义的写法
+_UNSUPPORTED = {
+    "JOIN": "多表连接",
+    "UNION": "UNION",
+    "HAVING": "HAVING",
+    "DISTINCT": "DISTINCT",
+    "OVER": "窗口函数",
+    "WITH": "公用表表达式",
+    "MIN": "MIN/MAX",
+    "MAX": "MIN/MAX",
+}
+
+# 列表项末尾不是别名的关键字
+_NOT_ALIAS = frozenset({"END", "NULL", "TRUE", "FALSE"})
+
+_INTEGER_TYPE = re.compile(r"^(TINYINT|SMALLINT|MEDIUMINT|INT|INTEGER|BIGINT)\b", re.IGNORECASE)
+
+
+class NotApproximable(Exception):
+    """查询不适合近似执行，异常信息为原因"""
+
+
+def _tokens(sql):
+    """切分为 (类型, 值, 起始位置, 结束位置) 列表，注释与空白被丢弃"""
+    tokens = []
+    for match in _TOKEN_PATTERN.finditer(sql):
+        kind = match.lastgroup
+        if kind in ("space", "comment"):
+            continue
+        value = match.group()
+        if kind == "quoted":
+            kind, value = "name", value[1:-1].replace("``", "`")
+        tokens.append((kind, value, match.start(), match.end()))
+    return tokens
+
+
+def _split_clauses(sql, tokens):
+    """
+    按最外层的子句关键字切分查询
+
+    Returns:
+        dict: 子句名（SELECT/FROM/WHERE/GROUP BY/ORDER BY/LIMIT） -> 子句文本（不含关键字）
+    """
+    starts = []
+    depth = 0
+    for i, (kind, value, start, end) in enumerate(tokens):
+        if value == "(":
+            depth += 1
+        elif value == ")":
+            depth -= 1
+        if depth or kind != "word":
+            continue
+        keyword = value.upper()
+        following = tokens[i + 1][1].upper() if i + 1 < len(tokens) else ""
+        if keyword in ("SELECT", "FROM", "WHERE", "LIMIT"):
+            starts.append((keyword, start, end))
+        elif keyword in ("GROUP", "ORDER") and following == "BY":
+            starts.append((f"{keyword} BY", start, tokens[i + 1][3]))
+    clauses = {}
+    for index, (name, start, end) in enumerate(starts):
+        if name in clauses:
+            raise NotApproximable(f"无法识别的{name}子句")
+        stop = starts[index + 1][1] if index + 1 < len(starts) else len(sql)
+        clauses[name] = sql[end:stop].strip().rstrip(";").strip()
+    return clauses
+
+
+def _split_items(text):
+    """按最外层的逗号切分列表"""
+    items = []
+    depth = 0
+    position = 0
+    for kind, value, start, end in _tokens(text):
+        if value == "(":
+            depth += 1
+        elif value == ")":
+            depth -= 1
+        elif value == "," and depth == 0:
+            items.append(text[position:start].strip())
+            position = end
+    items.append(text[position:].strip())
+    return [item for item in items if item]
+
+
+def _normalize(text):
+    return " ".join(value.lower() for _, value, _, _ in _tokens(text))
+
+
+def _strip_alias(item):
+    """
+    拆分列表项与别名
+
+    Returns:
+        tuple: (表达式文本, 别名或None)
+    """
+    tokens = _tokens(item)
+    if len(tokens) < 2:
+        return item, None
+    last, before = tokens[-1], tokens[-2]
+    if before[0] == "word" and before[1].upper() == "AS" and last[0] in ("word", "name", "string"):
+        alias = last[1][1:-1] if last[0] == "string" else last[1]
+        return item[:before[2]].strip(), alias
+    # 省略AS的别名：紧跟在列名、函数调用或字面量之后的标识符
+    if last[0] in ("word", "name") and last[1].upper() not in _NOT_ALIAS and \
+            (before[0] in ("word", "name", "number", "string") or before[1] == ")"):
+        return item[:last[2]].strip(), last[1]
+    return item, None
+
+
+def _parse_aggregate(expression):
+    """
+    识别单个聚合函数调用，允许外层的ROUND(聚合, 小数位)
+
+    Returns:
+        dict: {"func", "arg", "round"}，不是聚合函数时返回None
+    """
+    tokens = _tokens(expression)
+    digits = None
+    if len(tokens) >= 6 and tokens[0][1].upper() == "ROUND" and tokens[1][1] == "(" and tokens[-1][1] == ")":
+        if tokens[-3][1] == "," and tokens[-2][0] == "number":
+            digits = int(tokens[-2][1])
+            tokens = tokens[2:-3]
+        else:
+            tokens = tokens[2:-1]
+    if len(tokens) < 4 or tokens[0][0] != "word" or tokens[1][1] != "(" or tokens[-1][1] != ")":
+        return None
+    func = tokens[0][1].upper()
+    if func not in _AGGREGATES:
+        return None
+    depth = 0
+    for _, value, _, _ in tokens[1:-1]:
+        depth += {"(": 1, ")": -1}.get(value, 0)
+        if depth == 0:
+            # 聚合函数之后还有其他运算
+            return None
+    arg = expression[tokens[2][2]:tokens[-1][2]].strip()
+    if any(value.upper() in _AGGREGATES for kind, value, _, _ in _tokens(arg) if kind == "word"):
+        raise NotApproximable("不支持嵌套的聚合函数")
+    return {"func": func, "arg": arg, "round": digits}
+
+
+def plan_approximation(sql, tables):
+    """
+    分析查询能否近似执行
+
+    可近似的查询：单表、无子查询，SELECT列表由分组表达式与COUNT/SUM/AVG（可带ROUND）组成，
+    可带WHERE、GROUP BY、ORDER BY与LIMIT。
+
+    Args:
+        sql (str): SQL查询
+        tables (dict): 表名 -> 表结构信息
+
+    Returns:
+        dict: 查询计划，包含表名、SELECT列表项、子句文本、排序与行数限制
+
+    Raises:
+        NotApproximable: 查询不适合近似执行
+    """
+    tokens = _tokens(sql)
+    if not tokens or tokens[0][1].upper() != "SELECT":
+        raise NotApproximable("只有SELECT查询可以近似执行")
+    for i, (kind, value, _, _) in enumerate(tokens):
+        upper = value.upper()
+        if kind == "word" and upper in _UNSUPPORTED:
+            # MIN/MAX只有作为函数调用时才不支持
+            if upper in ("MIN", "MAX") and not (i + 1 < len(tokens) and tokens[i + 1][1] == "("):
+                continue
+            raise NotApproximable(f"不支持{_UNSUPPORTED[upper]}")
+        if kind == "word" and upper == "SELECT" and i > 0:
+            raise NotApproximable("不支持子查询")
+        if value == ";" and i != len(tokens) - 1:
+            raise NotApproximable("只能包含一条语句")
+
+    clauses = _split_clauses(sql, tokens)
+    if "FROM" not in clauses:
+        raise NotApproximable("查询中没有表")
+    if "," in [t[1] for t in _tokens(clauses["FROM"])]:
+        raise NotApproximable("只有单表查询可以近似执行")
+    aliases = _parse_tables([(kind, value) for kind, value, _, _ in tokens])
+    table_names = set(aliases.values())
+    if len(table_names) != 1:
+        raise NotApproximable("只有单表查询可以近似执行")
+    table = table_names.pop()
+    if table not in tables:
+        raise NotApproximable(f"未知的表: {table}")
+
+    items = []
+    for text in _split_items(clauses["SELECT"]):
+        expression, alias = _strip_alias(text)
+        aggregate = _parse_aggregate(expression)
+        name = alias or expression
+        if aggregate:
+            items.append(dict(aggregate, kind="aggregate", expression=expression, name=name))
+        else:
+            if expression == "*" or expression.endswith(".*"):
+                raise NotApproximable("SELECT * 不是聚合查询")
+            expression_tokens = _tokens(expression)
+            if any(kind == "word" and value.upper() in _AGGREGATES and j + 1 < len(expression_tokens)
+                   and expression_tokens[j + 1][1] == "("
+                   for j, (kind, value, _, _) in enumerate(expression_tokens)):
+                raise NotApproximable("只支持单独的COUNT/SUM/AVG（可带ROUND），不支持聚合结果参与运算")
+            items.append({"kind": "group", "expression": expression, "name": name})
+    if not any(item["kind"] == "aggregate" for item in items):
+        raise NotApproximable("查询中没有COUNT/SUM/AVG聚合")
+
+    # GROUP BY的各项对应到SELECT列表项，未选出的分组表达式作为隐藏列
+    group_items = []
+    for text in _split_items(clauses.get("GROUP BY", "")):
+        index = _resolve_reference(text, items)
+        if index is None:
+            items.append({"kind": "group", "expression": text, "name": None, "hidden": True})
+            index = len(items) - 1
+        if items[index]["kind"] != "group":
+            raise NotApproximable("不能按聚合结果分组")
+        group_items.append(index)
+    for index, item in enumerate(items):
+        if item["kind"] == "group" and index not in group_items:
+            raise NotApproximable(f"{item['expression']} 不在GROUP BY中")
+
+    order = []
+    for text in _split_items(clauses.get("ORDER BY", "")):
+        tokens_ = _tokens(text)
+        descending = bool(tokens_) and tokens_[-1][1].upper() == "DESC"
+        if tokens_ and tokens_[-1][1].upper() in ("ASC", "DESC"):
+            text = text[:tokens_[-1][2]].strip()
+        index = _resolve_reference(text, items)
+        if index is None:
+            raise NotApproximable(f"无法识别的排序项: {text}")
+        order.append((index, descending))
+
+    limit = offset = None
+    if "LIMIT" in clauses:
+        numbers = re.fullmatch(r"\s*(\d+)\s*(?:(,|OFFSET)\s*(\d+))?\s*", clauses["LIMIT"], re.IGNORECASE)
+        if not numbers:
+            raise NotApproximable("无法识别的LIMIT子句")
+        first, separator, second = numbers.groups()
+        if separator == ",":
+            offset, limit = int(first), int(second)
+        else:
+            limit, offset = int(first), int(second or 0)
+
+    return {
+        "table": table,
+        "from": clauses["FROM"],
+        "where": clauses.get("WHERE"),
+        "items": items,
+        "group": group_items,
+        "order": order,
+        "limit": limit,
+        "offset": offset or 0,
+        "aliased": any(key != table.lower() for key in aliases)
+    }
+
+
+def _resolve_reference(text, items):
+    """将GROUP BY/ORDER BY中的项对应到SELECT列表项（位置编号、别名或相同的表达式）"""
+    if text.isdigit():
+        index = int(text) - 1
+        if 0 <= index < len(items):
+            return index
+        raise NotApproximable(f"位置编号超出范围: {text}")
+    stripped = text.strip("`")
+    for index, item in enumerate(items):
+        if item.get("name") and item["name"] != item["expression"] and item["name"].lower() == stripped.lower():
+            return index
+    normalized = _normalize(text)
+    for index, item in enumerate(items):
+        if _normalize(item["expression"]) == normalized:
+            return index
+    return None
+
+
+def integer_primary_key(table_info):
+    """
+    表的单列整数主键
+
+    Returns:
+        str: 主键列名，不是单列整数主键时返回None
+    """
+    keys = [c for c in table_info.get("columns", []) if c.get("is_primary")]
+    if len(keys) == 1 and _INTEGER_TYPE.match(keys[0].get("type", "")):
+        return keys[0]["name"]
+    return None
+
+
+def range_sample(key, low, high, fraction, subsamples, rng=None):
+    """
+    主键范围抽样：将主键区间等分为subsamples段，每段内随机取一个连续的子区间，
+    按主键索引只读取这些子区间中的行
+
+    Args:
+        key (str): 主键列名
+        low (int): 主键最小值
+        high (int): 主键最大值
+        fraction (float): 目标抽样比例
+        subsamples (int): 子样本数
+        rng (random.Random, optional): 随机数生成器
+
+    Returns:
+        tuple: (抽样条件, 子样本编号表达式, 实际抽样比例)
+    """
+    rng = rng or random.Random()
+    span = high - low + 1
+    subsamples = max(1, min(subsamples, span))
+    stratum = span / subsamples
+    width = max(1, int(stratum * fraction))
+    column = f"`{key}`"
+    ranges = []
+    for i in range(subsamples):
+        start = low + int(i * stratum) + rng.randint(0, max(0, int(stratum) - width))
+        ranges.append((start, start + width - 1))
+    condition = " OR ".join(f"{column} BETWEEN {a} AND {b}" for a, b in ranges)
+    sample_id = "CASE " + " ".join(
+        f"WHEN {column} BETWEEN {a} AND {b} THEN {i}" for i, (a, b) in enumerate(ranges)
+    ) + " END"
+    return f"({condition})", sample_id, min(1.0, subsamples * width / span)
+
+
+def hashed_key(key):
+    """主键的散列值，避免主键本身的周期规律（如按主键轮流分配的类别）与子样本编号相关"""
+    return f"CRC32(`{key}`)"
+
+
+def modulo_sample(key, fraction, subsamples):
+    """
+    主键取模抽样：保留主键散列值除以m的余数小于subsamples的行，余数即子样本编号。
+    需要扫描全部候选行，适合WHERE条件已能通过索引大幅缩小范围的查询
+
+    Returns:
+        tuple: (抽样条件, 子样本编号表达式, 实际抽样比例)
+    """
+    modulus = max(subsamples, int(round(subsamples / fraction)))
+    sample_id = f"MOD({hashed_key(key)}, {modulus})"
+    return f"{sample_id} < {subsamples}", sample_id, subsamples / modulus
+
+
+def rewrite_query(plan, condition, sample_id, source=None, watermark=None):
+    """
+    生成在抽样子集上按子样本分别聚合的查询
+
+    Args:
+        plan (dict): plan_approximation 的结果
+        condition (str): 抽样条件，为空时不加条件（抽样表）
+        sample_id (str): 子样本编号表达式
+        source (str, optional): 替换原表的抽样表名
+        watermark (str, optional): 水位列表达式，提供时结果增加各组中的最大值 __w（用于增量刷新）
+
+    Returns:
+        str: 改写后的SQL，结果列为 __g*（分组）、__s（子样本编号）与 __a*（聚合的部分结果）
+    """
+    select = []
+    for index in plan["group"]:
+        select.append(f"{plan['items'][index]['expression']} AS `__g{index}`")
+    select.append(f"{sample_id} AS `__s`")
+    for index, item in enumerate(plan["items"]):
+        if item["kind"] != "aggregate":
+            continue
+        if item["func"] == "COUNT":
+            select.append(f"COUNT({item['arg']}) AS `__a{index}_n`")
+        else:
+            select.append(f"SUM({item['arg']}) AS `__a{index}_s`")
+            select.append(f"COUNT({item['arg']}) AS `__a{index}_n`")
+    if watermark:
+        select.append(f"MAX({watermark}) AS `__w`")
+
+    from_text = plan["from"]
+    if source:
+        replacement = f"`{source}`" if plan["aliased"] else f"`{source}` AS `{plan['table']}`"
+        from_text = re.sub(r"^\s*(?:`[^`]+`\s*\.\s*|\w+\s*\.\s*)?`?" + re.escape(plan["table"]) + r"`?(?![\w`])",
+                           lambda _: replacement, from_text, count=1)
+
+    sql = f"SELECT {', '.join(select)} FROM {from_text}"
+    conditions = [f"({plan['where']})" if plan["where"] else None, condition]
+    conditions = [c for c in conditions if c]
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    groups = [f"`__g{index}`" for index in plan["group"]] + ["`__s`"]
+    return sql + " GROUP BY " + ", ".join(groups)
+
+
+def _number(value):
+    if value is None:
+        return 0.0
+    return float(value) if isinstance(value, (Decimal, int, float)) else float(str(value))
+
+
+def _margin(estimates):
+    """子样本估计值之间的差异对应的95%置信区间半宽，子样本不足两个时无法估计"""
+    if len(estimates) < 2:
+        return None
+    return CONFIDENCE_Z * stdev(estimates) / math.sqrt(len(estimates))
+
+
+def combine_samples(plan, columns, rows, fraction, subsamples):
+    """
+    合并各子样本的部分结果，放大为全表估计值并计算误差
+
+    COUNT与SUM的估计值为样本合计除以抽样比例，AVG为样本的SUM除以COUNT；
+    误差由各子样本单独得到的估计值之间的标准差计算（95%置信区间半宽）。
+
+    Args:
+        plan (dict): plan_approximation 的结果
+        columns (list): 改写后查询的结果列名
+        rows (list): 改写后查询的结果行
+        fraction (float): 实际抽样比例
+        subsamples (int): 子样本数
+
+    Returns:
+        tuple: (列名列表, 结果行列表, 各行的误差列表 [{列名: 置信区间半宽}])
+    """
+    position = {name: i for i, name in enumerate(columns)}
+    groups = {}
+    for row in rows:
+        key = tuple(row[position[f"__g{index}"]] for index in plan["group"])
+        sample = row[position["__s"]]
+        groups.setdefault(key, {})[sample] = row
+    # 没有GROUP BY时即使没有匹配的行也返回一行（COUNT为0）
+    if not plan["group"] and not groups:
+        groups[()] = {}
+
+    items = plan["items"]
+    output_names = [item["name"] for item in items if not item.get("hidden")]
+    results = []
+    for key, samples in groups.items():
+        values = {index: value for index, value in zip(plan["group"], key)}
+        errors = {}
+        for index, item in enumerate(items):
+            if item["kind"] != "aggregate":
+                continue
+            counts = [_number(samples[s][position[f"__a{index}_n"]]) if s in samples else 0.0
+                      for s in range(subsamples)]
+            if item["func"] == "COUNT":
+                estimate = sum(counts) / fraction
+                margin = _margin([c * subsamples / fraction for c in counts])
+            else:
+                sums = [_number(samples[s][position[f"__a{index}_s"]]) if s in samples else 0.0
+                        for s in range(subsamples)]
+                if item["func"] == "SUM":
+                    estimate = sum(sums) / fraction
+                    margin = _margin([v * subsamples / fraction for v in sums])
+                else:
+                    estimate = sum(sums) / sum(counts) if sum(counts) else None
+                    margin = _margin([v / c for v, c in zip(sums, counts) if c])
+            if item["func"] == "COUNT":
+                estimate = int(round(estimate))
+            elif estimate is not None and item["round"] is not None:
+                estimate = round(estimate, item["round"])
+            values[index] = estimate
+            if item["name"] is not None:
+                errors[item["name"]] = round(margin, 4) if margin is not None else None
+        results.append((values, errors))
+
+    for index, descending in reversed(plan["order"]):
+        results.sort(key=lambda r: (r[0].get(index) is not None, r[0].get(index)), reverse=descending)
+    if plan["limit"] is not None or plan["offset"]:
+        end = plan["offset"] + plan["limit"] if plan["limit"] is not None else None
+        results = results[plan["offset"]:end]
+
+    visible = [index for index, item in enumerate(items) if not item.get("hidden")]
+    out_rows = [tuple(values.get(index) for index in visible) for values, _ in results]
+    return output_names, out_rows, [errors for _, errors in results]
+
+
+def parse_sample_tables(spec):
+    """
+    解析抽样表配置
+
+    Args:
+        spec (str): 形如 "orders=orders_sample:0.01,events=events_1pct:0.01"，抽样比例为抽样表行数占原表的比例
+
+    Returns:
+        dict: 原表名 -> (抽样表名, 抽样比例)
+    """
+    tables = {}
+    for entry in (spec or "").split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        table, _, rest = entry.partition("=")
+        sample, _, rate = rest.partition(":")
+        try:
+            rate = float(rate)
+        except ValueError:
+            raise ValueError(f"抽样表配置格式错误: {entry}")
+        if not table.strip() or not sample.strip() or not 0 < rate <= 1:
+            raise ValueError(f"抽样表配置格式错误: {entry}")
+        tables[table.strip()] = (sample.strip(), rate)
+    return tables
@@ -0,0 +1,413 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+索引建议：根据慢查询的执行计划找出全表扫描、文件排序与临时表，
+结合语句中的过滤、连接与排序列为每个表提出组合索引，并按估计节省的时间排序
+"""
+
+import re
+from collections import OrderedDict
+
+# 词法规则
+_TOKEN_PATTERN = re.compile(r"""
+    (?P<space>\s+)
+  | (?P<comment>(?:--(?=\s|$)|\#)[^\n]*|/\*.*?\*/)
+  | (?P<string>'(?:[^'\\]|\\.|'')*'|"(?:[^"\\]|\\.|"")*")
+  | (?P<quoted>`(?:[^`]|``)*`)
+  | (?P<number>\d+(?:\.\d+)?(?:[eE][+-]?\d+)?)
+  | (?P<word>[A-Za-z_][\w$]*)
+  | (?P<op><=>|<=|>=|<>|!=|[=<>])
+  | (?P<other>.)
+""", re.VERBOSE | re.DOTALL)
+
+# 表名之后不会作为别名出现的关键字
+_NOT_ALIAS = frozenset({
+    "WHERE", "GROUP", "ORDER", "HAVING", "LIMIT", "JOIN", "INNER", "LEFT", "RIGHT", "FULL", "CROSS",
+    "NATURAL", "STRAIGHT_JOIN", "ON", "USING", "UNION", "EXCEPT", "INTERSECT", "WINDOW", "FOR", "LOCK",
+    "INTO", "USE", "FORCE", "IGNORE", "PARTITION", "AS", "SELECT", "OUTER",
+})
+
+# ORDER BY / GROUP BY 列表的结束关键字
+_LIST_END = frozenset({"LIMIT", "HAVING", "ORDER", "UNION", "WINDOW", "FOR", "LOCK", "INTO", "WITH", "OFFSET"})
+
+# 单个索引的最大列数
+MAX_INDEX_COLUMNS = 5
+
+# 只命中文件排序或临时表（已使用索引过滤）时，估计可节省的耗时比例
+_SORT_SAVING = 0.3
+
+
+def _tokens(sql):
+    """切分为 (类型, 值) 列表，标识符去掉反引号，注释与空白被丢弃"""
+    tokens = []
+    for match in _TOKEN_PATTERN.finditer(sql):
+        kind = match.lastgroup
+        if kind in ("space", "comment"):
+            continue
+        value = match.group()
+        if kind == "quoted":
+            kind, value = "name", value[1:-1].replace("``", "`")
+        tokens.append((kind, value))
+    return tokens
+
+
+def _is_name(token):
+    return token[0] in ("word", "name")
+
+
+def _parse_tables(tokens):
+    """
+    找出FROM/JOIN之后的表与别名
+
+    Returns:
+        dict: 别名（小写） -> 表名，表名自身也作为键
+    """
+    aliases = {}
+    for i, (kind, value) in enumerate(tokens):
+        if kind != "word" or value.upper() not in ("FROM", "JOIN"):
+            continue
+        j = i + 1
+        while j < len(tokens):
+            if not _is_name(tokens[j]) or (tokens[j][0] == "word" and tokens[j][1].upper() in _NOT_ALIAS):
+                break
+            table = tokens[j][1]
+            j += 1
+            # 库名.表名
+            if j + 1 < len(tokens) and tokens[j][1] == "." and _is_name(tokens[j + 1]):
+                table = tokens[j + 1][1]
+                j += 2
+            aliases[table.lower()] = table
+            if j < len(tokens) and tokens[j][0] == "word" and tokens[j][1].upper() == "AS":
+                j += 1
+            if j < len(tokens) and _is_name(tokens[j]) and \
+                    not (tokens[j][0] == "word" and tokens[j][1].upper() in _NOT_ALIAS):
+                aliases[tokens[j][1].lower()] = table
+                j += 1
+            if j < len(tokens) and tokens[j][1] == "," and value.upper() == "FROM":
+                j += 1
+                continue
+            break
+    return aliases
+
+
+class _Resolver:
+    """将列引用解析为 (表名, 列名)，只接受表结构中存在的列"""
+
+    def __init__(self, aliases, tables):
+        self.aliases = aliases
+        self.columns = {}
+        for table in set(aliases.values()):
+            info = tables.get(table.lower())
+            if info:
+                self.columns[table] = {c["name"].lower(): c["name"] for c in info.get("columns", [])}
+
+    def resolve(self, tokens, i):
+        """
+        解析位置i开始的列引用
+
+        Returns:
+            tuple: ((表名, 列名), 下一个位置)，不是已知列时返回 (None, i)
+        """
+        if i >= len(tokens) or not _is_name(tokens[i]):
+            return None, i
+        # 函数调用不是列引用
+        if i + 1 < len(tokens) and tokens[i + 1][1] == "(":
+            return None, i
+        if i + 2 < len(tokens) and tokens[i + 1][1] == "." and _is_name(tokens[i + 2]):
+            table = self.aliases.get(tokens[i][1].lower())
+            column = self.columns.get(table, {}).get(tokens[i + 2][1].lower()) if table else None
+            return ((table, column) if column else None), i + 3
+        if i > 0 and tokens[i - 1][1] == ".":
+            return None, i
+        name = tokens[i][1].lower()
+        owners = [table for table, columns in self.columns.items() if name in columns]
+        if len(owners) == 1:
+            return (owners[0], self.columns[owners[0]][name]), i + 1
+        return None, i
+
+
+def extract_column_usage(sql, tables):
+    """
+    找出语句中各表用于过滤、连接、分组与排序的列
+
+    按保守的词法规则识别：只识别 列 = 值、列 IN (...)、列 >/< 值、列 BETWEEN、列 LIKE '前缀%'
+    以及 表.列 = 表.列 形式的条件，被函数包裹的列无法使用索引，不会被识别。
+
+    Args:
+        sql (str): SQL语句
+        tables (dict): 表名（小写） -> 表结构（含columns）
+
+    Returns:
+        dict: 表名 -> {"equality": [...], "join": [...], "range": [...], "group": [...], "order": [...]}，
+              equality为与常量比较的列，join为与其他表的列比较的列
+    """
+    tokens = _tokens(sql)
+    resolver = _Resolver(_parse_tables(tokens), tables)
+    usage = OrderedDict()
+
+    def add(ref, kind):
+        if ref is None:
+            return
+        table, column = ref
+        entry = usage.setdefault(table, {"equality": [], "join": [], "range": [], "group": [], "order": []})
+        if column not in entry[kind]:
+            entry[kind].append(column)
+
+    def operand_after(j):
+        """比较运算符之后的操作数：列引用、字面量或占位符"""
+        ref, end = resolver.resolve(tokens, j)
+        if ref is not None:
+            return "column", ref
+        if j < len(tokens):
+            kind, value = tokens[j]
+            if kind in ("string", "number") or value in ("?", "-", "+") or \
+                    (kind == "word" and value.upper() in ("NULL", "TRUE", "FALSE", "CURRENT_DATE", "NOW")) or \
+                    (kind == "other" and value in ("%", ":", "@")):
+                return "value", None
+        return None, None
+
+    i = 0
+    while i < len(tokens):
+        kind, value = tokens[i]
+        upper = value.upper() if kind == "word" else None
+
+        # GROUP BY / ORDER BY 列表
+        if upper in ("GROUP", "ORDER") and i + 1 < len(tokens) and tokens[i + 1][1].upper() == "BY":
+            target = "group" if upper == "GROUP" else "order"
+            j, depth = i + 2, 0
+            while j < len(tokens):
+                token = tokens[j]
+                if token[1] == "(":
+                    depth += 1
+                elif token[1] == ")":
+                    if depth == 0:
+                        break
+                    depth -= 1
+                elif depth == 0 and token[0] == "word" and token[1].upper() in _LIST_END:
+                    break
+                ref, end = resolver.resolve(tokens, j) if depth == 0 else (None, j)
+                if ref is not None:
+                    add(ref, target)
+                    j = end
+                    continue
+                j += 1
+            i = j
+            continue
+
+        ref, end = resolver.resolve(tokens, i)
+        if ref is None:
+            i += 1
+            continue
+        if i > 0 and tokens[i - 1][0] == "op":
+            # 值 = 列 的写法
+            previous = tokens[i - 2] if i > 1 else None
+            if previous is not None and previous[0] in ("string", "number") and tokens[i - 1][1] in ("=", "<=>"):
+                add(ref, "equality")
+            elif previous is not None and previous[0] in ("string", "number"):
+                add(ref, "range")
+        if end >= len(tokens):
+            break
+        next_kind, next_value = tokens[end]
+        next_upper = next_value.upper() if next_kind == "word" else None
+        if next_kind == "op":
+            operand, other = operand_after(end + 1)
+            if next_value in ("=", "<=>"):
+                if operand == "column":
+                    add(ref, "join")
+                    add(other, "join")
+                elif operand == "value":
+                    add(ref, "equality")
+            elif next_value in ("<", ">", "<=", ">=") and operand is not None:
+                add(ref, "range")
+        elif next_upper == "IN" and end + 1 < len(tokens) and tokens[end + 1][1] == "(":
+            # IN (SELECT ...) 同样可以按索引查找
+            add(ref, "equality")
+        elif next_upper == "BETWEEN":
+            add(ref, "range")
+        elif next_upper == "LIKE" and end + 1 < len(tokens) and tokens[end + 1][0] == "string":
+            pattern = tokens[end + 1][1][1:-1]
+            if pattern and pattern[0] not in "%_":
+                add(ref, "range")
+        elif next_upper == "IS" and end + 1 < len(tokens) and tokens[end + 1][1].upper() == "NULL":
+            add(ref, "equality")
+        i = end
+    return usage
+
+
+def propose_index(usage, include_join=True):
+    """
+    按 等值列 -> 分组/排序列 -> 第一个范围列 的顺序组成索引
+
+    Args:
+        usage (dict): extract_column_usage 中单个表的结果
+        include_join (bool): 是否包含连接列，表作为连接中的驱动表时连接列无法用于查找
+
+    Returns:
+        tuple: (索引列列表, 等值列数)
+    """
+    columns = list(usage["equality"])
+    if include_join:
+        columns += [c for c in usage["join"] if c not in columns]
+    equality_count = len(columns)
+    trailing = usage["group"] or usage["order"]
+    if trailing:
+        columns += [c for c in trailing if c not in columns]
+    else:
+        columns += [c for c in usage["range"] if c not in columns][:1]
+    return columns[:MAX_INDEX_COLUMNS], min(equality_count, MAX_INDEX_COLUMNS)
+
+
+def _covered(columns, equality_count, indexes):
+    """已有索引的前缀是否已经满足建议（等值列顺序不限）"""
+    for index in indexes:
+        existing = [c.lower() for c in index.get("columns", []) if c]
+        wanted = [c.lower() for c in columns]
+        if len(existing) < len(wanted):
+            continue
+        if set(existing[:equality_count]) == set(wanted[:equality_count]) and \
+                existing[equality_count:len(wanted)] == wanted[equality_count:]:
+            return True
+    return False
+
+
+def _plan_problems(row):
+    """执行计划中的一行存在的问题"""
+    problems = []
+    access = str(row.get("type") or "").upper()
+    extra = str(row.get("extra") or "")
+    if access == "ALL":
+        problems.append("full_scan")
+    elif access == "INDEX":
+        problems.append("full_index_scan")
+    if "Using filesort" in extra:
+        problems.append("filesort")
+    if "Using temporary" in extra:
+        problems.append("temporary")
+    return problems
+
+
+def _index_name(table, columns):
+    name = "idx_" + "_".join([table] + list(columns))
+    return re.sub(r"\W", "_", name)[:64]
+
+
+def _quote(name):
+    return "`" + name.replace("`", "``") + "`"
+
+
+def advise_indexes(templates, tables, limit=20):
+    """
+    根据慢查询模板的执行计划提出索引建议
+
+    每个有问题的计划行按其估计扫描行数分摊模板的总耗时，全表扫描按计划中
+    filtered（条件过滤后剩余行的百分比）估计索引可避免的比例，只有文件排序或临时表时按固定比例估计。
+    估计值只用于排序，实际效果需要在添加索引后对比。
+
+    Args:
+        templates (list): SlowQueryLog.templates() 的结果
+        tables (list): 表结构列表（含columns与indexes）
+        limit (int): 返回的建议数
+
+    Returns:
+        dict: suggestions（按估计节省时间排序的建议）、full_scans（各表的全表扫描统计）
+              与 unresolved（有问题但无法提出建议的模板）
+    """
+    table_map = {t["name"].lower(): t for t in tables}
+    suggestions = OrderedDict()
+    scans = {}
+    unresolved = []
+
+    for template in templates:
+        plan = template.get("plan")
+        if not plan:
+            continue
+        usage = None
+        aliases = None
+        total_rows = sum(max(1, int(row.get("rows") or 1)) for row in plan)
+        seen_selects = set()
+        for row in plan:
+            # 每个SELECT的第一行是连接中的驱动表
+            driving = row.get("id") not in seen_selects
+            seen_selects.add(row.get("id"))
+            problems = _plan_problems(row)
+            if not problems:
+                continue
+            if usage is None:
+                usage = extract_column_usage(template["example"], table_map)
+                aliases = _parse_tables(_tokens(template["example"]))
+            table = aliases.get(str(row.get("table") or "").lower())
+            share = max(1, int(row.get("rows") or 1)) / total_rows
+            if "full_scan" in problems or "full_index_scan" in problems:
+                try:
+                    filtered = float(row.get("filtered") or 100)
+                except (TypeError, ValueError):
+                    filtered = 100.0
+                fraction = max(0.1, 1 - filtered / 100)
+            else:
+                fraction = _SORT_SAVING
+            saved = template["total_time"] * share * fraction
+
+            if table and ("full_scan" in problems):
+                stats = scans.setdefault(table, {"table": table, "queries": 0, "executions": 0, "total_time": 0.0})
+                stats["queries"] += 1
+                stats["executions"] += template["count"]
+                stats["total_time"] += template["total_time"] * share
+
+            info = table_map.get(table.lower()) if table else None
+            columns, equality_count = propose_index(usage[table], include_join=not driving) \
+                if table in usage else ([], 0)
+            # InnoDB二级索引隐含主键列，末尾的主键列无需重复添加
+            primary = next((i["columns"] for i in (info or {}).get("indexes", []) if i.get("name") == "PRIMARY"), [])
+            if primary and len(columns) > len(primary) and \
+                    [c.lower() for c in columns[-len(primary):]] == [c.lower() for c in primary]:
+                columns = columns[:-len(primary)]
+                equality_count = min(equality_count, len(columns))
+            if not info or not columns:
+                unresolved.append({
+                    "fingerprint": template["fingerprint"],
+                    "template": template["template"],
+                    "table": row.get("table"),
+                    "problems": problems
+                })
+                continue
+            if _covered(columns, equality_count, info.get("indexes", [])):
+                continue
+
+            key = (table, tuple(columns))
+            suggestion = suggestions.get(key)
+            if suggestion is None:
+                name = _index_name(table, columns)
+                suggestion = suggestions[key] = {
+                    "table": table,
+                    "columns": columns,
+                    "ddl": f"ALTER TABLE {_quote(table)} ADD INDEX {_quote(name)} "
+                           f"({', '.join(_quote(c) for c in columns)})",
+                    "estimated_saving": 0.0,
+                    "executions": 0,
+                    "problems": [],
+                    "queries": []
+                }
+            suggestion["estimated_saving"] += saved
+            suggestion["executions"] += template["count"]
+            suggestion["problems"] = sorted(set(suggestion["problems"]) | set(problems))
+            if len(suggestion["queries"]) < 5 and template["fingerprint"] not in \
+                    [q["fingerprint"] for q in suggestion["queries"]]:
+                suggestion["queries"].append({
+                    "fingerprint": template["fingerprint"],
+                    "template": template["template"],
+                    "count": template["count"],
+                    "total_time": template["total_time"]
+                })
+
+    ranked = sorted(suggestions.values(), key=lambda s: s["estimated_saving"], reverse=True)[:limit]
+    for suggestion in ranked:
+        suggestion["estimated_saving"] = round(suggestion["estimated_saving"], 4)
+    full_scans = sorted(scans.values(), key=lambda s: s["total_time"], reverse=True)
+    for stats in full_scans:
+        stats["total_time"] = round(stats["total_time"], 4)
+    return {
+        "suggestions": ranked,
+        "full_scans": full_scans,
+        "unresolved": unresolved
+    }
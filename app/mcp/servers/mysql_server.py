@@ -5,16 +5,59 @@
 MySQL数据库MCP服务器实现
 """
 
+import os
+import re
 import json
+import time
+import hashlib
 import logging
-import pandas as pd
-from sqlalchemy import create_engine, text, MetaData, inspect
+import threading
+from sqlalchemy import create_engine, event, text, MetaData, inspect
 from sqlalchemy.exc import SQLAlchemyError
+from app.services.result_summarizer import ResultSummarizer
+from app.services.row_encoding import DEFAULT_ROW_FORMAT, encode_rows
+from app.mcp.servers.replica_router import ReplicaRouter
+from app.mcp.servers.sql_safety import classify_sql
+from app.mcp.servers.table_mirror import TableMirror
+from app.mcp.servers.schema_snapshot import SchemaSnapshotStore
+from app.mcp.servers.query_log import SlowQueryLog
+from app.mcp.servers.index_advisor import advise_indexes
+from app.mcp.servers.approximate import (
+    APPROX_METHODS, NotApproximable, plan_approximation, integer_primary_key, hashed_key,
+    range_sample, modulo_sample, rewrite_query, combine_samples, parse_sample_tables
+)
+from app.mcp.servers.pagination import (
+    CursorRegistry, HeldCursor, PageTokenError,
+    plan_keyset, build_keyset_query, encode_page_token, decode_page_token, query_hash
+)
+
+# MySQL协议中的列类型代码 -> 列类型（用于按结果的列描述确定导出类型）
+_FIELD_TYPES = {
+    0: "DECIMAL", 246: "DECIMAL",
+    1: "TINYINT", 2: "SMALLINT", 3: "INT", 8: "BIGINT", 9: "MEDIUMINT", 13: "YEAR",
+    4: "FLOAT", 5: "DOUBLE",
+    7: "TIMESTAMP", 12: "DATETIME", 10: "DATE", 14: "DATE", 11: "TIME",
+    16: "BIT", 255: "GEOMETRY",
+    15: "VARCHAR", 245: "JSON", 247: "ENUM", 248: "SET",
+}
+# 字符串与二进制共用的类型代码（TEXT与BLOB、CHAR与BINARY），需要结合表结构区分
+_AMBIGUOUS_FIELD_TYPES = frozenset({249, 250, 251, 252, 253, 254})
+# mysql-connector列描述第8项（列标志）中的UNSIGNED标志
+_UNSIGNED_FLAG = 32
+
+
+def _set_session_read_only(dbapi_connection, connection_record):
+    """新建的数据库连接之后的事务均为只读事务"""
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute("SET SESSION TRANSACTION READ ONLY")
+    finally:
+        cursor.close()
 
 class MySQLMCPServer:
     """MySQL MCP服务器类，实现MCP协议与MySQL数据库的交互"""
     
-    def __init__(self, host, user, password, database, port=3306):
+    def __init__(self, host, user, password, database, port=3306, snapshot_store=None, replicas=None):
         """
         初始化MySQL MCP服务器
         
@@ -24,117 +67,454 @@ class MySQLMCPServer:
             password (str): 数据库密码
             database (str): 数据库名称
             port (int, optional): 数据库端口. 默认为3306.
+            snapshot_store (SchemaSnapshotStore, optional): 元数据快照存储，用于重启后复用元数据
+            replicas (list, optional): 只读副本列表，每项包含host，可选port、user、password（默认与主库相同）
         """
         self.host = host
         self.user = user
         self.password = password
         self.database = database
         self.port = port
+        self.replicas = replicas or []
         self.engine = None
+        self.router = None
+        self.mirror = None
         self.logger = logging.getLogger(__name__)
         
+        # 需要解释结果时，摘要最多扫描的行数（超出max_rows的部分只参与统计，不返回），0表示只统计返回的行
+        self.digest_scan_limit = int(os.environ.get('RESULT_DIGEST_SCAN_LIMIT', 10000))
+        
+        # 元数据缓存：按表保存结构信息与指纹，结构变化时只重新获取变化的表
+        self.schema_check_interval = float(os.environ.get('SCHEMA_CHECK_INTERVAL', 30))
+        self.sample_cache_ttl = float(os.environ.get('SAMPLE_CACHE_TTL', 300))
+        self._schema_lock = threading.RLock()
+        self._table_cache = {}        # 表名 -> 表结构信息
+        self._table_states = {}       # 表名 -> 指纹查询结果（含fingerprint、update_time）
+        self._schema_checked_at = 0.0
+        self._sample_cache = {}       # 表名 -> (update_time, limit, 获取时间, 样本行)
+        self._value_cache = {}        # 表名 -> (update_time, 获取时间, {列名: [[取值, 行数], ...]})
+        self.schema_version = 0
+        self.last_schema_changes = {"added": [], "changed": [], "dropped": []}
+        self._prompt_cache = {}       # (格式, 表名) -> (指纹, 结构描述文本)
+        
+        # 元数据快照：首次刷新时加载，经指纹校验后只重新获取变化的表
+        self.snapshot_store = snapshot_store
+        self.snapshot_key = snapshot_store.key_for(host, port, database, user) if snapshot_store else None
+        self._snapshot_loaded = False
+        
+        # 分页查询的服务端游标（空闲超过PAGINATION_CURSOR_TTL秒自动关闭）
+        self.cursors = CursorRegistry(
+            ttl=float(os.environ.get('PAGINATION_CURSOR_TTL', 300)),
+            max_cursors=int(os.environ.get('PAGINATION_MAX_CURSORS', 16))
+        )
+        
+        # 慢查询日志：记录超过SLOW_QUERY_THRESHOLD秒的语句及其执行计划，用于索引建议
+        self.query_log = SlowQueryLog(
+            self.explain_query,
+            threshold=float(os.environ.get('SLOW_QUERY_THRESHOLD', 1.0)),
+            max_entries=int(os.environ.get('SLOW_QUERY_LOG_SIZE', 1000)),
+            max_templates=int(os.environ.get('SLOW_QUERY_MAX_TEMPLATES', 500))
+        )
+        
+        # 近似查询：抽样约APPROX_SAMPLE_ROWS行，分为APPROX_SUBSAMPLES个子样本估计误差；
+        # 抽样比例超过APPROX_MAX_FRACTION时直接精确执行
+        self.approx_sample_rows = int(os.environ.get('APPROX_SAMPLE_ROWS', 100000))
+        self.approx_subsamples = max(2, int(os.environ.get('APPROX_SUBSAMPLES', 20)))
+        self.approx_max_fraction = float(os.environ.get('APPROX_MAX_FRACTION', 0.5))
+        self.approx_sample_tables = parse_sample_tables(os.environ.get('APPROX_SAMPLE_TABLES'))
+        
         # 连接到MySQL数据库
         self._connect()
         
+        # 读请求路由：元数据获取与查询优先发往健康且负载最低的副本
+        self.router = ReplicaRouter(
+            self.engine,
+            self._connect_replicas(),
+            max_lag=float(os.environ.get('REPLICA_MAX_LAG', 30)),
+            check_interval=float(os.environ.get('REPLICA_CHECK_INTERVAL', 10)),
+            cooldown=float(os.environ.get('REPLICA_COOLDOWN', 30)),
+            include_primary=os.environ.get('REPLICA_INCLUDE_PRIMARY', 'false').lower() == 'true'
+        )
+        
+    def _create_engine(self, host, port, user, password):
+        """
+        创建SQLAlchemy引擎，使用mysql-connector-python
+
+        每个新连接都设置为只读事务模式：只读检查按语句文本进行，无法识别修改数据的自定义存储函数，
+        由数据库拒绝只读事务中的写操作。
+        """
+        connection_string = f"mysql+mysqlconnector://{user}:{password}@{host}:{port}/{self.database}"
+        engine = create_engine(connection_string, pool_pre_ping=bool(self.replicas))
+        event.listen(engine, "connect", _set_session_read_only)
+        return engine
+    
     def _connect(self):
         """建立与MySQL数据库的连接"""
         try:
-            # 创建SQLAlchemy引擎，使用mysql-connector-python
-            connection_string = f"mysql+mysqlconnector://{self.user}:{self.password}@{self.host}:{self.port}/{self.database}"
-            self.engine = create_engine(connection_string)
+            self.engine = self._create_engine(self.host, self.port, self.user, self.password)
             self.logger.info(f"成功连接到MySQL数据库: {self.host}:{self.port}/{self.database}")
         except SQLAlchemyError as e:
             self.logger.error(f"连接MySQL数据库失败: {str(e)}")
             raise
+    
+    def _connect_replicas(self):
+        """
+        为每个只读副本创建引擎
+        
+        Returns:
+            dict: 副本名称（host:port）-> SQLAlchemy引擎
+        """
+        engines = {}
+        for replica in self.replicas:
+            host = replica["host"]
+            port = replica.get("port") or self.port
+            engines[f"{host}:{port}"] = self._create_engine(
+                host, port, replica.get("user", self.user), replica.get("password", self.password)
+            )
+        if engines:
+            self.logger.info(f"已配置 {len(engines)} 个只读副本: {', '.join(engines)}")
+        return engines
+    
+    def enable_mirror(self, tables, directory=None, **options):
+        """
+        启用本地列式镜像，替换已有的镜像
+        
+        Args:
+            tables (list): 表名，或 {"name": 表名, "watermark": 水位列} 的列表
+            directory (str, optional): 镜像文件目录，为空时镜像保存在内存中
+            **options: TableMirror 的其他参数（refresh_interval、max_staleness等）
+        """
+        path = None
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            key = SchemaSnapshotStore.key_for(self.host, self.port, self.database, self.user)
+            path = os.path.join(directory, f"{key}.duckdb")
+        self.disable_mirror()
+        self.mirror = TableMirror(self, tables, path=path, **options)
+        self.logger.info(f"已启用本地列式镜像: {', '.join(str(t) for t in tables)}")
+    
+    def disable_mirror(self):
+        """停用本地列式镜像"""
+        if self.mirror is not None:
+            self.mirror.close()
+            self.mirror = None
+    
+    def get_mirror_stats(self):
+        """
+        获取本地列式镜像的状态
+        
+        Returns:
+            dict: 镜像状态，未启用时返回None
+        """
+        return self.mirror.stats() if self.mirror is not None else None
+    
+    def get_routing_stats(self):
+        """
+        获取主库与各副本的路由统计
+        
+        Returns:
+            list: 各节点状态
+        """
+        return self.router.stats()
+
+    def ping(self):
+        """
+        验证数据库连接可用，连接失败时抛出异常
+        """
+        with self.engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+
+    # 表级指纹查询：列数、列定义校验和、创建/更新时间
+    _TABLE_FINGERPRINT_SQL = text(
+        "SELECT t.TABLE_NAME, t.CREATE_TIME, t.UPDATE_TIME, t.TABLE_COMMENT, "
+        "COUNT(c.COLUMN_NAME), "
+        "COALESCE(SUM(CRC32(CONCAT_WS('|', c.ORDINAL_POSITION, c.COLUMN_NAME, c.COLUMN_TYPE, "
+        "c.IS_NULLABLE, c.COLUMN_KEY, IFNULL(c.COLUMN_DEFAULT, ''), c.COLUMN_COMMENT))), 0) "
+        "FROM INFORMATION_SCHEMA.TABLES t "
+        "LEFT JOIN INFORMATION_SCHEMA.COLUMNS c "
+        "ON c.TABLE_SCHEMA = t.TABLE_SCHEMA AND c.TABLE_NAME = t.TABLE_NAME "
+        "WHERE t.TABLE_SCHEMA = :schema AND t.TABLE_TYPE = 'BASE TABLE' "
+        "GROUP BY t.TABLE_NAME, t.CREATE_TIME, t.UPDATE_TIME, t.TABLE_COMMENT "
+        "ORDER BY t.TABLE_NAME"
+    )
+    
+    # 外键定义校验和
+    _FOREIGN_KEY_FINGERPRINT_SQL = text(
+        "SELECT TABLE_NAME, SUM(CRC32(CONCAT_WS('|', CONSTRAINT_NAME, COLUMN_NAME, "
+        "REFERENCED_TABLE_NAME, REFERENCED_COLUMN_NAME))) "
+        "FROM INFORMATION_SCHEMA.KEY_COLUMN_USAGE "
+        "WHERE TABLE_SCHEMA = :schema AND REFERENCED_TABLE_NAME IS NOT NULL "
+        "GROUP BY TABLE_NAME"
+    )
+    
+    def _fetch_table_states(self):
+        """
+        通过一次INFORMATION_SCHEMA查询获取所有表的指纹
+        
+        Returns:
+            dict: 表名 -> {"fingerprint", "update_time", "comment"}
+        """
+        states = {}
+        with self.router.connect() as conn:
+            foreign_keys = {
+                row[0]: row[1]
+                for row in conn.execute(self._FOREIGN_KEY_FINGERPRINT_SQL, {"schema": self.database})
+            }
+            for row in conn.execute(self._TABLE_FINGERPRINT_SQL, {"schema": self.database}):
+                table_name, create_time, update_time, comment, column_count, column_checksum = row
+                raw = f"{create_time}|{column_count}|{column_checksum}|{foreign_keys.get(table_name, 0)}|{comment}"
+                states[table_name] = {
+                    "fingerprint": hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16],
+                    "update_time": str(update_time) if update_time else None,
+                    "comment": comment or ""
+                }
+        return states
+    
+    def _introspect_table(self, inspector, table_name, table_comment=""):
+        """
+        获取单个表的结构信息
+        
+        Args:
+            inspector: SQLAlchemy Inspector
+            table_name (str): 表名
+            table_comment (str): 表注释
+            
+        Returns:
+            dict: 表结构信息
+        """
+        table_info = {"name": table_name, "columns": []}
+        
+        # 获取主键
+        primary_keys = inspector.get_pk_constraint(table_name).get('constrained_columns', [])
+        
+        # 获取索引（主键作为PRIMARY索引列出）
+        indexes = []
+        if primary_keys:
+            indexes.append({"name": "PRIMARY", "columns": list(primary_keys), "unique": True})
+        for index in inspector.get_indexes(table_name):
+            indexes.append({
+                "name": index.get('name'),
+                "columns": [c for c in index.get('column_names', []) if c],
+                "unique": bool(index.get('unique'))
+            })
+        
+        # 获取外键
+        foreign_keys = []
+        for fk in inspector.get_foreign_keys(table_name):
+            for col in fk['constrained_columns']:
+                foreign_keys.append({
+                    'column': col, 
+                    'references': {
+                        'table': fk['referred_table'], 
+                        'column': fk['referred_columns'][0]
+                    }
+                })
+        
+        # 获取列信息（get_columns已包含列注释，无需逐列查询）
+        columns = inspector.get_columns(table_name)
+        for column in columns:
+            col_name = column['name']
+            col_info = {
+                "name": col_name,
+                "type": str(column['type']),
+                "nullable": column.get('nullable', True),
+                "default": str(column.get('default', '')),
+                "is_primary": col_name in primary_keys
+            }
+            if column.get('autoincrement') is True:
+                col_info['auto_increment'] = True
+            
+            # 添加外键信息
+            for fk in foreign_keys:
+                if fk['column'] == col_name:
+                    col_info['foreign_key'] = fk['references']
+            
+            # 添加注释信息（如果有）
+            if column.get('comment'):
+                col_info['comment'] = column['comment']
+            
+            table_info["columns"].append(col_info)
+        
+        table_info["indexes"] = indexes
+        
+        # 添加表注释信息（如果有）
+        if table_comment:
+            table_info['comment'] = table_comment
+        
+        return table_info
+    
+    def refresh_schema(self, force=False, check_now=False):
+        """
+        增量刷新元数据缓存：比较各表指纹，只重新获取新增或变化的表，并移除已删除的表
+        
+        Args:
+            force (bool): 是否清空缓存后全量刷新
+            check_now (bool): 是否忽略检查间隔立即比较指纹
+            
+        Returns:
+            dict: 本次变化的表 {"added": [...], "changed": [...], "dropped": [...]}
+        """
+        with self._schema_lock:
+            now = time.monotonic()
+            recently_checked = now - self._schema_checked_at < self.schema_check_interval
+            if not force and not check_now and self._table_states and recently_checked:
+                return {"added": [], "changed": [], "dropped": []}
+            
+            if force:
+                self._table_cache.clear()
+                self._table_states.clear()
+                self._sample_cache.clear()
+                self._value_cache.clear()
+            elif not self._snapshot_loaded:
+                self._load_snapshot()
+            self._snapshot_loaded = True
+            
+            states = self._fetch_table_states()
+            added = [t for t in states if t not in self._table_states]
+            changed = [
+                t for t in states
+                if t in self._table_states and states[t]["fingerprint"] != self._table_states[t]["fingerprint"]
+            ]
+            dropped = [t for t in self._table_states if t not in states]
+            
+            if added or changed:
+                with self.router.connect() as conn:
+                    inspector = inspect(conn)
+                    for table_name in added + changed:
+                        self._table_cache[table_name] = self._introspect_table(
+                            inspector, table_name, states[table_name]["comment"]
+                        )
+                        self._sample_cache.pop(table_name, None)
+                        self._value_cache.pop(table_name, None)
+            for table_name in dropped:
+                self._table_cache.pop(table_name, None)
+                self._sample_cache.pop(table_name, None)
+                self._value_cache.pop(table_name, None)
+            
+            # 保持与INFORMATION_SCHEMA一致的表顺序
+            self._table_cache = {t: self._table_cache[t] for t in states if t in self._table_cache}
+            self._table_states = states
+            self._schema_checked_at = now
+            
+            changes = {"added": added, "changed": changed, "dropped": dropped}
+            if added or changed or dropped:
+                self.schema_version += 1
+                self.last_schema_changes = changes
+                self.logger.info(
+                    f"元数据已刷新: 新增{len(added)}个表, 变化{len(changed)}个表, 删除{len(dropped)}个表"
+                )
+                self._save_snapshot()
+            return changes
+    
+    def _load_snapshot(self):
+        """
+        从快照恢复元数据缓存，之后由指纹比较找出快照之后变化的表
+        
+        UPDATE_TIME不可用的表无法校验样本是否过期，不恢复其样本数据。
+        """
+        if not self.snapshot_store:
+            return
+        snapshot = self.snapshot_store.load(self.snapshot_key)
+        if not snapshot:
+            return
+        
+        for table_name, entry in snapshot.get("tables", {}).items():
+            self._table_states[table_name] = entry["state"]
+            self._table_cache[table_name] = entry["info"]
+        now = time.monotonic()
+        for table_name, entry in snapshot.get("samples", {}).items():
+            if entry.get("update_time") is not None and table_name in self._table_states:
+                self._sample_cache[table_name] = (entry["update_time"], entry["limit"], now, entry["rows"])
+        for item in snapshot.get("prompts", []):
+            schema_format, table_name, fingerprint, rendered = item
+            self._prompt_cache[(schema_format, table_name)] = (fingerprint, rendered)
+        self.schema_version = snapshot.get("schema_version", 0)
+        self.logger.info(f"已从快照恢复 {len(self._table_cache)} 个表的元数据")
+    
+    def _save_snapshot(self):
+        """将当前元数据缓存写入快照"""
+        if not self.snapshot_store:
+            return
+        with self._schema_lock:
+            snapshot = {
+                "database": self.database,
+                "schema_version": self.schema_version,
+                "tables": {
+                    t: {"state": self._table_states[t], "info": info}
+                    for t, info in self._table_cache.items() if t in self._table_states
+                },
+                "samples": {
+                    t: {"update_time": update_time, "limit": limit, "rows": rows}
+                    for t, (update_time, limit, _, rows) in self._sample_cache.items()
+                    if update_time is not None
+                },
+                "prompts": [
+                    [schema_format, table_name, fingerprint, rendered]
+                    for (schema_format, table_name), (fingerprint, rendered) in self._prompt_cache.items()
+                    if table_name in self._table_states
+                ]
+            }
+            self.snapshot_store.save(self.snapshot_key, snapshot)
+    
+    def get_prompt_cache(self):
+        """
+        获取本连接各表的结构描述缓存（含从快照恢复的部分）
+        
+        Returns:
+            dict: (格式, 表名) -> (指纹, 结构描述文本)
+        """
+        with self._schema_lock:
+            return dict(self._prompt_cache)
+    
+    def set_prompt_cache(self, entries):
+        """
+        保存本连接各表的结构描述文本，并写入快照
+        
+        Args:
+            entries (dict): (格式, 表名) -> (指纹, 结构描述文本)
+        """
+        with self._schema_lock:
+            if entries == self._prompt_cache:
+                return
+            self._prompt_cache = dict(entries)
+        self._save_snapshot()
+    
+    def get_table_fingerprints(self):
+        """
+        获取缓存中各表的指纹
+        
+        Returns:
+            dict: 表名 -> 指纹
+        """
+        with self._schema_lock:
+            return {t: state["fingerprint"] for t, state in self._table_states.items()}
 
     # MCP工具函数 - 获取数据库元数据
-    def get_database_metadata(self):
+    def get_database_metadata(self, force_refresh=False):
         """
         获取数据库的元数据信息，包括表名、列名、注释等
         
+        元数据按表缓存，每次调用最多每SCHEMA_CHECK_INTERVAL秒比较一次表指纹，
+        只重新获取发生变化的表。
+        
+        Args:
+            force_refresh (bool, optional): 是否强制全量刷新
+            
         Returns:
             str: 格式化的元数据信息
         """
         try:
-            # 获取SQLAlchemy元数据对象
-            metadata = {}
-            inspector = inspect(self.engine)
-            
-            # 获取所有表名
-            table_names = inspector.get_table_names()
-            metadata["tables"] = []
+            self.refresh_schema(force=force_refresh)
             
-            # 为每个表获取列信息
-            for table_name in table_names:
-                table_info = {"name": table_name, "columns": []}
-                
-                # 获取主键
-                primary_keys = inspector.get_pk_constraint(table_name).get('constrained_columns', [])
-                
-                # 获取外键
-                foreign_keys = []
-                for fk in inspector.get_foreign_keys(table_name):
-                    for col in fk['constrained_columns']:
-                        foreign_keys.append({
-                            'column': col, 
-                            'references': {
-                                'table': fk['referred_table'], 
-                                'column': fk['referred_columns'][0]
-                            }
-                        })
-                
-                # 获取索引
-                indices = inspector.get_indexes(table_name)
-                
-                # 获取列信息
-                columns = inspector.get_columns(table_name)
-                for column in columns:
-                    col_name = column['name']
-                    col_info = {
-                        "name": col_name,
-                        "type": str(column['type']),
-                        "nullable": column.get('nullable', True),
-                        "default": str(column.get('default', '')),
-                        "is_primary": col_name in primary_keys
-                    }
-                    
-                    # 添加外键信息
-                    for fk in foreign_keys:
-                        if fk['column'] == col_name:
-                            col_info['foreign_key'] = fk['references']
-                    
-                    # 添加注释信息（如果有）
-                    try:
-                        comment_query = text(
-                            f"SELECT COLUMN_COMMENT FROM INFORMATION_SCHEMA.COLUMNS "
-                            f"WHERE TABLE_SCHEMA = '{self.database}' AND TABLE_NAME = '{table_name}' "
-                            f"AND COLUMN_NAME = '{col_name}'"
-                        )
-                        with self.engine.connect() as conn:
-                            result = conn.execute(comment_query).fetchone()
-                            if result and result[0]:
-                                col_info['comment'] = result[0]
-                    except Exception as e:
-                        self.logger.warning(f"获取列注释失败: {str(e)}")
-                    
-                    table_info["columns"].append(col_info)
-                
-                # 添加表注释信息（如果有）
-                try:
-                    comment_query = text(
-                        f"SELECT TABLE_COMMENT FROM INFORMATION_SCHEMA.TABLES "
-                        f"WHERE TABLE_SCHEMA = '{self.database}' AND TABLE_NAME = '{table_name}'"
-                    )
-                    with self.engine.connect() as conn:
-                        result = conn.execute(comment_query).fetchone()
-                        if result and result[0]:
-                            table_info['comment'] = result[0]
-                except Exception as e:
-                    self.logger.warning(f"获取表注释失败: {str(e)}")
-                
-                metadata["tables"].append(table_info)
+            with self._schema_lock:
+                metadata = {"tables": []}
+                for table_name, table_info in self._table_cache.items():
+                    table = dict(table_info)
+                    table["fingerprint"] = self._table_states[table_name]["fingerprint"]
+                    metadata["tables"].append(table)
+                metadata["schema_version"] = self.schema_version
             
-            return json.dumps(metadata, ensure_ascii=False, indent=2)
+            return json.dumps(metadata, ensure_ascii=False, separators=(",", ":"))
         except Exception as e:
             self.logger.error(f"获取数据库元数据失败: {str(e)}")
             return json.dumps({"error": str(e)}, ensure_ascii=False)
@@ -144,6 +524,9 @@ class MySQLMCPServer:
         """
         获取每个表的样本数据
         
+        样本按表缓存，表的UPDATE_TIME未变化时直接复用
+        （UPDATE_TIME不可用时缓存SAMPLE_CACHE_TTL秒）。
+        
         Args:
             limit (int, optional): 每个表返回的样本数据数量. 默认为3.
             
@@ -151,17 +534,29 @@ class MySQLMCPServer:
             str: 包含所有表样本数据的JSON字符串
         """
         try:
-            # 获取所有表名
-            inspector = inspect(self.engine)
-            table_names = inspector.get_table_names()
+            self.refresh_schema()
+            with self._schema_lock:
+                states = dict(self._table_states)
             
             sample_data = {}
+            now = time.monotonic()
+            fetched = False
             
             # 为每个表获取样本数据
-            for table_name in table_names:
-                query = text(f"SELECT * FROM `{table_name}` LIMIT {limit}")
+            for table_name, state in states.items():
+                cached = self._sample_cache.get(table_name)
+                if cached:
+                    update_time, cached_limit, fetched_at, rows = cached
+                    fresh = update_time == state["update_time"] and (
+                        update_time is not None or now - fetched_at < self.sample_cache_ttl
+                    )
+                    if fresh and cached_limit == limit:
+                        sample_data[table_name] = rows
+                        continue
                 
-                with self.engine.connect() as conn:
+                query = text(f"SELECT * FROM `{table_name}` LIMIT {int(limit)}")
+                
+                with self.router.connect() as conn:
                     result = conn.execute(query)
                     columns = result.keys()
                     rows = []
@@ -170,103 +565,638 @@ class MySQLMCPServer:
                         rows.append(dict(zip(columns, row)))
                     
                     sample_data[table_name] = rows
+                    self._sample_cache[table_name] = (state["update_time"], limit, now, rows)
+                    fetched = fetched or state["update_time"] is not None
+            
+            if fetched:
+                self._save_snapshot()
             
-            return json.dumps(sample_data, ensure_ascii=False, indent=2, default=str)
+            return json.dumps(sample_data, ensure_ascii=False, separators=(",", ":"), default=str)
         except Exception as e:
             self.logger.error(f"获取样本数据失败: {str(e)}")
             return json.dumps({"error": str(e)}, ensure_ascii=False)
 
+    # MCP工具函数 - 获取低基数文本列的取值
+    def get_column_values(self, max_values=200, scan_rows=100000, max_length=100, timeout_ms=5000):
+        """
+        获取各表低基数文本列的取值及出现次数，用于将问题中的字面量对应到实际存储的值
+        
+        只统计CHAR/VARCHAR（长度不超过max_length）、ENUM与SET列，跳过主键与唯一索引列；
+        每列只扫描前scan_rows行，不同取值超过max_values个的列视为高基数列，不返回取值。
+        取值按表缓存，表的UPDATE_TIME未变化时直接复用（UPDATE_TIME不可用时缓存SAMPLE_CACHE_TTL秒）。
+        
+        Args:
+            max_values (int): 每列最多保留的取值数
+            scan_rows (int): 每列最多扫描的行数
+            max_length (int): 参与统计的文本列最大长度
+            timeout_ms (int): 单列统计的最长执行时间（毫秒）
+            
+        Returns:
+            str: {表名: {列名: [[取值, 行数], ...]}} 的JSON字符串
+        """
+        try:
+            self.refresh_schema()
+            with self._schema_lock:
+                states = dict(self._table_states)
+                tables = dict(self._table_cache)
+            
+            values = {}
+            now = time.monotonic()
+            for table_name, state in states.items():
+                cached = self._value_cache.get(table_name)
+                if cached:
+                    update_time, fetched_at, columns = cached
+                    if update_time == state["update_time"] and (
+                        update_time is not None or now - fetched_at < self.sample_cache_ttl
+                    ):
+                        values[table_name] = columns
+                        continue
+                
+                columns = {}
+                for column in self._dictionary_columns(tables.get(table_name), max_length):
+                    query = text(
+                        f"SELECT /*+ MAX_EXECUTION_TIME({int(timeout_ms)}) */ s.`{column}` AS v, COUNT(*) AS n "
+                        f"FROM (SELECT `{column}` FROM `{table_name}` LIMIT {int(scan_rows)}) s "
+                        f"WHERE s.`{column}` IS NOT NULL GROUP BY s.`{column}` ORDER BY n DESC LIMIT {int(max_values) + 1}"
+                    )
+                    try:
+                        with self.router.connect() as conn:
+                            rows = conn.execute(query).fetchall()
+                    except SQLAlchemyError as e:
+                        self.logger.warning(f"统计列取值失败 {table_name}.{column}: {str(e)}")
+                        continue
+                    if len(rows) > max_values:
+                        continue
+                    columns[column] = [
+                        [str(v), int(n)] for v, n in rows if v is not None and 0 < len(str(v)) <= max_length
+                    ]
+                values[table_name] = columns
+                self._value_cache[table_name] = (state["update_time"], now, columns)
+            
+            return json.dumps(values, ensure_ascii=False, separators=(",", ":"))
+        except Exception as e:
+            self.logger.error(f"获取列取值失败: {str(e)}")
+            return json.dumps({"error": str(e)}, ensure_ascii=False)
+    
+    @staticmethod
+    def _dictionary_columns(table_info, max_length):
+        """适合建立取值字典的列：较短的文本列与枚举列，不含主键与唯一索引列"""
+        if not table_info:
+            return []
+        unique = {
+            index["columns"][0] for index in table_info.get("indexes", [])
+            if index.get("unique") and len(index.get("columns", [])) == 1
+        }
+        columns = []
+        for column in table_info["columns"]:
+            column_type = column["type"].upper()
+            if column.get("is_primary") or column["name"] in unique:
+                continue
+            if column_type.startswith(("ENUM", "SET")):
+                columns.append(column["name"])
+                continue
+            match = re.match(r"^N?(?:VAR)?CHAR\s*\(\s*(\d+)", column_type)
+            if match and int(match.group(1)) <= max_length:
+                columns.append(column["name"])
+        return columns
+    
     # MCP工具函数 - 执行只读SQL查询
-    def execute_readonly_query(self, query, max_rows=100):
+    def execute_readonly_query(self, query, max_rows=100, row_format=DEFAULT_ROW_FORMAT, result_buffer=None,
+                               digest_scan=False):
         """
         在只读事务中执行SQL查询
         
         Args:
             query (str): 要执行的SQL查询语句
             max_rows (int, optional): 返回的最大行数. 默认为100.
+            row_format (str, optional): 行编码格式（objects/arrays/columns）. 默认为objects.
+            result_buffer (ResultBuffer, optional): 提供时将完整结果（直到缓冲区行数上限）写入该缓冲区
+            digest_scan (bool, optional): 是否为结果摘要多读取最多digest_scan_limit行（用于解释结果），
+                默认只根据返回的行生成摘要
             
         Returns:
             str: 查询结果的JSON字符串
         """
         try:
             # 检查SQL语句是否为只读
-            if not self._is_readonly_query(query):
-                error_msg = "不允许执行修改数据的SQL语句"
-                self.logger.warning(f"尝试执行非只读查询: {query}")
+            reason = self._readonly_violation(query)
+            if reason:
+                error_msg = f"不允许执行修改数据的SQL语句: {reason}"
+                self.logger.warning(f"尝试执行非只读查询（{reason}）: {query}")
                 return json.dumps({"error": error_msg}, ensure_ascii=False)
             
-            # 执行查询
-            with self.engine.connect() as conn:
+            # 涉及的表都已镜像且足够新时在本地列式镜像中执行
+            if self.mirror is not None:
+                mirrored = self.mirror.execute(query)
+                if mirrored is not None:
+                    columns, rows, refreshed_at, column_types = mirrored
+                    result_data = self._build_query_result(
+                        columns, rows, max_rows, row_format, result_buffer, column_types, digest_scan
+                    )
+                    result_data["source"] = "mirror"
+                    result_data["mirror_age"] = round(time.time() - refreshed_at, 1)
+                    return json.dumps(result_data, ensure_ascii=False, separators=(",", ":"), default=str)
+            
+            # 执行查询（有副本时发往负载最低的健康副本）
+            start = time.perf_counter()
+            with self.router.connect() as conn:
                 # 开启只读事务
                 with conn.begin():
                     # 执行查询
                     result = conn.execute(text(query))
-                    columns = result.keys()
-                    
-                    # 获取结果
-                    rows = []
-                    for idx, row in enumerate(result):
-                        if idx >= max_rows:
-                            break
-                        rows.append(dict(zip(columns, row)))
-                    
-                    # 构建结果
-                    result_data = {
-                        "columns": list(columns),
-                        "rows": rows,
-                        "rowCount": len(rows),
-                        "truncated": result.rowcount > max_rows if result.rowcount >= 0 else False
-                    }
-                    
-                    # 如果结果可以被Pandas处理，尝试添加基本的统计信息
-                    if len(rows) > 0:
-                        try:
-                            df = pd.DataFrame(rows)
-                            numeric_columns = df.select_dtypes(include=['number']).columns
-                            
-                            if not numeric_columns.empty:
-                                result_data["statistics"] = {}
-                                for col in numeric_columns:
-                                    result_data["statistics"][col] = {
-                                        "min": float(df[col].min()) if not df[col].isnull().all() else None,
-                                        "max": float(df[col].max()) if not df[col].isnull().all() else None,
-                                        "mean": float(df[col].mean()) if not df[col].isnull().all() else None,
-                                        "null_count": int(df[col].isnull().sum())
-                                    }
-                        except Exception as e:
-                            self.logger.warning(f"生成统计信息失败: {str(e)}")
-                    
-                    return json.dumps(result_data, ensure_ascii=False, indent=2, default=str)
+                    columns = list(result.keys())
+                    column_types = self._result_column_types(result, columns) if result_buffer is not None else None
+                    result_data = self._build_query_result(
+                        columns, result, max_rows, row_format, result_buffer, column_types, digest_scan
+                    )
+            self.query_log.record(query, time.perf_counter() - start, rows=result_data["rowCount"])
+            return json.dumps(result_data, ensure_ascii=False, separators=(",", ":"), default=str)
         except Exception as e:
             self.logger.error(f"执行查询失败: {str(e)}")
             return json.dumps({"error": str(e)}, ensure_ascii=False)
+    
+    def _build_query_result(self, columns, rows, max_rows, row_format, result_buffer=None, column_types=None,
+                            digest_scan=False):
+        """
+        读取查询结果并构建返回数据，同时对结果做流式摘要
+        
+        Args:
+            columns (list): 列名
+            rows (iterable): 结果行
+            max_rows (int): 返回的最大行数
+            row_format (str): 行编码格式
+            result_buffer (ResultBuffer, optional): 保存完整结果的缓冲区，读取行数不受摘要扫描上限限制
+            column_types (list, optional): 各列的MySQL类型，缓冲区写入磁盘时使用
+            digest_scan (bool, optional): 摘要是否统计返回行之外的行（最多digest_scan_limit行）
+            
+        Returns:
+            dict: 查询结果
+        """
+        raw_rows = []
+        summarizer = ResultSummarizer(columns)
+        scan_limit = max(max_rows, self.digest_scan_limit) if digest_scan else max_rows
+        truncated = False
+        scan_complete = True
+        exhausted = True
+        if result_buffer is not None:
+            result_buffer.start(columns, column_types)
+        for idx, row in enumerate(rows):
+            buffered = result_buffer is not None and result_buffer.append(row)
+            if idx >= scan_limit:
+                truncated = True
+                scan_complete = False
+                if buffered:
+                    continue
+                exhausted = False
+                break
+            summarizer.add(row)
+            if idx < max_rows:
+                raw_rows.append(tuple(row))
+            else:
+                truncated = True
+        if result_buffer is not None:
+            result_buffer.finish(complete=exhausted)
+        
+        # 构建结果
+        result_data = {
+            "columns": list(columns),
+            "rows": encode_rows(columns, raw_rows, row_format),
+            "rowFormat": row_format,
+            "rowCount": len(raw_rows),
+            "truncated": truncated,
+            "digest": summarizer.digest(complete=scan_complete)
+        }
+        
+        # 如果结果可以被Pandas处理，尝试添加基本的统计信息
+        if len(raw_rows) > 0:
+            try:
+                import pandas as pd
+                df = pd.DataFrame(raw_rows, columns=list(columns))
+                numeric_columns = df.select_dtypes(include=['number']).columns
+                
+                if not numeric_columns.empty:
+                    result_data["statistics"] = {}
+                    for col in numeric_columns:
+                        result_data["statistics"][col] = {
+                            "min": float(df[col].min()) if not df[col].isnull().all() else None,
+                            "max": float(df[col].max()) if not df[col].isnull().all() else None,
+                            "mean": float(df[col].mean()) if not df[col].isnull().all() else None,
+                            "null_count": int(df[col].isnull().sum())
+                        }
+            except Exception as e:
+                self.logger.warning(f"生成统计信息失败: {str(e)}")
+        
+        return result_data
 
-    def _is_readonly_query(self, query):
+    def _estimate_table_rows(self, table_name):
+        """表的估计行数（INFORMATION_SCHEMA.TABLES.TABLE_ROWS，InnoDB下为统计估计值）"""
+        query = text(
+            "SELECT TABLE_ROWS FROM INFORMATION_SCHEMA.TABLES "
+            "WHERE TABLE_SCHEMA = :schema AND TABLE_NAME = :table"
+        )
+        with self.router.connect() as conn:
+            row = conn.execute(query, {"schema": self.database, "table": table_name}).fetchone()
+        return int(row[0]) if row and row[0] is not None else 0
+    
+    def _exact_result(self, query, max_rows, row_format, reason):
+        """不适合近似执行时精确执行，结果中注明原因"""
+        result_data = json.loads(self.execute_readonly_query(query, max_rows=max_rows, row_format=row_format))
+        if "error" not in result_data:
+            result_data["approximate"] = False
+            result_data["approximation"] = {"reason": reason}
+        return json.dumps(result_data, ensure_ascii=False, separators=(",", ":"), default=str)
+    
+    # MCP工具函数 - 近似执行聚合查询
+    def execute_approximate_query(self, query, max_rows=100, row_format=DEFAULT_ROW_FORMAT, method="auto"):
         """
-        检查SQL查询是否为只读查询
+        在抽样子集上近似执行单表聚合查询
+        
+        COUNT与SUM按抽样比例放大，AVG直接在样本上计算，各聚合值附带95%置信区间半宽；
+        查询不适合近似执行（多表、MIN/MAX、DISTINCT等）或表较小时精确执行。
+        样本中没有出现的分组不会出现在近似结果中。
+        
+        Args:
+            query (str): 要执行的SQL查询语句
+            max_rows (int, optional): 返回的最大行数
+            row_format (str, optional): 行编码格式
+            method (str, optional): 抽样方式，auto（配置了抽样表时使用抽样表，否则按主键范围）、
+                range（主键范围）、modulo（主键取模）或sample_table（抽样表）
+            
+        Returns:
+            str: 查询结果的JSON字符串，approximate为true时approximation包含抽样方式、比例与各行误差
+        """
+        try:
+            if method not in APPROX_METHODS:
+                return json.dumps({"error": f"不支持的抽样方式: {method}"}, ensure_ascii=False)
+            reason = self._readonly_violation(query)
+            if reason:
+                self.logger.warning(f"尝试执行非只读查询（{reason}）: {query}")
+                return json.dumps({"error": f"不允许执行修改数据的SQL语句: {reason}"}, ensure_ascii=False)
+            
+            self.refresh_schema()
+            with self._schema_lock:
+                tables = dict(self._table_cache)
+            try:
+                plan = plan_approximation(query, tables)
+            except NotApproximable as e:
+                return self._exact_result(query, max_rows, row_format, str(e))
+            
+            table = plan["table"]
+            key = integer_primary_key(tables[table])
+            sample_table = self.approx_sample_tables.get(table)
+            if method == "auto":
+                method = "sample_table" if sample_table else "range"
+            
+            source = None
+            if method == "sample_table":
+                if not sample_table:
+                    return self._exact_result(query, max_rows, row_format, f"表 {table} 未配置抽样表")
+                source, fraction = sample_table
+                subsamples = self.approx_subsamples if key else 1
+                condition = None
+                sample_id = f"MOD({hashed_key(key)}, {subsamples})" if key else "0"
+            else:
+                if not key:
+                    return self._exact_result(query, max_rows, row_format, f"表 {table} 没有单列整数主键，无法按主键抽样")
+                table_rows = self._estimate_table_rows(table)
+                fraction = self.approx_sample_rows / table_rows if table_rows else 1.0
+                if fraction >= self.approx_max_fraction:
+                    return self._exact_result(query, max_rows, row_format, f"表 {table} 约{table_rows}行，直接精确执行")
+                subsamples = self.approx_subsamples
+                if method == "range":
+                    with self.router.connect() as conn:
+                        low, high = conn.execute(text(f"SELECT MIN(`{key}`), MAX(`{key}`) FROM `{table}`")).fetchone()
+                    if low is None:
+                        return self._exact_result(query, max_rows, row_format, f"表 {table} 为空")
+                    condition, sample_id, fraction = range_sample(key, int(low), int(high), fraction, subsamples)
+                    subsamples = min(subsamples, int(high) - int(low) + 1)
+                else:
+                    condition, sample_id, fraction = modulo_sample(key, fraction, subsamples)
+            
+            sampled_query = rewrite_query(plan, condition, sample_id, source)
+            start = time.perf_counter()
+            try:
+                with self.router.connect() as conn:
+                    with conn.begin():
+                        result = conn.execute(text(sampled_query))
+                        columns, rows = list(result.keys()), result.fetchall()
+            except SQLAlchemyError as e:
+                self.logger.warning(f"近似查询执行失败，改为精确执行: {str(e)}")
+                return self._exact_result(query, max_rows, row_format, f"抽样查询执行失败: {str(e)}")
+            self.query_log.record(sampled_query, time.perf_counter() - start, rows=len(rows))
+            
+            columns, rows, errors = combine_samples(plan, columns, rows, fraction, subsamples)
+            result_data = self._build_query_result(columns, rows, max_rows, row_format)
+            result_data["approximate"] = True
+            result_data["approximation"] = {
+                "method": method,
+                "fraction": round(fraction, 6),
+                "subsamples": subsamples,
+                "confidence": 0.95,
+                "errors": errors[:result_data["rowCount"]],
+                "sampled_sql": sampled_query,
+                "exact_sql": query
+            }
+            return json.dumps(result_data, ensure_ascii=False, separators=(",", ":"), default=str)
+        except Exception as e:
+            self.logger.error(f"近似执行查询失败: {str(e)}")
+            return json.dumps({"error": str(e)}, ensure_ascii=False)
+    
+    # MCP工具函数 - 按批次流式读取只读SQL查询结果
+    def _result_column_types(self, result, columns):
+        """
+        根据结果的列描述确定各列的MySQL类型
+        
+        驱动未提供类型代码，或类型代码不能区分文本与二进制时，使用表结构中同名列的类型（各表一致时）；
+        仍无法确定时为None（按文本处理）。列描述不含DECIMAL的精度与小数位数时（mysql-connector），
+        同样使用表结构中的类型，否则只返回DECIMAL，由导出时按数据确定小数位数。
+        
+        Args:
+            result: SQLAlchemy查询结果
+            columns (list): 列名
+            
+        Returns:
+            list: 各列的MySQL类型
+        """
+        try:
+            description = result.cursor.description or []
+        except Exception:
+            description = []
+        with self._schema_lock:
+            known = {}
+            for table_info in self._table_cache.values():
+                for column in table_info.get("columns", []):
+                    known.setdefault(column["name"].lower(), set()).add(column["type"])
+        
+        column_types = []
+        for index, name in enumerate(columns):
+            entry = description[index] if index < len(description) else None
+            type_code = entry[1] if entry else None
+            cached = known.get(str(name).lower(), set())
+            cached = next(iter(cached)) if len(cached) == 1 else None
+            if type_code in _FIELD_TYPES:
+                column_type = _FIELD_TYPES[type_code]
+                if column_type == "DECIMAL":
+                    if entry[4] is not None and entry[5] is not None:
+                        column_type = f"DECIMAL({entry[4]},{entry[5]})"
+                    elif cached and re.match(r"(?i)^(DECIMAL|NUMERIC)\s*\(", cached):
+                        column_type = cached
+                elif len(entry) > 7 and isinstance(entry[7], int) and entry[7] & _UNSIGNED_FLAG:
+                    column_type += " UNSIGNED"
+            elif type_code in _AMBIGUOUS_FIELD_TYPES:
+                column_type = cached if cached and re.match(r"(?i)^(BINARY|VARBINARY|\w*BLOB)\b", cached) else "TEXT"
+            else:
+                column_type = cached
+            column_types.append(column_type)
+        return column_types
+    
+    def iter_query_batches(self, query, batch_size=10000, with_types=False):
+        """
+        在只读事务中执行SQL查询，按批次产出原始行数据（驱动支持时使用流式结果）
+        
+        Args:
+            query (str): 要执行的SQL查询语句
+            batch_size (int, optional): 每批行数. 默认为10000.
+            with_types (bool, optional): 是否同时产出各列的MySQL类型（见 _result_column_types）
+            
+        Returns:
+            generator: 产出 (列名列表, 行元组列表) 的生成器，with_types为True时产出
+                (列名列表, 行元组列表, 列类型列表)，至少产出一批（可能为空）
+        """
+        reason = self._readonly_violation(query)
+        if reason:
+            self.logger.warning(f"尝试执行非只读查询（{reason}）: {query}")
+            raise ValueError(f"不允许执行修改数据的SQL语句: {reason}")
+        
+        with self.router.connect(stream=True) as conn:
+            with conn.begin():
+                result = conn.execute(text(query))
+                columns = list(result.keys())
+                column_types = self._result_column_types(result, columns) if with_types else None
+                first = True
+                while True:
+                    rows = [tuple(row) for row in result.fetchmany(batch_size)]
+                    if rows or first:
+                        yield (columns, rows, column_types) if with_types else (columns, rows)
+                    first = False
+                    if len(rows) < batch_size:
+                        break
+    
+    # MCP工具函数 - 分页执行只读SQL查询
+    def execute_paginated_query(self, query, page_size=100, page_token=None, row_format=DEFAULT_ROW_FORMAT):
+        """
+        分页执行只读SQL查询
+        
+        单表且结果包含主键的查询使用键集分页（按主键续读，无需保持连接）；
+        其他查询在服务端保持游标，每次请求只读取一页。
+        
+        Args:
+            query (str): 要执行的SQL查询语句
+            page_size (int, optional): 每页行数. 默认为100.
+            page_token (str, optional): 上一页返回的续页令牌，首页为空
+            row_format (str, optional): 行编码格式（objects/arrays/columns）. 默认为objects.
+            
+        Returns:
+            str: 当前页结果的JSON字符串，包含next_page_token（无下一页时为None）
+        """
+        try:
+            # 检查SQL语句是否为只读
+            reason = self._readonly_violation(query)
+            if reason:
+                error_msg = f"不允许执行修改数据的SQL语句: {reason}"
+                self.logger.warning(f"尝试执行非只读查询（{reason}）: {query}")
+                return json.dumps({"error": error_msg}, ensure_ascii=False)
+            
+            page_size = max(1, int(page_size))
+            digest = query_hash(query)
+            state = decode_page_token(page_token) if page_token else None
+            if state and state.get("h") != digest:
+                raise PageTokenError("续页令牌与查询语句不匹配")
+            
+            if state is None:
+                self.refresh_schema()
+                with self._schema_lock:
+                    primary_keys = plan_keyset(query, self._table_cache)
+                if primary_keys:
+                    state = {"m": "keyset", "h": digest, "pk": primary_keys, "last": None, "offset": 0}
+            elif state.get("m") == "keyset":
+                # 令牌未签名，主键列不能取自令牌：按当前表结构重新规划，不一致时令牌作废
+                with self._schema_lock:
+                    primary_keys = plan_keyset(query, self._table_cache)
+                last = state.get("last")
+                if not primary_keys or state.get("pk") != primary_keys or \
+                        not isinstance(last, list) or len(last) != len(primary_keys):
+                    raise PageTokenError("续页令牌无效，请重新执行查询")
+                state = {"m": "keyset", "h": digest, "pk": primary_keys, "last": last,
+                         "offset": int(state.get("offset") or 0)}
+            
+            start = time.perf_counter()
+            if state and state.get("m") == "keyset":
+                result_data = self._fetch_keyset_page(query, state, page_size)
+            else:
+                result_data = self._fetch_cursor_page(query, state, digest, page_size)
+            self.query_log.record(query, time.perf_counter() - start, rows=len(result_data["rows"]))
+            
+            result_data["rows"] = encode_rows(result_data["columns"], result_data["rows"], row_format)
+            result_data["rowFormat"] = row_format
+            return json.dumps(result_data, ensure_ascii=False, separators=(",", ":"), default=str)
+        except PageTokenError as e:
+            return json.dumps({"error": str(e), "page_token_expired": True}, ensure_ascii=False)
+        except Exception as e:
+            self.logger.error(f"分页查询失败: {str(e)}")
+            return json.dumps({"error": str(e)}, ensure_ascii=False)
+    
+    def _fetch_keyset_page(self, query, state, page_size):
+        """按主键位置读取一页"""
+        sql, params = build_keyset_query(query, state["pk"], state["last"], page_size)
+        reason = self._readonly_violation(sql)
+        if reason:
+            raise PageTokenError(f"续页令牌无效: {reason}")
+        with self.router.connect() as conn:
+            with conn.begin():
+                result = conn.execute(text(sql), params)
+                columns = list(result.keys())
+                fetched = result.fetchall()
+        
+        has_more = len(fetched) > page_size
+        rows = [tuple(row) for row in fetched[:page_size]]
+        next_token = None
+        if has_more:
+            last_row = dict(zip(columns, rows[-1]))
+            next_state = dict(state)
+            next_state["last"] = [last_row[pk] for pk in state["pk"]]
+            next_state["offset"] = state["offset"] + len(rows)
+            next_token = encode_page_token(next_state)
+        
+        return {
+            "columns": columns,
+            "rows": rows,
+            "rowCount": len(rows),
+            "offset": state["offset"],
+            "truncated": has_more,
+            "page_mode": "keyset",
+            "next_page_token": next_token
+        }
+    
+    def _fetch_cursor_page(self, query, state, digest, page_size):
+        """从服务端保持的游标读取一页"""
+        if state:
+            cursor_id = state.get("c")
+            cursor = self.cursors.get(cursor_id)
+            if cursor is None or cursor.query_digest != digest:
+                raise PageTokenError("续页令牌已过期，请重新执行查询")
+        else:
+            # 打开新游标（驱动支持时使用流式结果，避免一次性读取全部数据）
+            endpoint, conn = self.router.acquire(stream=True)
+            try:
+                conn.begin()
+                result = conn.execute(text(query))
+            except Exception as e:
+                conn.close()
+                self.router.release(endpoint, e)
+                raise
+            # 游标保持期间计入该节点的未完成请求
+            cursor = HeldCursor(conn, result, digest, on_close=lambda: self.router.release(endpoint))
+            cursor_id = self.cursors.add(cursor)
+        
+        with cursor.lock:
+            # 多取一行判断是否还有数据，多取的行留到下一页
+            fetched = cursor.pending + cursor.result.fetchmany(page_size + 1 - len(cursor.pending))
+            cursor.pending = fetched[page_size:]
+            fetched = fetched[:page_size]
+            offset = cursor.offset
+            cursor.offset += len(fetched)
+            has_more = bool(cursor.pending)
+        
+        rows = [tuple(row) for row in fetched]
+        next_token = None
+        if has_more:
+            next_token = encode_page_token({"m": "cursor", "h": digest, "c": cursor_id})
+        else:
+            self.cursors.remove(cursor_id)
+        
+        return {
+            "columns": cursor.columns,
+            "rows": rows,
+            "rowCount": len(rows),
+            "offset": offset,
+            "truncated": has_more,
+            "page_mode": "cursor",
+            "next_page_token": next_token
+        }
+    
+    def explain_query(self, query):
+        """
+        获取只读查询的执行计划
         
         Args:
             query (str): SQL查询语句
             
         Returns:
-            bool: 如果是只读查询返回True，否则返回False
+            list: 执行计划的各行（键为小写列名，如table、type、rows、filtered、extra）
+        """
+        reason = self._readonly_violation(query)
+        if reason:
+            raise ValueError(f"不允许执行修改数据的SQL语句: {reason}")
+        with self.router.connect() as conn:
+            with conn.begin():
+                result = conn.execute(text(f"EXPLAIN {query}"))
+                return [{key.lower(): value for key, value in row.items()} for row in result.mappings()]
+    
+    def get_slow_queries(self, limit=100):
         """
-        # 转换为小写以便进行不区分大小写的比较
-        query_lower = query.lower().strip()
+        获取慢查询日志
         
-        # 定义可能修改数据的SQL关键字
-        modifying_keywords = [
-            'insert', 'update', 'delete', 'drop', 'alter', 'create', 
-            'truncate', 'replace', 'rename', 'grant', 'revoke'
-        ]
+        Args:
+            limit (int): 返回的最近慢查询条数
+            
+        Returns:
+            dict: 最近的慢查询（entries）与按总耗时排序的语句模板（templates，含执行计划）
+        """
+        return {
+            "threshold": self.query_log.threshold,
+            "entries": self.query_log.entries(limit),
+            "templates": self.query_log.templates()
+        }
+    
+    def get_index_advice(self, limit=20):
+        """
+        根据慢查询的执行计划给出索引建议
         
-        # 检查查询是否以这些关键字开头
-        for keyword in modifying_keywords:
-            if query_lower.startswith(keyword):
-                return False
+        Args:
+            limit (int): 返回的建议数
             
-            # 也检查是否在查询中间包含这些关键字（可能是多语句查询）
-            if f"; {keyword} " in query_lower:
-                return False
+        Returns:
+            dict: 按估计节省时间排序的索引建议与全表扫描统计
+        """
+        metadata = json.loads(self.get_database_metadata())
+        if "error" in metadata:
+            raise RuntimeError(metadata["error"])
+        templates = self.query_log.templates()
+        advice = advise_indexes(templates, metadata["tables"], limit=limit)
+        advice["templates"] = len(templates)
+        advice["pending_plans"] = sum(1 for t in templates if t["plan"] is None and t["plan_error"] is None)
+        return advice
+    
+    def close(self):
+        """关闭所有服务端游标、本地镜像、慢查询日志并释放连接池"""
+        self.cursors.close_all()
+        self.disable_mirror()
+        self.query_log.close()
+        if self.router is not None:
+            self.router.close()
+        if self.engine is not None:
+            self.engine.dispose()
+    
+    def _readonly_violation(self, query):
+        """
+        检查SQL查询是否为只读查询
         
-        return True 
\ No newline at end of file
+        Args:
+            query (str): SQL查询语句
+            
+        Returns:
+            str: 不是只读查询时返回原因，只读查询返回None
+        """
+        classification = classify_sql(query)
+        return None if classification.readonly else classification.reason 
\ No newline at end of file
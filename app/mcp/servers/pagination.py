@@ -0,0 +1,292 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+查询结果分页：续页令牌、键集分页规划与服务端游标管理
+"""
+
+import re
+import json
+import time
+import base64
+import hashlib
+import secrets
+import logging
+import threading
+from collections import OrderedDict
+
+# 简单单表查询：SELECT 列 FROM 表 [别名] [WHERE ...]
+_SIMPLE_SELECT_PATTERN = re.compile(
+    r'^\s*select\s+(?P<columns>.+?)\s+from\s+`?(?P<table>[\w$]+)`?'
+    r'(?:\s+(?:as\s+)?(?!where\b)(?P<alias>[\w$]+))?'
+    r'(?P<rest>\s+where\s+.+)?\s*$',
+    re.IGNORECASE | re.DOTALL
+)
+
+# 出现这些关键字时不使用键集分页
+_KEYSET_BLOCKERS = re.compile(
+    r'\b(join|group\s+by|order\s+by|limit|union|having|distinct|for\s+update|lock\s+in|into)\b|\(',
+    re.IGNORECASE
+)
+
+
+class PageTokenError(Exception):
+    """续页令牌无效或已过期"""
+
+
+def query_hash(query):
+    """
+    计算查询语句的哈希，用于校验续页令牌与查询是否匹配
+
+    Args:
+        query (str): SQL查询语句
+
+    Returns:
+        str: 哈希值
+    """
+    normalized = " ".join(query.strip().rstrip(";").split())
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()[:16]
+
+
+def encode_page_token(state):
+    """
+    将分页状态编码为不透明的续页令牌
+
+    Args:
+        state (dict): 分页状态
+
+    Returns:
+        str: 续页令牌
+    """
+    raw = json.dumps(state, ensure_ascii=False, separators=(",", ":"), default=str)
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_page_token(token):
+    """
+    解码续页令牌
+
+    Args:
+        token (str): 续页令牌
+
+    Returns:
+        dict: 分页状态
+    """
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        return json.loads(base64.urlsafe_b64decode(padded.encode("ascii")).decode("utf-8"))
+    except Exception:
+        raise PageTokenError("续页令牌无效")
+
+
+def plan_keyset(query, tables):
+    """
+    判断查询能否使用键集分页
+
+    仅支持不含JOIN、GROUP BY、ORDER BY、LIMIT、子查询的单表查询，且结果包含该表的全部主键列。
+
+    Args:
+        query (str): SQL查询语句
+        tables (dict): 表名 -> 表结构信息（含columns及is_primary）
+
+    Returns:
+        list: 主键列名列表，不能使用键集分页时返回None
+    """
+    query = query.strip().rstrip(";")
+    match = _SIMPLE_SELECT_PATTERN.match(query)
+    if not match:
+        return None
+    if _KEYSET_BLOCKERS.search(match.group("columns")) or _KEYSET_BLOCKERS.search(match.group("rest") or ""):
+        return None
+
+    table = tables.get(match.group("table"))
+    if not table:
+        return None
+    primary_keys = [c["name"] for c in table.get("columns", []) if c.get("is_primary")]
+    if not primary_keys:
+        return None
+
+    # 结果中必须包含主键列
+    columns = match.group("columns").strip()
+    if columns != "*" and not re.fullmatch(r'[\w$]+\.\*', columns):
+        selected = set()
+        for item in columns.split(","):
+            name = item.strip().split(".")[-1].strip("`")
+            selected.add(name)
+        if not all(pk in selected for pk in primary_keys):
+            return None
+    return primary_keys
+
+
+def build_keyset_query(query, primary_keys, last_key, page_size):
+    """
+    构造键集分页查询，将原查询作为派生表并按主键排序
+
+    Args:
+        query (str): 原查询
+        primary_keys (list): 主键列
+        last_key (list): 上一页最后一行的主键值，首页为None
+        page_size (int): 每页行数（多取一行用于判断是否还有下一页）
+
+    Returns:
+        tuple: (SQL文本, 绑定参数)
+    """
+    inner = query.strip().rstrip(";")
+    key_columns = ", ".join("`" + pk.replace("`", "``") + "`" for pk in primary_keys)
+    sql = f"SELECT * FROM ({inner}) AS _wenshu_page"
+    params = {"_page_limit": int(page_size) + 1}
+    if last_key is not None:
+        placeholders = ", ".join(f":_page_k{i}" for i in range(len(primary_keys)))
+        sql += f" WHERE ({key_columns}) > ({placeholders})"
+        params.update({f"_page_k{i}": value for i, value in enumerate(last_key)})
+    sql += f" ORDER BY {key_columns} LIMIT :_page_limit"
+    return sql, params
+
+
+class HeldCursor:
+    """服务端保持的查询游标，独占一个数据库连接"""
+
+    def __init__(self, connection, result, query_digest, on_close=None):
+        self.connection = connection
+        self.result = result
+        self.columns = list(result.keys())
+        self.query_digest = query_digest
+        self.last_used = time.monotonic()
+        self.offset = 0
+        self.pending = []
+        self.lock = threading.Lock()
+        self.on_close = on_close
+
+    def close(self):
+        """关闭游标，回滚只读事务并将连接归还连接池"""
+        try:
+            self.result.close()
+            if self.connection.in_transaction():
+                self.connection.rollback()
+        finally:
+            self.connection.close()
+            if self.on_close:
+                self.on_close()
+
+
+class CursorRegistry:
+    """
+    服务端游标注册表
+
+    游标空闲超过ttl秒后关闭（有游标时后台线程每sweep_interval秒检查一次，客户端不再翻页时
+    也会释放连接与事务）；数量超过上限时关闭最久未使用的游标。
+    """
+
+    def __init__(self, ttl=300, max_cursors=16, sweep_interval=None):
+        """
+        初始化游标注册表
+
+        Args:
+            ttl (float): 游标最长空闲时间（秒）
+            max_cursors (int): 最多保持的游标数
+            sweep_interval (float, optional): 后台检查超时游标的间隔（秒），默认为ttl的四分之一（1~60秒）
+        """
+        self.logger = logging.getLogger(__name__)
+        self.ttl = float(ttl)
+        self.max_cursors = int(max_cursors)
+        if sweep_interval is None:
+            sweep_interval = min(max(self.ttl / 4, 1.0), 60.0)
+        self.sweep_interval = float(sweep_interval)
+        self._cursors = OrderedDict()
+        self._lock = threading.Lock()
+        self._stop = None
+        self._sweeper = None
+
+    def _close_quietly(self, cursor_id, cursor):
+        try:
+            cursor.close()
+        except Exception as e:
+            self.logger.warning(f"关闭游标 {cursor_id} 失败: {str(e)}")
+
+    def expire(self):
+        """关闭所有超时的游标"""
+        now = time.monotonic()
+        expired = []
+        with self._lock:
+            for cursor_id, cursor in list(self._cursors.items()):
+                if now - cursor.last_used > self.ttl and not cursor.lock.locked():
+                    expired.append((cursor_id, self._cursors.pop(cursor_id)))
+        for cursor_id, cursor in expired:
+            self.logger.info(f"游标 {cursor_id} 空闲超过 {self.ttl} 秒，已关闭")
+            self._close_quietly(cursor_id, cursor)
+
+    def _start_sweeper(self):
+        """启动后台清理线程（已启动时不重复启动）"""
+        with self._lock:
+            if self._sweeper is not None:
+                return
+            self._stop = threading.Event()
+            self._sweeper = threading.Thread(target=self._sweep_loop, args=(self._stop,),
+                                             name="cursor-expiry", daemon=True)
+            self._sweeper.start()
+
+    def _sweep_loop(self, stop):
+        while not stop.wait(self.sweep_interval):
+            try:
+                self.expire()
+            except Exception as e:
+                self.logger.warning(f"清理超时游标失败: {str(e)}")
+
+    def add(self, cursor):
+        """
+        注册游标
+
+        Args:
+            cursor (HeldCursor): 游标
+
+        Returns:
+            str: 游标ID
+        """
+        self.expire()
+        self._start_sweeper()
+        cursor_id = secrets.token_urlsafe(12)
+        evicted = []
+        with self._lock:
+            self._cursors[cursor_id] = cursor
+            while len(self._cursors) > self.max_cursors:
+                evicted.append(self._cursors.popitem(last=False))
+        for old_id, old_cursor in evicted:
+            self.logger.info(f"游标数量超过上限，关闭最久未使用的游标 {old_id}")
+            self._close_quietly(old_id, old_cursor)
+        return cursor_id
+
+    def get(self, cursor_id):
+        """
+        获取游标并刷新其使用时间
+
+        Args:
+            cursor_id (str): 游标ID
+
+        Returns:
+            HeldCursor: 游标，不存在或已过期时返回None
+        """
+        self.expire()
+        with self._lock:
+            cursor = self._cursors.get(cursor_id)
+            if cursor:
+                cursor.last_used = time.monotonic()
+                self._cursors.move_to_end(cursor_id)
+            return cursor
+
+    def remove(self, cursor_id):
+        """关闭并移除游标"""
+        with self._lock:
+            cursor = self._cursors.pop(cursor_id, None)
+        if cursor:
+            self._close_quietly(cursor_id, cursor)
+
+    def close_all(self):
+        """关闭所有游标并停止后台清理线程"""
+        with self._lock:
+            cursors = list(self._cursors.items())
+            self._cursors.clear()
+            if self._stop is not None:
+                self._stop.set()
+            self._stop = self._sweeper = None
+        for cursor_id, cursor in cursors:
+            self._close_quietly(cursor_id, cursor)
@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+慢查询日志：记录执行时间超过阈值的语句，按去除字面量后的语句模板聚合，
+并在后台为每个模板获取一次EXPLAIN执行计划，供索引建议使用
+"""
+
+import re
+import time
+import hashlib
+import logging
+import threading
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# 去除字面量：字符串、数字与IN列表替换为占位符
+_LITERAL_PATTERNS = (
+    (re.compile(r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.|\"\")*\""), "?"),
+    (re.compile(r"(?<![\w`.])-?\d+(?:\.\d+)?(?:e[+-]?\d+)?\b", re.IGNORECASE), "?"),
+    (re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.IGNORECASE), "IN (?)"),
+    (re.compile(r"\s+"), " "),
+)
+
+
+def normalize_query(sql):
+    """
+    去除SQL中的字面量与多余空白，得到语句模板
+
+    Args:
+        sql (str): SQL语句
+
+    Returns:
+        str: 语句模板，如 SELECT * FROM t WHERE id = ?
+    """
+    text = sql.strip().rstrip(";").strip()
+    for pattern, replacement in _LITERAL_PATTERNS:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+def query_fingerprint(sql):
+    """
+    语句模板的指纹，只有字面量不同的语句指纹相同
+
+    Args:
+        sql (str): SQL语句
+
+    Returns:
+        str: 16位十六进制指纹
+    """
+    return hashlib.sha1(normalize_query(sql).lower().encode("utf-8")).hexdigest()[:16]
+
+
+class SlowQueryLog:
+    """
+    单个连接的慢查询日志
+
+    - 最近的慢查询逐条保存（最多max_entries条）
+    - 按语句模板聚合次数与耗时，最多保留max_templates个模板（淘汰最久未出现的）
+    - 每个模板首次出现时在后台获取一次EXPLAIN，不增加查询本身的延迟
+    """
+
+    def __init__(self, explain, threshold=1.0, max_entries=1000, max_templates=500):
+        """
+        初始化慢查询日志
+
+        Args:
+            explain (callable): 以SQL为参数返回执行计划行（dict列表）的函数
+            threshold (float): 慢查询阈值（秒）
+            max_entries (int): 保留的慢查询条数
+            max_templates (int): 保留的语句模板数
+        """
+        self.logger = logging.getLogger(__name__)
+        self.explain = explain
+        self.threshold = float(threshold)
+        self.max_templates = max(1, int(max_templates))
+        self._entries = deque(maxlen=max(1, int(max_entries)))
+        self._templates = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="explain")
+
+    def record(self, sql, duration, rows=None):
+        """
+        记录一次执行，未超过阈值时忽略
+
+        Args:
+            sql (str): SQL语句
+            duration (float): 执行耗时（秒）
+            rows (int, optional): 读取的行数
+        """
+        if duration < self.threshold:
+            return
+        fingerprint = query_fingerprint(sql)
+        now = time.time()
+        with self._lock:
+            self._entries.append({
+                "time": now,
+                "fingerprint": fingerprint,
+                "sql": sql,
+                "duration": round(duration, 4),
+                "rows": rows
+            })
+            template = self._templates.pop(fingerprint, None)
+            new = template is None
+            if new:
+                template = {
+                    "fingerprint": fingerprint,
+                    "template": normalize_query(sql),
+                    "example": sql,
+                    "count": 0,
+                    "total_time": 0.0,
+                    "max_time": 0.0,
+                    "first_seen": now,
+                    "last_seen": now,
+                    "plan": None,
+                    "plan_error": None
+                }
+            template["count"] += 1
+            template["total_time"] += duration
+            template["max_time"] = max(template["max_time"], duration)
+            template["last_seen"] = now
+            self._templates[fingerprint] = template
+            while len(self._templates) > self.max_templates:
+                self._templates.popitem(last=False)
+        if new:
+            try:
+                self._executor.submit(self._explain, template)
+            except RuntimeError:
+                # 日志已关闭
+                pass
+
+    def _explain(self, template):
+        """获取模板示例语句的执行计划"""
+        try:
+            plan = self.explain(template["example"])
+            with self._lock:
+                template["plan"] = plan
+        except Exception as e:
+            self.logger.warning(f"获取执行计划失败: {str(e)}")
+            with self._lock:
+                template["plan_error"] = str(e)
+
+    def entries(self, limit=100):
+        """
+        最近的慢查询，按时间倒序
+
+        Args:
+            limit (int): 返回条数
+
+        Returns:
+            list: 慢查询记录
+        """
+        with self._lock:
+            return list(reversed(self._entries))[:limit]
+
+    def templates(self):
+        """
+        按总耗时排序的语句模板
+
+        Returns:
+            list: 各模板的次数、总耗时、最大耗时与执行计划
+        """
+        with self._lock:
+            templates = [dict(t, total_time=round(t["total_time"], 4), max_time=round(t["max_time"], 4))
+                         for t in self._templates.values()]
+        templates.sort(key=lambda t: t["total_time"], reverse=True)
+        return templates
+
+    def clear(self):
+        """清空日志"""
+        with self._lock:
+            self._entries.clear()
+            self._templates.clear()
+
+    def close(self):
+        """停止获取执行计划"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,255 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+只读副本路由：按最少未完成请求在健康的副本间分配读请求，
+副本故障或复制延迟过大时回退到其他副本或主库
+"""
+
+import time
+import random
+import logging
+import threading
+from contextlib import contextmanager
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError, InterfaceError, DBAPIError
+
+
+def is_connection_error(error):
+    """
+    判断异常是否为连接层面的故障（而非SQL本身的错误）
+
+    Args:
+        error (Exception): 异常
+
+    Returns:
+        bool: 连接故障返回True
+    """
+    if isinstance(error, DBAPIError) and error.connection_invalidated:
+        return True
+    return isinstance(error, (OperationalError, InterfaceError))
+
+
+class _Endpoint:
+    """一个可路由的数据库节点（主库或副本）"""
+
+    def __init__(self, name, engine, is_primary=False):
+        self.name = name
+        self.engine = engine
+        self.is_primary = is_primary
+        self.outstanding = 0
+        self.healthy = True
+        self.lag = None
+        self.down_until = 0.0
+        self.last_error = None
+        self.last_check = None
+        self.requests = 0
+        self.failures = 0
+
+    def available(self, now):
+        return self.healthy and now >= self.down_until
+
+    def stats(self):
+        return {
+            "name": self.name,
+            "primary": self.is_primary,
+            "healthy": self.healthy,
+            "cooling_down": time.monotonic() < self.down_until,
+            "outstanding": self.outstanding,
+            "lag_seconds": None if self.lag == float("inf") else self.lag,
+            "replication_stopped": self.lag == float("inf"),
+            "requests": self.requests,
+            "failures": self.failures,
+            "last_error": self.last_error,
+            "last_check": self.last_check
+        }
+
+
+class ReplicaRouter:
+    """
+    读请求路由器
+
+    - 优先在健康的副本中选择未完成请求最少的一个（相同时随机选择）
+    - 后台定期检查副本：连接失败或复制延迟超过max_lag秒的副本不再接收请求，恢复后自动加入
+    - 获取连接失败时将该副本冷却cooldown秒，并依次尝试其他副本，最后回退到主库
+    - 没有配置副本时所有请求都发往主库
+    """
+
+    def __init__(self, primary_engine, replica_engines=None, max_lag=30, check_interval=10,
+                 cooldown=30, include_primary=False):
+        """
+        初始化路由器
+
+        Args:
+            primary_engine: 主库SQLAlchemy引擎
+            replica_engines (dict, optional): 副本名称 -> SQLAlchemy引擎
+            max_lag (float): 可接受的最大复制延迟（秒）
+            check_interval (float): 健康检查间隔（秒）
+            cooldown (float): 副本连接失败后的冷却时间（秒）
+            include_primary (bool): 副本健康时主库是否也参与分担读请求
+        """
+        self.logger = logging.getLogger(__name__)
+        self.primary = _Endpoint("primary", primary_engine, is_primary=True)
+        self.replicas = [_Endpoint(name, engine) for name, engine in (replica_engines or {}).items()]
+        self.max_lag = float(max_lag)
+        self.check_interval = float(check_interval)
+        self.cooldown = float(cooldown)
+        self.include_primary = include_primary
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._checker = None
+
+        if self.replicas:
+            self._checker = threading.Thread(target=self._check_loop, name="replica-health", daemon=True)
+            self._checker.start()
+
+    def _candidates(self):
+        """按优先顺序排列的可用节点：未完成请求最少的副本在前，主库兜底"""
+        now = time.monotonic()
+        pool = [e for e in self.replicas if e.available(now)]
+        if self.include_primary or not pool:
+            pool.append(self.primary)
+        random.shuffle(pool)
+        pool.sort(key=lambda e: e.outstanding)
+        if self.primary not in pool:
+            pool.append(self.primary)
+        return pool
+
+    def _mark_failure(self, endpoint, error):
+        endpoint.failures += 1
+        endpoint.last_error = str(error)
+        if not endpoint.is_primary:
+            endpoint.down_until = time.monotonic() + self.cooldown
+            self.logger.warning(f"副本 {endpoint.name} 连接失败，冷却{self.cooldown}秒: {str(error)}")
+
+    def acquire(self, stream=False):
+        """
+        选择节点并打开连接，连接失败时依次尝试其他节点
+
+        Args:
+            stream (bool): 是否使用流式结果
+
+        Returns:
+            tuple: (节点, 连接)，使用完毕后需调用 release
+        """
+        last_error = None
+        with self._lock:
+            candidates = self._candidates()
+        for endpoint in candidates:
+            with self._lock:
+                endpoint.outstanding += 1
+                endpoint.requests += 1
+            try:
+                conn = endpoint.engine.connect()
+                if stream:
+                    conn = conn.execution_options(stream_results=True)
+                return endpoint, conn
+            except Exception as e:
+                self.release(endpoint)
+                if not is_connection_error(e):
+                    raise
+                self._mark_failure(endpoint, e)
+                last_error = e
+        raise last_error
+
+    def release(self, endpoint, error=None):
+        """
+        释放节点上的一个未完成请求
+
+        Args:
+            endpoint: acquire 返回的节点
+            error (Exception, optional): 请求中发生的异常，连接故障会使节点进入冷却
+        """
+        with self._lock:
+            endpoint.outstanding -= 1
+        if error is not None and is_connection_error(error):
+            self._mark_failure(endpoint, error)
+
+    @contextmanager
+    def connect(self, stream=False):
+        """
+        获取一个读连接的上下文管理器
+
+        Args:
+            stream (bool): 是否使用流式结果
+        """
+        endpoint, conn = self.acquire(stream=stream)
+        error = None
+        try:
+            yield conn
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            try:
+                conn.close()
+            finally:
+                self.release(endpoint, error)
+
+    def _check_replica(self, endpoint):
+        """检查副本的连通性与复制延迟"""
+        endpoint.last_check = time.time()
+        try:
+            with endpoint.engine.connect() as conn:
+                conn.execute(text("SELECT 1"))
+                lag = self._replication_lag(conn)
+        except Exception as e:
+            if endpoint.healthy:
+                self.logger.warning(f"副本 {endpoint.name} 健康检查失败: {str(e)}")
+            endpoint.healthy = False
+            endpoint.last_error = str(e)
+            return
+
+        endpoint.lag = lag
+        healthy = lag is None or lag <= self.max_lag
+        if healthy != endpoint.healthy:
+            if healthy:
+                self.logger.info(f"副本 {endpoint.name} 已恢复")
+            else:
+                self.logger.warning(f"副本 {endpoint.name} 复制延迟 {lag} 秒，暂停路由")
+        endpoint.healthy = healthy
+        if healthy:
+            endpoint.down_until = 0.0
+
+    def _replication_lag(self, conn):
+        """
+        查询复制延迟（秒）
+
+        Returns:
+            float: 延迟秒数；不是副本或无权限查询时返回None（视为可用）；
+                复制线程已停止时返回无穷大
+        """
+        for statement, column in (("SHOW REPLICA STATUS", "Seconds_Behind_Source"),
+                                  ("SHOW SLAVE STATUS", "Seconds_Behind_Master")):
+            try:
+                row = conn.execute(text(statement)).mappings().first()
+            except OperationalError:
+                raise
+            except Exception:
+                continue
+            if row is None:
+                return None
+            value = row.get(column)
+            return float("inf") if value is None else float(value)
+        return None
+
+    def _check_loop(self):
+        while not self._stop.is_set():
+            for endpoint in self.replicas:
+                self._check_replica(endpoint)
+            self._stop.wait(self.check_interval)
+
+    def stats(self):
+        """
+        获取各节点的路由统计
+
+        Returns:
+            list: 各节点状态
+        """
+        return [self.primary.stats()] + [e.stats() for e in self.replicas]
+
+    def close(self):
+        """停止健康检查并释放副本连接池"""
+        self._stop.set()
+        for endpoint in self.replicas:
+            endpoint.engine.dispose()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+元数据快照存储，将表结构、指纹、样本数据与提示词文本持久化到本地磁盘，
+使服务重启后无需重新获取全部元数据
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+import tempfile
+
+# 快照文件格式版本，结构变化时递增，旧版本快照将被忽略
+SNAPSHOT_FORMAT = 3
+
+
+class SchemaSnapshotStore:
+    """
+    本地元数据快照存储
+
+    每个连接（按主机、端口、数据库、用户区分）对应一个JSON文件，
+    写入时先写临时文件再原子替换，多个工作进程并发写入不会产生不完整的文件。
+    快照中包含样本数据，文件仅对当前用户可读写。
+    """
+
+    def __init__(self, directory, max_age=7 * 24 * 3600):
+        """
+        初始化快照存储
+
+        Args:
+            directory (str): 快照目录
+            max_age (float): 快照最长有效时间（秒），超过后不再加载
+        """
+        self.logger = logging.getLogger(__name__)
+        self.directory = directory
+        self.max_age = float(max_age)
+
+    @classmethod
+    def from_env(cls):
+        """
+        根据环境变量创建快照存储，SCHEMA_SNAPSHOT_DIR为空时不启用
+
+        Returns:
+            SchemaSnapshotStore: 快照存储，未启用时返回None
+        """
+        directory = os.environ.get('SCHEMA_SNAPSHOT_DIR', os.path.join('data', 'schema_snapshots'))
+        if not directory:
+            return None
+        return cls(directory, max_age=float(os.environ.get('SCHEMA_SNAPSHOT_MAX_AGE', 7 * 24 * 3600)))
+
+    @staticmethod
+    def key_for(host, port, database, user):
+        """
+        根据连接参数生成快照键（不包含密码）
+
+        Args:
+            host (str): 数据库主机
+            port (int): 数据库端口
+            database (str): 数据库名称
+            user (str): 数据库用户名
+
+        Returns:
+            str: 快照键
+        """
+        raw = f"mysql://{user}@{host}:{port}/{database}"
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:20]
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def load(self, key):
+        """
+        读取快照
+
+        Args:
+            key (str): 快照键
+
+        Returns:
+            dict: 快照内容，不存在、已过期或无法解析时返回None
+        """
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                snapshot = json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            self.logger.warning(f"读取元数据快照 {path} 失败: {str(e)}")
+            return None
+
+        if snapshot.get("format") != SNAPSHOT_FORMAT:
+            return None
+        if time.time() - snapshot.get("saved_at", 0) > self.max_age:
+            self.logger.info(f"元数据快照 {path} 已过期，忽略")
+            return None
+        return snapshot
+
+    def save(self, key, snapshot):
+        """
+        写入快照
+
+        Args:
+            key (str): 快照键
+            snapshot (dict): 快照内容
+        """
+        snapshot = dict(snapshot, format=SNAPSHOT_FORMAT, saved_at=time.time())
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(prefix=f".{key}.", suffix=".tmp", dir=self.directory)
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump(snapshot, f, ensure_ascii=False, separators=(",", ":"), default=str)
+                os.replace(tmp_path, self._path(key))
+            except Exception:
+                os.unlink(tmp_path)
+                raise
+        except Exception as e:
+            self.logger.warning(f"写入元数据快照失败: {str(e)}")
+
+    def delete(self, key):
+        """
+        删除快照
+
+        Args:
+            key (str): 快照键
+        """
+        try:
+            os.unlink(self._path(key))
+        except FileNotFoundError:
+            pass
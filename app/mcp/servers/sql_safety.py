@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+SQL安全检查：基于词法扫描的只读语句分类
+
+一次扫描去除注释与字符串字面量、按分号切分语句，按语句类型白名单判断是否只读，
+并拒绝只读语句中带副作用的子句（SELECT ... INTO、加锁读取）与函数（LOAD_FILE、SLEEP等）。
+词法检查无法识别修改数据的自定义存储函数，执行查询的连接另外设置为只读事务（见 MySQLMCPServer._create_engine）。
+"""
+
+import re
+from functools import lru_cache
+from collections import namedtuple
+
+# 词法规则，按顺序匹配；不闭合的字符串、标识符与注释单独识别为unterminated
+_TOKEN_RULES = r"""
+    (?P<space>\s+)
+  | (?P<line_comment>(?:--(?=\s|$)|\#)[^\n]*)
+  | (?P<exec_comment>/\*!\d*)
+  | (?P<block_comment>/\*.*?\*/)
+  | (?P<string>{string})
+  | (?P<identifier>`(?:[^`]|``)*`)
+  | (?P<unterminated>['"`]|/\*)
+  | (?P<semicolon>;)
+  | (?P<word>[A-Za-z_][\w$]*)
+  | (?P<lparen>\()
+  | (?P<other>.)
+"""
+# 字符串字面量分别按反斜杠转义（MySQL默认）与NO_BACKSLASH_ESCAPES模式解析，
+# 能完整解析的模式都判定为只读时才放行，避免利用转义差异隐藏语句
+_TOKEN_PATTERNS = tuple(
+    re.compile(_TOKEN_RULES.format(string=string), re.VERBOSE | re.DOTALL)
+    for string in (
+        r"""'(?:[^'\\]|\\.|'')*'|"(?:[^"\\]|\\.|"")*\"""",
+        r"""'(?:[^']|'')*'|"(?:[^"]|"")*\"""",
+    )
+)
+
+# 允许的语句类型（语句的第一个关键字）
+READONLY_STATEMENTS = frozenset({"SELECT", "WITH", "SHOW", "DESCRIBE", "DESC", "EXPLAIN", "TABLE", "VALUES"})
+
+# 只读且内容无需进一步检查的语句类型（如 SHOW CREATE TABLE）
+_INFO_STATEMENTS = frozenset({"SHOW", "DESCRIBE", "DESC"})
+
+# 出现在语句任意位置即视为修改数据的关键字（如 WITH ... DELETE、EXPLAIN UPDATE），均为MySQL保留字
+_WRITE_KEYWORDS = frozenset({
+    "INSERT", "UPDATE", "DELETE", "REPLACE", "DROP", "ALTER", "CREATE", "TRUNCATE", "RENAME",
+    "GRANT", "REVOKE", "LOAD", "CALL", "SET", "LOCK", "UNLOCK",
+})
+
+# 同名函数调用不视为写操作，如 REPLACE(str, a, b)、INSERT(str, pos, len, new)、TRUNCATE(x, d)
+_FUNCTION_KEYWORDS = frozenset({"REPLACE", "INSERT", "TRUNCATE"})
+
+# 有副作用或可能被滥用的函数
+_UNSAFE_FUNCTIONS = frozenset({
+    "LOAD_FILE", "SLEEP", "BENCHMARK", "GET_LOCK", "RELEASE_LOCK", "RELEASE_ALL_LOCKS",
+    "MASTER_POS_WAIT", "SOURCE_POS_WAIT", "WAIT_FOR_EXECUTED_GTID_SET",
+})
+
+SqlClassification = namedtuple("SqlClassification", ["readonly", "statement_types", "reason"])
+
+
+def _tokenize(sql, pattern):
+    """
+    将SQL切分为语句，每条语句为 [(关键字大写, 是否后接左括号)] 列表
+
+    注释、字符串与反引号标识符不产生关键字；/*! */ 可执行注释中的内容按SQL处理。
+
+    Returns:
+        tuple: (语句列表, 是否存在未闭合的字符串或注释)
+    """
+    statements = [[]]
+    current = statements[0]
+    pending = None
+    for match in pattern.finditer(sql):
+        kind = match.lastgroup
+        if kind == "word":
+            if pending is not None:
+                current.append((pending, False))
+            pending = match.group().upper()
+        elif kind == "lparen":
+            if pending is not None:
+                current.append((pending, True))
+                pending = None
+            elif not current:
+                # 以括号开头的查询，如 (SELECT ...) UNION (SELECT ...)
+                continue
+        elif kind in ("space", "line_comment", "block_comment", "exec_comment"):
+            continue
+        elif kind == "unterminated":
+            return statements, True
+        else:
+            if pending is not None:
+                current.append((pending, False))
+                pending = None
+            if kind == "semicolon":
+                current = []
+                statements.append(current)
+    if pending is not None:
+        current.append((pending, False))
+    return [s for s in statements if s], False
+
+
+def _check_statement(tokens):
+    """检查单条语句，返回不安全的原因，安全时返回None"""
+    statement_type = tokens[0][0]
+    if statement_type not in READONLY_STATEMENTS:
+        return f"不允许的语句类型: {statement_type}"
+    if statement_type in _INFO_STATEMENTS:
+        return None
+
+    previous = None
+    for word, is_call in tokens:
+        if is_call and word in _UNSAFE_FUNCTIONS:
+            return f"不允许调用函数: {word}"
+        if previous == "FOR" and word in ("UPDATE", "SHARE") or word == "LOCK":
+            return "不允许加锁读取"
+        if word == "INTO":
+            return "不允许 SELECT ... INTO"
+        if word in _WRITE_KEYWORDS:
+            is_function = is_call and word in _FUNCTION_KEYWORDS
+            is_charset = word == "SET" and previous == "CHARACTER"
+            if not is_function and not is_charset:
+                return f"语句中包含修改操作: {word}"
+        previous = word
+    return None
+
+
+@lru_cache(maxsize=1024)
+def classify_sql(sql):
+    """
+    判断SQL是否只读
+
+    结果按语句文本缓存，分页续读等重复检查同一语句时不再重新扫描。
+    包含反斜杠时分别按两种转义模式解析：某种模式下存在未闭合的字符串（如 'it\\'s' 在
+    NO_BACKSLASH_ESCAPES模式下），服务器按该模式执行只会报语法错误，该模式不参与判断；
+    能完整解析的模式的结论不一致（一种只读、另一种不是）时拒绝。
+
+    Args:
+        sql (str): SQL文本，可包含多条语句
+
+    Returns:
+        SqlClassification: readonly为是否只读，statement_types为各语句类型，reason为拒绝原因
+    """
+    types = ()
+    parsed = False
+    # 两种转义模式只在包含反斜杠时才可能得出不同的结果
+    patterns = _TOKEN_PATTERNS if "\\" in sql else _TOKEN_PATTERNS[:1]
+    for pattern in patterns:
+        statements, unterminated = _tokenize(sql, pattern)
+        if unterminated:
+            continue
+        parsed = True
+        if not statements:
+            return SqlClassification(False, types, "没有可执行的语句")
+
+        types = types or tuple(tokens[0][0] for tokens in statements)
+        for tokens in statements:
+            reason = _check_statement(tokens)
+            if reason:
+                return SqlClassification(False, types, reason)
+    if not parsed:
+        return SqlClassification(False, types, "存在未闭合的字符串、标识符或注释")
+    return SqlClassification(True, types, None)
+
+
+def is_readonly_sql(sql):
+    """
+    判断SQL是否只读
+
+    Args:
+        sql (str): SQL文本
+
+    Returns:
+        bool: 只读返回True
+    """
+    return classify_sql(sql).readonly
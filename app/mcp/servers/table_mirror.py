@@ -0,0 +1,562 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+热点表的本地列式镜像：将选定的表复制到内嵌的DuckDB中并定期增量刷新，
+只读查询涉及的表都已镜像且足够新时在本地执行，否则回退到MySQL
+"""
+
+import re
+import json
+import time
+import logging
+import threading
+
+from app.mcp.servers.sql_safety import classify_sql
+from app.services.result_export import column_array
+
+# 词法规则：用于识别查询涉及的表，并将MySQL的引号写法转换为DuckDB写法
+_TOKEN_PATTERN = re.compile(r"""
+    (?P<space>\s+)
+  | (?P<exec_comment>/\*!)
+  | (?P<comment>(?:--(?=\s|$)|\#)[^\n]*|/\*.*?\*/)
+  | (?P<string>'(?:[^'\\]|\\.|'')*'|"(?:[^"\\]|\\.|"")*")
+  | (?P<quoted>`(?:[^`]|``)*`)
+  | (?P<word>[A-Za-z_][\w$]*)
+  | (?P<other>.)
+""", re.VERBOSE | re.DOTALL)
+
+# 表名之后不会作为别名出现的关键字
+_CLAUSE_KEYWORDS = frozenset({
+    "WHERE", "GROUP", "ORDER", "HAVING", "LIMIT", "JOIN", "INNER", "LEFT", "RIGHT", "FULL", "CROSS",
+    "NATURAL", "STRAIGHT_JOIN", "ON", "USING", "UNION", "EXCEPT", "INTERSECT", "WINDOW", "FOR", "LOCK",
+    "INTO", "USE", "FORCE", "IGNORE", "PARTITION", "AS",
+})
+
+# MySQL列类型 -> DuckDB列类型，按顺序匹配
+_TYPE_RULES = (
+    (re.compile(r"^BIGINT\b.*\bUNSIGNED\b"), "UBIGINT"),
+    (re.compile(r"^(TINYINT|SMALLINT|MEDIUMINT|INT|INTEGER|BIGINT|YEAR)\b"), "BIGINT"),
+    (re.compile(r"^(FLOAT|DOUBLE|REAL)\b"), "DOUBLE"),
+    (re.compile(r"^DATETIME\b|^TIMESTAMP\b"), "TIMESTAMP"),
+    (re.compile(r"^DATE\b"), "DATE"),
+    (re.compile(r"^TIME\b"), "INTERVAL"),
+    (re.compile(r"^(BINARY|VARBINARY|TINYBLOB|BLOB|MEDIUMBLOB|LONGBLOB|BIT)\b"), "BLOB"),
+)
+_DECIMAL_PATTERN = re.compile(r"^(?:DECIMAL|NUMERIC)\s*\(\s*(\d+)\s*(?:,\s*(\d+)\s*)?\)")
+
+# 在MySQL与DuckDB中结果相同的函数，调用其他函数的查询回退到MySQL
+# （如CONCAT遇到NULL、DAYOFWEEK的编号、AVG与除法的结果类型、ROUND对浮点数的舍入方式均不同）
+_SAFE_FUNCTIONS = frozenset({
+    "COUNT", "SUM", "MIN", "MAX", "COALESCE", "IFNULL", "NULLIF", "ABS", "LOWER", "UPPER",
+})
+
+# 可以出现在括号之前、不是函数调用的关键字
+_PAREN_KEYWORDS = frozenset({
+    "SELECT", "FROM", "JOIN", "ON", "USING", "WHERE", "AND", "OR", "NOT", "IN", "EXISTS", "AS", "BY",
+    "HAVING", "WHEN", "THEN", "ELSE", "CASE", "DISTINCT", "ALL", "ANY", "SOME", "WITH", "UNION", "IS",
+    "BETWEEN",
+})
+
+# 两种数据库中含义不同的运算关键字（LIKE的大小写规则、DIV/MOD/XOR、日期加INTERVAL的结果类型等）
+_UNSAFE_KEYWORDS = frozenset({
+    "LIKE", "REGEXP", "RLIKE", "SOUNDS", "ESCAPE", "DIV", "MOD", "XOR", "INTERVAL", "COLLATE", "BINARY",
+})
+
+# 结果相同的符号运算符（单个字符），其他符号（如 || ^ / %）回退到MySQL
+_SAFE_SYMBOLS = frozenset("0123456789.,()*+-=<>!;")
+
+
+def _require_duckdb():
+    """导入duckdb，未安装时给出明确提示"""
+    try:
+        import duckdb
+        return duckdb
+    except ImportError:
+        raise ImportError("本地列式镜像需要安装duckdb")
+
+
+def duckdb_type(mysql_type):
+    """
+    将MySQL列类型转换为DuckDB列类型
+
+    整数统一为BIGINT（TINYINT(1)也按整数处理，与MySQL返回的值一致），未识别的类型按文本保存。
+
+    Args:
+        mysql_type (str): MySQL列类型，如 DECIMAL(10, 2)
+
+    Returns:
+        str: DuckDB列类型
+    """
+    mysql_type = (mysql_type or "").upper().strip()
+    match = _DECIMAL_PATTERN.match(mysql_type)
+    if match:
+        precision, scale = int(match.group(1)), int(match.group(2) or 0)
+        return f"DECIMAL({precision},{scale})" if precision <= 38 else "DOUBLE"
+    if mysql_type.startswith(("DECIMAL", "NUMERIC")):
+        return "DECIMAL(18,0)"
+    for pattern, target in _TYPE_RULES:
+        if pattern.match(mysql_type):
+            return target
+    return "VARCHAR"
+
+
+def _arrow_type(pa, column_type):
+    """将镜像表的DuckDB列类型转换为写入时使用的Arrow列类型"""
+    match = re.match(r"^DECIMAL\((\d+),(\d+)\)$", column_type)
+    if match:
+        return pa.decimal128(int(match.group(1)), int(match.group(2)))
+    return {
+        "BIGINT": pa.int64(),
+        "UBIGINT": pa.uint64(),
+        "DOUBLE": pa.float64(),
+        "TIMESTAMP": pa.timestamp("us"),
+        "DATE": pa.date32(),
+        "INTERVAL": pa.duration("us"),
+        "BLOB": pa.binary(),
+    }.get(column_type, pa.string())
+
+
+def _mysql_type(column_type):
+    """将DuckDB结果列类型转换为对应的MySQL类型名称（用于结果缓冲区确定列类型）"""
+    column_type = str(column_type).upper()
+    if column_type == "HUGEINT":
+        return "DECIMAL(38,0)"  # 整数列SUM的结果类型
+    if column_type in ("TINYINT", "SMALLINT", "INTEGER", "BIGINT", "BOOLEAN"):
+        return "BIGINT"
+    if column_type == "UBIGINT":
+        return "BIGINT UNSIGNED"
+    if column_type == "INTERVAL":
+        return "TIME"
+    return column_type
+
+
+def _quote(name):
+    """DuckDB标识符"""
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _mysql_quote(name):
+    """MySQL标识符"""
+    return "`" + name.replace("`", "``") + "`"
+
+
+def _sql_literal(value):
+    """将水位值转换为MySQL字面量"""
+    if isinstance(value, bool):
+        return str(int(value))
+    if isinstance(value, (int, float)):
+        return repr(value)
+    text = value.isoformat(sep=" ") if hasattr(value, "isoformat") and not isinstance(value, str) else str(value)
+    return "'" + text.replace("\\", "\\\\").replace("'", "''") + "'"
+
+
+def _safe_operations(tokens):
+    """
+    检查查询中的函数调用与运算符是否都在允许列表中
+
+    Args:
+        tokens (list): (类型, 文本) 列表，类型为word（未加引号的词）、name（加引号的标识符）、string或other
+
+    Returns:
+        bool: 是否可以在镜像中执行
+    """
+    for index, (kind, text) in enumerate(tokens):
+        following = tokens[index + 1] if index + 1 < len(tokens) else (None, "")
+        if kind == "word":
+            word = text.upper()
+            if word in _UNSAFE_KEYWORDS:
+                return False
+            # 函数调用：词之后是括号（DuckDB允许函数名与括号之间有空白）
+            if following[1] == "(" and word not in _PAREN_KEYWORDS and word not in _SAFE_FUNCTIONS:
+                return False
+        elif kind == "other" and text == "!":
+            if following[1] != "=":
+                return False
+        elif kind == "other" and text == "<" and following[1] == "=" and \
+                index + 2 < len(tokens) and tokens[index + 2][1] == ">":
+            return False  # <=>
+    return True
+
+
+def translate_query(sql):
+    """
+    将MySQL查询转换为DuckDB查询，并找出查询涉及的表
+
+    只处理单条SELECT/WITH语句；包含可执行注释、带反斜杠转义的字符串或带库名的表时不转换。
+    DuckDB能执行的MySQL查询结果不一定相同，只有调用的函数与使用的运算符都在允许列表中时才转换。
+    FROM/JOIN之后的表名按保守方式识别（如 EXTRACT(YEAR FROM col) 中的列名也会被当作表名），
+    识别结果只会使查询回退到MySQL，不会错误地在镜像中执行。
+
+    Args:
+        sql (str): MySQL查询
+
+    Returns:
+        tuple: (DuckDB查询, 表名集合（小写）)，无法在镜像中执行时返回None
+    """
+    classification = classify_sql(sql)
+    if not classification.readonly or classification.statement_types not in (("SELECT",), ("WITH",)):
+        return None
+
+    pieces, tokens = [], []
+    for match in _TOKEN_PATTERN.finditer(sql):
+        kind, text = match.lastgroup, match.group()
+        if kind == "exec_comment":
+            return None
+        if kind == "comment":
+            pieces.append(" ")
+            continue
+        if kind == "string":
+            if "\\" in text:
+                return None
+            if text[0] == '"':
+                text = "'" + text[1:-1].replace('""', '"').replace("'", "''") + "'"
+            pieces.append(text)
+            tokens.append(("string", text))
+            continue
+        if kind == "quoted":
+            name = text[1:-1].replace("``", "`")
+            pieces.append(_quote(name))
+            tokens.append(("name", name))
+            continue
+        pieces.append(text)
+        if kind == "word":
+            tokens.append(("word", text))
+        elif kind == "other":
+            if text not in _SAFE_SYMBOLS:
+                return None
+            if text != ";":
+                tokens.append(("other", text))
+
+    if not _safe_operations(tokens):
+        return None
+    tokens = [("name", text) if kind == "word" else (kind, text) for kind, text in tokens]
+
+    tables, ctes = set(), set()
+    for index, (kind, text) in enumerate(tokens):
+        # WITH name AS (...) 定义的公用表表达式不是实际的表
+        if kind == "name" and index + 2 < len(tokens) and tokens[index + 1][1].upper() == "AS" \
+                and tokens[index + 2][1] == "(":
+            ctes.add(text.lower())
+        if kind != "name" or text.upper() not in ("FROM", "JOIN"):
+            continue
+        position = index + 1
+        while position < len(tokens):
+            if tokens[position][1] == "(":
+                break  # 子查询，其中的表由内部的FROM识别
+            if tokens[position][0] != "name":
+                return None
+            name = tokens[position][1]
+            position += 1
+            if position < len(tokens) and tokens[position][1] in (".", "("):
+                return None  # 带库名的表或表函数
+            tables.add(name.lower())
+            # 跳过别名
+            if position < len(tokens) and tokens[position][1].upper() == "AS":
+                position += 2
+            elif position < len(tokens) and tokens[position][0] == "name" \
+                    and tokens[position][1].upper() not in _CLAUSE_KEYWORDS:
+                position += 1
+            # FROM a, b 形式的多个表
+            if text.upper() == "FROM" and position < len(tokens) and tokens[position][1] == ",":
+                position += 1
+                continue
+            break
+
+    tables -= ctes
+    if not tables:
+        return None
+    return "".join(pieces).strip().rstrip(";"), tables
+
+
+class TableMirror:
+    """
+    单个连接的本地列式镜像
+
+    - 首次启用时全量复制各表，之后每refresh_interval秒刷新一次
+    - 表的更新时间（INFORMATION_SCHEMA.TABLES.UPDATE_TIME）未变化时跳过复制
+    - 指定了水位列的表增量复制：水位列为整数主键时只追加新行，
+      其他列（如更新时间）按主键覆盖水位之后的行；未指定时全量复制
+    - 增量刷新无法发现删除的行，每full_refresh_interval秒对所有表做一次全量复制
+    - 表结构变化时重新全量复制
+    """
+
+    def __init__(self, server, tables, path=None, refresh_interval=300, max_staleness=900,
+                 full_refresh_interval=86400, batch_size=10000):
+        """
+        初始化镜像并在后台开始首次复制
+
+        Args:
+            server (MySQLMCPServer): 源数据库
+            tables (list): 表名，或 {"name": 表名, "watermark": 水位列} 的列表
+            path (str, optional): DuckDB数据库文件路径，为空时保存在内存中
+            refresh_interval (float): 刷新间隔（秒）
+            max_staleness (float): 距上次成功刷新超过该秒数的表不再用于查询
+            full_refresh_interval (float): 全量复制的间隔（秒）
+            batch_size (int): 复制时每批读取的行数
+        """
+        duckdb = _require_duckdb()
+        self.logger = logging.getLogger(__name__)
+        self.server = server
+        self.path = path
+        self.refresh_interval = float(refresh_interval)
+        self.max_staleness = float(max_staleness)
+        self.full_refresh_interval = float(full_refresh_interval)
+        self.batch_size = int(batch_size)
+        self.queries = 0
+        self.fallbacks = 0
+
+        self._db = duckdb.connect(path or ":memory:")
+        # 尽量与MySQL默认行为一致：字符串比较不区分大小写，升序时NULL在前
+        self._db.execute("SET GLOBAL default_collation = 'nocase'")
+        self._db.execute("SET GLOBAL default_null_order = 'nulls_first_on_asc_last_on_desc'")
+        self._refresh_lock = threading.Lock()
+        self._tables = {}
+        for spec in tables:
+            spec = {"name": spec} if isinstance(spec, str) else dict(spec)
+            self._tables[spec["name"].lower()] = {
+                "name": spec["name"],
+                "watermark": spec.get("watermark"),
+                "mode": None,
+                "fingerprint": None,
+                "update_time": None,
+                "rows": 0,
+                "refreshed_at": None,
+                "full_refreshed_at": None,
+                "last_duration": None,
+                "last_error": None,
+                "refreshes": 0
+            }
+
+        self._stop = threading.Event()
+        self._worker = threading.Thread(target=self._refresh_loop, name="table-mirror", daemon=True)
+        self._worker.start()
+
+    def _refresh_loop(self):
+        try:
+            while not self._stop.is_set():
+                self.refresh()
+                self._stop.wait(self.refresh_interval)
+        finally:
+            self._db.close()
+
+    def _table_definition(self, metadata, state):
+        """根据源表结构确定列、主键与刷新方式"""
+        table = next((t for t in metadata.get("tables", []) if t["name"] == state["name"]), None)
+        if table is None:
+            raise ValueError(f"表不存在: {state['name']}")
+        columns = [(c["name"], duckdb_type(c["type"])) for c in table["columns"]]
+        primary_keys = [c["name"] for c in table["columns"] if c.get("is_primary")]
+        watermark = state["watermark"]
+        if watermark is None:
+            mode = "full"
+        elif watermark not in dict(columns):
+            raise ValueError(f"水位列不存在: {state['name']}.{watermark}")
+        elif primary_keys == [watermark] and dict(columns)[watermark] in ("BIGINT", "UBIGINT"):
+            mode = "append"
+        elif primary_keys:
+            mode = "upsert"
+        else:
+            raise ValueError(f"按{watermark}增量刷新需要表 {state['name']} 有主键")
+        return columns, primary_keys, mode
+
+    def _insert_batches(self, cursor, target, columns, source_query, primary_keys=None):
+        """从源库按批读取并写入镜像表，primary_keys不为空时先删除主键相同的旧行"""
+        import pyarrow as pa
+        names = [name for name, _ in columns]
+        column_list = ", ".join(_quote(name) for name in names)
+        count = 0
+        for _, rows in self.server.iter_query_batches(source_query, batch_size=self.batch_size):
+            if self._stop.is_set():
+                raise RuntimeError("镜像已关闭")
+            if not rows:
+                continue
+            values = list(zip(*rows))
+            # 按镜像表的列类型写入，不根据数据推断
+            batch = pa.table({
+                name: column_array(pa, list(column_values), _arrow_type(pa, column_type))
+                for (name, column_type), column_values in zip(columns, values)
+            })
+            cursor.register("_mirror_batch", batch)
+            try:
+                cursor.execute("BEGIN TRANSACTION")
+                if primary_keys:
+                    condition = " AND ".join(f"{_quote(target)}.{_quote(k)} = _mirror_batch.{_quote(k)}"
+                                             for k in primary_keys)
+                    cursor.execute(f"DELETE FROM {_quote(target)} USING _mirror_batch WHERE {condition}")
+                cursor.execute(f"INSERT INTO {_quote(target)} ({column_list}) SELECT {column_list} FROM _mirror_batch")
+                cursor.execute("COMMIT")
+            except Exception:
+                cursor.execute("ROLLBACK")
+                raise
+            finally:
+                cursor.unregister("_mirror_batch")
+            count += len(rows)
+        return count
+
+    def _full_copy(self, cursor, state, columns):
+        """全量复制到临时表后替换镜像表，复制期间查询仍使用旧数据"""
+        name = state["name"]
+        staging = f"{name}__staging"
+        definition = ", ".join(f"{_quote(column)} {column_type}" for column, column_type in columns)
+        cursor.execute(f"CREATE OR REPLACE TABLE {_quote(staging)} ({definition})")
+        select = f"SELECT {', '.join(_mysql_quote(c) for c, _ in columns)} FROM {_mysql_quote(name)}"
+        self._insert_batches(cursor, staging, columns, select)
+        cursor.execute("BEGIN TRANSACTION")
+        cursor.execute(f"DROP TABLE IF EXISTS {_quote(name)}")
+        cursor.execute(f"ALTER TABLE {_quote(staging)} RENAME TO {_quote(name)}")
+        cursor.execute("COMMIT")
+        state["full_refreshed_at"] = time.time()
+
+    def _incremental_copy(self, cursor, state, columns, primary_keys):
+        """复制水位之后的行，返回False表示镜像表为空、需要全量复制"""
+        name, watermark = state["name"], state["watermark"]
+        current = cursor.execute(f"SELECT max({_quote(watermark)}) FROM {_quote(name)}").fetchone()[0]
+        if current is None:
+            return False
+        operator = ">" if state["mode"] == "append" else ">="
+        select = (f"SELECT {', '.join(_mysql_quote(c) for c, _ in columns)} FROM {_mysql_quote(name)} "
+                  f"WHERE {_mysql_quote(watermark)} {operator} {_sql_literal(current)}")
+        self._insert_batches(cursor, name, columns, select,
+                             primary_keys=primary_keys if state["mode"] == "upsert" else None)
+        return True
+
+    def _refresh_table(self, cursor, state, source_state, metadata, full):
+        """刷新单个表"""
+        columns, primary_keys, mode = self._table_definition(metadata, state)
+        changed_structure = source_state["fingerprint"] != state["fingerprint"]
+        full_due = state["full_refreshed_at"] is None or \
+            time.time() - state["full_refreshed_at"] >= self.full_refresh_interval
+        unchanged = source_state["update_time"] is not None and source_state["update_time"] == state["update_time"]
+        state["mode"] = mode
+
+        if full or changed_structure or full_due:
+            self._full_copy(cursor, state, columns)
+        elif unchanged:
+            pass
+        elif mode == "full" or not self._incremental_copy(cursor, state, columns, primary_keys):
+            self._full_copy(cursor, state, columns)
+
+        state["fingerprint"] = source_state["fingerprint"]
+        state["update_time"] = source_state["update_time"]
+        state["rows"] = cursor.execute(f"SELECT count(*) FROM {_quote(state['name'])}").fetchone()[0]
+
+    def refresh(self, full=False):
+        """
+        刷新所有镜像表，单个表失败不影响其他表
+
+        Args:
+            full (bool): 是否强制全量复制
+        """
+        with self._refresh_lock:
+            try:
+                source_states = self.server._fetch_table_states()
+                metadata = json.loads(self.server.get_database_metadata())
+            except Exception as e:
+                self.logger.warning(f"刷新本地镜像失败: {str(e)}")
+                for state in self._tables.values():
+                    state["last_error"] = str(e)
+                return
+
+            cursor = self._db.cursor()
+            try:
+                for state in self._tables.values():
+                    if self._stop.is_set():
+                        return
+                    start = time.monotonic()
+                    try:
+                        source_state = source_states.get(state["name"])
+                        if source_state is None:
+                            raise ValueError(f"表不存在: {state['name']}")
+                        # 先记录本次刷新开始的时间，复制期间的写入由下一次刷新处理
+                        started_at = time.time()
+                        self._refresh_table(cursor, state, source_state, metadata, full)
+                        state["refreshed_at"] = started_at
+                        state["last_error"] = None
+                        state["refreshes"] += 1
+                    except Exception as e:
+                        self.logger.warning(f"刷新镜像表 {state['name']} 失败: {str(e)}")
+                        state["last_error"] = str(e)
+                    state["last_duration"] = round(time.monotonic() - start, 3)
+            finally:
+                cursor.close()
+
+    def _is_fresh(self, table):
+        state = self._tables.get(table)
+        return state is not None and state["refreshed_at"] is not None and \
+            time.time() - state["refreshed_at"] <= self.max_staleness
+
+    def execute(self, query):
+        """
+        在镜像中执行查询
+
+        Args:
+            query (str): MySQL查询
+
+        Returns:
+            tuple: (列名列表, 行迭代器, 数据的最早刷新时间, 各列的MySQL类型)；查询涉及未镜像或已过期的表、
+                或DuckDB无法执行该查询时返回None，调用方应改为查询MySQL
+        """
+        translated = translate_query(query)
+        if translated is None or not all(self._is_fresh(table) for table in translated[1]):
+            self.fallbacks += 1
+            return None
+
+        duckdb_query, tables = translated
+        cursor = self._db.cursor()
+        try:
+            cursor.execute(duckdb_query)
+        except Exception as e:
+            cursor.close()
+            self.logger.info(f"镜像无法执行该查询，回退到MySQL: {str(e)}")
+            self.fallbacks += 1
+            return None
+
+        self.queries += 1
+        columns = [column[0] for column in cursor.description]
+        column_types = [_mysql_type(column[1]) for column in cursor.description]
+
+        def rows():
+            try:
+                while True:
+                    batch = cursor.fetchmany(1000)
+                    if not batch:
+                        break
+                    yield from batch
+            finally:
+                cursor.close()
+
+        return columns, rows(), min(self._tables[table]["refreshed_at"] for table in tables), column_types
+
+    def stats(self):
+        """
+        获取镜像状态
+
+        Returns:
+            dict: 各表的行数、刷新方式、刷新时间与错误，以及查询命中与回退次数
+        """
+        tables = {}
+        for key, state in self._tables.items():
+            tables[state["name"]] = {
+                "mode": state["mode"],
+                "watermark": state["watermark"],
+                "rows": state["rows"],
+                "fresh": self._is_fresh(key),
+                "refreshed_at": state["refreshed_at"],
+                "last_duration": state["last_duration"],
+                "refreshes": state["refreshes"],
+                "last_error": state["last_error"]
+            }
+        return {
+            "path": self.path,
+            "refresh_interval": self.refresh_interval,
+            "max_staleness": self.max_staleness,
+            "queries": self.queries,
+            "fallbacks": self.fallbacks,
+            "tables": tables
+        }
+
+    def close(self):
+        """停止刷新，刷新线程在当前批次写完后关闭镜像数据库"""
+        self._stop.set()
+        self._worker.join(timeout=5)
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+应用预加载：在gunicorn主进程fork之前导入重量级依赖，
+工作进程通过写时复制共享这些只读的模块与代码对象
+"""
+
+import gc
+import time
+import logging
+import importlib
+
+logger = logging.getLogger(__name__)
+
+# 预加载的模块：应用自身按需导入的重量级依赖
+PRELOAD_MODULES = (
+    "sqlalchemy",
+    "sqlalchemy.dialects.mysql.mysqlconnector",
+    "mysql.connector",
+    "pandas",
+    "anthropic",
+    "requests",
+    "app.mcp.servers.mysql_server",
+    "app.services.query_service",
+)
+
+
+def preload_modules(modules=PRELOAD_MODULES):
+    """
+    导入重量级依赖，未安装的模块跳过
+
+    只导入模块，不创建客户端、连接池或线程：这些对象不能跨fork共享，
+    由各工作进程在首次使用时创建。
+
+    Args:
+        modules (tuple): 模块名列表
+
+    Returns:
+        dict: 模块名 -> 导入耗时（秒），导入失败的模块为None
+    """
+    timings = {}
+    for name in modules:
+        start = time.perf_counter()
+        try:
+            importlib.import_module(name)
+            timings[name] = round(time.perf_counter() - start, 4)
+        except ImportError as e:
+            logger.warning(f"预加载模块 {name} 失败: {str(e)}")
+            timings[name] = None
+    return timings
+
+
+def freeze_shared_state():
+    """
+    将当前所有对象移出垃圾回收的跟踪范围
+
+    在fork之前调用，避免工作进程的垃圾回收写入这些对象的引用计数头部，
+    导致共享的内存页被逐一复制。
+    """
+    gc.collect()
+    gc.freeze()
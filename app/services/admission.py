@@ -0,0 +1,289 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+准入控制：限制同时执行的查询数，交互式请求优先于批量请求，
+排队过长时立即拒绝并给出重试建议
+"""
+
+import os
+import math
+import time
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+# 优先级，按调度顺序排列
+PRIORITIES = ("interactive", "bulk")
+
+# 排队时间统计保留的最近样本数
+_RECENT_SAMPLES = 500
+
+
+class AdmissionRejected(Exception):
+    """排队已满或排队超时"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class _Ticket:
+    """一个排队或执行中的请求"""
+
+    __slots__ = ("connection_id", "priority", "event", "granted", "released", "enqueued_at", "started_at")
+
+    def __init__(self, connection_id, priority):
+        self.connection_id = connection_id
+        self.priority = priority
+        self.event = threading.Event()
+        self.granted = False
+        self.released = False
+        self.enqueued_at = time.monotonic()
+        self.started_at = None
+
+
+class _PriorityStats:
+    """单个优先级的运行统计"""
+
+    def __init__(self):
+        self.running = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.queue_time_total = 0.0
+        self.queue_time_max = 0.0
+        self.recent = deque(maxlen=_RECENT_SAMPLES)
+        self.service_time = None  # 执行耗时的指数移动平均
+
+    def record_wait(self, seconds):
+        self.admitted += 1
+        self.queue_time_total += seconds
+        self.queue_time_max = max(self.queue_time_max, seconds)
+        self.recent.append(seconds)
+
+    def record_service(self, seconds):
+        self.service_time = seconds if self.service_time is None else 0.8 * self.service_time + 0.2 * seconds
+
+    def percentile(self, fraction):
+        if not self.recent:
+            return None
+        ordered = sorted(self.recent)
+        return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))], 4)
+
+
+class AdmissionController:
+    """
+    查询准入控制器
+
+    - 全局与每个连接分别限制同时执行的请求数
+    - 交互式与批量请求各自排队，有空闲名额时先调度交互式请求；
+      批量请求最多占用max_bulk个名额，始终为交互式请求保留余量
+    - 同一优先级按到达顺序调度，受连接上限阻塞的请求不影响其他连接的请求
+    - 队列长度达到上限或排队超时时抛出 AdmissionRejected，附带建议的重试等待秒数
+    """
+
+    def __init__(self, max_concurrent=16, max_per_connection=4, max_bulk=4,
+                 max_queue=None, queue_timeout=30):
+        """
+        初始化准入控制器
+
+        Args:
+            max_concurrent (int): 全局最大同时执行数
+            max_per_connection (int): 每个连接的最大同时执行数
+            max_bulk (int): 批量请求最多占用的执行名额
+            max_queue (dict, optional): 各优先级的最大排队数，默认交互式64、批量16
+            queue_timeout (float): 最长排队时间（秒）
+        """
+        self.logger = logging.getLogger(__name__)
+        self.max_concurrent = max(1, int(max_concurrent))
+        self.max_per_connection = max(1, int(max_per_connection))
+        self.max_bulk = max(1, min(int(max_bulk), self.max_concurrent))
+        self.max_queue = dict({"interactive": 64, "bulk": 16}, **(max_queue or {}))
+        self.queue_timeout = float(queue_timeout)
+
+        self._lock = threading.Lock()
+        self._queues = {priority: deque() for priority in PRIORITIES}
+        self._running = 0
+        self._running_by_connection = {}
+        self._stats = {priority: _PriorityStats() for priority in PRIORITIES}
+
+    @classmethod
+    def from_env(cls):
+        """
+        根据环境变量创建准入控制器
+
+        Returns:
+            AdmissionController: 准入控制器
+        """
+        return cls(
+            max_concurrent=int(os.environ.get('ADMISSION_MAX_CONCURRENT', 16)),
+            max_per_connection=int(os.environ.get('ADMISSION_MAX_PER_CONNECTION', 4)),
+            max_bulk=int(os.environ.get('ADMISSION_MAX_BULK', 4)),
+            max_queue={
+                "interactive": int(os.environ.get('ADMISSION_QUEUE_INTERACTIVE', 64)),
+                "bulk": int(os.environ.get('ADMISSION_QUEUE_BULK', 16))
+            },
+            queue_timeout=float(os.environ.get('ADMISSION_QUEUE_TIMEOUT', 30))
+        )
+
+    def _can_start(self, ticket):
+        """是否有名额立即执行（调用方需持有锁）"""
+        if self._running >= self.max_concurrent:
+            return False
+        if self._running_by_connection.get(ticket.connection_id, 0) >= self.max_per_connection:
+            return False
+        if ticket.priority == "bulk" and self._stats["bulk"].running >= self.max_bulk:
+            return False
+        return True
+
+    def _dispatch(self):
+        """按优先级调度排队中的请求（调用方需持有锁）"""
+        for priority in PRIORITIES:
+            queue = self._queues[priority]
+            for ticket in list(queue):
+                if self._running >= self.max_concurrent:
+                    return
+                if self._can_start(ticket):
+                    queue.remove(ticket)
+                    self._start(ticket)
+
+    def _start(self, ticket):
+        """占用名额并唤醒请求（调用方需持有锁）"""
+        ticket.granted = True
+        ticket.started_at = time.monotonic()
+        self._running += 1
+        self._running_by_connection[ticket.connection_id] = self._running_by_connection.get(ticket.connection_id, 0) + 1
+        stats = self._stats[ticket.priority]
+        stats.running += 1
+        stats.record_wait(ticket.started_at - ticket.enqueued_at)
+        ticket.event.set()
+
+    def _retry_after(self, priority):
+        """根据排队长度与平均执行耗时估算建议的重试等待秒数（调用方需持有锁）"""
+        slots = self.max_concurrent if priority == "interactive" else self.max_bulk
+        service_time = self._stats[priority].service_time or 1.0
+        estimate = (len(self._queues[priority]) + 1) * service_time / slots
+        return int(min(60, max(1, math.ceil(estimate))))
+
+    def check(self, priority="interactive"):
+        """
+        检查优先级队列是否已满，已满时立即拒绝
+
+        Args:
+            priority (str): 优先级
+
+        Raises:
+            AdmissionRejected: 队列已满
+        """
+        with self._lock:
+            if len(self._queues[priority]) >= self.max_queue[priority]:
+                self._stats[priority].rejected += 1
+                raise AdmissionRejected("服务繁忙，排队请求过多，请稍后重试", self._retry_after(priority))
+
+    def acquire(self, connection_id, priority="interactive", reject=True, timeout=None):
+        """
+        申请执行名额，没有空闲名额时排队等待
+
+        Args:
+            connection_id (str): 连接ID（或连接组ID）
+            priority (str): 优先级，interactive或bulk
+            reject (bool): 队列已满时是否立即拒绝，为False时总是排队
+            timeout (float, optional): 最长排队时间（秒），默认为queue_timeout
+
+        Returns:
+            _Ticket: 执行凭证，执行完毕后需调用 release
+
+        Raises:
+            AdmissionRejected: 队列已满或排队超时
+        """
+        if priority not in PRIORITIES:
+            raise ValueError(f"不支持的优先级: {priority}")
+
+        ticket = _Ticket(connection_id, priority)
+        with self._lock:
+            queue = self._queues[priority]
+            if reject and len(queue) >= self.max_queue[priority]:
+                self._stats[priority].rejected += 1
+                raise AdmissionRejected("服务繁忙，排队请求过多，请稍后重试", self._retry_after(priority))
+            queue.append(ticket)
+            self._dispatch()
+
+        if not ticket.event.wait(self.queue_timeout if timeout is None else timeout):
+            with self._lock:
+                if not ticket.granted:
+                    self._queues[priority].remove(ticket)
+                    self._stats[priority].timed_out += 1
+                    self.logger.warning(f"请求排队超时: {connection_id} ({priority})")
+                    raise AdmissionRejected("服务繁忙，排队超时，请稍后重试", self._retry_after(priority))
+        return ticket
+
+    def release(self, ticket):
+        """
+        释放执行名额，可重复调用
+
+        Args:
+            ticket (_Ticket): acquire 返回的凭证
+        """
+        with self._lock:
+            if ticket.released:
+                return
+            ticket.released = True
+            self._running -= 1
+            remaining = self._running_by_connection.get(ticket.connection_id, 1) - 1
+            if remaining > 0:
+                self._running_by_connection[ticket.connection_id] = remaining
+            else:
+                self._running_by_connection.pop(ticket.connection_id, None)
+            stats = self._stats[ticket.priority]
+            stats.running -= 1
+            stats.record_service(time.monotonic() - ticket.started_at)
+            self._dispatch()
+
+    @contextmanager
+    def admit(self, connection_id, priority="interactive", reject=True, timeout=None):
+        """
+        申请执行名额的上下文管理器，参数同 acquire
+        """
+        ticket = self.acquire(connection_id, priority, reject=reject, timeout=timeout)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    def stats(self):
+        """
+        获取准入控制统计
+
+        Returns:
+            dict: 当前执行数、各优先级的排队数、排队时间（秒）与拒绝次数
+        """
+        with self._lock:
+            priorities = {}
+            for priority in PRIORITIES:
+                stats = self._stats[priority]
+                priorities[priority] = {
+                    "running": stats.running,
+                    "waiting": len(self._queues[priority]),
+                    "admitted": stats.admitted,
+                    "rejected": stats.rejected,
+                    "timed_out": stats.timed_out,
+                    "queue_time_avg": round(stats.queue_time_total / stats.admitted, 4) if stats.admitted else None,
+                    "queue_time_p50": stats.percentile(0.5),
+                    "queue_time_p95": stats.percentile(0.95),
+                    "queue_time_max": round(stats.queue_time_max, 4),
+                    "service_time_avg": round(stats.service_time, 4) if stats.service_time is not None else None
+                }
+            return {
+                "running": self._running,
+                "limits": {
+                    "max_concurrent": self.max_concurrent,
+                    "max_per_connection": self.max_per_connection,
+                    "max_bulk": self.max_bulk,
+                    "max_queue": dict(self.max_queue),
+                    "queue_timeout": self.queue_timeout
+                },
+                "connections": dict(self._running_by_connection),
+                "priorities": priorities
+            }
@@ -0,0 +1,487 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+仪表盘查询：注册反复执行的查询并保存其结果，刷新时只读取水位列之后的新行并合并到已保存的结果中。
+只追加的明细查询直接追加新行，单表COUNT/SUM/AVG聚合查询按分组累加部分结果，其他查询每次完整执行
+"""
+
+import os
+import re
+import json
+import time
+import uuid
+import bisect
+import logging
+import threading
+
+from app.mcp.servers.approximate import (
+    NotApproximable, plan_approximation, rewrite_query, combine_samples, _INTEGER_TYPE, _tokens, _split_clauses
+)
+from app.mcp.servers.index_advisor import _parse_tables
+from app.mcp.servers.table_mirror import _sql_literal
+
+# 刷新方式
+DASHBOARD_MODES = ("append", "aggregate", "full")
+
+# 可作为水位的时间列：记录创建时间一类的列（更新时间会变化，不能作为只追加的水位）
+_CREATED_COLUMN = re.compile(r"(creat|insert|add|regist|occur|event_?time|log_?time|order_?time|paid_?time)",
+                             re.IGNORECASE)
+_TEMPORAL_TYPE = re.compile(r"^(DATETIME|TIMESTAMP)\b", re.IGNORECASE)
+
+# 明细查询中不能增量追加的写法
+_APPEND_UNSUPPORTED = frozenset({"JOIN", "UNION", "DISTINCT", "HAVING", "LIMIT", "OVER", "WITH"})
+
+
+def _quote(name):
+    return "`" + name.replace("`", "``") + "`"
+
+
+def detect_watermark(table_info):
+    """
+    从表结构中找出适合作为水位的列：优先自增列，其次记录创建时间的DATETIME/TIMESTAMP列
+
+    Args:
+        table_info (dict): 表结构信息
+
+    Returns:
+        dict: {"column": 列名, "kind": "key"或"time"}，没有合适的列时返回None
+    """
+    columns = table_info.get("columns", [])
+    for column in columns:
+        if column.get("auto_increment") and _INTEGER_TYPE.match(column.get("type", "")):
+            return {"column": column["name"], "kind": "key"}
+    for column in columns:
+        if _TEMPORAL_TYPE.match(column.get("type", "")) and _CREATED_COLUMN.search(column["name"]):
+            return {"column": column["name"], "kind": "time"}
+    return None
+
+
+def _watermark_kind(table_info, column_name):
+    """指定的水位列的类型"""
+    column = next((c for c in table_info.get("columns", []) if c["name"].lower() == column_name.lower()), None)
+    if column is None:
+        raise ValueError(f"水位列不存在: {table_info['name']}.{column_name}")
+    if _INTEGER_TYPE.match(column.get("type", "")):
+        return {"column": column["name"], "kind": "key"}
+    if _TEMPORAL_TYPE.match(column.get("type", "")):
+        return {"column": column["name"], "kind": "time"}
+    if column.get("type", "").upper().startswith("DATE"):
+        # DATE只精确到天，刷新读到当天后，当天之后插入的行都不大于水位，会被跳过
+        raise ValueError(f"DATE列只精确到天，不能作为水位，请使用DATETIME/TIMESTAMP列或自增列: {column_name}")
+    raise ValueError(f"水位列必须是整数或DATETIME/TIMESTAMP类型: {column_name}")
+
+
+def _plan_append(sql, tables):
+    """
+    分析明细查询能否增量追加
+
+    Returns:
+        dict: {"table", "select", "from", "where", "order"}
+
+    Raises:
+        NotApproximable: 不能增量追加，异常信息为原因
+    """
+    tokens = _tokens(sql)
+    if not tokens or tokens[0][1].upper() != "SELECT":
+        raise NotApproximable("只有SELECT查询可以增量刷新")
+    for i, (kind, value, _, _) in enumerate(tokens):
+        if kind != "word":
+            continue
+        upper = value.upper()
+        if upper in _APPEND_UNSUPPORTED:
+            raise NotApproximable(f"包含{upper}的查询不能增量追加")
+        if upper == "SELECT" and i > 0:
+            raise NotApproximable("包含子查询的查询不能增量追加")
+    clauses = _split_clauses(sql, tokens)
+    if "FROM" not in clauses or "GROUP BY" in clauses:
+        raise NotApproximable("只有单表明细查询可以增量追加")
+    if "," in [t[1] for t in _tokens(clauses["FROM"])]:
+        raise NotApproximable("只有单表明细查询可以增量追加")
+    table_names = set(_parse_tables([(kind, value) for kind, value, _, _ in tokens]).values())
+    if len(table_names) != 1 or next(iter(table_names)) not in tables:
+        raise NotApproximable("只有单表明细查询可以增量追加")
+    return {
+        "table": next(iter(table_names)),
+        "select": clauses["SELECT"],
+        "from": clauses["FROM"],
+        "where": clauses.get("WHERE"),
+        "order": clauses.get("ORDER BY")
+    }
+
+
+def _ordered_by(order, column):
+    """ORDER BY 是否只按该列升序（追加的新行才能保持原有顺序）"""
+    tokens = [t[1] for t in _tokens(order)]
+    if tokens and tokens[-1].upper() == "ASC":
+        tokens = tokens[:-1]
+    if len(tokens) == 3 and tokens[1] == ".":
+        tokens = tokens[2:]
+    return len(tokens) == 1 and tokens[0].lower() == column.lower()
+
+
+class DashboardQuery:
+    """已注册的仪表盘查询及其保存的结果"""
+
+    def __init__(self, query_id, connection_id, sql):
+        self.id = query_id
+        self.connection_id = connection_id
+        self.sql = sql
+        self.mode = "full"
+        self.reason = None
+        self.plan = None
+        self.watermark = None        # {"column", "kind"}
+        self.watermark_value = None
+        self.columns = []
+        self.rows = []               # 明细查询与完整执行的结果行
+        self.row_keys = []           # 明细查询：每行的水位值（与rows一一对应）
+        self.groups = {}             # 聚合查询：分组值 -> {部分结果列: 值}
+        self.partial_columns = []
+        self.registered_at = time.time()
+        self.refreshed_at = None
+        self.full_refreshed_at = None
+        self.refreshes = 0
+        self.incremental_refreshes = 0
+        self.last_fetched_rows = 0
+        self.last_duration = None
+        self.lock = threading.Lock()
+
+    def info(self):
+        """
+        查询概况
+
+        Returns:
+            dict: 刷新方式、水位、行数与刷新统计
+        """
+        watermark = dict(self.watermark, value=self.watermark_value) if self.watermark else None
+        return {
+            "query_id": self.id,
+            "sql": self.sql,
+            "mode": self.mode,
+            "reason": self.reason,
+            "watermark": watermark,
+            "rows": len(self.groups) if self.mode == "aggregate" else len(self.rows),
+            "registered_at": self.registered_at,
+            "refreshed_at": self.refreshed_at,
+            "full_refreshed_at": self.full_refreshed_at,
+            "refreshes": self.refreshes,
+            "incremental_refreshes": self.incremental_refreshes,
+            "last_fetched_rows": self.last_fetched_rows,
+            "last_duration": self.last_duration
+        }
+
+
+class DashboardRegistry:
+    """
+    全部连接共享的仪表盘查询注册表
+
+    - 注册时完整执行一次并保存结果，之后的刷新只读取水位之后的新行
+    - 时间水位只读取watermark_lag秒之前的行，给并发写入留出提交时间
+    - 自增水位的明细查询重新读取水位之前key_window个值的范围并按水位值去重，
+      补上晚于更大自增值提交的行；聚合查询无法去重，这类行要到下一次完整执行才计入
+    - 增量刷新无法发现更新与删除的行，每full_refresh_interval秒完整执行一次
+    - 距上次刷新不足min_refresh_interval秒时直接返回已保存的结果（多个看板同时刷新时只查询一次）
+    """
+
+    def __init__(self, full_refresh_interval=3600, min_refresh_interval=5, watermark_lag=5,
+                 max_rows=10000, max_queries=200, key_window=1000):
+        """
+        初始化注册表
+
+        Args:
+            full_refresh_interval (float): 完整执行的间隔（秒）
+            min_refresh_interval (float): 两次刷新的最短间隔（秒）
+            watermark_lag (float): 时间水位的延迟（秒）
+            max_rows (int): 单个查询保存的最大行数
+            max_queries (int): 最多注册的查询数
+            key_window (int): 自增水位的明细查询每次重新读取的水位范围
+        """
+        self.logger = logging.getLogger(__name__)
+        self.full_refresh_interval = float(full_refresh_interval)
+        self.min_refresh_interval = float(min_refresh_interval)
+        self.watermark_lag = float(watermark_lag)
+        self.max_rows = int(max_rows)
+        self.max_queries = int(max_queries)
+        self.key_window = int(key_window)
+        self._queries = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """
+        根据环境变量创建注册表
+
+        Returns:
+            DashboardRegistry: 注册表
+        """
+        return cls(
+            full_refresh_interval=float(os.environ.get('DASHBOARD_FULL_REFRESH_INTERVAL', 3600)),
+            min_refresh_interval=float(os.environ.get('DASHBOARD_MIN_REFRESH_INTERVAL', 5)),
+            watermark_lag=float(os.environ.get('DASHBOARD_WATERMARK_LAG', 5)),
+            max_rows=int(os.environ.get('DASHBOARD_MAX_ROWS', 10000)),
+            max_queries=int(os.environ.get('DASHBOARD_MAX_QUERIES', 200)),
+            key_window=int(os.environ.get('DASHBOARD_KEY_WINDOW', 1000))
+        )
+
+    @staticmethod
+    def normalize_sql(sql):
+        """去除多余空白与末尾分号，用于识别相同的查询"""
+        return " ".join(sql.split()).rstrip(";").strip()
+
+    def register(self, server, connection_id, sql, watermark=None):
+        """
+        注册查询并完整执行一次
+
+        Args:
+            server (MySQLMCPServer): 数据库
+            connection_id (str): 数据库连接ID
+            sql (str): 查询
+            watermark (str, optional): 水位列，为空时根据表结构自动选择
+
+        Returns:
+            DashboardQuery: 已注册的查询
+        """
+        sql = self.normalize_sql(sql)
+        existing = self.find(connection_id, sql)
+        if existing:
+            return existing
+        with self._lock:
+            if len(self._queries) >= self.max_queries:
+                raise ValueError(f"已注册的仪表盘查询超过上限（{self.max_queries}个）")
+
+        entry = DashboardQuery(uuid.uuid4().hex[:12], connection_id, sql)
+        self._plan(server, entry, watermark)
+        with entry.lock:
+            self._refresh_full(server, entry)
+        with self._lock:
+            self._queries[entry.id] = entry
+        self.logger.info(f"注册仪表盘查询 {entry.id}（{entry.mode}）: {sql}")
+        return entry
+
+    def _plan(self, server, entry, watermark):
+        """确定刷新方式与水位列"""
+        metadata = json.loads(server.get_database_metadata())
+        if "error" in metadata:
+            raise ValueError(metadata["error"])
+        tables = {t["name"]: t for t in metadata.get("tables", [])}
+
+        plan = None
+        mode = None
+        try:
+            plan = plan_approximation(entry.sql, tables)
+            mode = "aggregate"
+        except NotApproximable as aggregate_reason:
+            reason = str(aggregate_reason)
+            try:
+                plan = _plan_append(entry.sql, tables)
+                mode = "append"
+            except NotApproximable as append_reason:
+                # 两种都不适用时给出更相关的原因
+                is_aggregate = re.search(r"\b(COUNT|SUM|AVG|MIN|MAX)\s*\(|\bGROUP\s+BY\b", entry.sql, re.IGNORECASE)
+                entry.reason = reason if is_aggregate else str(append_reason)
+                return
+
+        table_info = tables[plan["table"]]
+        detected = _watermark_kind(table_info, watermark) if watermark else detect_watermark(table_info)
+        if detected is None:
+            entry.reason = f"表 {plan['table']} 没有自增列或创建时间列可作为水位，请指定watermark"
+            return
+        if mode == "append" and plan["order"] and not _ordered_by(plan["order"], detected["column"]):
+            entry.reason = f"ORDER BY 不是按水位列 {detected['column']} 升序，不能增量追加"
+            return
+        entry.mode, entry.plan, entry.watermark = mode, plan, detected
+
+    def _rereads_keys(self, entry):
+        """是否重新读取水位之前的一段自增值（只有明细查询能按水位值去重）"""
+        return entry.mode == "append" and entry.watermark["kind"] == "key" and self.key_window > 0
+
+    def _condition(self, entry, incremental):
+        """水位条件：只读取上次水位之后、且（时间水位）早于当前时间减延迟的行"""
+        column = _quote(entry.watermark["column"])
+        conditions = []
+        if incremental and entry.watermark_value is not None:
+            low = entry.watermark_value
+            if self._rereads_keys(entry):
+                low -= self.key_window
+            conditions.append(f"{column} > {_sql_literal(low)}")
+        if entry.watermark["kind"] == "time" and self.watermark_lag > 0:
+            conditions.append(f"{column} <= NOW() - INTERVAL {int(self.watermark_lag)} SECOND")
+        return " AND ".join(conditions) or None
+
+    def _fetch(self, server, sql):
+        """执行查询并读取全部结果行，超过max_rows时报错"""
+        columns, rows = [], []
+        for columns, batch in server.iter_query_batches(sql, batch_size=min(10000, self.max_rows + 1)):
+            rows.extend(batch)
+            if len(rows) > self.max_rows:
+                raise ValueError(f"查询结果超过{self.max_rows}行，不适合注册为仪表盘查询")
+        return columns, rows
+
+    def _advance(self, entry, values):
+        values = [v for v in values if v is not None]
+        if values:
+            newest = max(values)
+            if entry.watermark_value is None or newest > entry.watermark_value:
+                entry.watermark_value = newest
+
+    def _fetch_increment(self, server, entry, incremental):
+        """读取水位之后的新行（incremental为False时读取全部行）并合并"""
+        condition = self._condition(entry, incremental)
+        column = _quote(entry.watermark["column"])
+        if entry.mode == "aggregate":
+            sql = rewrite_query(entry.plan, condition, "0", watermark=column)
+            columns, rows = self._fetch(server, sql)
+            if not incremental:
+                entry.groups = {}
+            position = {name: i for i, name in enumerate(columns)}
+            group_columns = [f"__g{index}" for index in entry.plan["group"]]
+            entry.partial_columns = [name for name in columns if name.startswith("__a")]
+            for row in rows:
+                key = tuple(row[position[name]] for name in group_columns)
+                partial = entry.groups.setdefault(key, {name: 0 for name in entry.partial_columns})
+                for name in entry.partial_columns:
+                    value = row[position[name]]
+                    if value is not None:
+                        partial[name] += value
+            if len(entry.groups) > self.max_rows:
+                raise ValueError(f"查询结果超过{self.max_rows}行，不适合注册为仪表盘查询")
+            self._advance(entry, [row[position["__w"]] for row in rows])
+            return len(rows)
+
+        select = f"SELECT {entry.plan['select']}, {column} AS `__w` FROM {entry.plan['from']}"
+        conditions = [f"({entry.plan['where']})" if entry.plan["where"] else None, condition]
+        conditions = [c for c in conditions if c]
+        if conditions:
+            select += " WHERE " + " AND ".join(conditions)
+        if entry.plan["order"]:
+            select += f" ORDER BY {entry.plan['order']}"
+        columns, rows = self._fetch(server, select)
+        watermark_index = len(columns) - 1
+        if not incremental:
+            entry.rows, entry.row_keys = [], []
+        entry.columns = columns[:watermark_index]
+        if incremental and self._rereads_keys(entry) and entry.watermark_value is not None:
+            # 重新读取的范围内已保存的水位值跳过，其余是晚提交的行，按水位顺序插入
+            low = entry.watermark_value - self.key_window
+            seen = {key for key in entry.row_keys if key is not None and key > low}
+            # 升序排序时水位为NULL的行在最前面
+            first = next((i for i, key in enumerate(entry.row_keys) if key is not None), len(entry.row_keys))
+            for row in rows:
+                key = row[watermark_index]
+                if key in seen:
+                    continue
+                position = bisect.bisect_right(entry.row_keys, key, first) if entry.plan["order"] else len(entry.rows)
+                entry.rows.insert(position, row[:watermark_index])
+                entry.row_keys.insert(position, key)
+        else:
+            entry.rows.extend(row[:watermark_index] for row in rows)
+            entry.row_keys.extend(row[watermark_index] for row in rows)
+        if len(entry.rows) > self.max_rows:
+            raise ValueError(f"查询结果超过{self.max_rows}行，不适合注册为仪表盘查询")
+        self._advance(entry, [row[watermark_index] for row in rows])
+        return len(rows)
+
+    def _refresh_full(self, server, entry):
+        """完整执行并替换保存的结果"""
+        start = time.monotonic()
+        if entry.mode == "full":
+            columns, rows = self._fetch(server, entry.sql)
+            entry.columns, entry.rows = columns, rows
+            fetched = len(rows)
+        else:
+            entry.watermark_value = None
+            fetched = self._fetch_increment(server, entry, incremental=False)
+        entry.full_refreshed_at = entry.refreshed_at = time.time()
+        entry.refreshes += 1
+        entry.last_fetched_rows = fetched
+        entry.last_duration = round(time.monotonic() - start, 4)
+
+    def refresh(self, server, entry, full=False):
+        """
+        刷新查询结果
+
+        Args:
+            server (MySQLMCPServer): 数据库
+            entry (DashboardQuery): 已注册的查询
+            full (bool): 是否强制完整执行
+
+        Returns:
+            bool: 是否实际查询了数据库（距上次刷新过近时直接使用已保存的结果）
+        """
+        with entry.lock:
+            now = time.time()
+            if not full and entry.refreshed_at is not None and now - entry.refreshed_at < self.min_refresh_interval:
+                return False
+            full_due = entry.full_refreshed_at is None or now - entry.full_refreshed_at >= self.full_refresh_interval
+            if full or full_due or entry.mode == "full":
+                self._refresh_full(server, entry)
+                return True
+            start = time.monotonic()
+            fetched = self._fetch_increment(server, entry, incremental=True)
+            entry.refreshed_at = now
+            entry.refreshes += 1
+            entry.incremental_refreshes += 1
+            entry.last_fetched_rows = fetched
+            entry.last_duration = round(time.monotonic() - start, 4)
+            return True
+
+    def result(self, entry):
+        """
+        保存的结果
+
+        Returns:
+            tuple: (列名列表, 结果行列表)
+        """
+        with entry.lock:
+            if entry.mode != "aggregate":
+                return list(entry.columns), list(entry.rows)
+            group_columns = [f"__g{index}" for index in entry.plan["group"]]
+            columns = group_columns + ["__s"] + entry.partial_columns
+            rows = [key + (0,) + tuple(partial[name] for name in entry.partial_columns)
+                    for key, partial in entry.groups.items()]
+            columns, rows, _ = combine_samples(entry.plan, columns, rows, 1.0, 1)
+            return columns, rows
+
+    def find(self, connection_id, sql):
+        """
+        查找相同连接上已注册的相同查询
+
+        Returns:
+            DashboardQuery: 已注册的查询，未注册时返回None
+        """
+        sql = self.normalize_sql(sql)
+        with self._lock:
+            return next((q for q in self._queries.values()
+                         if q.connection_id == connection_id and q.sql == sql), None)
+
+    def get(self, connection_id, query_id):
+        """获取连接上已注册的查询，不存在时返回None"""
+        with self._lock:
+            entry = self._queries.get(query_id)
+        return entry if entry is not None and entry.connection_id == connection_id else None
+
+    def list(self, connection_id):
+        """连接上已注册的查询概况"""
+        with self._lock:
+            entries = [q for q in self._queries.values() if q.connection_id == connection_id]
+        return [entry.info() for entry in entries]
+
+    def remove(self, connection_id, query_id):
+        """
+        取消注册
+
+        Returns:
+            bool: 是否存在该查询
+        """
+        with self._lock:
+            entry = self._queries.get(query_id)
+            if entry is None or entry.connection_id != connection_id:
+                return False
+            del self._queries[query_id]
+            return True
+
+    def remove_connection(self, connection_id):
+        """取消连接上的全部注册"""
+        with self._lock:
+            for query_id in [q.id for q in self._queries.values() if q.connection_id == connection_id]:
+                del self._queries[query_id]
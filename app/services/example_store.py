@@ -0,0 +1,291 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+问题→SQL示例库，记录每个连接上执行成功的查询，
+按字符n-gram的TF-IDF相似度检索相似问题作为少样本示例
+"""
+
+import os
+import re
+import json
+import math
+import time
+import hashlib
+import logging
+import tempfile
+import threading
+from collections import Counter
+
+# 参与相似度计算的字符n-gram长度
+NGRAM_SIZES = (1, 2, 3)
+
+# 归一化时去除的字符：空白与常见中英文标点
+_STRIP_PATTERN = re.compile(r"[\s\.,;:!?'\"`()\[\]{}，。；：！？、“”‘’（）【】《》]+")
+_NUMBER_PATTERN = re.compile(r"\d+(?:\.\d+)?")
+
+
+def normalize_question(question):
+    """
+    归一化问题文本：转小写并去除空白和标点
+
+    Args:
+        question (str): 问题
+
+    Returns:
+        str: 归一化后的文本
+    """
+    return _STRIP_PATTERN.sub("", (question or "").lower())
+
+
+def _ngrams(text):
+    """统计文本的字符n-gram"""
+    grams = Counter()
+    for n in NGRAM_SIZES:
+        for i in range(len(text) - n + 1):
+            grams[text[i:i + n]] += 1
+    return grams
+
+
+class _ConnectionExamples:
+    """单个连接的示例集合与倒排索引"""
+
+    def __init__(self):
+        self.examples = {}       # 归一化问题 -> 示例
+        self.postings = {}       # n-gram -> {归一化问题: 词频}
+        self._norms = None       # 归一化问题 -> 向量长度（示例变化后重新计算）
+
+    def add(self, key, example):
+        self.remove(key)
+        self.examples[key] = example
+        for gram, tf in _ngrams(key).items():
+            self.postings.setdefault(gram, {})[key] = tf
+        self._norms = None
+
+    def remove(self, key):
+        if self.examples.pop(key, None) is None:
+            return
+        for gram in _ngrams(key):
+            docs = self.postings.get(gram)
+            if docs is not None:
+                docs.pop(key, None)
+                if not docs:
+                    del self.postings[gram]
+        self._norms = None
+
+    def _idf(self, gram):
+        return math.log((len(self.examples) + 1) / (len(self.postings.get(gram, ())) + 1)) + 1
+
+    def _weight(self, tf, gram):
+        return (1 + math.log(tf)) * self._idf(gram)
+
+    def norms(self):
+        if self._norms is None:
+            squares = Counter()
+            for gram, docs in self.postings.items():
+                for key, tf in docs.items():
+                    squares[key] += self._weight(tf, gram) ** 2
+            self._norms = {key: math.sqrt(value) for key, value in squares.items()}
+        return self._norms
+
+    def score(self, key):
+        """计算问题与各示例的余弦相似度，只遍历有共同n-gram的示例"""
+        query_weights = {gram: self._weight(tf, gram) for gram, tf in _ngrams(key).items()}
+        query_norm = math.sqrt(sum(w * w for w in query_weights.values()))
+        if not query_norm:
+            return {}
+        dots = Counter()
+        for gram, weight in query_weights.items():
+            for doc, tf in self.postings.get(gram, {}).items():
+                dots[doc] += weight * self._weight(tf, gram)
+        norms = self.norms()
+        return {doc: dot / (query_norm * norms[doc]) for doc, dot in dots.items() if norms.get(doc)}
+
+
+class ExampleStore:
+    """
+    问题→SQL示例库
+
+    每个连接最多保留max_examples条示例，超出时淘汰最久未使用的示例；
+    设置了目录时示例持久化到磁盘，首次访问某个连接时加载。
+    """
+
+    def __init__(self, directory=None, max_examples=500):
+        """
+        初始化示例库
+
+        Args:
+            directory (str, optional): 持久化目录，为空时只保存在内存中
+            max_examples (int): 每个连接最多保留的示例数
+        """
+        self.logger = logging.getLogger(__name__)
+        self.directory = directory
+        self.max_examples = int(max_examples)
+        self._connections = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """
+        根据环境变量创建示例库
+
+        Returns:
+            ExampleStore: 示例库
+        """
+        return cls(
+            directory=os.environ.get('EXAMPLE_STORE_DIR', os.path.join('data', 'examples')) or None,
+            max_examples=int(os.environ.get('EXAMPLE_STORE_MAX', 500))
+        )
+
+    def _path(self, connection_key):
+        digest = hashlib.sha1(connection_key.encode("utf-8")).hexdigest()[:20]
+        return os.path.join(self.directory, f"{digest}.json")
+
+    def _get(self, connection_key):
+        """获取连接的示例集合，首次访问时从磁盘加载（调用方需持有锁）"""
+        examples = self._connections.get(connection_key)
+        if examples is not None:
+            return examples
+
+        examples = _ConnectionExamples()
+        if self.directory:
+            try:
+                with open(self._path(connection_key), "r", encoding="utf-8") as f:
+                    for example in json.load(f):
+                        examples.add(normalize_question(example["question"]), example)
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                self.logger.warning(f"加载示例库失败: {str(e)}")
+        self._connections[connection_key] = examples
+        return examples
+
+    def _save(self, connection_key, examples):
+        """将连接的示例写入磁盘（调用方需持有锁）"""
+        if not self.directory:
+            return
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=self.directory)
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump(list(examples.examples.values()), f, ensure_ascii=False, separators=(",", ":"))
+                os.replace(tmp_path, self._path(connection_key))
+            except Exception:
+                os.unlink(tmp_path)
+                raise
+        except Exception as e:
+            self.logger.warning(f"保存示例库失败: {str(e)}")
+
+    def record(self, connection_key, question, sql):
+        """
+        记录一条执行成功的问题→SQL示例
+
+        Args:
+            connection_key (str): 连接标识
+            question (str): 自然语言问题
+            sql (str): 执行成功的SQL
+        """
+        key = normalize_question(question)
+        if not key or not sql:
+            return
+        with self._lock:
+            examples = self._get(connection_key)
+            previous = examples.examples.get(key)
+            example = {
+                "question": question,
+                "sql": sql,
+                "uses": (previous["uses"] + 1) if previous and previous["sql"] == sql else 1,
+                "last_used": time.time()
+            }
+            examples.add(key, example)
+
+            # 淘汰最久未使用的示例
+            overflow = len(examples.examples) - self.max_examples
+            if overflow > 0:
+                oldest = sorted(examples.examples.items(), key=lambda item: item[1]["last_used"])[:overflow]
+                for old_key, _ in oldest:
+                    examples.remove(old_key)
+            self._save(connection_key, examples)
+
+    def search(self, connection_key, question, top_k=3, min_score=0.2):
+        """
+        检索相似问题的示例
+
+        Args:
+            connection_key (str): 连接标识
+            question (str): 自然语言问题
+            top_k (int): 最多返回的示例数
+            min_score (float): 最低相似度
+
+        Returns:
+            list: 示例列表，每项包含question、sql、score，按相似度降序
+        """
+        key = normalize_question(question)
+        if not key or top_k <= 0:
+            return []
+        with self._lock:
+            examples = self._get(connection_key)
+            scores = examples.score(key)
+            ranked = sorted(
+                ((score, doc) for doc, score in scores.items() if score >= min_score),
+                reverse=True
+            )[:top_k]
+            return [
+                {
+                    "question": examples.examples[doc]["question"],
+                    "sql": examples.examples[doc]["sql"],
+                    "score": round(score, 4)
+                }
+                for score, doc in ranked
+            ]
+
+    def find_reusable(self, connection_key, question, threshold=1.0):
+        """
+        查找可直接复用SQL的示例
+
+        相似度达到阈值且问题中的数字完全一致时才复用，避免"前10名"与"前20名"之类的问题误用同一SQL。
+
+        Args:
+            connection_key (str): 连接标识
+            question (str): 自然语言问题
+            threshold (float): 复用所需的最低相似度，1.0表示归一化后完全相同
+
+        Returns:
+            dict: 可复用的示例（含question、sql、score），没有时返回None
+        """
+        matches = self.search(connection_key, question, top_k=1, min_score=min(threshold, 1.0) - 1e-9)
+        if not matches:
+            return None
+        match = matches[0]
+        if _NUMBER_PATTERN.findall(match["question"]) != _NUMBER_PATTERN.findall(question):
+            return None
+        if threshold >= 1.0 and normalize_question(match["question"]) != normalize_question(question):
+            return None
+        return match
+
+    def discard(self, connection_key, question):
+        """
+        删除示例（如复用的SQL已无法执行）
+
+        Args:
+            connection_key (str): 连接标识
+            question (str): 自然语言问题
+        """
+        with self._lock:
+            examples = self._get(connection_key)
+            examples.remove(normalize_question(question))
+            self._save(connection_key, examples)
+
+    def count(self, connection_key):
+        """
+        获取连接的示例数
+
+        Args:
+            connection_key (str): 连接标识
+
+        Returns:
+            int: 示例数
+        """
+        with self._lock:
+            return len(self._get(connection_key).examples)
@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+对话历史管理，按token预算压缩对话历史
+"""
+
+import os
+import re
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+from app.services.tokenizer import estimate_message_tokens
+
+# 匹配```sql```代码块
+SQL_BLOCK_PATTERN = re.compile(r'```sql\s+(.*?)\s+```', re.DOTALL)
+
+
+class ConversationHistoryManager:
+    """
+    对话历史管理器
+
+    - 最近的若干轮对话原样保留
+    - 更早的对话压缩为摘要（用户问题截断 + 之前生成的SQL）
+    - 压缩结果按会话缓存，客户端每次提交完整历史时只需增量压缩新过期的消息
+    - 整体不超过token预算，超出时先丢弃最旧的摘要，再减少保留的对话轮数
+    """
+
+    SUMMARY_HEADER = "此前对话摘要（仅供参考）:\n"
+    SUMMARY_ACK = "好的，我已了解之前的对话内容。"
+
+    def __init__(self, token_budget=1500, keep_recent_turns=2, max_sessions=256, question_chars=80):
+        """
+        初始化对话历史管理器
+
+        Args:
+            token_budget (int): 对话历史允许占用的最大token数
+            keep_recent_turns (int): 原样保留的最近对话轮数（一问一答为一轮）
+            max_sessions (int): 最多缓存的会话数
+            question_chars (int): 摘要中用户问题保留的最大字符数
+        """
+        self.logger = logging.getLogger(__name__)
+        self.token_budget = int(token_budget)
+        self.keep_recent_turns = max(0, int(keep_recent_turns))
+        self.max_sessions = int(max_sessions)
+        self.question_chars = int(question_chars)
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """
+        根据环境变量创建管理器
+
+        Returns:
+            ConversationHistoryManager: 管理器实例
+        """
+        return cls(
+            token_budget=int(os.environ.get('HISTORY_TOKEN_BUDGET', 1500)),
+            keep_recent_turns=int(os.environ.get('HISTORY_KEEP_RECENT_TURNS', 2)),
+            max_sessions=int(os.environ.get('HISTORY_MAX_SESSIONS', 256)),
+        )
+
+    @staticmethod
+    def _normalize(history):
+        """统一消息格式，只保留role、content与可选的sql"""
+        messages = []
+        for message in history or []:
+            role = "user" if message.get("role") == "user" else "assistant"
+            item = {"role": role, "content": message.get("content") or ""}
+            if message.get("sql"):
+                item["sql"] = message["sql"]
+            messages.append(item)
+        return messages
+
+    @staticmethod
+    def _fingerprint(previous, message):
+        """计算增量的消息指纹"""
+        digest = hashlib.sha1(previous.encode("utf-8"))
+        digest.update(message["role"].encode("utf-8"))
+        digest.update(message["content"].encode("utf-8"))
+        digest.update((message.get("sql") or "").encode("utf-8"))
+        return digest.hexdigest()
+
+    def _summarize_message(self, message):
+        """
+        将单条消息压缩为一行摘要
+
+        Args:
+            message (dict): 消息
+
+        Returns:
+            str: 摘要行，无需保留时返回None
+        """
+        if message["role"] == "user":
+            question = " ".join(message["content"].split())
+            if len(question) > self.question_chars:
+                question = question[:self.question_chars] + "…"
+            return f"问: {question}" if question else None
+
+        sql = message.get("sql")
+        if not sql:
+            blocks = SQL_BLOCK_PATTERN.findall(message["content"])
+            sql = blocks[0] if blocks else None
+        if sql:
+            return "SQL: " + " ".join(sql.split())
+        return None
+
+    def _split_index(self, messages):
+        """
+        计算保留原文的起始位置，保证保留部分以用户消息开头
+
+        Returns:
+            int: 原样保留部分在列表中的起始下标
+        """
+        if self.keep_recent_turns == 0:
+            return len(messages)
+        user_indices = [i for i, m in enumerate(messages) if m["role"] == "user"]
+        if len(user_indices) <= self.keep_recent_turns:
+            return user_indices[0] if user_indices else len(messages)
+        return user_indices[-self.keep_recent_turns]
+
+    def _get_summary_lines(self, session_id, older):
+        """
+        获取较早消息的摘要行，优先复用会话缓存并增量更新
+
+        Args:
+            session_id (str): 会话ID
+            older (list): 需要压缩的较早消息
+
+        Returns:
+            list: 摘要行
+        """
+        with self._lock:
+            cached = self._cache.get(session_id) if session_id else None
+
+        count = 0
+        fingerprint = ""
+        lines = []
+        if cached and cached["count"] <= len(older):
+            # 校验缓存对应的消息前缀未被修改
+            check = ""
+            for message in older[:cached["count"]]:
+                check = self._fingerprint(check, message)
+            if check == cached["fingerprint"]:
+                count = cached["count"]
+                fingerprint = cached["fingerprint"]
+                lines = list(cached["lines"])
+
+        for message in older[count:]:
+            fingerprint = self._fingerprint(fingerprint, message)
+            line = self._summarize_message(message)
+            if line:
+                lines.append(line)
+
+        if session_id:
+            with self._lock:
+                self._cache[session_id] = {"count": len(older), "fingerprint": fingerprint, "lines": lines}
+                self._cache.move_to_end(session_id)
+                while len(self._cache) > self.max_sessions:
+                    self._cache.popitem(last=False)
+        return lines
+
+    def _build(self, summary_lines, recent):
+        """组装摘要消息与原样保留的消息"""
+        messages = []
+        if summary_lines:
+            messages.append({"role": "user", "content": self.SUMMARY_HEADER + "\n".join(summary_lines)})
+            messages.append({"role": "assistant", "content": self.SUMMARY_ACK})
+        messages.extend({"role": m["role"], "content": m["content"]} for m in recent)
+        return messages
+
+    def compact(self, history, session_id=None):
+        """
+        按token预算压缩对话历史
+
+        Args:
+            history (list): 客户端提交的完整对话历史
+            session_id (str, optional): 会话ID，用于缓存压缩结果
+
+        Returns:
+            list: 可直接发送给LLM的消息列表
+        """
+        messages = self._normalize(history)
+        if not messages:
+            return []
+
+        split = self._split_index(messages)
+        older, recent = messages[:split], messages[split:]
+        summary_lines = self._get_summary_lines(session_id, older) if older else []
+
+        compacted = self._build(summary_lines, recent)
+        # 超出预算时先丢弃最旧的摘要行
+        while summary_lines and estimate_message_tokens(compacted) > self.token_budget:
+            summary_lines = summary_lines[1:]
+            compacted = self._build(summary_lines, recent)
+        # 仍超出预算时从最旧的一轮开始丢弃原文
+        while recent and estimate_message_tokens(compacted) > self.token_budget:
+            next_user = [i for i, m in enumerate(recent) if i > 0 and m["role"] == "user"]
+            recent = recent[next_user[0]:] if next_user else []
+            compacted = self._build(summary_lines, recent)
+
+        if len(compacted) != len(messages):
+            self.logger.debug(
+                f"对话历史已压缩: {len(messages)} 条消息 -> {len(compacted)} 条, "
+                f"约 {estimate_message_tokens(compacted)} tokens"
+            )
+        return compacted
+
+    def clear(self, session_id=None):
+        """
+        清除会话缓存
+
+        Args:
+            session_id (str, optional): 会话ID，为空时清除全部
+        """
+        with self._lock:
+            if session_id is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(session_id, None)
+
@@ -0,0 +1,513 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+LLM提供商注册表，支持多提供商并发限制、限流、故障转移与对冲请求
+"""
+
+import os
+import time
+import logging
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+class ProviderThrottledError(Exception):
+    """提供商被限流（本地限流或远端返回429）"""
+
+
+class ProviderUnavailableError(Exception):
+    """没有可用的LLM提供商"""
+
+
+def _env_float(name, default):
+    """读取浮点型环境变量"""
+    try:
+        return float(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        return float(default)
+
+
+def _env_int(name, default):
+    """读取整型环境变量"""
+    try:
+        return int(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        return int(default)
+
+
+class BaseLLMProvider(ABC):
+    """
+    LLM提供商基类
+
+    每个提供商拥有独立的并发上限（信号量）与速率限制（令牌桶，单位：次/分钟），
+    并在连续失败或被限流后进入冷却期，冷却期内注册表会跳过该提供商。
+    """
+
+    name = "base"
+
+    def __init__(self, max_concurrency=4, rate_limit=60, timeout=60, cooldown=30, failure_threshold=3):
+        """
+        初始化提供商
+
+        Args:
+            max_concurrency (int): 最大并发请求数
+            rate_limit (float): 每分钟允许的请求数，0表示不限制
+            timeout (float): 单次请求超时时间（秒）
+            cooldown (float): 被限流或连续失败后的冷却时间（秒）
+            failure_threshold (int): 进入冷却前允许的连续失败次数
+        """
+        self.logger = logging.getLogger(__name__)
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.rate_limit = float(rate_limit)
+        self.timeout = float(timeout)
+        self.cooldown = float(cooldown)
+        self.failure_threshold = max(1, int(failure_threshold))
+
+        self._semaphore = threading.BoundedSemaphore(self.max_concurrency)
+        self._lock = threading.Lock()
+        self._tokens = self.rate_limit if self.rate_limit > 0 else 0.0
+        self._last_refill = time.monotonic()
+        self._consecutive_failures = 0
+        self._cooldown_until = 0.0
+
+        # 运行统计
+        self.stats = {"calls": 0, "failures": 0, "throttled": 0, "total_latency": 0.0}
+
+    @classmethod
+    def from_env(cls):
+        """
+        根据环境变量创建提供商实例，变量名形如 LLM_<NAME>_MAX_CONCURRENCY
+
+        Returns:
+            BaseLLMProvider: 提供商实例
+        """
+        prefix = f"LLM_{cls.name.upper()}_"
+        return cls(
+            max_concurrency=_env_int(prefix + "MAX_CONCURRENCY", 4),
+            rate_limit=_env_float(prefix + "RATE_LIMIT", 60),
+            timeout=_env_float(prefix + "TIMEOUT", 60),
+            cooldown=_env_float(prefix + "COOLDOWN", 30),
+            failure_threshold=_env_int(prefix + "FAILURE_THRESHOLD", 3),
+        )
+
+    def is_configured(self):
+        """
+        是否已正确配置（如API密钥）
+
+        Returns:
+            bool: 已配置返回True
+        """
+        return False
+
+    def is_healthy(self):
+        """
+        是否不在冷却期
+
+        Returns:
+            bool: 可用返回True
+        """
+        return time.monotonic() >= self._cooldown_until
+
+    def _take_rate_token(self):
+        """从令牌桶取一个令牌，取不到返回False"""
+        if self.rate_limit <= 0:
+            return True
+        with self._lock:
+            now = time.monotonic()
+            elapsed = now - self._last_refill
+            self._last_refill = now
+            self._tokens = min(self.rate_limit, self._tokens + elapsed * self.rate_limit / 60.0)
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+    def acquire(self, timeout=0):
+        """
+        申请一个调用名额（并发槽位 + 速率令牌）
+
+        Args:
+            timeout (float): 等待并发槽位的最长时间（秒），0表示不等待
+
+        Returns:
+            bool: 成功申请返回True
+        """
+        if timeout and timeout > 0:
+            acquired = self._semaphore.acquire(timeout=timeout)
+        else:
+            acquired = self._semaphore.acquire(blocking=False)
+        if not acquired:
+            with self._lock:
+                self.stats["throttled"] += 1
+            return False
+        if not self._take_rate_token():
+            self._semaphore.release()
+            with self._lock:
+                self.stats["throttled"] += 1
+            return False
+        return True
+
+    def release(self):
+        """释放并发槽位"""
+        self._semaphore.release()
+
+    def record_success(self, latency):
+        """记录一次成功调用"""
+        with self._lock:
+            self._consecutive_failures = 0
+            self.stats["calls"] += 1
+            self.stats["total_latency"] += latency
+
+    def record_failure(self, throttled=False):
+        """记录一次失败调用，必要时进入冷却期"""
+        with self._lock:
+            self._consecutive_failures += 1
+            self.stats["calls"] += 1
+            self.stats["failures"] += 1
+            if throttled or self._consecutive_failures >= self.failure_threshold:
+                self._cooldown_until = time.monotonic() + self.cooldown
+                self.logger.warning(f"LLM提供商 {self.name} 进入冷却期 {self.cooldown} 秒")
+
+    @abstractmethod
+    def complete(self, system, messages, max_tokens=2000, temperature=0.0):
+        """
+        调用模型生成文本
+
+        Args:
+            system (str): 系统消息
+            messages (list): 消息列表
+            max_tokens (int): 最大token数
+            temperature (float): 温度参数
+
+        Returns:
+            str: 模型返回的文本
+        """
+
+
+class AnthropicProvider(BaseLLMProvider):
+    """Anthropic Claude 提供商"""
+
+    name = "anthropic"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.api_key = os.environ.get('ANTHROPIC_API_KEY')
+        self.model = os.environ.get('ANTHROPIC_MODEL', 'claude-3-sonnet-20240229')
+        self._client = None
+        self._client_lock = threading.Lock()
+
+    def is_configured(self):
+        return bool(self.api_key)
+
+    def _get_client(self):
+        """获取（必要时创建）客户端，首次调用时才导入anthropic"""
+        with self._client_lock:
+            if self._client is None:
+                from anthropic import Anthropic
+                self._client = Anthropic(api_key=self.api_key, timeout=self.timeout, max_retries=0)
+                self.logger.info("已初始化Anthropic API客户端")
+            return self._client
+
+    def complete(self, system, messages, max_tokens=2000, temperature=0.0):
+        if not self.api_key:
+            raise ValueError("未初始化Anthropic客户端")
+
+        import anthropic
+        try:
+            response = self._get_client().messages.create(
+                model=self.model,
+                system=system,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=temperature
+            )
+        except anthropic.RateLimitError as e:
+            raise ProviderThrottledError(f"Anthropic API限流: {str(e)}")
+
+        return response.content[0].text
+
+
+class DeepSeekProvider(BaseLLMProvider):
+    """DeepSeek 提供商，使用REST API"""
+
+    name = "deepseek"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.api_key = os.environ.get('DEEPSEEK_API_KEY')
+        self.api_url = os.environ.get('DEEPSEEK_API_URL', "https://api.deepseek.com/v1/chat/completions")
+        self.model = os.environ.get('DEEPSEEK_MODEL', 'deepseek-chat')
+        self._session = None
+        self._session_lock = threading.Lock()
+
+    def is_configured(self):
+        return bool(self.api_key)
+
+    def _get_session(self):
+        """获取（必要时创建）HTTP会话，首次调用时才导入requests"""
+        with self._session_lock:
+            if self._session is None:
+                import requests
+                self._session = requests.Session()
+                self.logger.info("已初始化DeepSeek API客户端")
+            return self._session
+
+    def complete(self, system, messages, max_tokens=2000, temperature=0.0):
+        if not self.api_key:
+            raise ValueError("未配置DeepSeek API密钥")
+
+        # 格式化消息，包括系统消息
+        formatted_messages = [{"role": "system", "content": system}]
+        formatted_messages.extend(messages)
+
+        request_body = {
+            "model": self.model,
+            "messages": formatted_messages,
+            "max_tokens": max_tokens,
+            "temperature": temperature
+        }
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {self.api_key}"
+        }
+
+        response = self._get_session().post(self.api_url, headers=headers, json=request_body, timeout=self.timeout)
+
+        if response.status_code == 429:
+            raise ProviderThrottledError(f"DeepSeek API限流: {response.text}")
+        if response.status_code != 200:
+            raise Exception(f"DeepSeek API请求失败: {response.text}")
+
+        response_data = response.json()
+        if "choices" not in response_data or len(response_data["choices"]) == 0:
+            raise Exception("DeepSeek API响应格式错误")
+
+        return response_data["choices"][0]["message"]["content"]
+
+
+class StubProvider(BaseLLMProvider):
+    """
+    本地桩提供商，不访问网络，用于测试与演示
+
+    通过 LLM_STUB_RESPONSE 指定固定返回内容，LLM_STUB_LATENCY 模拟响应延迟（秒），
+    LLM_STUB_FAIL=1 模拟调用失败。
+    """
+
+    name = "stub"
+
+    DEFAULT_RESPONSE = "```sql\nSELECT 1\n```\n\n这是本地桩提供商返回的示例SQL。"
+
+    def __init__(self, *args, response=None, latency=None, fail=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.response = response if response is not None else os.environ.get('LLM_STUB_RESPONSE', self.DEFAULT_RESPONSE)
+        self.latency = latency if latency is not None else _env_float('LLM_STUB_LATENCY', 0)
+        self.fail = fail if fail is not None else os.environ.get('LLM_STUB_FAIL') == '1'
+
+    def is_configured(self):
+        return True
+
+    def complete(self, system, messages, max_tokens=2000, temperature=0.0):
+        if self.latency > 0:
+            time.sleep(self.latency)
+        if self.fail:
+            raise Exception("桩提供商模拟调用失败")
+        return self.response
+
+
+class LLMProviderRegistry:
+    """
+    LLM提供商注册表
+
+    按优先级依次尝试已配置的提供商：
+    - 提供商处于冷却期、并发已满或速率超限时直接跳到下一个（故障转移）
+    - 提供商调用失败时转到下一个
+    - 首个请求超过 hedge_delay 秒仍未返回时，同时向下一个提供商发起对冲请求，取先返回者
+    """
+
+    # 可用的提供商类型
+    PROVIDER_CLASSES = {
+        AnthropicProvider.name: AnthropicProvider,
+        DeepSeekProvider.name: DeepSeekProvider,
+        StubProvider.name: StubProvider,
+    }
+
+    def __init__(self, providers=None, hedge_delay=0):
+        """
+        初始化注册表
+
+        Args:
+            providers (list, optional): 按优先级排列的提供商实例
+            hedge_delay (float): 发起对冲请求前等待的秒数，0表示不对冲
+        """
+        self.logger = logging.getLogger(__name__)
+        self.providers = []
+        self.hedge_delay = float(hedge_delay)
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        for provider in providers or []:
+            self.register(provider)
+
+    @classmethod
+    def register_provider_class(cls, provider_class):
+        """
+        注册新的提供商类型，使其可以通过 LLM_PROVIDERS 环境变量启用
+
+        Args:
+            provider_class (type): BaseLLMProvider 的子类
+        """
+        cls.PROVIDER_CLASSES[provider_class.name] = provider_class
+
+    @classmethod
+    def from_env(cls):
+        """
+        根据环境变量创建注册表
+
+        LLM_PROVIDERS 为逗号分隔的提供商列表（按优先级），未设置时回退到 LLM_PROVIDER；
+        LLM_HEDGE_DELAY 为对冲等待秒数。
+
+        Returns:
+            LLMProviderRegistry: 注册表实例
+        """
+        names = os.environ.get('LLM_PROVIDERS') or os.environ.get('LLM_PROVIDER', 'anthropic')
+        registry = cls(hedge_delay=_env_float('LLM_HEDGE_DELAY', 0))
+        for name in [n.strip().lower() for n in names.split(',') if n.strip()]:
+            provider_class = cls.PROVIDER_CLASSES.get(name)
+            if provider_class is None:
+                registry.logger.warning(f"未知的LLM提供商: {name}")
+                continue
+            registry.register(provider_class.from_env())
+        return registry
+
+    def register(self, provider):
+        """
+        注册提供商实例（追加到优先级末尾）
+
+        Args:
+            provider (BaseLLMProvider): 提供商实例
+        """
+        self.providers.append(provider)
+        if not provider.is_configured():
+            self.logger.warning(f"未能初始化{provider.name}客户端，请检查API密钥配置")
+        # 提供商变化后重建线程池
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+
+    @property
+    def primary_name(self):
+        """首选提供商名称"""
+        return self.providers[0].name if self.providers else "none"
+
+    def available(self):
+        """
+        是否存在已配置的提供商
+
+        Returns:
+            bool: 存在返回True
+        """
+        return any(p.is_configured() for p in self.providers)
+
+    def _get_executor(self):
+        """获取（必要时创建）调用线程池"""
+        with self._executor_lock:
+            if self._executor is None:
+                workers = max(1, sum(p.max_concurrency for p in self.providers))
+                self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="llm")
+            return self._executor
+
+    def _invoke(self, provider, system, messages, max_tokens, temperature):
+        """在已申请名额的前提下调用提供商并记录统计"""
+        start = time.monotonic()
+        try:
+            result = provider.complete(system, messages, max_tokens, temperature)
+            provider.record_success(time.monotonic() - start)
+            return result
+        except ProviderThrottledError:
+            provider.record_failure(throttled=True)
+            raise
+        except Exception:
+            provider.record_failure()
+            raise
+        finally:
+            provider.release()
+
+    def call(self, system, messages, max_tokens=2000, temperature=0.0):
+        """
+        调用LLM，自动故障转移与对冲
+
+        Args:
+            system (str): 系统消息
+            messages (list): 消息列表
+            max_tokens (int): 最大token数
+            temperature (float): 温度参数
+
+        Returns:
+            str: 模型返回的文本
+        """
+        candidates = [p for p in self.providers if p.is_configured()]
+        if not candidates:
+            raise ProviderUnavailableError("未配置可用的LLM提供商")
+
+        # 健康的提供商优先，冷却中的放到最后作为兜底
+        queue = [p for p in candidates if p.is_healthy()] + [p for p in candidates if not p.is_healthy()]
+        executor = self._get_executor()
+        pending = {}
+        errors = []
+
+        def launch_next():
+            # 依次尝试申请名额，最后一个候选允许阻塞等待
+            while queue:
+                provider = queue.pop(0)
+                wait_timeout = provider.timeout if not queue and not pending else 0
+                if not provider.acquire(timeout=wait_timeout):
+                    errors.append(f"{provider.name}: 并发或速率超限")
+                    continue
+                future = executor.submit(self._invoke, provider, system, messages, max_tokens, temperature)
+                pending[future] = provider
+                return True
+            return False
+
+        launch_next()
+        while pending:
+            hedge = self.hedge_delay if self.hedge_delay > 0 and queue else None
+            done, _ = wait(list(pending), timeout=hedge, return_when=FIRST_COMPLETED)
+
+            if not done:
+                # 超过对冲等待时间，向下一个提供商发起对冲请求
+                names = ",".join(p.name for p in pending.values())
+                if launch_next():
+                    self.logger.info(f"LLM提供商 {names} 响应缓慢，发起对冲请求")
+                continue
+
+            for future in done:
+                provider = pending.pop(future)
+                try:
+                    return future.result()
+                except Exception as e:
+                    self.logger.warning(f"LLM提供商 {provider.name} 调用失败: {str(e)}")
+                    errors.append(f"{provider.name}: {str(e)}")
+
+            if not pending:
+                launch_next()
+
+        raise ProviderUnavailableError("所有LLM提供商调用失败: " + "; ".join(errors))
+
+    def get_stats(self):
+        """
+        获取各提供商的运行统计
+
+        Returns:
+            dict: 提供商名称到统计信息的映射
+        """
+        stats = {}
+        for provider in self.providers:
+            item = dict(provider.stats)
+            calls = item["calls"] - item["failures"]
+            item["avg_latency"] = item["total_latency"] / calls if calls > 0 else None
+            item["configured"] = provider.is_configured()
+            item["healthy"] = provider.is_healthy()
+            stats[provider.name] = item
+        return stats
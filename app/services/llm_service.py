@@ -5,47 +5,47 @@
 LLM服务，处理自然语言到SQL的转换
 """
 
-import os
-import json
 import logging
-import requests
-import anthropic
-from anthropic import Anthropic
-import time
+from app.services.llm_providers import LLMProviderRegistry
+from app.services.history_manager import ConversationHistoryManager
+from app.services.schema_formatter import format_schema
+from app.services.result_summarizer import summarize_rows, format_digest
+from app.services.tokenizer import estimate_tokens
 
 class LLMService:
     """提供自然语言处理相关的服务"""
     
-    def __init__(self):
-        """初始化LLM服务"""
+    def __init__(self, registry=None):
+        """
+        初始化LLM服务
+        
+        Args:
+            registry (LLMProviderRegistry, optional): 提供商注册表，默认根据环境变量创建
+        """
         self.logger = logging.getLogger(__name__)
         
-        # 获取API密钥
-        self.anthropic_api_key = os.environ.get('ANTHROPIC_API_KEY')
-        self.deepseek_api_key = os.environ.get('DEEPSEEK_API_KEY')
+        # 初始化提供商注册表（LLM_PROVIDERS可配置多个提供商，按优先级故障转移）
+        self.registry = registry or LLMProviderRegistry.from_env()
+        self.llm_provider = self.registry.primary_name
         
-        # 判断使用哪个LLM服务
-        self.llm_provider = os.environ.get('LLM_PROVIDER', 'anthropic').lower()
+        # 对话历史管理器（按token预算压缩历史）
+        self.history_manager = ConversationHistoryManager.from_env()
         
-        # 初始化客户端
-        self.client = None
-        if self.llm_provider == 'anthropic' and self.anthropic_api_key:
-            self.client = Anthropic(api_key=self.anthropic_api_key)
-            self.logger.info("已初始化Anthropic API客户端")
-        elif self.llm_provider == 'deepseek' and self.deepseek_api_key:
-            # DeepSeek使用REST API而不是SDK客户端
-            self.deepseek_api_url = "https://api.deepseek.com/v1/chat/completions"
-            self.logger.info("已初始化DeepSeek API客户端")
-        else:
-            self.logger.warning(f"未能初始化{self.llm_provider}客户端，请检查API密钥配置")
+        # 单表结构描述缓存，按表指纹失效
+        self.schema_render_cache = {}
+    
+    def _missing_provider_message(self):
+        """未配置可用提供商时的提示信息"""
+        return f"未配置{self.llm_provider.capitalize()} API密钥，无法使用LLM功能"
     
-    def _generate_system_message(self, metadata, sample_data=None):
+    def _generate_system_message(self, metadata, sample_data=None, schema_format=None):
         """
         生成系统消息，用于指导LLM生成SQL
         
         Args:
             metadata (dict): 数据库元数据
             sample_data (dict, optional): 样本数据
+            schema_format (str, optional): 结构描述格式，见 schema_formatter.SCHEMA_FORMATS
             
         Returns:
             str: 系统消息
@@ -74,39 +74,7 @@ class LLMService:
 """
         
         # 添加表和字段信息
-        if metadata and "tables" in metadata:
-            for table in metadata["tables"]:
-                table_name = table.get("name", "")
-                table_comment = table.get("comment", "")
-                
-                # 添加表信息
-                system_message += f"\n表名: {table_name}"
-                if table_comment:
-                    system_message += f" (说明: {table_comment})"
-                system_message += "\n"
-                
-                # 添加字段信息
-                if "columns" in table and table["columns"]:
-                    system_message += "字段:\n"
-                    for column in table["columns"]:
-                        col_name = column.get("name", "")
-                        col_type = column.get("type", "")
-                        col_comment = column.get("comment", "")
-                        is_pk = "是" if column.get("is_primary", False) else "否"
-                        nullable = "可空" if column.get("nullable", True) else "非空"
-                        
-                        system_message += f"- {col_name} ({col_type}, {nullable}, 主键: {is_pk})"
-                        if col_comment:
-                            system_message += f" 说明: {col_comment}"
-                        
-                        # 如果有外键信息，添加外键说明
-                        if "foreign_key" in column:
-                            fk = column["foreign_key"]
-                            system_message += f" 外键 -> {fk['table']}.{fk['column']}"
-                        
-                        system_message += "\n"
-                
-                system_message += "\n"
+        system_message += format_schema(metadata, schema_format, self.schema_render_cache)
         
         # 如果有样本数据，添加样本数据
         if sample_data:
@@ -136,84 +104,37 @@ class LLMService:
         
         return system_message
 
-    def _call_anthropic_api(self, system, messages, max_tokens=2000, temperature=0.0):
+    def build_system_message(self, metadata, sample_data=None, schema_format=None):
         """
-        调用Anthropic Claude API
+        生成系统消息，供多个问题共享（如批量查询）
         
         Args:
-            system (str): 系统消息
-            messages (list): 消息列表
-            max_tokens (int): 最大token数
-            temperature (float): 温度参数
+            metadata (dict): 数据库元数据
+            sample_data (dict, optional): 样本数据
+            schema_format (str, optional): 结构描述格式
             
         Returns:
-            dict: API响应
+            str: 系统消息
         """
-        if not self.client:
-            raise ValueError("未初始化Anthropic客户端")
-            
-        response = self.client.messages.create(
-            model="claude-3-sonnet-20240229",
-            system=system,
-            messages=messages,
-            max_tokens=max_tokens,
-            temperature=temperature
-        )
-        
-        return response.content[0].text
-    
-    def _call_deepseek_api(self, system, messages, max_tokens=2000, temperature=0.0):
+        return self._generate_system_message(metadata, sample_data, schema_format)
+
+    def warm_prompt(self, metadata, sample_data=None, schema_format=None):
         """
-        调用DeepSeek API
+        预生成系统消息，填充结构描述缓存
         
         Args:
-            system (str): 系统消息
-            messages (list): 消息列表
-            max_tokens (int): 最大token数
-            temperature (float): 温度参数
+            metadata (dict): 数据库元数据
+            sample_data (dict, optional): 样本数据
+            schema_format (str, optional): 结构描述格式
             
         Returns:
-            dict: API响应
+            int: 系统消息的估算token数
         """
-        if not self.deepseek_api_key:
-            raise ValueError("未配置DeepSeek API密钥")
-            
-        # 格式化消息，包括系统消息
-        formatted_messages = [{"role": "system", "content": system}]
-        
-        # 添加用户和助手的消息
-        for message in messages:
-            formatted_messages.append(message)
-        
-        # 准备请求体
-        request_body = {
-            "model": "deepseek-chat",  # 使用DeepSeek Chat模型
-            "messages": formatted_messages,
-            "max_tokens": max_tokens,
-            "temperature": temperature
-        }
-        
-        # 发送请求
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {self.deepseek_api_key}"
-        }
-        
-        response = requests.post(self.deepseek_api_url, headers=headers, json=request_body)
-        
-        # 检查响应
-        if response.status_code != 200:
-            raise Exception(f"DeepSeek API请求失败: {response.text}")
-            
-        response_data = response.json()
-        if "choices" not in response_data or len(response_data["choices"]) == 0:
-            raise Exception("DeepSeek API响应格式错误")
-            
-        return response_data["choices"][0]["message"]["content"]
-        
+        return estimate_tokens(self.build_system_message(metadata, sample_data, schema_format))
+
     def _call_llm_api(self, system, messages, max_tokens=2000, temperature=0.0):
         """
-        根据配置调用相应的LLM API
+        通过提供商注册表调用LLM API（自动限流、故障转移与对冲）
         
         Args:
             system (str): 系统消息
@@ -224,14 +145,10 @@ class LLMService:
         Returns:
             str: 模型返回的文本
         """
-        if self.llm_provider == 'anthropic' and self.client:
-            return self._call_anthropic_api(system, messages, max_tokens, temperature)
-        elif self.llm_provider == 'deepseek' and self.deepseek_api_key:
-            return self._call_deepseek_api(system, messages, max_tokens, temperature)
-        else:
-            raise ValueError(f"不支持的LLM提供商: {self.llm_provider}")
+        return self.registry.call(system, messages, max_tokens, temperature)
 
-    def natural_language_to_sql(self, query, metadata, sample_data=None, conversation_history=None):
+    def natural_language_to_sql(self, query, metadata, sample_data=None, conversation_history=None, session_id=None,
+                                schema_format=None, examples=None, system_message=None, value_hints=None):
         """
         将自然语言转换为SQL查询
         
@@ -240,30 +157,39 @@ class LLMService:
             metadata (dict): 数据库元数据
             sample_data (dict, optional): 样本数据
             conversation_history (list, optional): 对话历史
+            session_id (str, optional): 会话ID，用于缓存压缩后的对话历史
+            schema_format (str, optional): 结构描述格式
+            examples (list, optional): 相似问题的已验证示例，每项包含question和sql
+            system_message (str, optional): 预先生成的系统消息（批量查询时共享），为空时根据元数据生成
+            value_hints (str, optional): 问题中提到的取值在数据库中的实际存储值，见 format_value_hints
             
         Returns:
             dict: 包含生成的SQL和解释的字典
         """
         try:
-            if (self.llm_provider == 'anthropic' and not self.anthropic_api_key) or (self.llm_provider == 'deepseek' and not self.deepseek_api_key):
+            if not self.registry.available():
                 return {
-                    "error": f"未配置{self.llm_provider.capitalize()} API密钥，无法使用LLM功能",
+                    "error": self._missing_provider_message(),
                     "sql": None,
                     "explanation": None
                 }
             
             # 生成系统消息
-            system_message = self._generate_system_message(metadata, sample_data)
+            if system_message is None:
+                system_message = self._generate_system_message(metadata, sample_data, schema_format)
+            
+            # 添加相似问题的示例
+            if examples:
+                system_message += "\n以下是该数据库中相似问题的已验证SQL，可作为参考:\n"
+                for example in examples:
+                    system_message += f"\n问: {example['question']}\n```sql\n{example['sql']}\n```\n"
             
-            # 准备消息历史
-            messages = []
+            # 添加问题中提到的实际取值
+            if value_hints:
+                system_message += value_hints
             
-            # 添加对话历史（如果有）
-            if conversation_history:
-                for message in conversation_history:
-                    role = "user" if message.get("role") == "user" else "assistant"
-                    content = message.get("content", "")
-                    messages.append({"role": role, "content": content})
+            # 准备消息历史（按token预算压缩，较早的对话只保留摘要）
+            messages = self.history_manager.compact(conversation_history, session_id)
             
             # 添加当前查询
             messages.append({"role": "user", "content": query})
@@ -296,7 +222,8 @@ class LLMService:
                 "explanation": None
             }
     
-    def revise_sql(self, original_sql, error_message, metadata, sample_data=None, user_query=None):
+    def revise_sql(self, original_sql, error_message, metadata, sample_data=None, user_query=None, schema_format=None,
+                   value_hints=None):
         """
         修正有问题的SQL语句
         
@@ -306,20 +233,24 @@ class LLMService:
             metadata (dict): 数据库元数据
             sample_data (dict, optional): 样本数据
             user_query (str, optional): 用户的原始查询
+            schema_format (str, optional): 结构描述格式
+            value_hints (str, optional): 问题中提到的取值在数据库中的实际存储值
             
         Returns:
             dict: 包含修正后的SQL和解释的字典
         """
         try:
-            if (self.llm_provider == 'anthropic' and not self.anthropic_api_key) or (self.llm_provider == 'deepseek' and not self.deepseek_api_key):
+            if not self.registry.available():
                 return {
-                    "error": f"未配置{self.llm_provider.capitalize()} API密钥，无法使用LLM功能",
+                    "error": self._missing_provider_message(),
                     "sql": None,
                     "explanation": None
                 }
             
             # 生成系统消息
-            system_message = self._generate_system_message(metadata, sample_data)
+            system_message = self._generate_system_message(metadata, sample_data, schema_format)
+            if value_hints:
+                system_message += value_hints
             system_message += "\n你的任务是修正有问题的SQL语句，确保修正后的SQL语句可以正确执行。"
             
             # 构建用户消息
@@ -372,8 +303,8 @@ class LLMService:
             str: 结果解释
         """
         try:
-            if (self.llm_provider == 'anthropic' and not self.anthropic_api_key) or (self.llm_provider == 'deepseek' and not self.deepseek_api_key):
-                return f"未配置{self.llm_provider.capitalize()} API密钥，无法使用LLM功能进行结果解释"
+            if not self.registry.available():
+                return f"{self._missing_provider_message()}进行结果解释"
             
             # 构建系统消息
             system_message = """你是一个专业的数据分析师，能够清晰解释SQL查询结果。
@@ -400,31 +331,12 @@ class LLMService:
                 if "error" in results:
                     user_message += f"查询出错: {results['error']}\n"
                 else:
-                    # 添加结果统计
-                    row_count = results.get("rowCount", 0)
-                    user_message += f"返回了 {row_count} 条记录\n"
-                    
-                    # 添加统计信息
-                    if "statistics" in results:
-                        user_message += "\n统计信息:\n"
-                        for col, stats in results["statistics"].items():
-                            user_message += f"- {col}: 最小值={stats.get('min')}, 最大值={stats.get('max')}, 平均值={stats.get('mean')}, 空值数={stats.get('null_count')}\n"
-                    
-                    # 添加结果数据
-                    if "columns" in results and "rows" in results and results["rows"]:
-                        user_message += "\n数据示例:\n"
-                        columns = results["columns"]
-                        
-                        # 表头
-                        user_message += "| " + " | ".join(columns) + " |\n"
-                        user_message += "| " + " | ".join(["---" for _ in columns]) + " |\n"
-                        
-                        # 数据行（最多显示10行）
-                        for idx, row in enumerate(results["rows"]):
-                            if idx >= 10:
-                                user_message += "| ... | ... | ... |\n"
-                                break
-                            user_message += "| " + " | ".join([str(row.get(col, "")) for col in columns]) + " |\n"
+                    # 添加固定大小的结果摘要（基于完整结果统计，与结果行数、列数无关）
+                    digest = results.get("digest")
+                    if not digest:
+                        rows = results.get("rows", []) if results.get("rowFormat") != "columns" else []
+                        digest = summarize_rows(results.get("columns", []), rows)
+                    user_message += format_digest(digest)
             else:
                 user_message += f"查询结果: {results}\n"
             
@@ -0,0 +1,439 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+性能分析：单个请求的cProfile/采样分析，以及对运行中工作进程的限时采样，
+采样结果可导出为火焰图使用的折叠栈格式（flamegraph.pl、speedscope均可读取）
+"""
+
+import os
+import io
+import sys
+import time
+import uuid
+import pstats
+import marshal
+import logging
+import threading
+import cProfile
+from collections import Counter, OrderedDict
+
+# 单个请求的分析方式
+PROFILE_MODES = ("cprofile", "sampling")
+
+# 采样间隔与时长的范围（秒）
+MIN_SAMPLE_INTERVAL = 0.001
+MAX_SAMPLE_DURATION = 120
+
+# 栈的最大深度，超出部分截断
+_MAX_STACK_DEPTH = 200
+
+
+class ProfilerBusy(Exception):
+    """已有同类分析正在进行"""
+
+
+def _frame_name(frame):
+    """栈帧在折叠栈中的名称：函数名 (文件:首行号)"""
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _collect_stack(frame):
+    """从最外层到当前帧的函数名列表"""
+    stack = []
+    while frame is not None and len(stack) < _MAX_STACK_DEPTH:
+        stack.append(_frame_name(frame))
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+
+class SamplingProfiler:
+    """
+    采样分析器：后台线程按固定间隔读取各线程的调用栈并按栈聚合计数
+
+    不修改被分析线程的执行，开销只取决于采样间隔与线程数，可以对生产环境的工作进程使用。
+    """
+
+    def __init__(self, interval=0.005, thread_ids=None, on_finish=None):
+        """
+        初始化采样分析器
+
+        Args:
+            interval (float): 采样间隔（秒）
+            thread_ids (set, optional): 只采样这些线程，为空时采样除自身外的所有线程
+            on_finish (callable, optional): 采样结束后以分析器为参数调用
+        """
+        self.interval = max(MIN_SAMPLE_INTERVAL, float(interval))
+        self.thread_ids = set(thread_ids) if thread_ids else None
+        self.on_finish = on_finish
+        self.stacks = Counter()
+        self.samples = 0
+        self.started_at = None
+        self.finished_at = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self, duration=None):
+        """
+        开始采样
+
+        Args:
+            duration (float, optional): 采样时长（秒），为空时采样到调用 stop 为止
+        """
+        self.started_at = time.time()
+        self._thread = threading.Thread(target=self._run, args=(duration,), name="sampling-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """停止采样并等待采样线程结束"""
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _run(self, duration):
+        own_id = threading.get_ident()
+        deadline = time.monotonic() + duration if duration else None
+        try:
+            while not self._stop.is_set():
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id == own_id or (self.thread_ids and thread_id not in self.thread_ids):
+                        continue
+                    stack = _collect_stack(frame)
+                    if self.thread_ids is None:
+                        # 分析整个进程时以线程名作为根节点，区分请求线程与后台线程
+                        stack.insert(0, names.get(thread_id, str(thread_id)))
+                    self.stacks[tuple(stack)] += 1
+                self.samples += 1
+                if deadline is not None and time.monotonic() >= deadline:
+                    break
+                self._stop.wait(self.interval)
+        finally:
+            self.finished_at = time.time()
+            if self.on_finish is not None:
+                self.on_finish(self)
+
+    def collapsed(self):
+        """
+        折叠栈格式的结果：每行为分号分隔的调用栈与采样次数
+
+        Returns:
+            str: 折叠栈文本
+        """
+        lines = [f"{';'.join(stack)} {count}" for stack, count in self.stacks.most_common()]
+        return "\n".join(lines) + ("\n" if lines else "")
+
+    def top(self, limit=30):
+        """
+        按采样次数排列的函数
+
+        Args:
+            limit (int): 返回的函数数
+
+        Returns:
+            list: 每个函数在栈中出现的采样次数（total）与位于栈顶的采样次数（self）
+        """
+        total = Counter()
+        own = Counter()
+        for stack, count in self.stacks.items():
+            for name in set(stack):
+                total[name] += count
+            own[stack[-1]] += count
+        samples = sum(self.stacks.values()) or 1
+        return [
+            {
+                "function": name,
+                "samples": count,
+                "self_samples": own.get(name, 0),
+                "percent": round(count * 100 / samples, 1)
+            }
+            for name, count in total.most_common(limit)
+        ]
+
+
+class RequestProfile:
+    """
+    单个请求的性能分析，作为上下文管理器包裹需要分析的代码
+
+    - cprofile: 记录每个函数的调用次数与耗时，同一时间只允许一个（cProfile对解释器有全局影响）
+    - sampling: 只采样当前线程，开销更低，可与其他请求同时进行
+    """
+
+    _cprofile_lock = threading.Lock()
+
+    def __init__(self, mode="cprofile", label=None, interval=0.001):
+        """
+        初始化请求分析
+
+        Args:
+            mode (str): 分析方式，cprofile或sampling
+            label (str, optional): 描述，例如接口路径
+            interval (float): sampling方式的采样间隔（秒）
+        """
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"不支持的分析方式: {mode}")
+        self.mode = mode
+        self.label = label
+        self.interval = interval
+        self.duration = None
+        self.profiler = None
+        self._start = None
+
+    def __enter__(self):
+        if self.mode == "cprofile":
+            if not self._cprofile_lock.acquire(blocking=False):
+                raise ProfilerBusy("已有请求正在进行cProfile分析，请稍后重试或使用sampling方式")
+            self.profiler = cProfile.Profile()
+            self._start = time.perf_counter()
+            self.profiler.enable()
+        else:
+            self.profiler = SamplingProfiler(self.interval, thread_ids={threading.get_ident()})
+            self._start = time.perf_counter()
+            self.profiler.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.mode == "cprofile":
+            self.profiler.disable()
+            self._cprofile_lock.release()
+        else:
+            self.profiler.stop()
+        self.duration = time.perf_counter() - self._start
+        return False
+
+
+class ProfileStore:
+    """
+    保存最近的分析结果，可选同时写入目录（.prof可用pstats/snakeviz打开，.collapsed可生成火焰图）
+    """
+
+    def __init__(self, directory=None, keep=20):
+        """
+        初始化分析结果存储
+
+        Args:
+            directory (str, optional): 分析结果文件目录，为空时只保存在内存中
+            keep (int): 内存中保留的结果数
+        """
+        self.logger = logging.getLogger(__name__)
+        self.directory = directory
+        self.keep = max(1, int(keep))
+        self._profiles = OrderedDict()
+        self._lock = threading.Lock()
+        self._sampler = None
+
+    @classmethod
+    def from_env(cls):
+        """
+        根据环境变量创建分析结果存储
+
+        Returns:
+            ProfileStore: 分析结果存储
+        """
+        return cls(
+            directory=os.environ.get('PROFILE_DIR') or None,
+            keep=int(os.environ.get('PROFILE_KEEP', 20))
+        )
+
+    def _save(self, entry):
+        """保存分析结果，超出数量时丢弃最早的结果"""
+        with self._lock:
+            self._profiles[entry["id"]] = entry
+            while len(self._profiles) > self.keep:
+                self._profiles.popitem(last=False)
+        if self.directory:
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                base = os.path.join(self.directory, entry["id"])
+                if entry.get("pstats") is not None:
+                    with open(base + ".prof", "wb") as f:
+                        f.write(entry["pstats"])
+                if entry.get("collapsed") is not None:
+                    with open(base + ".collapsed", "w", encoding="utf-8") as f:
+                        f.write(entry["collapsed"])
+            except OSError as e:
+                self.logger.warning(f"写入分析结果失败: {str(e)}")
+        return entry["id"]
+
+    @staticmethod
+    def _new_entry(kind, label):
+        return {
+            "id": f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{uuid.uuid4().hex[:8]}",
+            "kind": kind,
+            "label": label,
+            "pid": os.getpid(),
+            "created_at": time.time()
+        }
+
+    def save_request(self, profile, limit=30):
+        """
+        保存单个请求的分析结果
+
+        Args:
+            profile (RequestProfile): 已结束的请求分析
+            limit (int): 摘要中的函数数
+
+        Returns:
+            str: 分析结果ID
+        """
+        entry = self._new_entry(profile.mode, profile.label)
+        entry["duration"] = round(profile.duration, 4)
+        if profile.mode == "cprofile":
+            stats = pstats.Stats(profile.profiler)
+            entry["pstats"] = marshal.dumps(stats.stats)
+            entry["top"] = self._pstats_top(stats, limit)
+            entry["collapsed"] = None
+        else:
+            entry["pstats"] = None
+            entry["samples"] = profile.profiler.samples
+            entry["interval"] = profile.profiler.interval
+            entry["top"] = profile.profiler.top(limit)
+            entry["collapsed"] = profile.profiler.collapsed()
+        return self._save(entry)
+
+    @staticmethod
+    def _pstats_top(stats, limit):
+        """按累计耗时排列的函数"""
+        rows = []
+        for (filename, line, name), (_, calls, total, cumulative, _) in stats.stats.items():
+            rows.append({
+                "function": f"{name} ({os.path.basename(filename)}:{line})",
+                "calls": calls,
+                "total_time": round(total, 6),
+                "cumulative_time": round(cumulative, 6)
+            })
+        rows.sort(key=lambda row: row["cumulative_time"], reverse=True)
+        return rows[:limit]
+
+    def start_sampling(self, duration, interval=0.01, label=None):
+        """
+        对当前进程的所有线程开始限时采样，结束后自动保存结果
+
+        Args:
+            duration (float): 采样时长（秒）
+            interval (float): 采样间隔（秒）
+            label (str, optional): 描述
+
+        Returns:
+            str: 分析结果ID，采样结束后可通过 get 获取
+
+        Raises:
+            ProfilerBusy: 已有采样正在进行
+        """
+        duration = min(float(duration), MAX_SAMPLE_DURATION)
+        entry = self._new_entry("process", label)
+
+        def finish(sampler):
+            entry["duration"] = round(sampler.finished_at - sampler.started_at, 4)
+            entry["samples"] = sampler.samples
+            entry["interval"] = sampler.interval
+            entry["top"] = sampler.top()
+            entry["collapsed"] = sampler.collapsed()
+            entry["pstats"] = None
+            entry["running"] = False
+            self._save(entry)
+
+        with self._lock:
+            if self._sampler is not None and self._sampler.running:
+                raise ProfilerBusy("已有进程采样正在进行，请等待其结束")
+            entry["running"] = True
+            self._profiles[entry["id"]] = entry
+            self._sampler = SamplingProfiler(interval, on_finish=finish).start(duration)
+        self.logger.info(f"开始进程采样: {duration}秒，间隔{interval}秒")
+        return entry["id"]
+
+    def stop_sampling(self):
+        """
+        提前结束正在进行的进程采样
+
+        Returns:
+            bool: 是否有采样被结束
+        """
+        with self._lock:
+            sampler = self._sampler
+        if sampler is None or not sampler.running:
+            return False
+        sampler.stop()
+        return True
+
+    def wait(self, profile_id, timeout):
+        """
+        等待进程采样结束
+
+        Args:
+            profile_id (str): 分析结果ID
+            timeout (float): 最长等待时间（秒）
+        """
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            entry = self.get(profile_id)
+            if entry is None or not entry.get("running"):
+                return
+            time.sleep(0.05)
+
+    def get(self, profile_id):
+        """
+        获取分析结果
+
+        Args:
+            profile_id (str): 分析结果ID
+
+        Returns:
+            dict: 分析结果，不存在时返回None
+        """
+        with self._lock:
+            return self._profiles.get(profile_id)
+
+    def summary(self, entry):
+        """
+        分析结果的摘要（不含原始数据）
+
+        Args:
+            entry (dict): 分析结果
+
+        Returns:
+            dict: 摘要
+        """
+        return {key: value for key, value in entry.items() if key not in ("pstats", "collapsed")}
+
+    def list(self):
+        """
+        列出内存中保存的分析结果
+
+        Returns:
+            list: 各结果的ID、类型、描述、进程号与时间
+        """
+        with self._lock:
+            return [
+                {key: entry.get(key) for key in ("id", "kind", "label", "pid", "created_at", "duration", "running")}
+                for entry in reversed(self._profiles.values())
+            ]
+
+    @staticmethod
+    def pstats_text(entry, limit=50):
+        """
+        cProfile结果的文本报告
+
+        Args:
+            entry (dict): 分析结果
+            limit (int): 输出的函数数
+
+        Returns:
+            str: 按累计耗时排序的pstats报告
+        """
+        stats = pstats.Stats()
+        stats.stats = marshal.loads(entry["pstats"])
+        stats.total_calls = sum(row[1] for row in stats.stats.values())
+        stats.prim_calls = sum(row[0] for row in stats.stats.values())
+        stats.total_tt = sum(row[2] for row in stats.stats.values())
+        stream = io.StringIO()
+        stats.stream = stream
+        stats.sort_stats("cumulative").print_stats(limit)
+        return stream.getvalue()
@@ -5,11 +5,28 @@
 查询服务，集成LLM服务与MCP服务
 """
 
+import os
 import json
+import time
 import logging
 import traceback
+from contextlib import nullcontext
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from app.services.llm_service import LLMService
 from app.mcp import MCPServerFactory
+from app.mcp.servers.schema_snapshot import SchemaSnapshotStore
+from app.services.row_encoding import DEFAULT_ROW_FORMAT, encode_rows
+from app.services.result_merger import plan_merge, merge_results
+from app.services.result_summarizer import summarize_rows
+from app.services.warmup import ConnectionWarmup
+from app.services.value_dictionary import format_value_hints
+from app.services.sql_repair import repair_sql
+from app.services.example_store import ExampleStore
+from app.services.result_export import EXPORT_FORMATS, stream_export
+from app.services.result_buffer import ResultBufferStore
+from app.services.dashboard import DashboardRegistry
+from app.services.schema_formatter import SCHEMA_FORMATS, normalize_schema_format, measure_schema_formats
 
 class QueryService:
     """
@@ -21,13 +38,77 @@ class QueryService:
         self.logger = logging.getLogger(__name__)
         self.llm_service = LLMService()
         self.mcp_servers = {}  # 存储已连接的MCP服务器实例
+        self.schema_formats = {}  # 每个连接使用的结构描述格式
+        self.default_schema_format = normalize_schema_format(os.environ.get('SCHEMA_FORMAT'))
+        
+        # 问题→SQL示例库：相似问题作为少样本示例，相同问题直接复用SQL
+        self.example_store = ExampleStore.from_env()
+        self.example_top_k = int(os.environ.get('EXAMPLE_TOP_K', 3))
+        self.example_reuse_threshold = float(os.environ.get('EXAMPLE_REUSE_THRESHOLD', 1.0))
+        
+        # 连接组：同一问题只生成一次SQL，并发在各成员连接（结构相同的分片）上执行
+        self.connection_groups = {}
+        self.fanout_executor = ThreadPoolExecutor(
+            max_workers=int(os.environ.get('FANOUT_WORKERS', 8)),
+            thread_name_prefix="fanout"
+        )
+        self.fanout_max_rows = int(os.environ.get('FANOUT_MAX_ROWS', 1000))
+        
+        # 元数据快照：服务重启后复用已获取的元数据
+        self.snapshot_store = SchemaSnapshotStore.from_env()
+        
+        # 连接预热：后台获取元数据、样本数据并预生成提示词
+        self.warmups = {}
+        self.warmup_executor = ThreadPoolExecutor(
+            max_workers=int(os.environ.get('WARMUP_WORKERS', 4)),
+            thread_name_prefix="warmup"
+        )
+        self.metadata_wait_timeout = float(os.environ.get('WARMUP_METADATA_TIMEOUT', 120))
+        self.sample_wait_timeout = float(os.environ.get('WARMUP_SAMPLE_TIMEOUT', 2))
+        
+        # 列取值字典：预热时统计低基数文本列的取值，只把问题中提到的取值加入提示词（VALUE_HINT_LIMIT为0时关闭）
+        self.value_hint_limit = int(os.environ.get('VALUE_HINT_LIMIT', 20))
+        self.value_refresh_interval = float(os.environ.get('VALUE_DICT_REFRESH_INTERVAL', 600))
+        self.value_retry_interval = float(os.environ.get('VALUE_DICT_RETRY_INTERVAL', 60))
+        self.value_options = {
+            "max_values": int(os.environ.get('VALUE_DICT_MAX_VALUES', 200)),
+            "scan_rows": int(os.environ.get('VALUE_DICT_SCAN_ROWS', 100000)),
+            "max_length": int(os.environ.get('VALUE_DICT_MAX_LENGTH', 100)),
+            "timeout_ms": int(os.environ.get('VALUE_DICT_QUERY_TIMEOUT', 5000))
+        }
+        
+        # 各连接的SQL生成统计：生成次数、修正次数、空结果次数等
+        self.query_stats = {}
+        
+        # 查询结果缓冲区：保存完整结果供后续翻页读取，大结果写入磁盘并以内存映射方式读取
+        self.result_buffers = ResultBufferStore.from_env()
+        
+        # 仪表盘查询：保存注册查询的结果，刷新时只读取水位列之后的新行
+        self.dashboards = DashboardRegistry.from_env()
+        
+        # SQL执行失败时先按错误信息在本地修正，最多尝试的次数（为0时直接调用LLM修正）
+        self.sql_repair_attempts = int(os.environ.get('SQL_REPAIR_ATTEMPTS', 3))
+        
+        # 本地列式镜像：热点表复制到DuckDB，聚合查询在本地执行
+        self.mirror_dir = os.environ.get('MIRROR_DIR', os.path.join('data', 'mirrors'))
+        self.mirror_options = {
+            "refresh_interval": float(os.environ.get('MIRROR_REFRESH_INTERVAL', 300)),
+            "max_staleness": float(os.environ.get('MIRROR_MAX_STALENESS', 900)),
+            "full_refresh_interval": float(os.environ.get('MIRROR_FULL_REFRESH_INTERVAL', 86400)),
+            "batch_size": int(os.environ.get('MIRROR_BATCH_SIZE', 10000))
+        }
     
-    def connect_database(self, db_type, **connection_params):
+    def connect_database(self, db_type, schema_format=None, wait=False, **connection_params):
         """
         连接到指定的数据库
         
+        验证连接可用后立即返回，元数据、样本数据与提示词在后台预热，
+        进度可通过 get_connection_status 查询。
+        
         Args:
             db_type (str): 数据库类型
+            schema_format (str, optional): 提示词中的结构描述格式（verbose/compact/minimal）
+            wait (bool, optional): 是否等待预热完成并在结果中返回元数据与样本数据
             **connection_params: 连接参数
             
         Returns:
@@ -38,26 +119,48 @@ class QueryService:
             connection_id = f"{db_type}_{connection_params.get('host')}_{connection_params.get('database')}"
             
             # 创建MCP服务器实例
-            mcp_server = MCPServerFactory.create_server(db_type, **connection_params)
+            mcp_server = MCPServerFactory.create_server(
+                db_type, snapshot_store=self.snapshot_store, **connection_params
+            )
+            
+            # 验证连接可用
+            mcp_server.ping()
+            
+            # 替换同名的旧连接
+            if connection_id in self.mcp_servers:
+                self.disconnect_database(connection_id)
             
             # 存储MCP服务器实例
             self.mcp_servers[connection_id] = mcp_server
+            self.schema_formats[connection_id] = normalize_schema_format(schema_format or self.default_schema_format)
             
-            # 获取元数据
-            metadata_str = mcp_server.get_database_metadata()
-            metadata = json.loads(metadata_str)
-            
-            # 获取样本数据
-            sample_data_str = mcp_server.get_sample_data(limit=3)
-            sample_data = json.loads(sample_data_str)
+            # 启动后台预热
+            warmup = ConnectionWarmup(
+                connection_id, mcp_server, self.llm_service,
+                schema_format=self.schema_formats[connection_id],
+                value_options=self.value_options if self.value_hint_limit > 0 else None
+            )
+            self.warmups[connection_id] = warmup
+            self.query_stats[connection_id] = Counter()
+            warmup.start(self.warmup_executor)
             
-            return {
+            result = {
                 "status": "success",
                 "connection_id": connection_id,
                 "message": f"成功连接到 {db_type} 数据库",
-                "metadata": metadata,
-                "sample_data": sample_data
+                "schema_format": self.schema_formats[connection_id]
             }
+            
+            if wait:
+                # 列取值字典不影响返回内容，无需等待
+                for stage in ConnectionWarmup.STAGES:
+                    if stage != "values":
+                        warmup.wait(stage, timeout=self.metadata_wait_timeout)
+                result["metadata"] = warmup.metadata
+                result["sample_data"] = warmup.sample_data
+            
+            result["warmup"] = warmup.status()
+            return result
         except Exception as e:
             self.logger.error(f"连接数据库失败: {str(e)}")
             self.logger.error(traceback.format_exc())
@@ -66,7 +169,8 @@ class QueryService:
                 "message": f"连接数据库失败: {str(e)}"
             }
     
-    def process_query(self, connection_id, query, conversation_history=None):
+    def process_query(self, connection_id, query, conversation_history=None, session_id=None,
+                      row_format=DEFAULT_ROW_FORMAT, schema_context=None, approximate=False):
         """
         处理自然语言查询
         
@@ -74,9 +178,13 @@ class QueryService:
             connection_id (str): 数据库连接ID
             query (str): 用户的自然语言查询
             conversation_history (list, optional): 对话历史
+            session_id (str, optional): 会话ID，用于缓存压缩后的对话历史
+            row_format (str, optional): 结果行编码格式（objects/arrays/columns）
+            schema_context (dict, optional): 预先准备的metadata、sample_data与system_message（批量查询时共享）
+            approximate (bool, optional): 生成（或修正后）的SQL适合时在抽样子集上近似执行
             
         Returns:
-            dict: 查询结果
+            dict: 查询结果，approximate表示是否为近似执行的结果
         """
         try:
             # 检查连接是否存在
@@ -89,20 +197,65 @@ class QueryService:
             # 获取MCP服务器实例
             mcp_server = self.mcp_servers[connection_id]
             
-            # 获取元数据
-            metadata_str = mcp_server.get_database_metadata()
-            metadata = json.loads(metadata_str)
+            # 获取元数据与样本数据（预热未完成时只等待所需部分）
+            if schema_context:
+                metadata, sample_data = schema_context["metadata"], schema_context["sample_data"]
+            else:
+                metadata, sample_data = self._get_schema_context(connection_id, mcp_server)
             
-            # 获取样本数据
-            sample_data_str = mcp_server.get_sample_data(limit=3)
-            sample_data = json.loads(sample_data_str)
+            # 只记录与复用不依赖对话上下文的独立问题
+            standalone = not conversation_history
+            
+            # 相同问题已有执行成功的SQL时直接复用，跳过SQL生成
+            reusable = None
+            if standalone and self.example_reuse_threshold > 0:
+                reusable = self.example_store.find_reusable(connection_id, query, self.example_reuse_threshold)
+            if reusable:
+                results = self._run_sql(mcp_server, reusable["sql"], row_format, approximate)
+                if "error" not in results:
+                    self.example_store.record(connection_id, query, reusable["sql"])
+                    result_explanation = self.llm_service.explain_results(
+                        query=query,
+                        sql=reusable["sql"],
+                        results=results,
+                        metadata=metadata
+                    )
+                    return {
+                        "status": "success",
+                        "message": "查询执行成功（复用相同问题的SQL）",
+                        "query": query,
+                        "sql": reusable["sql"],
+                        "results": results,
+                        "explanation": f"复用此前相同问题「{reusable['question']}」执行成功的SQL。",
+                        "result_explanation": result_explanation,
+                        "revised": False,
+                        "reused": True,
+                        "approximate": bool(results.get("approximate"))
+                    }
+                # 复用的SQL已无法执行（如表结构变化），删除该示例后重新生成
+                self.logger.info(f"复用的SQL执行失败，删除示例: {results['error']}")
+                self.example_store.discard(connection_id, reusable["question"])
+            
+            # 检索相似问题的示例
+            examples = self.example_store.search(connection_id, query, top_k=self.example_top_k)
+            
+            # 查找问题中提到的实际取值
+            value_hints = self._value_hints(connection_id, query)
+            stats = self.query_stats.setdefault(connection_id, Counter())
+            stats["generated"] += 1
+            stats["value_hinted"] += bool(value_hints)
             
             # 调用LLM服务转换自然语言为SQL
             llm_response = self.llm_service.natural_language_to_sql(
                 query=query,
                 metadata=metadata,
                 sample_data=sample_data,
-                conversation_history=conversation_history
+                conversation_history=conversation_history,
+                session_id=f"{connection_id}:{session_id}" if session_id else None,
+                schema_format=self.schema_formats.get(connection_id),
+                examples=examples,
+                system_message=schema_context.get("system_message") if schema_context else None,
+                value_hints=value_hints
             )
             
             # 检查是否成功生成SQL
@@ -126,18 +279,52 @@ class QueryService:
                 }
             
             # 执行SQL查询
-            results_str = mcp_server.execute_readonly_query(sql)
-            results = json.loads(results_str)
+            results = self._run_sql(mcp_server, sql, row_format, approximate)
+            
+            # 执行失败时先尝试本地修正，修正成功则不再调用LLM
+            if "error" in results:
+                repaired = self._repair_locally(
+                    mcp_server, sql, results["error"], metadata, row_format, stats, approximate
+                )
+                if repaired:
+                    repaired_sql, repaired_results, repairs = repaired
+                    if standalone:
+                        self.example_store.record(connection_id, query, repaired_sql)
+                    result_explanation = self.llm_service.explain_results(
+                        query=query,
+                        sql=repaired_sql,
+                        results=repaired_results,
+                        metadata=metadata
+                    )
+                    return {
+                        "status": "success",
+                        "message": "查询执行成功（已自动修正SQL）",
+                        "query": query,
+                        "original_sql": sql,
+                        "sql": repaired_sql,
+                        "results": repaired_results,
+                        "explanation": explanation,
+                        "repairs": repairs,
+                        "result_explanation": result_explanation,
+                        "revised": True,
+                        "repaired": True,
+                        "approximate": bool(repaired_results.get("approximate"))
+                    }
             
             # 检查执行结果是否有错误
             if "error" in results:
+                stats["revised"] += 1
+                stats["revised_value_hinted"] += bool(value_hints)
+                
                 # 尝试修正SQL
                 revised_response = self.llm_service.revise_sql(
                     original_sql=sql,
                     error_message=results["error"],
                     metadata=metadata,
                     sample_data=sample_data,
-                    user_query=query
+                    user_query=query,
+                    schema_format=self.schema_formats.get(connection_id),
+                    value_hints=value_hints
                 )
                 
                 revised_sql = revised_response.get("sql")
@@ -145,11 +332,13 @@ class QueryService:
                 
                 if revised_sql and revised_sql != sql:
                     # 执行修正后的SQL
-                    revised_results_str = mcp_server.execute_readonly_query(revised_sql)
-                    revised_results = json.loads(revised_results_str)
+                    revised_results = self._run_sql(mcp_server, revised_sql, row_format, approximate)
                     
                     # 如果修正后的SQL执行成功
                     if "error" not in revised_results:
+                        if standalone:
+                            self.example_store.record(connection_id, query, revised_sql)
+                        
                         # 解释结果
                         result_explanation = self.llm_service.explain_results(
                             query=query,
@@ -168,7 +357,8 @@ class QueryService:
                             "original_explanation": explanation,
                             "explanation": revised_explanation,
                             "result_explanation": result_explanation,
-                            "revised": True
+                            "revised": True,
+                            "approximate": bool(revised_results.get("approximate"))
                         }
                 
                 # 如果无法修正SQL或修正后仍有错误
@@ -182,6 +372,12 @@ class QueryService:
                     "revised_explanation": revised_explanation
                 }
             
+            if standalone:
+                self.example_store.record(connection_id, query, sql)
+            if results.get("rowCount") == 0:
+                stats["empty_results"] += 1
+                stats["empty_results_value_hinted"] += bool(value_hints)
+            
             # 解释结果
             result_explanation = self.llm_service.explain_results(
                 query=query,
@@ -199,7 +395,8 @@ class QueryService:
                 "results": results,
                 "explanation": explanation,
                 "result_explanation": result_explanation,
-                "revised": False
+                "revised": False,
+                "approximate": bool(results.get("approximate"))
             }
             
         except Exception as e:
@@ -211,17 +408,257 @@ class QueryService:
                 "query": query
             }
     
-    def execute_sql(self, connection_id, sql):
+    def process_query_batch(self, connection_id, questions, row_format=DEFAULT_ROW_FORMAT, max_parallel=4,
+                            admit=None):
+        """
+        批量处理自然语言查询
+        
+        元数据、样本数据与系统消息只准备一次，各问题以有限并发生成并执行SQL，
+        结果按完成顺序逐条产出。
+        
+        Args:
+            connection_id (str): 数据库连接ID
+            questions (list): 问题列表，每项为字符串或 {"id": ..., "query": ...}
+            row_format (str, optional): 结果行编码格式
+            max_parallel (int, optional): 最大并发数
+            admit (callable, optional): 返回上下文管理器的函数，每个问题执行前进入（如申请准入名额），
+                进入失败时该问题返回错误
+            
+        Returns:
+            dict: 成功时包含total与stream（逐条产出结果字典的生成器，最后一条为汇总）
+        """
+        try:
+            if connection_id not in self.mcp_servers:
+                return {
+                    "status": "error",
+                    "message": f"未找到连接ID: {connection_id}，请先连接数据库"
+                }
+            
+            items = []
+            for index, question in enumerate(questions):
+                if isinstance(question, dict):
+                    items.append((index, question.get("id", index), question.get("query")))
+                else:
+                    items.append((index, index, question))
+            
+            # 共享的元数据与系统消息
+            mcp_server = self.mcp_servers[connection_id]
+            metadata, sample_data = self._get_schema_context(connection_id, mcp_server)
+            schema_context = {
+                "metadata": metadata,
+                "sample_data": sample_data,
+                "system_message": self.llm_service.build_system_message(
+                    metadata, sample_data, self.schema_formats.get(connection_id)
+                )
+            }
+            
+            def run(item):
+                index, question_id, query = item
+                if not query or not isinstance(query, str):
+                    result = {"status": "error", "message": "问题不能为空"}
+                else:
+                    try:
+                        with admit() if admit else nullcontext():
+                            result = self.process_query(
+                                connection_id, query, row_format=row_format, schema_context=schema_context
+                            )
+                    except Exception as e:
+                        result = {"status": "error", "message": str(e)}
+                result.update({"index": index, "id": question_id})
+                return result
+            
+            def generate():
+                start = time.monotonic()
+                succeeded = 0
+                executor = ThreadPoolExecutor(max_workers=max(1, min(max_parallel, len(items))),
+                                              thread_name_prefix="batch")
+                try:
+                    futures = [executor.submit(run, item) for item in items]
+                    for future in as_completed(futures):
+                        result = future.result()
+                        succeeded += result.get("status") == "success"
+                        yield result
+                    yield {
+                        "done": True,
+                        "total": len(items),
+                        "succeeded": succeeded,
+                        "failed": len(items) - succeeded,
+                        "elapsed": round(time.monotonic() - start, 3)
+                    }
+                finally:
+                    # 客户端提前断开时取消尚未开始的问题
+                    executor.shutdown(wait=False, cancel_futures=True)
+            
+            return {
+                "status": "success",
+                "total": len(items),
+                "stream": generate()
+            }
+            
+        except Exception as e:
+            self.logger.error(f"批量查询失败: {str(e)}")
+            self.logger.error(traceback.format_exc())
+            return {
+                "status": "error",
+                "message": f"批量查询失败: {str(e)}"
+            }
+    
+    def _value_hints(self, connection_id, query):
+        """
+        在列取值字典中查找问题提到的取值，格式化为提示词
+        
+        字典尚未建立时不等待，本次查询不带取值提示；字典过期或预热时建立失败时在后台重新建立。
+        
+        Args:
+            connection_id (str): 数据库连接ID
+            query (str): 用户的问题
+            
+        Returns:
+            str: 取值提示，没有匹配时为空字符串
+        """
+        warmup = self.warmups.get(connection_id)
+        if not warmup or self.value_hint_limit <= 0:
+            return ""
+        warmup.refresh_values(self.warmup_executor, self.value_refresh_interval, self.value_retry_interval)
+        if warmup.values is None:
+            return ""
+        return format_value_hints(warmup.values.match(query, limit=self.value_hint_limit))
+    
+    def _run_sql(self, mcp_server, sql, row_format, approximate=False):
+        """
+        执行生成的SQL，结果供解释结果使用
+
+        Args:
+            mcp_server: MCP服务器实例
+            sql (str): SQL语句
+            row_format (str): 结果行编码格式
+            approximate (bool): 是否在查询适合时近似执行
+
+        Returns:
+            dict: 执行结果，失败时包含error
+        """
+        if approximate:
+            return json.loads(mcp_server.execute_approximate_query(sql, row_format=row_format))
+        return json.loads(mcp_server.execute_readonly_query(sql, row_format=row_format, digest_scan=True))
+    
+    def _repair_locally(self, mcp_server, sql, error_message, metadata, row_format, stats, approximate=False):
+        """
+        按错误信息在本地修正SQL并重新执行
+        
+        每次修正后重新执行，仍然出错时按新的错误信息继续修正，直到成功、
+        无法识别错误或达到尝试次数上限。
+        
+        Args:
+            mcp_server: MCP服务器实例
+            sql (str): 执行失败的SQL
+            error_message (str): 执行错误信息
+            metadata (dict): 数据库元数据
+            row_format (str): 结果行编码格式
+            stats (Counter): 连接的SQL生成统计
+            approximate (bool, optional): 修正后的SQL是否在适合时近似执行
+            
+        Returns:
+            tuple: (修正后的SQL, 执行结果, 修正说明列表)，本地无法修正时返回None
+        """
+        repairs = []
+        for _ in range(self.sql_repair_attempts):
+            repaired = repair_sql(sql, error_message, metadata)
+            if repaired is None:
+                break
+            sql, kind, description = repaired
+            if not repairs:
+                stats["repair_attempted"] += 1
+            stats[f"repair_{kind}"] += 1
+            repairs.append(description)
+            results = self._run_sql(mcp_server, sql, row_format, approximate)
+            if "error" not in results:
+                stats["repaired_locally"] += 1
+                self.logger.info(f"SQL已在本地修正: {'; '.join(repairs)}")
+                return sql, results, repairs
+            error_message = results["error"]
+        if repairs:
+            stats["repair_failed"] += 1
+        return None
+    
+    def _get_schema_context(self, connection_id, mcp_server):
+        """
+        获取生成SQL所需的元数据与样本数据
+        
+        元数据是必需的，会等待预热完成；样本数据只是辅助信息，
+        预热在短时间内未完成时不再等待，本次查询不带样本数据。
+        
+        Args:
+            connection_id (str): 数据库连接ID
+            mcp_server: MCP服务器实例
+            
+        Returns:
+            tuple: (元数据, 样本数据)
+        """
+        warmup = self.warmups.get(connection_id)
+        if warmup:
+            warmup.wait("metadata", timeout=self.metadata_wait_timeout)
+        
+        # 元数据已缓存，这里只做指纹检查
+        metadata = json.loads(mcp_server.get_database_metadata())
+        
+        if warmup and not warmup.wait("samples", timeout=self.sample_wait_timeout):
+            self.logger.info(f"连接 {connection_id} 样本数据尚未就绪，本次查询不使用样本数据")
+            return metadata, None
+        
+        sample_data = json.loads(mcp_server.get_sample_data(limit=3))
+        return metadata, sample_data
+    
+    def get_connection_status(self, connection_id, include_metadata=False):
+        """
+        获取连接的预热进度
+        
+        Args:
+            connection_id (str): 数据库连接ID
+            include_metadata (bool): 元数据就绪时是否在结果中返回元数据
+            
+        Returns:
+            dict: 预热状态
+        """
+        if connection_id not in self.mcp_servers:
+            return {
+                "status": "error",
+                "message": f"未找到连接ID: {connection_id}，请先连接数据库"
+            }
+        
+        warmup = self.warmups.get(connection_id)
+        result = {
+            "status": "success",
+            "connection_id": connection_id,
+            "warmup": warmup.status() if warmup else None,
+            "routing": self.mcp_servers[connection_id].get_routing_stats(),
+            "mirror": self.mcp_servers[connection_id].get_mirror_stats(),
+            "query_stats": dict(self.query_stats.get(connection_id, {})),
+            "result_buffers": self.result_buffers.stats(connection_id),
+            "dashboards": len(self.dashboards.list(connection_id))
+        }
+        if include_metadata and warmup and warmup.is_done("metadata"):
+            result["metadata"] = warmup.metadata
+        return result
+    
+    def execute_sql(self, connection_id, sql, page_size=None, page_token=None, row_format=DEFAULT_ROW_FORMAT,
+                    keep_result=False, approximate=None):
         """
         直接执行SQL语句
         
         Args:
             connection_id (str): 数据库连接ID
             sql (str): SQL语句
+            page_size (int, optional): 每页行数，提供时使用分页模式
+            page_token (str, optional): 上一页返回的续页令牌
+            row_format (str, optional): 结果行编码格式（objects/arrays/columns）
+            keep_result (bool, optional): 是否将完整结果保存到结果缓冲区，之后通过 get_buffered_result 读取
+            approximate (str, optional): 抽样方式（auto/range/modulo/sample_table），提供时近似执行聚合查询
             
         Returns:
-            dict: 执行结果
+            dict: 执行结果，分页模式下results包含next_page_token，保存结果时results包含result_buffer，
+                已注册为仪表盘查询时增量刷新并在results.dashboard中注明
         """
+        buffer = None
         try:
             # 检查连接是否存在
             if connection_id not in self.mcp_servers:
@@ -233,18 +670,39 @@ class QueryService:
             # 获取MCP服务器实例
             mcp_server = self.mcp_servers[connection_id]
             
-            # 执行SQL查询
-            results_str = mcp_server.execute_readonly_query(sql)
+            # 已注册的仪表盘查询：增量刷新后返回保存的结果
+            plain = not (page_size or page_token or approximate or keep_result)
+            dashboard = self.dashboards.find(connection_id, sql) if plain else None
+            if dashboard is not None:
+                return self._refresh_dashboard(mcp_server, dashboard, row_format=row_format)
+            
+            # 执行SQL查询（提供分页参数时每次只读取一页）
+            if page_size or page_token:
+                results_str = mcp_server.execute_paginated_query(
+                    sql, page_size=page_size or 100, page_token=page_token, row_format=row_format
+                )
+            elif approximate:
+                results_str = mcp_server.execute_approximate_query(sql, row_format=row_format, method=approximate)
+            else:
+                if keep_result:
+                    buffer = self.result_buffers.create(connection_id)
+                results_str = mcp_server.execute_readonly_query(sql, row_format=row_format, result_buffer=buffer)
             results = json.loads(results_str)
             
             # 检查执行结果是否有错误
             if "error" in results:
+                if buffer is not None:
+                    self.result_buffers.remove(buffer.id)
                 return {
                     "status": "error",
                     "message": f"SQL执行失败: {results.get('error')}",
-                    "sql": sql
+                    "sql": sql,
+                    "page_token_expired": results.get("page_token_expired", False)
                 }
             
+            if buffer is not None:
+                results["result_buffer"] = buffer.info()
+            
             # 返回成功结果
             return {
                 "status": "success",
@@ -254,6 +712,8 @@ class QueryService:
             }
             
         except Exception as e:
+            if buffer is not None:
+                self.result_buffers.remove(buffer.id)
             self.logger.error(f"执行SQL失败: {str(e)}")
             self.logger.error(traceback.format_exc())
             return {
@@ -262,6 +722,791 @@ class QueryService:
                 "sql": sql
             }
     
+    def get_buffered_result(self, connection_id, result_id, offset=0, limit=100, row_format=DEFAULT_ROW_FORMAT):
+        """
+        从结果缓冲区读取一段结果
+        
+        Args:
+            connection_id (str): 数据库连接ID
+            result_id (str): 执行SQL时返回的结果缓冲区ID
+            offset (int, optional): 起始行
+            limit (int, optional): 行数
+            row_format (str, optional): 结果行编码格式
+            
+        Returns:
+            dict: 该段结果，results包含total_rows与next_offset（没有更多行时为None）
+        """
+        try:
+            buffer = self.result_buffers.get(result_id, connection_id)
+            if buffer is None:
+                return {
+                    "status": "error",
+                    "message": f"未找到结果: {result_id}（结果已过期、连接已断开或不在此工作进程中）"
+                }
+            
+            rows = buffer.read(offset, limit)
+            info = buffer.info()
+            next_offset = offset + len(rows)
+            # 与执行结果相同的JSON编码（日期、Decimal等转为文本）
+            encoded = json.loads(json.dumps(encode_rows(info["columns"], rows, row_format), default=str))
+            return {
+                "status": "success",
+                "message": "读取结果成功",
+                "results": {
+                    "columns": info["columns"],
+                    "rows": encoded,
+                    "rowFormat": row_format,
+                    "rowCount": len(rows),
+                    "offset": offset,
+                    "next_offset": next_offset if next_offset < info["row_count"] else None,
+                    "total_rows": info["row_count"],
+                    "complete": info["complete"],
+                    "storage": info["storage"]
+                }
+            }
+            
+        except Exception as e:
+            self.logger.error(f"读取结果失败: {str(e)}")
+            return {
+                "status": "error",
+                "message": f"读取结果失败: {str(e)}"
+            }
+    
+    def release_buffered_result(self, connection_id, result_id):
+        """
+        删除结果缓冲区
+        
+        Args:
+            connection_id (str): 数据库连接ID
+            result_id (str): 结果缓冲区ID
+            
+        Returns:
+            dict: 删除结果
+        """
+        if self.result_buffers.get(result_id, connection_id) is None or \
+                not self.result_buffers.remove(result_id):
+            return {
+                "status": "error",
+                "message": f"未找到结果: {result_id}"
+            }
+        return {
+            "status": "success",
+            "message": f"已删除结果: {result_id}"
+        }
+    
+    def _dashboard_result(self, mcp_server, entry, refreshed, max_rows=100, row_format=DEFAULT_ROW_FORMAT):
+        """按执行结果的格式返回仪表盘查询保存的结果"""
+        columns, rows = self.dashboards.result(entry)
+        results = mcp_server._build_query_result(columns, rows, max_rows, row_format)
+        results = json.loads(json.dumps(results, default=str))
+        results["dashboard"] = dict(entry.info(), refreshed=refreshed)
+        return {
+            "status": "success",
+            "message": "SQL执行成功",
+            "sql": entry.sql,
+            "results": results
+        }
+    
+    def _refresh_dashboard(self, mcp_server, entry, full=False, max_rows=100, row_format=DEFAULT_ROW_FORMAT):
+        """刷新仪表盘查询并返回结果，刷新失败时返回错误"""
+        try:
+            refreshed = self.dashboards.refresh(mcp_server, entry, full=full)
+        except Exception as e:
+            self.logger.error(f"刷新仪表盘查询失败: {str(e)}")
+            return {
+                "status": "error",
+                "message": f"刷新仪表盘查询失败: {str(e)}",
+                "sql": entry.sql
+            }
+        return self._dashboard_result(mcp_server, entry, refreshed, max_rows, row_format)
+    
+    def register_dashboard_query(self, connection_id, sql, watermark=None, max_rows=100,
+                                 row_format=DEFAULT_ROW_FORMAT):
+        """
+        注册仪表盘查询：完整执行一次并保存结果，之后通过 refresh_dashboard_query 或
+        execute_sql 执行相同SQL时只读取水位列之后的新行
+        
+        Args:
+            connection_id (str): 数据库连接ID
+            sql (str): SQL语句
+            watermark (str, optional): 水位列，为空时自动选择自增列或创建时间列
+            max_rows (int, optional): 返回的最大行数
+            row_format (str, optional): 结果行编码格式
+            
+        Returns:
+            dict: 首次执行的结果，results.dashboard包含query_id、刷新方式（append/aggregate/full）与水位
+        """
+        if connection_id not in self.mcp_servers:
+            return {
+                "status": "error",
+                "message": f"未找到连接ID: {connection_id}，请先连接数据库"
+            }
+        mcp_server = self.mcp_servers[connection_id]
+        reason = mcp_server._readonly_violation(sql)
+        if reason:
+            return {
+                "status": "error",
+                "message": reason,
+                "sql": sql
+            }
+        try:
+            entry = self.dashboards.register(mcp_server, connection_id, sql, watermark=watermark)
+        except ValueError as e:
+            return {
+                "status": "error",
+                "message": str(e),
+                "sql": sql
+            }
+        except Exception as e:
+            self.logger.error(f"注册仪表盘查询失败: {str(e)}")
+            self.logger.error(traceback.format_exc())
+            return {
+                "status": "error",
+                "message": f"注册仪表盘查询失败: {str(e)}",
+                "sql": sql
+            }
+        return self._dashboard_result(mcp_server, entry, True, max_rows, row_format)
+    
+    def refresh_dashboard_query(self, connection_id, query_id, full=False, max_rows=100,
+                                row_format=DEFAULT_ROW_FORMAT):
+        """
+        刷新仪表盘查询
+        
+        Args:
+            connection_id (str): 数据库连接ID
+            query_id (str): 注册时返回的查询ID
+            full (bool, optional): 是否完整执行（发现数据被修改或删除时使用）
+            max_rows (int, optional): 返回的最大行数
+            row_format (str, optional): 结果行编码格式
+            
+        Returns:
+            dict: 刷新后的结果
+        """
+        if connection_id not in self.mcp_servers:
+            return {
+                "status": "error",
+                "message": f"未找到连接ID: {connection_id}，请先连接数据库"
+            }
+        entry = self.dashboards.get(connection_id, query_id)
+        if entry is None:
+            return {
+                "status": "error",
+                "message": f"未找到仪表盘查询: {query_id}"
+            }
+        return self._refresh_dashboard(self.mcp_servers[connection_id], entry, full=full,
+                                       max_rows=max_rows, row_format=row_format)
+    
+    def list_dashboard_queries(self, connection_id):
+        """
+        列出连接上注册的仪表盘查询
+        
+        Args:
+            connection_id (str): 数据库连接ID
+            
+        Returns:
+            dict: 各查询的刷新方式、水位与刷新统计
+        """
+        return {
+            "status": "success",
+            "connection_id": connection_id,
+            "queries": self.dashboards.list(connection_id)
+        }
+    
+    def delete_dashboard_query(self, connection_id, query_id):
+        """
+        取消注册仪表盘查询
+        
+        Args:
+            connection_id (str): 数据库连接ID
+            query_id (str): 查询ID
+            
+        Returns:
+            dict: 删除结果
+        """
+        if not self.dashboards.remove(connection_id, query_id):
+            return {
+                "status": "error",
+                "message": f"未找到仪表盘查询: {query_id}"
+            }
+        return {
+            "status": "success",
+            "message": f"已删除仪表盘查询: {query_id}"
+        }
+    
+    def refresh_schema(self, connection_id, full=False):
+        """
+        刷新指定连接的元数据缓存
+        
+        Args:
+            connection_id (str): 数据库连接ID
+            full (bool): 是否全量刷新，默认只重新获取结构发生变化的表
+            
+        Returns:
+            dict: 刷新结果，包含新增、变化与删除的表
+        """
+        try:
+            # 检查连接是否存在
+            if connection_id not in self.mcp_servers:
+                return {
+                    "status": "error",
+                    "message": f"未找到连接ID: {connection_id}，请先连接数据库"
+                }
+            
+            mcp_server = self.mcp_servers[connection_id]
+            changes = mcp_server.refresh_schema(force=full, check_now=True)
+            
+            return {
+                "status": "success",
+                "message": "元数据已刷新",
+                "schema_version": mcp_server.schema_version,
+                "changes": changes
+            }
+            
+        except Exception as e:
+            self.logger.error(f"刷新元数据失败: {str(e)}")
+            self.logger.error(traceback.format_exc())
+            return {
+                "status": "error",
+                "message": f"刷新元数据失败: {str(e)}"
+            }
+    
+    def get_slow_queries(self, connection_id, limit=100):
+        """
+        获取指定连接的慢查询日志
+        
+        Args:
+            connection_id (str): 数据库连接ID
+            limit (int): 返回的最近慢查询条数
+            
+        Returns:
+            dict: 慢查询记录与按总耗时排序的语句模板
+        """
+        if connection_id not in self.mcp_servers:
+            return {
+                "status": "error",
+                "message": f"未找到连接ID: {connection_id}，请先连接数据库"
+            }
+        return dict({"status": "success"}, **self.mcp_servers[connection_id].get_slow_queries(limit))
+    
+    def get_index_advice(self, connection_id, limit=20):
+        """
+        根据指定连接的慢查询给出索引建议
+        
+        Args:
+            connection_id (str): 数据库连接ID
+            limit (int): 返回的建议数
+            
+        Returns:
+            dict: 按估计节省时间排序的索引建议
+        """
+        try:
+            if connection_id not in self.mcp_servers:
+                return {
+                    "status": "error",
+                    "message": f"未找到连接ID: {connection_id}，请先连接数据库"
+                }
+            advice = self.mcp_servers[connection_id].get_index_advice(limit)
+            return dict({"status": "success"}, **advice)
+            
+        except Exception as e:
+            self.logger.error(f"生成索引建议失败: {str(e)}")
+            self.logger.error(traceback.format_exc())
+            return {
+                "status": "error",
+                "message": f"生成索引建议失败: {str(e)}"
+            }
+    
+    def measure_schema_formats(self, connection_id):
+        """
+        统计指定连接在各结构描述格式下的提示词token数
+        
+        Args:
+            connection_id (str): 数据库连接ID
+            
+        Returns:
+            dict: 统计结果
+        """
+        try:
+            # 检查连接是否存在
+            if connection_id not in self.mcp_servers:
+                return {
+                    "status": "error",
+                    "message": f"未找到连接ID: {connection_id}，请先连接数据库"
+                }
+            
+            metadata = json.loads(self.mcp_servers[connection_id].get_database_metadata())
+            
+            return {
+                "status": "success",
+                "current_format": self.schema_formats.get(connection_id),
+                "formats": measure_schema_formats(metadata)
+            }
+            
+        except Exception as e:
+            self.logger.error(f"统计结构描述长度失败: {str(e)}")
+            return {
+                "status": "error",
+                "message": f"统计结构描述长度失败: {str(e)}"
+            }
+    
+    def set_schema_format(self, connection_id, schema_format):
+        """
+        设置指定连接的结构描述格式
+        
+        Args:
+            connection_id (str): 数据库连接ID
+            schema_format (str): 格式名称
+            
+        Returns:
+            dict: 设置结果
+        """
+        if connection_id not in self.mcp_servers:
+            return {
+                "status": "error",
+                "message": f"未找到连接ID: {connection_id}，请先连接数据库"
+            }
+        if schema_format not in SCHEMA_FORMATS:
+            return {
+                "status": "error",
+                "message": f"不支持的结构描述格式: {schema_format}，可选: {', '.join(SCHEMA_FORMATS)}"
+            }
+        self.schema_formats[connection_id] = schema_format
+        return {
+            "status": "success",
+            "message": f"结构描述格式已设置为: {schema_format}",
+            "schema_format": schema_format
+        }
+    
+    def export_query(self, connection_id, sql, export_format="arrow", batch_size=10000):
+        """
+        以Arrow IPC或Parquet格式流式导出查询结果
+        
+        生成器在返回前先读取第一批数据，SQL错误会在此阶段以错误结果返回，而不是在传输中途中断。
+        
+        Args:
+            connection_id (str): 数据库连接ID
+            sql (str): SQL语句
+            export_format (str): 导出格式，arrow或parquet
+            batch_size (int): 每批读取的行数
+            
+        Returns:
+            dict: 成功时包含stream（字节段生成器）、mimetype与extension
+        """
+        try:
+            # 检查连接是否存在
+            if connection_id not in self.mcp_servers:
+                return {
+                    "status": "error",
+                    "message": f"未找到连接ID: {connection_id}，请先连接数据库"
+                }
+            
+            if export_format not in EXPORT_FORMATS:
+                return {
+                    "status": "error",
+                    "message": f"不支持的导出格式: {export_format}，可选: {', '.join(EXPORT_FORMATS)}"
+                }
+            
+            mcp_server = self.mcp_servers[connection_id]
+            stream = stream_export(
+                mcp_server.iter_query_batches(sql, batch_size=batch_size, with_types=True), export_format
+            )
+            
+            # 预读第一段数据，提前暴露SQL执行错误
+            first_chunk = next(stream, b"")
+            
+            def generate():
+                try:
+                    yield first_chunk
+                    for chunk in stream:
+                        yield chunk
+                except Exception as e:
+                    self.logger.error(f"导出查询结果中断: {str(e)}")
+                    raise
+                finally:
+                    stream.close()
+            
+            mimetype, extension = EXPORT_FORMATS[export_format]
+            return {
+                "status": "success",
+                "stream": generate(),
+                "mimetype": mimetype,
+                "extension": extension
+            }
+            
+        except ImportError as e:
+            return {
+                "status": "error",
+                "message": str(e),
+                "not_implemented": True
+            }
+        except Exception as e:
+            self.logger.error(f"导出查询结果失败: {str(e)}")
+            self.logger.error(traceback.format_exc())
+            return {
+                "status": "error",
+                "message": f"导出查询结果失败: {str(e)}",
+                "sql": sql
+            }
+    
+    @staticmethod
+    def _schema_signature(metadata):
+        """表名 -> 列名与类型列表，用于比较各分片的表结构"""
+        return {
+            table.get("name"): [(c.get("name"), c.get("type")) for c in table.get("columns", [])]
+            for table in metadata.get("tables", [])
+        }
+    
+    def create_connection_group(self, group_id, connection_ids):
+        """
+        创建连接组，组内连接应为表结构相同的分片
+        
+        Args:
+            group_id (str): 连接组ID
+            connection_ids (list): 成员连接ID列表，第一个连接的元数据用于生成SQL
+            
+        Returns:
+            dict: 创建结果，表结构不一致的成员列在schema_mismatch中
+        """
+        try:
+            missing = [cid for cid in connection_ids if cid not in self.mcp_servers]
+            if missing:
+                return {
+                    "status": "error",
+                    "message": f"未找到连接ID: {', '.join(missing)}，请先连接数据库"
+                }
+            
+            # 比较各成员的表结构
+            signatures = {}
+            for cid in connection_ids:
+                warmup = self.warmups.get(cid)
+                if warmup:
+                    warmup.wait("metadata", timeout=self.metadata_wait_timeout)
+                signatures[cid] = self._schema_signature(json.loads(self.mcp_servers[cid].get_database_metadata()))
+            primary_signature = signatures[connection_ids[0]]
+            mismatch = [cid for cid in connection_ids[1:] if signatures[cid] != primary_signature]
+            
+            self.connection_groups[group_id] = list(connection_ids)
+            
+            result = {
+                "status": "success",
+                "group_id": group_id,
+                "connection_ids": list(connection_ids),
+                "message": f"已创建连接组 {group_id}，共 {len(connection_ids)} 个连接"
+            }
+            if mismatch:
+                result["schema_mismatch"] = mismatch
+                result["message"] += f"；以下连接的表结构与 {connection_ids[0]} 不一致: {', '.join(mismatch)}"
+            return result
+            
+        except Exception as e:
+            self.logger.error(f"创建连接组失败: {str(e)}")
+            return {
+                "status": "error",
+                "message": f"创建连接组失败: {str(e)}"
+            }
+    
+    def _fetch_shard(self, connection_id, sql, max_rows):
+        """
+        在单个分片上执行查询，读取原始行（保留Decimal等类型以便重新聚合）
+        
+        Returns:
+            tuple: (列名列表, 行元组列表, 分片执行报告)，失败时列名与行为None
+        """
+        start = time.monotonic()
+        report = {"connection_id": connection_id}
+        try:
+            mcp_server = self.mcp_servers.get(connection_id)
+            if mcp_server is None:
+                raise ValueError(f"未找到连接ID: {connection_id}")
+            
+            batches = mcp_server.iter_query_batches(sql, batch_size=max_rows + 1)
+            try:
+                columns, rows = next(batches)
+            finally:
+                batches.close()
+            
+            report.update({
+                "status": "success",
+                "rowCount": min(len(rows), max_rows),
+                "truncated": len(rows) > max_rows,
+                "latency_ms": round((time.monotonic() - start) * 1000, 1)
+            })
+            return columns, rows[:max_rows], report
+        except Exception as e:
+            report.update({
+                "status": "error",
+                "error": str(e),
+                "latency_ms": round((time.monotonic() - start) * 1000, 1)
+            })
+            return None, None, report
+    
+    def _fan_out(self, connection_ids, sql, row_format=DEFAULT_ROW_FORMAT):
+        """
+        在各分片上并发执行查询并合并结果
+        
+        Args:
+            connection_ids (list): 成员连接ID列表
+            sql (str): SQL语句
+            row_format (str): 结果行编码格式
+            
+        Returns:
+            dict: 合并后的查询结果，含各分片的执行报告；全部分片失败时包含error
+        """
+        futures = [
+            self.fanout_executor.submit(self._fetch_shard, cid, sql, self.fanout_max_rows)
+            for cid in connection_ids
+        ]
+        outcomes = [future.result() for future in futures]
+        shards = [report for _, _, report in outcomes]
+        
+        succeeded = [(columns, rows, report) for columns, rows, report in outcomes if columns is not None]
+        if not succeeded:
+            return {"error": shards[0].get("error", "所有分片执行失败"), "shards": shards}
+        
+        # 结果列与第一个成功分片不一致的分片不参与合并
+        columns = succeeded[0][0]
+        shard_rows = []
+        for shard_columns, rows, report in succeeded:
+            if shard_columns != columns:
+                report.update({"status": "error", "error": "结果列与其他分片不一致，未合并"})
+                continue
+            shard_rows.append(rows)
+        
+        plan = plan_merge(sql, columns)
+        rows = merge_results(plan, shard_rows)
+        truncated = len(rows) > self.fanout_max_rows
+        rows = rows[:self.fanout_max_rows]
+        shards_complete = not any(report.get("truncated") for report in shards)
+        
+        notes = list(plan["notes"])
+        if not shards_complete:
+            notes.append(f"部分分片结果超过 {self.fanout_max_rows} 行被截断，合并结果不完整")
+        failed = [report["connection_id"] for report in shards if report["status"] != "success"]
+        if failed:
+            notes.append(f"以下分片未参与合并: {', '.join(failed)}")
+        
+        digest = summarize_rows(columns, rows)
+        digest["complete"] = shards_complete and not truncated
+        
+        result = {
+            "columns": list(columns),
+            "rows": encode_rows(columns, rows, row_format),
+            "rowFormat": row_format,
+            "rowCount": len(rows),
+            "truncated": truncated or not shards_complete,
+            "digest": digest,
+            "merge": {"mode": plan["mode"], "notes": notes},
+            "shards": shards
+        }
+        # 与单库查询结果一致，将Decimal、日期等转为JSON兼容的值
+        return json.loads(json.dumps(result, ensure_ascii=False, default=str))
+    
+    def process_group_query(self, group_id, query, conversation_history=None, session_id=None,
+                            row_format=DEFAULT_ROW_FORMAT):
+        """
+        在连接组上处理自然语言查询：生成一次SQL，并发在所有成员上执行并合并结果
+        
+        Args:
+            group_id (str): 连接组ID
+            query (str): 用户的自然语言查询
+            conversation_history (list, optional): 对话历史
+            session_id (str, optional): 会话ID
+            row_format (str, optional): 结果行编码格式
+            
+        Returns:
+            dict: 查询结果，results.shards 中包含各分片的耗时与行数
+        """
+        try:
+            connection_ids = self.connection_groups.get(group_id)
+            if not connection_ids:
+                return {
+                    "status": "error",
+                    "message": f"未找到连接组: {group_id}"
+                }
+            
+            # 使用第一个可用成员的元数据生成SQL
+            primary = next((cid for cid in connection_ids if cid in self.mcp_servers), None)
+            if primary is None:
+                return {
+                    "status": "error",
+                    "message": f"连接组 {group_id} 中没有可用的连接"
+                }
+            metadata, sample_data = self._get_schema_context(primary, self.mcp_servers[primary])
+            schema_format = self.schema_formats.get(primary)
+            
+            llm_response = self.llm_service.natural_language_to_sql(
+                query=query,
+                metadata=metadata,
+                sample_data=sample_data,
+                conversation_history=conversation_history,
+                session_id=f"{group_id}:{session_id}" if session_id else None,
+                schema_format=schema_format
+            )
+            
+            if "error" in llm_response:
+                return {
+                    "status": "error",
+                    "message": llm_response["error"],
+                    "query": query,
+                    "explanation": llm_response.get("explanation")
+                }
+            
+            sql = llm_response.get("sql")
+            explanation = llm_response.get("explanation")
+            if not sql:
+                return {
+                    "status": "error",
+                    "message": "无法从LLM响应中提取SQL语句",
+                    "query": query,
+                    "explanation": explanation
+                }
+            
+            results = self._fan_out(connection_ids, sql, row_format)
+            original_sql = None
+            
+            # 所有分片均失败时尝试修正一次SQL
+            if "error" in results:
+                revised_response = self.llm_service.revise_sql(
+                    original_sql=sql,
+                    error_message=results["error"],
+                    metadata=metadata,
+                    sample_data=sample_data,
+                    user_query=query,
+                    schema_format=schema_format
+                )
+                revised_sql = revised_response.get("sql")
+                if not revised_sql or revised_sql == sql:
+                    return {
+                        "status": "error",
+                        "message": f"SQL执行失败: {results['error']}",
+                        "query": query,
+                        "sql": sql,
+                        "explanation": explanation,
+                        "shards": results["shards"]
+                    }
+                revised_results = self._fan_out(connection_ids, revised_sql, row_format)
+                if "error" in revised_results:
+                    return {
+                        "status": "error",
+                        "message": f"SQL执行失败: {revised_results['error']}",
+                        "query": query,
+                        "sql": revised_sql,
+                        "original_sql": sql,
+                        "explanation": revised_response.get("explanation"),
+                        "shards": revised_results["shards"]
+                    }
+                original_sql, sql, results = sql, revised_sql, revised_results
+                explanation = revised_response.get("explanation")
+            
+            result_explanation = self.llm_service.explain_results(
+                query=query,
+                sql=sql,
+                results=results,
+                metadata=metadata
+            )
+            
+            response = {
+                "status": "success",
+                "message": f"查询执行成功（{len(connection_ids)} 个分片）",
+                "query": query,
+                "group_id": group_id,
+                "sql": sql,
+                "results": results,
+                "explanation": explanation,
+                "result_explanation": result_explanation,
+                "revised": original_sql is not None
+            }
+            if original_sql:
+                response["original_sql"] = original_sql
+            return response
+            
+        except Exception as e:
+            self.logger.error(f"处理连接组查询失败: {str(e)}")
+            self.logger.error(traceback.format_exc())
+            return {
+                "status": "error",
+                "message": f"处理连接组查询失败: {str(e)}",
+                "query": query
+            }
+    
+    def delete_connection_group(self, group_id):
+        """
+        删除连接组（不断开成员连接）
+        
+        Args:
+            group_id (str): 连接组ID
+            
+        Returns:
+            dict: 删除结果
+        """
+        if self.connection_groups.pop(group_id, None) is None:
+            return {
+                "status": "warning",
+                "message": f"未找到连接组: {group_id}"
+            }
+        return {
+            "status": "success",
+            "message": f"已删除连接组: {group_id}"
+        }
+    
+    def enable_mirror(self, connection_id, tables):
+        """
+        为连接启用本地列式镜像
+        
+        Args:
+            connection_id (str): 数据库连接ID
+            tables (list): 表名，或 {"name": 表名, "watermark": 水位列} 的列表
+            
+        Returns:
+            dict: 启用结果
+        """
+        if connection_id not in self.mcp_servers:
+            return {
+                "status": "error",
+                "message": f"未找到连接ID: {connection_id}，请先连接数据库"
+            }
+        try:
+            mcp_server = self.mcp_servers[connection_id]
+            mcp_server.enable_mirror(tables, directory=self.mirror_dir or None, **self.mirror_options)
+            return {
+                "status": "success",
+                "message": "已启用本地列式镜像，首次复制在后台进行",
+                "mirror": mcp_server.get_mirror_stats()
+            }
+        except ImportError as e:
+            return {
+                "status": "error",
+                "message": str(e),
+                "not_implemented": True
+            }
+        except Exception as e:
+            self.logger.error(f"启用本地列式镜像失败: {str(e)}")
+            return {
+                "status": "error",
+                "message": f"启用本地列式镜像失败: {str(e)}"
+            }
+    
+    def disable_mirror(self, connection_id):
+        """
+        停用连接的本地列式镜像
+        
+        Args:
+            connection_id (str): 数据库连接ID
+            
+        Returns:
+            dict: 停用结果
+        """
+        if connection_id not in self.mcp_servers:
+            return {
+                "status": "error",
+                "message": f"未找到连接ID: {connection_id}，请先连接数据库"
+            }
+        self.mcp_servers[connection_id].disable_mirror()
+        return {
+            "status": "success",
+            "message": "已停用本地列式镜像"
+        }
+    
     def disconnect_database(self, connection_id):
         """
         断开数据库连接
@@ -280,8 +1525,16 @@ class QueryService:
                     "message": f"未找到连接ID: {connection_id}"
                 }
             
-            # 移除MCP服务器实例
-            del self.mcp_servers[connection_id]
+            # 停止预热，移除MCP服务器实例并释放游标与连接
+            warmup = self.warmups.pop(connection_id, None)
+            if warmup:
+                warmup.cancel()
+            mcp_server = self.mcp_servers.pop(connection_id)
+            mcp_server.close()
+            self.schema_formats.pop(connection_id, None)
+            self.query_stats.pop(connection_id, None)
+            self.result_buffers.remove_connection(connection_id)
+            self.dashboards.remove_connection(connection_id)
             
             return {
                 "status": "success",
@@ -0,0 +1,451 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+查询结果缓冲区：保存一次查询的完整结果供后续翻页、导出与追问使用。
+小结果保存在内存中，大结果或内存总量超出预算时写入磁盘上的Arrow IPC列式文件，
+读取时通过内存映射按需访问，不占用工作进程的堆内存
+"""
+
+import os
+import time
+import uuid
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+
+from app.services.result_export import arrow_type, column_array, resolve_column_types
+
+# 写入磁盘时每个记录批次的行数
+SPILL_BATCH_ROWS = 10000
+
+# 每隔多少行向存储汇报一次内存占用
+_CHARGE_INTERVAL = 1000
+
+
+def _estimate_size(row):
+    """估算一行结果在内存中占用的字节数（元组与各值对象）"""
+    size = 56 + 8 * len(row)
+    for value in row:
+        if isinstance(value, (str, bytes, bytearray)):
+            size += 49 + len(value)
+        elif value is not None:
+            size += 32
+    return size
+
+
+def _require_pyarrow():
+    """导入pyarrow，未安装时无法写入磁盘（结果仍保存在内存中）"""
+    try:
+        import pyarrow
+        return pyarrow
+    except ImportError:
+        raise ImportError("结果缓冲区写入磁盘需要安装pyarrow")
+
+
+class ResultBuffer:
+    """
+    单个查询结果的缓冲区
+
+    写入阶段逐行追加，未落盘时行保存在内存中；落盘后按批次写入Arrow IPC文件。
+    写入结束（finish）后只读，落盘的结果以内存映射方式打开。
+    """
+
+    def __init__(self, store, buffer_id, connection_id, max_rows):
+        self.store = store
+        self.id = buffer_id
+        self.connection_id = connection_id
+        self.max_rows = max_rows
+        self.columns = []
+        self.column_types = []
+        self.row_count = 0
+        self.complete = True
+        self.finished = False
+        self.created_at = time.time()
+        self.last_used = time.monotonic()
+        self.memory_bytes = 0
+        self.path = None
+        self.lock = threading.RLock()
+        self._rows = []            # 未落盘时的全部行；落盘后为等待写入的行
+        self._uncharged = 0        # 尚未汇报给存储的内存增量
+        self._schema = None
+        self._writer = None
+        self._mapped = None        # (内存映射文件, Arrow表)
+
+    @property
+    def spilled(self):
+        return self.path is not None
+
+    def start(self, columns, column_types=None):
+        """
+        设置列名与列类型，开始写入
+
+        Args:
+            columns (list): 列名
+            column_types (list, optional): 各列的MySQL类型，写入磁盘时据此确定Arrow列类型，未知的列按文本保存
+        """
+        self.columns = list(columns)
+        self.column_types = list(column_types) if column_types else [None] * len(self.columns)
+
+    def append(self, row):
+        """
+        追加一行
+
+        Returns:
+            bool: 是否已保存，达到行数上限时返回False
+        """
+        with self.lock:
+            if self.row_count >= self.max_rows:
+                self.complete = False
+                return False
+            row = tuple(row)
+            self._rows.append(row)
+            self.row_count += 1
+            if self.spilled:
+                if len(self._rows) >= SPILL_BATCH_ROWS:
+                    self._write_pending()
+                return True
+            size = _estimate_size(row)
+            self.memory_bytes += size
+            self._uncharged += size
+            if self.row_count % _CHARGE_INTERVAL:
+                return True
+            delta, self._uncharged = self._uncharged, 0
+        self.store._charge(self, delta)
+        return True
+
+    def finish(self, complete=True):
+        """
+        结束写入，落盘的结果写完剩余行并以内存映射方式打开
+
+        Args:
+            complete (bool): 是否已读取查询的全部结果
+        """
+        with self.lock:
+            self.complete = self.complete and complete
+            self.finished = True
+            if self.spilled:
+                self._write_pending()
+                self._close_writer()
+                self._open_mapped()
+            delta, self._uncharged = self._uncharged, 0
+        self.store._charge(self, delta)
+
+    def _write_pending(self):
+        """将等待写入的行作为一个记录批次写入文件"""
+        pa = _require_pyarrow()
+        if self._schema is None:
+            self._schema = pa.schema([
+                pa.field(name, arrow_type(pa, column_type))
+                for name, column_type in zip(self.columns, resolve_column_types(self.column_types, self._rows))
+            ])
+            self._writer = pa.ipc.new_file(self.path, self._schema)
+        if self._rows:
+            arrays = [
+                column_array(pa, list(values), field.type)
+                for values, field in zip(zip(*self._rows), self._schema)
+            ]
+            self._writer.write_batch(pa.record_batch(arrays, schema=self._schema))
+        self._rows = []
+
+    def _close_writer(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def _open_mapped(self):
+        pa = _require_pyarrow()
+        source = pa.memory_map(self.path, "r")
+        # 读取内存映射文件时数据不复制到堆内存
+        self._mapped = (source, pa.ipc.open_file(source).read_all())
+
+    def spill(self):
+        """
+        将内存中的行写入磁盘
+
+        Returns:
+            int: 释放的内存字节数（已汇报给存储的部分）
+        """
+        with self.lock:
+            if self.spilled:
+                return 0
+            self.path = self.store._new_path(self.id)
+            try:
+                self._write_pending()
+                if self.finished:
+                    self._close_writer()
+                    self._open_mapped()
+            except Exception:
+                self._close_writer()
+                self._remove_file()
+                self.path = None
+                self._schema = None
+                raise
+            released = self.memory_bytes - self._uncharged
+            self.memory_bytes = 0
+            self._uncharged = 0
+            return released
+
+    def read(self, offset=0, limit=100):
+        """
+        读取一段结果行
+
+        Args:
+            offset (int): 起始行
+            limit (int): 行数
+
+        Returns:
+            list: 行元组列表
+        """
+        with self.lock:
+            self.last_used = time.monotonic()
+            if not self.spilled:
+                return self._rows[offset:offset + limit]
+            table = self._mapped[1].slice(offset, limit)
+            return list(zip(*[column.to_pylist() for column in table.columns]))
+
+    def disk_bytes(self):
+        try:
+            return os.path.getsize(self.path) if self.path else 0
+        except OSError:
+            return 0
+
+    def info(self):
+        """
+        缓冲区概况
+
+        Returns:
+            dict: 行数、是否完整、存储位置与占用
+        """
+        with self.lock:
+            return {
+                "result_id": self.id,
+                "columns": self.columns,
+                "row_count": self.row_count,
+                "complete": self.complete,
+                "storage": "disk" if self.spilled else "memory",
+                "memory_bytes": self.memory_bytes,
+                "disk_bytes": self.disk_bytes(),
+                "created_at": self.created_at
+            }
+
+    def _remove_file(self):
+        if self.path:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+    def close(self):
+        """释放内存与内存映射，删除落盘文件"""
+        with self.lock:
+            self._close_writer()
+            if self._mapped is not None:
+                self._mapped[0].close()
+                self._mapped = None
+            self._remove_file()
+            self._rows = []
+
+
+class ResultBufferStore:
+    """
+    全部连接共享的结果缓冲区存储
+
+    - 内存中的结果总量超过memory_budget时，将最久未使用的内存缓冲区写入磁盘
+    - 单个结果超过spill_bytes时直接写入磁盘
+    - 缓冲区空闲超过ttl秒后删除，数量超过上限时删除最久未使用的缓冲区
+    """
+
+    def __init__(self, directory=None, memory_budget=256 * 1024 * 1024, spill_bytes=8 * 1024 * 1024,
+                 ttl=1800, max_buffers=64, max_rows=1000000):
+        """
+        初始化结果缓冲区存储
+
+        Args:
+            directory (str, optional): 落盘文件目录，为空时使用系统临时目录下的新目录
+            memory_budget (int): 内存中结果的总字节数上限
+            spill_bytes (int): 单个结果在内存中的字节数上限
+            ttl (float): 缓冲区最长空闲时间（秒）
+            max_buffers (int): 最多保留的缓冲区数
+            max_rows (int): 单个缓冲区的行数上限
+        """
+        self.logger = logging.getLogger(__name__)
+        self.directory = directory
+        self.memory_budget = int(memory_budget)
+        self.spill_bytes = int(spill_bytes)
+        self.ttl = float(ttl)
+        self.max_buffers = max(1, int(max_buffers))
+        self.max_rows = max(1, int(max_rows))
+        self._buffers = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self.spills = 0
+
+    @classmethod
+    def from_env(cls):
+        """
+        根据环境变量创建结果缓冲区存储
+
+        Returns:
+            ResultBufferStore: 结果缓冲区存储
+        """
+        return cls(
+            directory=os.environ.get('RESULT_BUFFER_DIR') or None,
+            memory_budget=int(os.environ.get('RESULT_BUFFER_MEMORY_BUDGET', 256 * 1024 * 1024)),
+            spill_bytes=int(os.environ.get('RESULT_BUFFER_SPILL_BYTES', 8 * 1024 * 1024)),
+            ttl=float(os.environ.get('RESULT_BUFFER_TTL', 1800)),
+            max_buffers=int(os.environ.get('RESULT_BUFFER_MAX_COUNT', 64)),
+            max_rows=int(os.environ.get('RESULT_BUFFER_MAX_ROWS', 1000000))
+        )
+
+    def _new_path(self, buffer_id):
+        """落盘文件路径，文件名带进程号以免多个工作进程共用目录时冲突"""
+        with self._lock:
+            if self.directory is None:
+                self.directory = tempfile.mkdtemp(prefix="wenshu-results-")
+        os.makedirs(self.directory, exist_ok=True)
+        return os.path.join(self.directory, f"{os.getpid()}-{buffer_id}.arrow")
+
+    def create(self, connection_id):
+        """
+        创建缓冲区
+
+        Args:
+            connection_id (str): 数据库连接ID
+
+        Returns:
+            ResultBuffer: 待写入的缓冲区
+        """
+        self.expire()
+        buffer = ResultBuffer(self, uuid.uuid4().hex[:16], connection_id, self.max_rows)
+        evicted = []
+        with self._lock:
+            self._buffers[buffer.id] = buffer
+            while len(self._buffers) > self.max_buffers:
+                evicted.append(self._buffers.popitem(last=False)[1])
+        for old in evicted:
+            self.logger.info(f"结果缓冲区数量超过上限，删除最久未使用的缓冲区 {old.id}")
+            self._close(old)
+        return buffer
+
+    def _charge(self, buffer, delta):
+        """
+        记录缓冲区新增的内存占用，超出单个或总量上限时将缓冲区写入磁盘
+        """
+        victims = []
+        with self._lock:
+            # 已删除或已落盘（落盘时释放的内存已包含该增量）
+            if buffer.id not in self._buffers or buffer.spilled:
+                return
+            self._memory_bytes += delta
+            if buffer.memory_bytes > self.spill_bytes:
+                victims.append(buffer)
+            excess = self._memory_bytes - self.memory_budget - sum(v.memory_bytes for v in victims)
+            for candidate in self._buffers.values():
+                if excess <= 0:
+                    break
+                if candidate.spilled or candidate in victims or not candidate.memory_bytes:
+                    continue
+                victims.append(candidate)
+                excess -= candidate.memory_bytes
+        for victim in victims:
+            try:
+                released = victim.spill()
+            except Exception as e:
+                self.logger.warning(f"结果缓冲区 {victim.id} 写入磁盘失败: {str(e)}")
+                continue
+            with self._lock:
+                self._memory_bytes -= released
+                self.spills += 1
+            self.logger.info(f"结果缓冲区 {victim.id} 已写入磁盘（{victim.row_count} 行）")
+
+    def get(self, result_id, connection_id=None):
+        """
+        获取写入完成的缓冲区并刷新其使用时间
+
+        Args:
+            result_id (str): 缓冲区ID
+            connection_id (str, optional): 提供时只返回属于该连接的缓冲区
+
+        Returns:
+            ResultBuffer: 缓冲区，不存在或已过期时返回None
+        """
+        self.expire()
+        with self._lock:
+            buffer = self._buffers.get(result_id)
+            if buffer is None or not buffer.finished:
+                return None
+            if connection_id is not None and buffer.connection_id != connection_id:
+                return None
+            buffer.last_used = time.monotonic()
+            self._buffers.move_to_end(result_id)
+            return buffer
+
+    def _close(self, buffer):
+        with self._lock:
+            self._memory_bytes -= buffer.memory_bytes - buffer._uncharged
+        buffer.close()
+
+    def remove(self, result_id):
+        """
+        删除缓冲区
+
+        Returns:
+            bool: 是否存在该缓冲区
+        """
+        with self._lock:
+            buffer = self._buffers.pop(result_id, None)
+        if buffer is None:
+            return False
+        self._close(buffer)
+        return True
+
+    def remove_connection(self, connection_id):
+        """
+        删除连接的全部缓冲区
+
+        Returns:
+            int: 删除的缓冲区数
+        """
+        with self._lock:
+            removed = [self._buffers.pop(buffer_id) for buffer_id, buffer in list(self._buffers.items())
+                       if buffer.connection_id == connection_id]
+        for buffer in removed:
+            self._close(buffer)
+        return len(removed)
+
+    def expire(self):
+        """删除空闲超时的缓冲区"""
+        now = time.monotonic()
+        with self._lock:
+            expired = [self._buffers.pop(buffer_id) for buffer_id, buffer in list(self._buffers.items())
+                       if buffer.finished and now - buffer.last_used > self.ttl]
+        for buffer in expired:
+            self._close(buffer)
+
+    def stats(self, connection_id=None):
+        """
+        缓冲区统计
+
+        Args:
+            connection_id (str, optional): 提供时只统计该连接的缓冲区
+
+        Returns:
+            dict: 缓冲区数、落盘数、内存与磁盘占用
+        """
+        with self._lock:
+            buffers = [b for b in self._buffers.values()
+                       if connection_id is None or b.connection_id == connection_id]
+            memory_bytes = self._memory_bytes if connection_id is None else \
+                sum(b.memory_bytes for b in buffers)
+            spills = self.spills
+        return {
+            "buffers": len(buffers),
+            "spilled": sum(1 for b in buffers if b.spilled),
+            "rows": sum(b.row_count for b in buffers),
+            "memory_bytes": memory_bytes,
+            "disk_bytes": sum(b.disk_bytes() for b in buffers),
+            "memory_budget": self.memory_budget,
+            "spills": spills
+        }
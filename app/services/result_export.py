@@ -0,0 +1,242 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+查询结果导出，将游标结果按批次流式编码为Arrow IPC或Parquet格式
+"""
+
+import re
+import datetime
+from decimal import Decimal
+
+# 支持的导出格式 -> (MIME类型, 文件扩展名)
+EXPORT_FORMATS = {
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+
+def _require_pyarrow():
+    """导入pyarrow，未安装时给出明确提示"""
+    try:
+        import pyarrow
+        return pyarrow
+    except ImportError:
+        raise ImportError("导出Arrow/Parquet格式需要安装pyarrow")
+
+
+class _ChunkSink:
+    """可写的内存缓冲区，写入的数据可分段取出，用于边编码边输出"""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def writable(self):
+        return True
+
+    def seekable(self):
+        return False
+
+    def drain(self):
+        """取出并清空已写入的数据"""
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+# MySQL列类型 -> Arrow列类型，按顺序匹配
+_ARROW_TYPE_RULES = (
+    (re.compile(r"^BIGINT\b.*\bUNSIGNED\b"), "uint64"),
+    (re.compile(r"^(TINYINT|SMALLINT|MEDIUMINT|INT|INTEGER|BIGINT|YEAR)\b"), "int64"),
+    (re.compile(r"^(FLOAT|DOUBLE|REAL)\b"), "float64"),
+    (re.compile(r"^(DATETIME|TIMESTAMP)\b"), "timestamp"),
+    (re.compile(r"^DATE\b"), "date32"),
+    (re.compile(r"^TIME\b"), "duration"),
+    (re.compile(r"^(BINARY|VARBINARY|TINYBLOB|BLOB|MEDIUMBLOB|LONGBLOB|BIT|GEOMETRY)\b"), "binary"),
+)
+_DECIMAL_PATTERN = re.compile(r"^(?:DECIMAL|NUMERIC)\s*(?:\(\s*(\d+)\s*(?:,\s*(\d+)\s*)?\))?")
+# 推断小数位数时使用的精度（MySQL DECIMAL的最大精度）
+_MAX_DECIMAL_PRECISION = 65
+
+
+def arrow_type(pa, sql_type):
+    """
+    将MySQL列类型转换为Arrow列类型
+
+    列类型来自结果的列描述或表结构，而不是数据中的值，同一列的所有批次类型一致；
+    未识别的类型（含未知类型与未给出精度的DECIMAL）按文本保存，不会丢失数据。
+
+    Args:
+        pa: pyarrow模块
+        sql_type (str): MySQL列类型，如 DECIMAL(10, 2)，未知时为None
+
+    Returns:
+        pyarrow.DataType: 列类型
+    """
+    sql_type = (sql_type or "").upper().strip()
+    match = _DECIMAL_PATTERN.match(sql_type)
+    if match:
+        if match.group(1) is None:
+            # 精度未知时不猜测小数位数，按文本保存
+            return pa.string()
+        precision, scale = int(match.group(1)), int(match.group(2) or 0)
+        precision = max(precision, scale, 1)
+        return pa.decimal128(precision, scale) if precision <= 38 else pa.decimal256(min(precision, 76), scale)
+    for pattern, target in _ARROW_TYPE_RULES:
+        if pattern.match(sql_type):
+            if target == "timestamp":
+                return pa.timestamp("us")
+            if target == "duration":
+                return pa.duration("us")
+            return getattr(pa, target)()
+    return pa.string()
+
+
+def resolve_column_types(column_types, rows):
+    """
+    补全未给出精度的DECIMAL列类型
+
+    部分驱动（如mysql-connector）的列描述不包含DECIMAL的精度与小数位数。驱动返回的同一DECIMAL列的值
+    小数位数相同，因此按首批数据中的值确定小数位数、精度取MySQL的上限；没有非空值可参考时保持原样，
+    由 arrow_type 按文本保存。
+
+    Args:
+        column_types (list): 各列的MySQL类型
+        rows (list): 首批结果行
+
+    Returns:
+        list: 补全后的各列类型
+    """
+    resolved = []
+    for index, column_type in enumerate(column_types):
+        match = _DECIMAL_PATTERN.match((column_type or "").upper().strip())
+        if match and match.group(1) is None:
+            exponents = [
+                Decimal(str(row[index])).as_tuple().exponent
+                for row in rows if row[index] is not None
+            ]
+            exponents = [e for e in exponents if isinstance(e, int)]
+            if exponents:
+                column_type = f"DECIMAL({_MAX_DECIMAL_PRECISION},{max(0, -min(exponents))})"
+        resolved.append(column_type)
+    return resolved
+
+
+def _coerce(pa, value, data_type):
+    """将单个值转换为列类型对应的Python值，无法转换的时间值（如MySQL的零日期）为空"""
+    if pa.types.is_string(data_type):
+        return value.decode("utf-8", "replace") if isinstance(value, (bytes, bytearray)) else str(value)
+    if pa.types.is_binary(data_type):
+        return value.encode("utf-8") if isinstance(value, str) else bytes(value)
+    if pa.types.is_integer(data_type):
+        return int(value)
+    if pa.types.is_floating(data_type):
+        return float(value)
+    if pa.types.is_decimal(data_type):
+        # 按列的小数位数对齐，避免不同行小数位数不一致时无法转换
+        return Decimal(str(value)).quantize(Decimal(1).scaleb(-data_type.scale))
+    try:
+        if pa.types.is_timestamp(data_type):
+            if isinstance(value, datetime.datetime):
+                return value
+            if isinstance(value, datetime.date):
+                return datetime.datetime.combine(value, datetime.time())
+            return datetime.datetime.fromisoformat(str(value))
+        if pa.types.is_date(data_type):
+            if isinstance(value, datetime.datetime):
+                return value.date()
+            if isinstance(value, datetime.date):
+                return value
+            return datetime.date.fromisoformat(str(value))
+    except ValueError:
+        return None
+    return value
+
+
+def column_array(pa, values, data_type):
+    """
+    将列值转换为指定类型的Arrow数组
+
+    Args:
+        pa: pyarrow模块
+        values (list): 列值
+        data_type (pyarrow.DataType): 列类型（由 arrow_type 得到）
+
+    Returns:
+        pyarrow.Array: 列数组
+    """
+    return pa.array([None if v is None else _coerce(pa, v, data_type) for v in values], type=data_type)
+
+
+def stream_export(batches, export_format="arrow"):
+    """
+    将按批次读取的查询结果编码为Arrow IPC流或Parquet文件，逐段产出字节
+
+    列类型由结果的列描述确定（见 arrow_type），每批数据按相同类型编码；
+    每批数据写完后立即产出编码结果，内存占用只与批次大小有关。
+
+    Args:
+        batches (iterable): 产出 (列名列表, 行元组列表, 列类型列表) 的迭代器
+        export_format (str): 导出格式，arrow或parquet
+
+    Returns:
+        generator: 产出编码后字节段的生成器
+    """
+    pa = _require_pyarrow()
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"不支持的导出格式: {export_format}")
+
+    sink = _ChunkSink()
+    writer = None
+    schema = None
+    try:
+        for columns, rows, column_types in batches:
+            if schema is None:
+                schema = pa.schema([
+                    pa.field(name, arrow_type(pa, column_type))
+                    for name, column_type in zip(columns, resolve_column_types(column_types, rows))
+                ])
+                if export_format == "parquet":
+                    import pyarrow.parquet as pq
+                    writer = pq.ParquetWriter(sink, schema, compression="snappy")
+                else:
+                    writer = pa.ipc.new_stream(sink, schema)
+
+            if rows:
+                column_values = list(zip(*rows))
+                arrays = [
+                    column_array(pa, list(values), field.type)
+                    for values, field in zip(column_values, schema)
+                ]
+                writer.write_batch(pa.record_batch(arrays, schema=schema))
+
+            data = sink.drain()
+            if data:
+                yield data
+
+        if writer is not None:
+            writer.close()
+            writer = None
+        data = sink.drain()
+        if data:
+            yield data
+    finally:
+        if writer is not None:
+            writer.close()
@@ -0,0 +1,253 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+分片查询结果合并：简单查询直接合并各分片的行，
+只含SUM/COUNT/MIN/MAX的聚合查询按分组键重新聚合
+"""
+
+import re
+from decimal import Decimal
+
+# 顶层子句关键字
+_CLAUSE_PATTERN = re.compile(
+    r'(select|from|where|group\s+by|having|order\s+by|limit|union|window)\b', re.IGNORECASE
+)
+# 可重新聚合的单个聚合函数列：FUNC(参数) [AS 别名]
+_AGGREGATE_ITEM = re.compile(
+    r'^(?P<func>sum|count|min|max|avg)\s*\((?P<arg>[^()]*)\)\s*(?:(?:as\s+)?(?P<alias>`[^`]+`|[\w$]+))?$',
+    re.IGNORECASE | re.DOTALL
+)
+# 任意位置出现的聚合函数
+_ANY_AGGREGATE = re.compile(
+    r'\b(sum|count|min|max|avg|group_concat|std\w*|variance|var_\w+|bit_\w+|json_arrayagg|json_objectagg)\s*\(',
+    re.IGNORECASE
+)
+_ORDER_ITEM = re.compile(r'^(?P<expr>.+?)(?:\s+(?P<dir>asc|desc))?$', re.IGNORECASE | re.DOTALL)
+_LIMIT_PATTERN = re.compile(r'^\s*(\d+)\s*$')
+
+
+def _scan_top_level(sql):
+    """
+    找出括号与引号之外的子句关键字及逗号位置
+
+    Returns:
+        tuple: ([(关键字, 起始位置, 结束位置)], [逗号位置])
+    """
+    clauses, commas = [], []
+    depth, quote, i = 0, None, 0
+    while i < len(sql):
+        ch = sql[i]
+        if quote:
+            if ch == "\\" and quote != "`":
+                i += 2
+                continue
+            if ch == quote:
+                quote = None
+        elif ch in ("'", '"', "`"):
+            quote = ch
+        elif ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+        elif depth == 0:
+            if ch == ",":
+                commas.append(i)
+            elif (ch.isalpha()) and (i == 0 or not (sql[i - 1].isalnum() or sql[i - 1] in "_$")):
+                match = _CLAUSE_PATTERN.match(sql, i)
+                if match:
+                    keyword = " ".join(match.group(1).lower().split())
+                    clauses.append((keyword, match.start(), match.end()))
+                    i = match.end()
+                    continue
+        i += 1
+    return clauses, commas
+
+
+def _split_list(text, commas, start, end):
+    """按顶层逗号切分 [start, end) 范围内的列表"""
+    points = [c for c in commas if start <= c < end]
+    items, last = [], start
+    for point in points:
+        items.append(text[last:point].strip())
+        last = point + 1
+    items.append(text[last:end].strip())
+    return items
+
+
+def _unquote(name):
+    """去除反引号和表名前缀"""
+    return name.strip().split(".")[-1].strip("`")
+
+
+def plan_merge(sql, columns):
+    """
+    分析查询语句，确定分片结果的合并方式
+
+    Args:
+        sql (str): 各分片执行的SQL
+        columns (list): 结果列名
+
+    Returns:
+        dict: 合并计划，包含mode（union/aggregate）、aggregates（每列的聚合函数或None）、
+            distinct、order_by（[(列序号, 是否降序)]）、limit与notes（无法精确合并的说明）
+    """
+    sql = sql.strip().rstrip(";").strip()
+    plan = {"mode": "union", "aggregates": [None] * len(columns), "distinct": False,
+            "order_by": [], "limit": None, "notes": []}
+
+    clauses, commas = _scan_top_level(sql)
+    names = [c[0] for c in clauses]
+    if not names or names[0] != "select" or clauses[0][1] != 0:
+        plan["notes"].append("无法解析查询语句，各分片结果直接合并")
+        return plan
+    if "union" in names:
+        plan["notes"].append("UNION查询的各分片结果直接合并，未重新排序")
+        return plan
+
+    bounds = {}
+    for index, (keyword, start, end) in enumerate(clauses):
+        next_start = clauses[index + 1][1] if index + 1 < len(clauses) else len(sql)
+        bounds.setdefault(keyword, (end, next_start))
+
+    select_start, select_end = bounds["select"]
+    select_text = sql[select_start:select_end]
+    distinct = re.match(r'\s*distinct\b', select_text, re.IGNORECASE)
+    if distinct:
+        plan["distinct"] = True
+        select_start += distinct.end()
+    items = _split_list(sql, commas, select_start, select_end)
+    if len(items) != len(columns) or "*" in items:
+        items = None
+
+    # 确定每列的聚合方式
+    has_group = "group by" in bounds
+    aggregates = [None] * len(columns)
+    mergeable = items is not None
+    has_aggregate = False
+    for index, item in enumerate(items or []):
+        match = _AGGREGATE_ITEM.match(item)
+        if match:
+            has_aggregate = True
+            func = match.group("func").lower()
+            if func == "avg" or re.match(r'\s*distinct\b', match.group("arg"), re.IGNORECASE):
+                mergeable = False
+            aggregates[index] = func
+        elif _ANY_AGGREGATE.search(item):
+            has_aggregate = True
+            mergeable = False
+
+    if has_group or has_aggregate:
+        if not mergeable:
+            plan["notes"].append("查询包含AVG、COUNT(DISTINCT)或复合聚合表达式，各分片的聚合结果未重新聚合")
+        elif "having" in bounds:
+            plan["notes"].append("查询包含HAVING，各分片的聚合结果未重新聚合")
+        else:
+            plan["mode"] = "aggregate"
+            plan["aggregates"] = aggregates
+
+    # 排序：按结果列名、别名或列序号
+    if "order by" in bounds:
+        start, end = bounds["order by"]
+        order_by = []
+        lowered = [c.lower() for c in columns]
+        for item in _split_list(sql, commas, start, end):
+            match = _ORDER_ITEM.match(item)
+            expr = match.group("expr").strip() if match else item
+            descending = bool(match and (match.group("dir") or "").lower() == "desc")
+            index = None
+            if expr.isdigit() and 1 <= int(expr) <= len(columns):
+                index = int(expr) - 1
+            elif _unquote(expr).lower() in lowered:
+                index = lowered.index(_unquote(expr).lower())
+            elif items and expr in items:
+                index = items.index(expr)
+            if index is None:
+                order_by = None
+                break
+            order_by.append((index, descending))
+        if order_by:
+            plan["order_by"] = order_by
+        else:
+            plan["notes"].append("排序表达式不在结果列中，合并后未重新排序")
+
+    if "limit" in bounds:
+        start, end = bounds["limit"]
+        match = _LIMIT_PATTERN.match(sql[start:end])
+        if match:
+            plan["limit"] = int(match.group(1))
+            if plan["mode"] == "aggregate":
+                plan["notes"].append("各分片先执行LIMIT再合并聚合，结果可能不完整")
+        else:
+            plan["notes"].append("带OFFSET的LIMIT在各分片分别生效，合并结果不等价于单库查询")
+
+    return plan
+
+
+def _combine(func, left, right):
+    """合并两个分片的聚合值，忽略NULL"""
+    if left is None:
+        return right
+    if right is None:
+        return left
+    if func in ("sum", "count"):
+        try:
+            return left + right
+        except TypeError:
+            return float(left) + float(right)
+    if func == "min":
+        return min(left, right)
+    return max(left, right)
+
+
+def _sort_key(value):
+    """NULL排在最前，与MySQL升序一致"""
+    if value is None:
+        return (0, 0)
+    if isinstance(value, Decimal):
+        value = float(value)
+    return (1, value)
+
+
+def merge_results(plan, shard_rows):
+    """
+    按合并计划合并各分片的结果行
+
+    Args:
+        plan (dict): plan_merge 返回的合并计划
+        shard_rows (list): 各分片的行元组列表
+
+    Returns:
+        list: 合并后的行元组列表
+    """
+    if plan["mode"] == "aggregate":
+        aggregates = plan["aggregates"]
+        key_indexes = [i for i, func in enumerate(aggregates) if func is None]
+        groups = {}
+        for rows in shard_rows:
+            for row in rows:
+                key = tuple(row[i] for i in key_indexes)
+                current = groups.get(key)
+                if current is None:
+                    groups[key] = list(row)
+                else:
+                    for i, func in enumerate(aggregates):
+                        if func:
+                            current[i] = _combine(func, current[i], row[i])
+        merged = [tuple(row) for row in groups.values()]
+    else:
+        merged = [tuple(row) for rows in shard_rows for row in rows]
+        if plan["distinct"]:
+            merged = list(dict.fromkeys(merged))
+
+    # 依次按次要到主要排序键做稳定排序
+    for index, descending in reversed(plan["order_by"]):
+        try:
+            merged.sort(key=lambda row: _sort_key(row[index]), reverse=descending)
+        except TypeError:
+            merged.sort(key=lambda row: _sort_key(None if row[index] is None else str(row[index])),
+                        reverse=descending)
+
+    if plan["limit"] is not None:
+        merged = merged[:plan["limit"]]
+    return merged
@@ -0,0 +1,318 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+查询结果摘要，为结果解释提示词生成固定大小的结构化摘要
+"""
+
+import random
+import datetime
+from decimal import Decimal
+from collections import Counter
+
+# 摘要中列出的未统计列名的最大数量
+MAX_OMITTED_NAMES = 10
+
+
+def truncate_text(value, max_chars):
+    """
+    截断过长的单元格文本
+
+    Args:
+        value: 单元格值
+        max_chars (int): 最大字符数
+
+    Returns:
+        str: 截断后的文本
+    """
+    if value is None:
+        return "NULL"
+    text = " ".join(str(value).split())
+    if len(text) > max_chars:
+        return text[:max_chars] + "…"
+    return text
+
+
+def _format_number(value):
+    """格式化数值，避免过长的小数"""
+    if value is None:
+        return "-"
+    if float(value).is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return f"{value:.4g}"
+
+
+class _ColumnSummary:
+    """单列的流式统计"""
+
+    def __init__(self, name, top_k, max_distinct, reservoir_size):
+        self.name = name
+        self.top_k = top_k
+        self.max_distinct = max_distinct
+        self.reservoir_size = reservoir_size
+
+        self.count = 0
+        self.nulls = 0
+        self.kinds = Counter()
+
+        # 数值统计
+        self.num_count = 0
+        self.num_sum = 0.0
+        self.num_min = None
+        self.num_max = None
+        self.reservoir = []
+
+        # 日期统计
+        self.date_min = None
+        self.date_max = None
+
+        # 分类统计
+        self.values = Counter()
+        self.distinct_overflow = False
+        self.max_length = 0
+
+    def add(self, value):
+        """加入一个单元格值"""
+        self.count += 1
+        if value is None:
+            self.nulls += 1
+            return
+
+        if isinstance(value, bool):
+            self.kinds["text"] += 1
+            self._add_category(str(value))
+        elif isinstance(value, (int, float, Decimal)):
+            self.kinds["numeric"] += 1
+            number = float(value)
+            self.num_count += 1
+            self.num_sum += number
+            self.num_min = number if self.num_min is None else min(self.num_min, number)
+            self.num_max = number if self.num_max is None else max(self.num_max, number)
+            # 蓄水池抽样，用有限内存近似分布
+            if len(self.reservoir) < self.reservoir_size:
+                self.reservoir.append(number)
+            else:
+                index = random.randrange(self.num_count)
+                if index < self.reservoir_size:
+                    self.reservoir[index] = number
+        elif isinstance(value, (datetime.date, datetime.datetime)):
+            self.kinds["date"] += 1
+            self.date_min = value if self.date_min is None else min(self.date_min, value)
+            self.date_max = value if self.date_max is None else max(self.date_max, value)
+        else:
+            self.kinds["text"] += 1
+            text = value.decode("utf-8", "replace") if isinstance(value, bytes) else str(value)
+            self.max_length = max(self.max_length, len(text))
+            self._add_category(text)
+
+    def _add_category(self, text):
+        """统计分类值，超过上限后不再记录新值"""
+        if text in self.values or len(self.values) < self.max_distinct:
+            self.values[text] += 1
+        else:
+            self.distinct_overflow = True
+
+    @property
+    def kind(self):
+        """列的主要类型"""
+        if not self.kinds:
+            return "empty"
+        return self.kinds.most_common(1)[0][0]
+
+    def _histogram(self, bins):
+        """根据抽样值生成等宽直方图"""
+        if not self.reservoir or self.num_min is None or self.num_min == self.num_max:
+            return []
+        width = (self.num_max - self.num_min) / bins
+        counts = [0] * bins
+        for number in self.reservoir:
+            index = min(int((number - self.num_min) / width), bins - 1)
+            counts[index] += 1
+        # 抽样计数按比例放大到总数
+        scale = self.num_count / len(self.reservoir)
+        return [
+            {
+                "from": self.num_min + i * width,
+                "to": self.num_min + (i + 1) * width,
+                "count": int(round(c * scale))
+            }
+            for i, c in enumerate(counts)
+        ]
+
+    def digest(self, histogram_bins, max_cell_chars):
+        """生成该列的摘要"""
+        item = {"name": self.name, "kind": self.kind, "nulls": self.nulls}
+        if self.kind == "numeric":
+            item.update({
+                "min": self.num_min,
+                "max": self.num_max,
+                "mean": self.num_sum / self.num_count if self.num_count else None,
+                "histogram": self._histogram(histogram_bins),
+            })
+        elif self.kind == "date":
+            item.update({"min": str(self.date_min), "max": str(self.date_max)})
+        elif self.kind == "text":
+            item.update({
+                "distinct": len(self.values),
+                "distinct_overflow": self.distinct_overflow,
+                "max_length": self.max_length,
+                "top_values": [
+                    {"value": truncate_text(v, max_cell_chars), "count": c}
+                    for v, c in self.values.most_common(self.top_k)
+                ],
+            })
+        return item
+
+
+class ResultSummarizer:
+    """
+    查询结果摘要器
+
+    逐行流式接收完整结果，内存占用与结果行数无关：
+    - 数值列：最小值、最大值、平均值与直方图（基于蓄水池抽样）
+    - 日期列：时间范围
+    - 文本列：取值最多的top-k及其计数，长文本截断
+    - 仅保留前几行作为示例，列数超过上限的部分只列出列名
+    """
+
+    def __init__(self, columns, max_columns=12, top_k=5, histogram_bins=5, max_cell_chars=40,
+                 sample_rows=5, max_distinct=1000, reservoir_size=1000):
+        """
+        初始化摘要器
+
+        Args:
+            columns (list): 列名列表
+            max_columns (int): 详细统计的最大列数
+            top_k (int): 文本列保留的高频值个数
+            histogram_bins (int): 数值列直方图的分桶数
+            max_cell_chars (int): 单元格文本的最大字符数
+            sample_rows (int): 保留的示例行数
+            max_distinct (int): 文本列最多记录的不同取值数
+            reservoir_size (int): 数值列抽样的样本数
+        """
+        self.columns = list(columns)
+        self.max_columns = max_columns
+        self.histogram_bins = histogram_bins
+        self.max_cell_chars = max_cell_chars
+        self.sample_rows = sample_rows
+        self.row_count = 0
+        self.samples = []
+        self._summaries = [
+            _ColumnSummary(name, top_k, max_distinct, reservoir_size)
+            for name in self.columns[:max_columns]
+        ]
+
+    def add(self, row):
+        """
+        加入一行结果
+
+        Args:
+            row (tuple|list|dict): 行数据，dict按列名取值
+        """
+        if isinstance(row, dict):
+            row = [row.get(col) for col in self.columns]
+        self.row_count += 1
+        for summary, value in zip(self._summaries, row):
+            summary.add(value)
+        if len(self.samples) < self.sample_rows:
+            self.samples.append([truncate_text(v, self.max_cell_chars) for v in row[:self.max_columns]])
+
+    def digest(self, complete=True):
+        """
+        生成结果摘要
+
+        Args:
+            complete (bool): 是否已接收完整结果
+
+        Returns:
+            dict: 可JSON序列化的摘要
+        """
+        return {
+            "row_count": self.row_count,
+            "complete": complete,
+            "column_count": len(self.columns),
+            "columns": [s.digest(self.histogram_bins, self.max_cell_chars) for s in self._summaries],
+            "omitted_column_count": max(0, len(self.columns) - self.max_columns),
+            # 未统计的列只列出前几个名称，避免摘要长度随结果宽度增长
+            "omitted_columns": self.columns[self.max_columns:self.max_columns + MAX_OMITTED_NAMES],
+            "sample_rows": self.samples,
+        }
+
+
+def summarize_rows(columns, rows, **kwargs):
+    """
+    对已获取的行生成摘要
+
+    Args:
+        columns (list): 列名列表
+        rows (list): 行数据列表
+        **kwargs: 传给 ResultSummarizer 的参数
+
+    Returns:
+        dict: 结果摘要
+    """
+    summarizer = ResultSummarizer(columns, **kwargs)
+    for row in rows:
+        summarizer.add(row)
+    return summarizer.digest()
+
+
+def format_digest(digest):
+    """
+    将结果摘要格式化为提示词文本
+
+    Args:
+        digest (dict): 结果摘要
+
+    Returns:
+        str: 摘要文本
+    """
+    text = f"共 {digest['row_count']} 条记录"
+    if not digest.get("complete", True):
+        text += "（仅统计了前面部分记录）"
+    text += f"，{digest['column_count']} 列\n"
+
+    if digest["columns"]:
+        text += "\n列摘要:\n"
+    for col in digest["columns"]:
+        line = f"- {col['name']}"
+        if col["kind"] == "numeric":
+            line += (f" (数值): 最小值={_format_number(col['min'])}, 最大值={_format_number(col['max'])}, "
+                     f"平均值={_format_number(col['mean'])}")
+            if col["histogram"]:
+                buckets = ", ".join(
+                    f"[{_format_number(b['from'])},{_format_number(b['to'])}):{b['count']}" for b in col["histogram"]
+                )
+                line += f", 分布={buckets}"
+        elif col["kind"] == "date":
+            line += f" (日期): 范围 {col['min']} ~ {col['max']}"
+        elif col["kind"] == "text":
+            distinct = f"{col['distinct']}+" if col["distinct_overflow"] else str(col["distinct"])
+            line += f" (文本): 不同值={distinct}"
+            if col["top_values"] and col["top_values"][0]["count"] > 1:
+                line += ", 常见值: " + ", ".join(f"{v['value']}({v['count']})" for v in col["top_values"])
+            else:
+                line += ", 取值基本唯一"
+        else:
+            line += ": 全部为空"
+        if col["nulls"]:
+            line += f", 空值数={col['nulls']}"
+        text += line + "\n"
+
+    if digest["omitted_column_count"]:
+        names = ", ".join(digest["omitted_columns"])
+        if digest["omitted_column_count"] > len(digest["omitted_columns"]):
+            names += ", …"
+        text += f"- 其余 {digest['omitted_column_count']} 列未统计: {names}\n"
+
+    if digest["sample_rows"]:
+        names = [c["name"] for c in digest["columns"]]
+        text += "\n数据示例:\n"
+        text += "| " + " | ".join(names) + " |\n"
+        text += "| " + " | ".join(["---" for _ in names]) + " |\n"
+        for row in digest["sample_rows"]:
+            text += "| " + " | ".join(row) + " |\n"
+        if digest["row_count"] > len(digest["sample_rows"]):
+            text += f"（其余 {digest['row_count'] - len(digest['sample_rows'])} 条省略）\n"
+
+    return text
@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+查询结果行编码，支持按行对象、行数组与按列数组三种形式
+"""
+
+# 支持的行编码格式
+# objects: 每行一个 {列名: 值} 对象（默认，兼容原有接口）
+# arrays: 每行一个值数组，列名只在columns中出现一次
+# columns: 按列存储，rows[i] 为第i列的全部值
+ROW_FORMATS = ("objects", "arrays", "columns")
+DEFAULT_ROW_FORMAT = "objects"
+
+
+def normalize_row_format(row_format):
+    """
+    规范化行编码格式名称
+
+    Args:
+        row_format (str): 格式名称
+
+    Returns:
+        str: 规范化后的格式名称，未知格式返回None
+    """
+    row_format = (row_format or DEFAULT_ROW_FORMAT).lower()
+    return row_format if row_format in ROW_FORMATS else None
+
+
+def encode_rows(columns, rows, row_format=DEFAULT_ROW_FORMAT):
+    """
+    将原始行元组编码为指定格式
+
+    Args:
+        columns (list): 列名列表
+        rows (list): 行元组列表
+        row_format (str): 编码格式，见 ROW_FORMATS
+
+    Returns:
+        list: 编码后的行数据
+    """
+    if row_format == "arrays":
+        return [list(row) for row in rows]
+    if row_format == "columns":
+        return [list(values) for values in zip(*rows)] if rows else [[] for _ in columns]
+    return [dict(zip(columns, row)) for row in rows]
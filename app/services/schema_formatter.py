@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+数据库结构序列化，为提示词生成不同详细程度的结构描述
+"""
+
+import re
+
+from app.services.tokenizer import estimate_tokens
+
+# 支持的结构描述格式
+# verbose: 逐列说明（原始格式）
+# compact: 类DDL格式，每表一行，使用缩写标记并省略默认值，保留注释
+# minimal: 同compact，但省略列注释
+SCHEMA_FORMATS = ("verbose", "compact", "minimal")
+DEFAULT_SCHEMA_FORMAT = "verbose"
+
+# 紧凑格式的说明，放在结构描述之前
+COMPACT_LEGEND = "格式: 表名(列 类型 标记, ...) # 表说明；标记: PK=主键, NN=非空, FK>表.列=外键, 列后[]内为列说明\n"
+
+# 类型名缩写
+_TYPE_ALIASES = {
+    "INTEGER": "INT",
+    "BOOLEAN": "BOOL",
+    "CHARACTER VARYING": "VARCHAR",
+    "DOUBLE PRECISION": "DOUBLE",
+}
+_COLLATE_PATTERN = re.compile(r'\s+(COLLATE|CHARACTER SET|CHARSET)\s+"?[\w]+"?', re.IGNORECASE)
+
+
+def normalize_schema_format(schema_format):
+    """
+    规范化格式名称，未知格式回退为默认格式
+
+    Args:
+        schema_format (str): 格式名称
+
+    Returns:
+        str: 规范化后的格式名称
+    """
+    schema_format = (schema_format or DEFAULT_SCHEMA_FORMAT).lower()
+    return schema_format if schema_format in SCHEMA_FORMATS else DEFAULT_SCHEMA_FORMAT
+
+
+def compact_type(col_type):
+    """
+    压缩类型字符串，去除字符集/排序规则并缩写常见类型名
+
+    Args:
+        col_type (str): 原始类型字符串
+
+    Returns:
+        str: 压缩后的类型字符串
+    """
+    col_type = _COLLATE_PATTERN.sub("", str(col_type or "")).strip()
+    col_type = re.sub(r'\s*,\s*', ',', col_type)
+    upper = col_type.upper()
+    for name, alias in _TYPE_ALIASES.items():
+        if upper == name or upper.startswith(name + "("):
+            return alias + col_type[len(name):]
+    return col_type
+
+
+def _render_table_verbose(table):
+    """逐列说明的单表结构描述"""
+    table_name = table.get("name", "")
+    table_comment = table.get("comment", "")
+
+    # 添加表信息
+    text = f"\n表名: {table_name}"
+    if table_comment:
+        text += f" (说明: {table_comment})"
+    text += "\n"
+
+    # 添加字段信息
+    if "columns" in table and table["columns"]:
+        text += "字段:\n"
+        for column in table["columns"]:
+            col_name = column.get("name", "")
+            col_type = column.get("type", "")
+            col_comment = column.get("comment", "")
+            is_pk = "是" if column.get("is_primary", False) else "否"
+            nullable = "可空" if column.get("nullable", True) else "非空"
+
+            text += f"- {col_name} ({col_type}, {nullable}, 主键: {is_pk})"
+            if col_comment:
+                text += f" 说明: {col_comment}"
+
+            # 如果有外键信息，添加外键说明
+            if "foreign_key" in column:
+                fk = column["foreign_key"]
+                text += f" 外键 -> {fk['table']}.{fk['column']}"
+
+            text += "\n"
+
+    return text + "\n"
+
+
+def _render_table_compact(table, with_comments=True):
+    """类DDL的单表一行结构描述"""
+    parts = []
+    for column in table.get("columns", []):
+        part = f"{column.get('name', '')} {compact_type(column.get('type', ''))}"
+        # 主键隐含非空，仅标记PK
+        if column.get("is_primary", False):
+            part += " PK"
+        elif not column.get("nullable", True):
+            part += " NN"
+        if "foreign_key" in column:
+            fk = column["foreign_key"]
+            part += f" FK>{fk['table']}.{fk['column']}"
+        if with_comments and column.get("comment"):
+            part += f" [{column['comment']}]"
+        parts.append(part)
+
+    line = f"{table.get('name', '')}({', '.join(parts)})"
+    if with_comments and table.get("comment"):
+        line += f" # {table['comment']}"
+    return line + "\n"
+
+
+def _render_table(table, schema_format):
+    """按格式生成单表结构描述"""
+    if schema_format == "compact":
+        return _render_table_compact(table, with_comments=True)
+    if schema_format == "minimal":
+        return _render_table_compact(table, with_comments=False)
+    return _render_table_verbose(table)
+
+
+def format_schema(metadata, schema_format=DEFAULT_SCHEMA_FORMAT, cache=None):
+    """
+    将数据库元数据序列化为提示词中的结构描述
+
+    Args:
+        metadata (dict): 数据库元数据
+        schema_format (str): 格式名称，见 SCHEMA_FORMATS
+        cache (dict, optional): 单表描述缓存，以(格式, 表名)为键、按表指纹校验，
+            表结构变化时只重新生成变化的表
+
+    Returns:
+        str: 结构描述文本
+    """
+    if not metadata or "tables" not in metadata:
+        return ""
+
+    schema_format = normalize_schema_format(schema_format)
+    text = "\n" + COMPACT_LEGEND if schema_format in ("compact", "minimal") else ""
+    for table in metadata["tables"]:
+        fingerprint = table.get("fingerprint")
+        key = (schema_format, table.get("name", ""))
+        if cache is not None and fingerprint:
+            cached = cache.get(key)
+            if cached and cached[0] == fingerprint:
+                text += cached[1]
+                continue
+        rendered = _render_table(table, schema_format)
+        if cache is not None and fingerprint:
+            cache[key] = (fingerprint, rendered)
+        text += rendered
+    return text
+
+
+def measure_schema_formats(metadata):
+    """
+    统计各格式结构描述的长度与估算token数
+
+    Args:
+        metadata (dict): 数据库元数据
+
+    Returns:
+        dict: 格式名称到 {"chars", "tokens"} 的映射
+    """
+    report = {}
+    for schema_format in SCHEMA_FORMATS:
+        text = format_schema(metadata, schema_format)
+        report[schema_format] = {"chars": len(text), "tokens": estimate_tokens(text)}
+    return report
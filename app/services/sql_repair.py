@@ -0,0 +1,298 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+SQL本地修正：按MySQL错误信息分类，对照缓存的元数据确定性地修正常见的机械性错误
+（列名大小写或拼写错误、表名错误、连接中有歧义的列、未加引号的保留字），
+修正失败时才调用LLM
+"""
+
+import re
+from difflib import SequenceMatcher, get_close_matches
+
+from app.mcp.servers.index_advisor import _TOKEN_PATTERN, _parse_tables
+
+# MySQL错误信息
+_UNKNOWN_COLUMN = re.compile(r"Unknown column '([^']+)' in '([^']+)'")
+_UNKNOWN_TABLE = re.compile(r"Table '(?:[^'.]+\.)?([^']+)' doesn't exist")
+_AMBIGUOUS_COLUMN = re.compile(r"Column '([^']+)' in ([\w ]+?) is ambiguous")
+_SYNTAX_ERROR = re.compile(r"right syntax to use near '(.*?)' at line (\d+)", re.DOTALL)
+
+# 常被用作列名或表名的MySQL保留字，作为标识符时必须加反引号
+RESERVED_WORDS = frozenset({
+    "ACCESSIBLE", "ADD", "ALL", "ANALYZE", "CHANGE", "CONDITION", "CURRENT_DATE", "CURRENT_TIME",
+    "CURRENT_USER", "DATABASE", "DEFAULT", "DELAYED", "DESC", "DESCRIBE", "DIV", "DUAL", "FUNCTION",
+    "GROUP", "GROUPS", "INDEX", "INTERVAL", "KEY", "KEYS", "LAG", "LEAD", "LIMIT", "LINES", "LOAD",
+    "LOCK", "MATCH", "MOD", "OF", "OPTION", "ORDER", "OUT", "RANGE", "RANK", "READ", "RELEASE",
+    "REPEAT", "REPLACE", "REQUIRE", "RETURN", "ROW", "ROWS", "SCHEMA", "SEPARATOR", "SIGNAL", "SQL",
+    "SYSTEM", "TABLE", "TO", "TRIGGER", "USAGE", "USE", "VALUES", "WINDOW", "WRITE",
+})
+
+# 模糊匹配的最低相似度
+_FUZZY_CUTOFF = 0.75
+
+# 错误类型，按出现顺序用于统计
+REPAIR_KINDS = ("unknown_column", "unknown_table", "ambiguous_column", "reserved_word")
+
+
+class _Query:
+    """带位置的词法单元与表别名，用于按位置替换标识符"""
+
+    def __init__(self, sql, metadata):
+        self.sql = sql
+        self.tokens = []
+        for match in _TOKEN_PATTERN.finditer(sql):
+            kind = match.lastgroup
+            if kind in ("space", "comment"):
+                continue
+            value = match.group()
+            if kind == "quoted":
+                kind, value = "name", value[1:-1].replace("``", "`")
+            self.tokens.append((kind, value, match.start(), match.end()))
+        self.aliases = _parse_tables([(kind, value) for kind, value, _, _ in self.tokens])
+        self.tables = {t["name"].lower(): t for t in metadata.get("tables", [])}
+
+    def columns_of(self, table):
+        info = self.tables.get(table.lower()) if table else None
+        return [c["name"] for c in info.get("columns", [])] if info else []
+
+    def referenced(self):
+        """
+        查询中引用的表（按出现顺序）
+
+        Returns:
+            list: (表名, 查询中引用该表的写法)，有别名时为别名，否则为加反引号的表名
+        """
+        result = []
+        for key, table in self.aliases.items():
+            if table.lower() not in self.tables:
+                continue
+            if key == table.lower():
+                result.append((table, _quote(table)))
+                continue
+            # 别名保留原始大小写
+            alias = next(value for kind, value, _, _ in self.tokens
+                         if kind in ("word", "name") and value.lower() == key)
+            result = [entry for entry in result if entry != (table, _quote(table))]
+            result.append((table, alias))
+        return result
+
+    def is_name(self, index):
+        return 0 <= index < len(self.tokens) and self.tokens[index][0] in ("word", "name")
+
+    def column_refs(self, name, qualifier=None):
+        """
+        列引用的位置
+
+        Returns:
+            list: (限定名起始下标或None, 列名下标)
+        """
+        refs = []
+        for i, (kind, value, _, _) in enumerate(self.tokens):
+            if kind not in ("word", "name") or value.lower() != name.lower():
+                continue
+            # 函数调用不是列引用
+            if i + 1 < len(self.tokens) and self.tokens[i + 1][1] == "(":
+                continue
+            # 限定名本身不是列引用
+            if i + 1 < len(self.tokens) and self.tokens[i + 1][1] == ".":
+                continue
+            qualified = i >= 2 and self.tokens[i - 1][1] == "." and self.is_name(i - 2)
+            if qualifier is None and not qualified:
+                refs.append((None, i))
+            elif qualifier is not None and qualified and self.tokens[i - 2][1].lower() == qualifier.lower():
+                refs.append((i - 2, i))
+        return refs
+
+    def replace(self, replacements):
+        """
+        按词法单元下标替换文本
+
+        Args:
+            replacements (dict): (起始下标, 结束下标) -> 新文本
+
+        Returns:
+            str: 替换后的SQL
+        """
+        parts = []
+        position = 0
+        for (first, last), text in sorted(replacements.items()):
+            start, end = self.tokens[first][2], self.tokens[last][3]
+            parts.append(self.sql[position:start])
+            parts.append(text)
+            position = end
+        parts.append(self.sql[position:])
+        return "".join(parts)
+
+
+def _quote(name):
+    return "`" + name.replace("`", "``") + "`"
+
+
+def _closest(name, candidates):
+    """大小写不同时直接对应，否则按拼写相似度取唯一的最佳匹配"""
+    exact = [c for c in candidates if c.lower() == name.lower()]
+    if exact:
+        return exact[0]
+    lowered = {c.lower(): c for c in candidates}
+    matches = get_close_matches(name.lower(), list(lowered), n=2, cutoff=_FUZZY_CUTOFF)
+    if len(matches) == 1 or (len(matches) == 2 and
+                             _similarity(name, matches[0]) > _similarity(name, matches[1])):
+        return lowered[matches[0]]
+    return None
+
+
+def _similarity(a, b):
+    return SequenceMatcher(None, a.lower(), b.lower()).ratio()
+
+
+def _repair_unknown_column(query, reference):
+    qualifier, _, column = reference.rpartition(".")
+    qualifier = qualifier or None
+    referenced = query.referenced()
+
+    if qualifier:
+        table = query.aliases.get(qualifier.lower())
+        fixed = _closest(column, query.columns_of(table))
+        new_qualifier = qualifier
+        if fixed is None:
+            # 列属于查询中的另一个表：改为该表的限定名
+            owners = [(t, n) for t, n in referenced if _closest(column, query.columns_of(t))]
+            if len(owners) != 1:
+                return None
+            new_qualifier = owners[0][1]
+            fixed = _closest(column, query.columns_of(owners[0][0]))
+        refs = query.column_refs(column, qualifier)
+        if not refs:
+            return None
+        text = f"{new_qualifier}.{_quote(fixed)}" if new_qualifier != qualifier else None
+        replacements = {}
+        for qualifier_index, column_index in refs:
+            if text:
+                replacements[(qualifier_index, column_index)] = text
+            else:
+                replacements[(column_index, column_index)] = _quote(fixed)
+        return query.replace(replacements), f"列 {reference} 改为 {new_qualifier}.{fixed}"
+
+    candidates = [(t, n, _closest(column, query.columns_of(t))) for t, n in referenced]
+    candidates = [c for c in candidates if c[2]]
+    fixed_names = {c[2].lower() for c in candidates}
+    if not candidates or len(fixed_names) != 1:
+        return None
+    fixed = candidates[0][2]
+    if fixed == column:
+        return None
+    refs = query.column_refs(column)
+    if not refs:
+        return None
+    return query.replace({(i, i): _quote(fixed) for _, i in refs}), f"列 {column} 改为 {fixed}"
+
+
+def _repair_unknown_table(query, table):
+    fixed = _closest(table, [t["name"] for t in query.tables.values()])
+    if fixed is None or fixed == table:
+        return None
+    replacements = {}
+    for i, (kind, value, _, _) in enumerate(query.tokens):
+        if kind not in ("word", "name") or value != table:
+            continue
+        previous = query.tokens[i - 1][1].upper() if i > 0 else ""
+        as_table = previous in ("FROM", "JOIN", ",") or previous == "." and i >= 2
+        as_qualifier = i + 1 < len(query.tokens) and query.tokens[i + 1][1] == "."
+        if as_table or as_qualifier:
+            replacements[(i, i)] = _quote(fixed)
+    if not replacements:
+        return None
+    return query.replace(replacements), f"表 {table} 改为 {fixed}"
+
+
+def _repair_ambiguous_column(query, column):
+    # 按FROM中的顺序选择第一个包含该列的表（通常为主表）
+    owners = [(t, n) for t, n in query.referenced()
+              if column.lower() in (c.lower() for c in query.columns_of(t))]
+    if len(owners) < 2:
+        return None
+    refs = query.column_refs(column)
+    if not refs:
+        return None
+    qualifier = owners[0][1]
+    return (query.replace({(i, i): f"{qualifier}.{_quote(query.tokens[i][1])}" for _, i in refs}),
+            f"有歧义的列 {column} 限定为 {qualifier}.{column}")
+
+
+def _repair_reserved_word(query, near):
+    known = set()
+    for table in query.tables.values():
+        known.add(table["name"].lower())
+        known.update(c["name"].lower() for c in table.get("columns", []))
+    start = query.sql.find(near[:40]) if near else len(query.sql)
+    if start < 0:
+        return None
+    # 出错位置前后的词
+    after = [i for i, token in enumerate(query.tokens) if token[2] >= start][:2]
+    before = [i for i, token in enumerate(query.tokens) if token[3] <= start][-1:]
+    for i in before + after:
+        kind, value = query.tokens[i][0], query.tokens[i][1]
+        if kind != "word" or value.upper() not in RESERVED_WORDS or value.lower() not in known:
+            continue
+        # 同一个词作为标识符的其他位置一并加引号，函数调用与 ORDER BY / GROUP BY 除外
+        replacements = {}
+        for j, (other_kind, other, _, _) in enumerate(query.tokens):
+            following = query.tokens[j + 1][1].upper() if j + 1 < len(query.tokens) else ""
+            if other_kind == "word" and other.lower() == value.lower() and following not in ("(", "BY"):
+                replacements[(j, j)] = _quote(other)
+        return query.replace(replacements), f"保留字 {value} 加反引号"
+    return None
+
+
+def classify_error(error_message):
+    """
+    识别可以本地修正的错误
+
+    Args:
+        error_message (str): 执行错误信息
+
+    Returns:
+        tuple: (错误类型, 相关的名称)，无法识别时返回 (None, None)
+    """
+    message = error_message or ""
+    match = _UNKNOWN_COLUMN.search(message)
+    if match:
+        return "unknown_column", match.group(1)
+    match = _UNKNOWN_TABLE.search(message)
+    if match:
+        return "unknown_table", match.group(1)
+    match = _AMBIGUOUS_COLUMN.search(message)
+    if match:
+        return "ambiguous_column", match.group(1)
+    match = _SYNTAX_ERROR.search(message)
+    if match:
+        return "reserved_word", match.group(1)
+    return None, None
+
+
+def repair_sql(sql, error_message, metadata):
+    """
+    尝试在本地修正SQL
+
+    Args:
+        sql (str): 执行失败的SQL
+        error_message (str): 执行错误信息
+        metadata (dict): 数据库元数据
+
+    Returns:
+        tuple: (修正后的SQL, 错误类型, 修正说明)，无法修正时返回None
+    """
+    kind, name = classify_error(error_message)
+    if kind is None or not metadata:
+        return None
+    query = _Query(sql, metadata)
+    repaired = {
+        "unknown_column": _repair_unknown_column,
+        "unknown_table": _repair_unknown_table,
+        "ambiguous_column": _repair_ambiguous_column,
+        "reserved_word": _repair_reserved_word,
+    }[kind](query, name)
+    if repaired is None or repaired[0] == sql:
+        return None
+    return repaired[0], kind, repaired[1]
@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Token数量估算工具，用于控制提示词长度
+"""
+
+import re
+
+# 中日韩字符（每个字符约占1个token）
+_CJK_PATTERN = re.compile(r'[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef]')
+
+
+def estimate_tokens(text):
+    """
+    粗略估算文本的token数量
+
+    不依赖具体模型的分词器：中日韩字符按每字1个token计算，其余字符按每4个字符1个token计算。
+
+    Args:
+        text (str): 文本内容
+
+    Returns:
+        int: 估算的token数量
+    """
+    if not text:
+        return 0
+    cjk_count = len(_CJK_PATTERN.findall(text))
+    other_count = len(text) - cjk_count
+    return cjk_count + (other_count + 3) // 4
+
+
+def estimate_message_tokens(messages):
+    """
+    估算消息列表的token数量（每条消息额外计入少量角色开销）
+
+    Args:
+        messages (list): 消息列表
+
+    Returns:
+        int: 估算的token数量
+    """
+    return sum(estimate_tokens(m.get("content", "")) + 4 for m in messages)
@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+列取值字典：将问题中提到的城市名、状态、部门名等字面量对应到数据库中实际存储的值，
+只把匹配到的取值加入提示词，避免LLM猜测取值导致查询出错或结果为空
+"""
+
+import re
+import time
+import threading
+from difflib import SequenceMatcher
+
+# 归一化时去除的字符：空白与常见中英文标点
+_STRIP_PATTERN = re.compile(r"[\s\.,;:!?'\"`()\[\]{}，。；：！？、“”‘’（）【】《》]+")
+_ASCII_PATTERN = re.compile(r"^[\x00-\x7f]+$")
+_WORD_PATTERN = re.compile(r"[a-z0-9]+")
+
+# 部分匹配时问题中连续命中的最少字符数与占取值长度的最低比例
+_MIN_PARTIAL_CHARS = 2
+_MIN_PARTIAL_RATIO = 0.6
+# 纯ASCII取值只接受较长的部分匹配（如 refund 与 refunded），避免单词片段误命中
+_MIN_ASCII_PARTIAL_CHARS = 4
+_MIN_ASCII_PARTIAL_RATIO = 0.75
+
+
+def _normalize(text):
+    return _STRIP_PATTERN.sub("", str(text).lower())
+
+
+def _keys(value, text):
+    """
+    倒排索引的键：纯ASCII取值按原取值中的单词，其他取值按归一化后相邻两个字符（单字取值按单字）
+    """
+    if _ASCII_PATTERN.match(text):
+        return _word_keys(_WORD_PATTERN.findall(str(value).lower()))
+    if len(text) == 1:
+        return {text}
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+def _word_keys(words):
+    """单词及其前缀，前缀用于取出词形不同的候选（如 refund 与 refunded）"""
+    keys = set(words)
+    keys.update(word[:_MIN_ASCII_PARTIAL_CHARS] for word in words if len(word) > _MIN_ASCII_PARTIAL_CHARS)
+    return keys
+
+
+class ValueDictionary:
+    """
+    单个连接的列取值字典
+
+    以倒排索引保存各列的取值，查找时先按问题中的单词与相邻字符取出候选取值，
+    再逐个计算匹配程度：取值完整出现在问题中得1分，问题中只提到取值的一部分
+    （如问"北京"而存储的是"北京市"）时按连续命中的字符比例计分。
+    """
+
+    def __init__(self, values):
+        """
+        根据列取值建立字典
+
+        Args:
+            values (dict): {表名: {列名: [[取值, 行数], ...]}}，见 MySQLMCPServer.get_column_values
+        """
+        self.built_at = time.time()
+        self.columns = 0
+        self.size = 0
+        self._entries = []       # (表名, 列名, 取值, 归一化取值, 行数)
+        self._postings = {}      # 键 -> 条目下标集合
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.hits = 0
+
+        for table, columns in values.items():
+            for column, column_values in columns.items():
+                if not column_values:
+                    continue
+                self.columns += 1
+                for value, count in column_values:
+                    normalized = _normalize(value)
+                    if not normalized or (len(normalized) == 1 and _ASCII_PATTERN.match(normalized)):
+                        continue
+                    index = len(self._entries)
+                    self._entries.append((table, column, value, normalized, count))
+                    for key in _keys(value, normalized):
+                        self._postings.setdefault(key, set()).add(index)
+        self.size = len(self._entries)
+
+    def _score(self, value, normalized, question, words, raw_question):
+        """取值与问题的匹配程度，0表示不匹配"""
+        ascii_value = bool(_ASCII_PATTERN.match(normalized))
+        if ascii_value:
+            if normalized in words:
+                return 1.0
+            # 多个单词组成的取值（如 "New York"）在原问题中按单词边界依次匹配
+            value_words = _WORD_PATTERN.findall(str(value).lower())
+            if len(value_words) > 1 and re.search(
+                r"(?<![a-z0-9])" + r"[^a-z0-9]*".join(map(re.escape, value_words)) + r"(?![a-z0-9])",
+                raw_question
+            ):
+                return 1.0
+        elif normalized in question:
+            return 1.0
+        if len(normalized) == 1:
+            return 0.0
+        match = SequenceMatcher(None, normalized, question, autojunk=False).find_longest_match(
+            0, len(normalized), 0, len(question)
+        )
+        ratio = match.size / len(normalized)
+        if ascii_value:
+            accepted = match.size >= _MIN_ASCII_PARTIAL_CHARS and ratio >= _MIN_ASCII_PARTIAL_RATIO
+        else:
+            accepted = match.size >= _MIN_PARTIAL_CHARS and ratio >= _MIN_PARTIAL_RATIO
+        return ratio if accepted else 0.0
+
+    def match(self, question, limit=20, per_column=5):
+        """
+        查找问题中提到的取值
+
+        Args:
+            question (str): 用户的问题
+            limit (int): 最多返回的取值数
+            per_column (int): 每列最多返回的取值数
+
+        Returns:
+            list: [{"table", "column", "value", "count", "score"}]，按匹配程度与行数排序
+        """
+        raw_question = str(question).lower()
+        normalized_question = _normalize(question)
+        words = set(_WORD_PATTERN.findall(raw_question))
+        keys = _word_keys(words) | {normalized_question[i:i + 2] for i in range(len(normalized_question) - 1)} | \
+            set(normalized_question)
+
+        candidates = set()
+        for key in keys:
+            candidates.update(self._postings.get(key, ()))
+
+        matches = []
+        for index in candidates:
+            table, column, value, normalized, count = self._entries[index]
+            score = self._score(value, normalized, normalized_question, words, raw_question)
+            if score > 0:
+                matches.append({"table": table, "column": column, "value": value, "count": count,
+                                "score": round(score, 2)})
+        matches.sort(key=lambda m: (-m["score"], -len(m["value"]), -m["count"]))
+
+        selected = []
+        per_column_counts = {}
+        for item in matches:
+            key = (item["table"], item["column"])
+            if per_column_counts.get(key, 0) >= per_column:
+                continue
+            per_column_counts[key] = per_column_counts.get(key, 0) + 1
+            selected.append(item)
+            if len(selected) >= limit:
+                break
+
+        with self._lock:
+            self.lookups += 1
+            self.hits += bool(selected)
+        return selected
+
+    def stats(self):
+        """
+        字典规模与查找统计
+
+        Returns:
+            dict: 列数、取值数、建立时间、查找次数与命中次数
+        """
+        with self._lock:
+            return {
+                "columns": self.columns,
+                "values": self.size,
+                "built_at": self.built_at,
+                "lookups": self.lookups,
+                "hits": self.hits
+            }
+
+
+def format_value_hints(matches):
+    """
+    将匹配到的取值格式化为提示词
+
+    Args:
+        matches (list): ValueDictionary.match 的结果
+
+    Returns:
+        str: 按列列出的实际取值，没有匹配时为空字符串
+    """
+    if not matches:
+        return ""
+    grouped = {}
+    for item in matches:
+        grouped.setdefault(f"{item['table']}.{item['column']}", []).append(item)
+    lines = ["\n数据库中与问题相关的实际取值（写过滤条件时请使用这些值，括号内为行数）:"]
+    for column, items in grouped.items():
+        values = ", ".join("'" + item["value"].replace("'", "''") + f"'({item['count']})" for item in items)
+        lines.append(f"- {column}: {values}")
+    return "\n".join(lines) + "\n"
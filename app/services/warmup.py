@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+连接预热，在后台获取元数据、样本数据、预生成提示词并建立列取值字典
+"""
+
+import json
+import time
+import logging
+import threading
+
+from app.services.value_dictionary import ValueDictionary
+
+
+class ConnectionWarmup:
+    """
+    单个连接的后台预热任务
+
+    按顺序执行各阶段，每个阶段完成后立即可被等待方使用，
+    查询只需等待其真正依赖的阶段（如元数据），无需等待全部预热完成。
+    """
+
+    # 预热阶段，按执行顺序排列
+    STAGES = ("metadata", "samples", "prompt", "values")
+
+    def __init__(self, connection_id, mcp_server, llm_service, schema_format=None, sample_limit=3,
+                 value_options=None):
+        """
+        初始化预热任务
+
+        Args:
+            connection_id (str): 数据库连接ID
+            mcp_server: MCP服务器实例
+            llm_service (LLMService): LLM服务，用于预生成提示词
+            schema_format (str, optional): 结构描述格式
+            sample_limit (int): 每个表的样本行数
+            value_options (dict, optional): 列取值统计参数，见 MySQLMCPServer.get_column_values，为空时不建立列取值字典
+        """
+        self.logger = logging.getLogger(__name__)
+        self.connection_id = connection_id
+        self.mcp_server = mcp_server
+        self.llm_service = llm_service
+        self.schema_format = schema_format
+        self.sample_limit = sample_limit
+        self.value_options = value_options
+
+        self.metadata = None
+        self.sample_data = None
+        self.prompt_tokens = None
+        self.values = None
+        self._values_refreshing = False
+        self._values_attempted_at = None
+        self._values_failures = 0
+        self.cancelled = False
+        self.started_at = None
+
+        self._lock = threading.Lock()
+        self._events = {stage: threading.Event() for stage in self.STAGES}
+        self._stages = {stage: {"state": "pending", "seconds": None, "error": None} for stage in self.STAGES}
+
+    def start(self, executor):
+        """
+        在线程池中启动预热
+
+        Args:
+            executor (ThreadPoolExecutor): 线程池
+        """
+        self.started_at = time.time()
+        executor.submit(self._run)
+
+    def cancel(self):
+        """取消尚未开始的阶段"""
+        self.cancelled = True
+
+    def _run(self):
+        """依次执行各预热阶段"""
+        for stage in self.STAGES:
+            if self.cancelled:
+                self._finish(stage, "cancelled")
+                continue
+            with self._lock:
+                self._stages[stage]["state"] = "running"
+            start = time.monotonic()
+            try:
+                getattr(self, f"_stage_{stage}")()
+                self._finish(stage, "done", seconds=round(time.monotonic() - start, 3))
+            except Exception as e:
+                self.logger.warning(f"连接 {self.connection_id} 预热阶段 {stage} 失败: {str(e)}")
+                if stage == "values":
+                    self._values_failures += 1
+                self._finish(stage, "error", seconds=round(time.monotonic() - start, 3), error=str(e))
+
+    def _finish(self, stage, state, seconds=None, error=None):
+        """记录阶段结束并唤醒等待方"""
+        with self._lock:
+            self._stages[stage].update({"state": state, "seconds": seconds, "error": error})
+        self._events[stage].set()
+
+    def _stage_metadata(self):
+        metadata = json.loads(self.mcp_server.get_database_metadata())
+        if "error" in metadata:
+            raise Exception(metadata["error"])
+        self.metadata = metadata
+
+    def _stage_samples(self):
+        sample_data = json.loads(self.mcp_server.get_sample_data(limit=self.sample_limit))
+        if "error" in sample_data:
+            raise Exception(sample_data["error"])
+        self.sample_data = sample_data
+
+    def _stage_prompt(self):
+        if self.metadata is None:
+            raise Exception("元数据不可用，跳过提示词预生成")
+        # 先载入快照中的结构描述，生成后再将本连接的描述写回快照
+        cache = self.llm_service.schema_render_cache
+        cache.update(self.mcp_server.get_prompt_cache())
+        self.prompt_tokens = self.llm_service.warm_prompt(self.metadata, self.sample_data, self.schema_format)
+        # 结构描述缓存由所有连接共享，其他数据库的同名表指纹不同，不能写入本连接的快照
+        fingerprints = {table.get("name"): table.get("fingerprint") for table in self.metadata.get("tables", [])}
+        self.mcp_server.set_prompt_cache({
+            key: value for key, value in cache.items()
+            if fingerprints.get(key[1]) and value[0] == fingerprints[key[1]]
+        })
+
+    def _stage_values(self):
+        if self.value_options is None:
+            return
+        self._values_attempted_at = time.time()
+        values = json.loads(self.mcp_server.get_column_values(**self.value_options))
+        if "error" in values:
+            raise Exception(values["error"])
+        self.values = ValueDictionary(values)
+
+    def refresh_values(self, executor, max_age, retry_interval=60):
+        """
+        列取值字典超过max_age秒时在线程池中重新建立（未变化的表复用服务端缓存）；
+        预热时建立失败（超时或数据库临时错误）的字典按退避间隔重试，
+        间隔从retry_interval起每次失败翻倍，最长为max_age
+
+        Args:
+            executor (ThreadPoolExecutor): 线程池
+            max_age (float): 字典最长使用时间（秒）
+            retry_interval (float): 建立失败后首次重试的间隔（秒）
+        """
+        with self._lock:
+            if self._values_refreshing or self.value_options is None:
+                return
+            now = time.time()
+            if self.values is None:
+                backoff = min(retry_interval * 2 ** max(self._values_failures - 1, 0), max_age)
+                if self._stages["values"]["state"] != "error" or now - self._values_attempted_at < backoff:
+                    return
+            elif now - self.values.built_at < max_age:
+                return
+            self._values_refreshing = True
+
+        def run():
+            start = time.monotonic()
+            try:
+                self._stage_values()
+                self._values_failures = 0
+                self._finish("values", "done", seconds=round(time.monotonic() - start, 3))
+            except Exception as e:
+                self.logger.warning(f"连接 {self.connection_id} 刷新列取值字典失败: {str(e)}")
+                if self.values is None:
+                    self._values_failures += 1
+                    self._finish("values", "error", seconds=round(time.monotonic() - start, 3), error=str(e))
+            finally:
+                with self._lock:
+                    self._values_refreshing = False
+
+        executor.submit(run)
+
+    def wait(self, stage, timeout=None):
+        """
+        等待指定阶段结束
+
+        Args:
+            stage (str): 阶段名称
+            timeout (float, optional): 最长等待秒数
+
+        Returns:
+            bool: 阶段已成功完成返回True
+        """
+        self._events[stage].wait(timeout)
+        with self._lock:
+            return self._stages[stage]["state"] == "done"
+
+    def is_done(self, stage):
+        """
+        指定阶段是否已成功完成
+
+        Args:
+            stage (str): 阶段名称
+
+        Returns:
+            bool: 已完成返回True
+        """
+        with self._lock:
+            return self._stages[stage]["state"] == "done"
+
+    def status(self):
+        """
+        获取预热进度
+
+        Returns:
+            dict: 各阶段状态、完成数量与耗时
+        """
+        with self._lock:
+            stages = {stage: dict(info) for stage, info in self._stages.items()}
+        finished = [s for s in stages.values() if s["state"] in ("done", "error", "cancelled")]
+        return {
+            "ready": all(s["state"] == "done" for s in stages.values()),
+            "finished": len(finished) == len(stages),
+            "progress": f"{len(finished)}/{len(stages)}",
+            "stages": stages,
+            "prompt_tokens": self.prompt_tokens,
+            "values": self.values.stats() if self.values else None,
+            "elapsed": round(time.time() - self.started_at, 3) if self.started_at else None
+        }
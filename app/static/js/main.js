@@ -63,8 +63,9 @@ new Vue({
                     this.connecting = false;
                     
                     if (response.data.status === 'success') {
-                        // 保存连接信息
+                        // 保存连接信息，元数据在后台预热完成后加载
                         this.currentConnection = response.data;
+                        this.pollConnectionStatus(response.data.connection_id);
                         
                         // 创建新会话
                         this.createNewConversation();
@@ -84,6 +85,26 @@ new Vue({
                 });
         },
         
+        // 轮询连接预热进度，元数据就绪后加载
+        pollConnectionStatus(connectionId) {
+            axios.get('/api/connection/status', {
+                params: { connection_id: connectionId, include_metadata: 1 }
+            })
+                .then(response => {
+                    if (!this.currentConnection || this.currentConnection.connection_id !== connectionId) return;
+                    
+                    const data = response.data;
+                    this.$set(this.currentConnection, 'warmup', data.warmup);
+                    if (data.metadata) {
+                        this.$set(this.currentConnection, 'metadata', data.metadata);
+                    }
+                    if (!data.metadata && data.warmup && !data.warmup.finished) {
+                        setTimeout(() => this.pollConnectionStatus(connectionId), 1000);
+                    }
+                })
+                .catch(() => {});
+        },
+        
         // 断开数据库连接
         disconnectDatabase() {
             if (!this.currentConnection) return;
@@ -154,13 +175,15 @@ new Vue({
                 .slice(0, -1) // 不包括刚刚添加的用户消息
                 .map(msg => ({
                     role: msg.role,
-                    content: msg.content
+                    content: msg.content,
+                    sql: msg.sql
                 }));
             
             // 发送查询请求
             axios.post('/api/query', {
                 connection_id: this.currentConnection.connection_id,
                 query: query,
+                session_id: this.conversations[this.currentConversationIndex].timestamp,
                 conversation_history: history
             })
                 .then(response => {
@@ -199,6 +222,39 @@ new Vue({
                 });
         },
         
+        // 加载下一页结果
+        loadMoreResults(message) {
+            if (!message.results || !message.results.next_page_token || message.loadingMore) return;
+            
+            this.$set(message, 'loadingMore', true);
+            
+            axios.post('/api/execute', {
+                connection_id: this.currentConnection.connection_id,
+                sql: message.sql,
+                page_size: 100,
+                page_token: message.results.next_page_token
+            })
+                .then(response => {
+                    message.loadingMore = false;
+                    
+                    if (response.data.status === 'success') {
+                        const page = response.data.results;
+                        message.results.rows = message.results.rows.concat(page.rows);
+                        message.results.rowCount = message.results.rows.length;
+                        message.results.next_page_token = page.next_page_token;
+                    } else {
+                        this.$message.error(response.data.message || '加载下一页失败');
+                    }
+                })
+                .catch(error => {
+                    message.loadingMore = false;
+                    if (error.response && error.response.status === 410) {
+                        message.results.next_page_token = null;
+                    }
+                    this.$message.error('加载下一页失败: ' + (error.response?.data?.message || error.message));
+                });
+        },
+        
         // 显示SQL输入对话框
         showSqlInput() {
             if (!this.currentConnection) {
@@ -219,7 +275,8 @@ new Vue({
             // 发送执行SQL请求
             axios.post('/api/execute', {
                 connection_id: this.currentConnection.connection_id,
-                sql: this.sqlInput
+                sql: this.sqlInput,
+                page_size: 100
             })
                 .then(response => {
                     this.sqlLoading = false;
@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+gunicorn配置
+
+主进程预加载应用与重量级依赖后再fork工作进程，工作进程共享已导入的模块；
+LLM客户端、数据库连接与线程池在每个工作进程fork之后创建。
+
+注意：数据库连接保存在工作进程内存中，多个工作进程时同一连接ID只在建立它的进程中有效，
+需要更高并发时优先增加线程数（GUNICORN_THREADS）。
+"""
+
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('WEB_CONCURRENCY', 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 1))
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') != '0'
+
+
+def on_starting(server):
+    """主进程启动时导入重量级依赖"""
+    if preload_app:
+        from app.preload import preload_modules
+        timings = preload_modules()
+        server.log.info(f"预加载模块耗时: {timings}")
+
+
+def when_ready(server):
+    """应用已加载、即将fork工作进程"""
+    if preload_app:
+        from app.preload import freeze_shared_state
+        freeze_shared_state()
+
+
+def post_fork(server, worker):
+    """工作进程中立即创建查询服务，使首个请求无需等待客户端初始化"""
+    if preload_app:
+        from app.controllers.api import get_query_service
+        get_query_service()
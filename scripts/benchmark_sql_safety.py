@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+对比只读SQL检查的正确性与耗时
+
+用法:
+    python scripts/benchmark_sql_safety.py
+    python scripts/benchmark_sql_safety.py --rounds 2000 --show-errors
+
+使用内置的语句集合（示例库 db_init.sql 上的常见查询与若干绕过检查的写法），
+分别统计旧的关键字检查与新的词法分类器的误判数，以及每条语句的平均检查耗时。
+"""
+
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.mcp.servers.sql_safety import classify_sql
+
+# (SQL, 是否应判定为只读)
+CORPUS = [
+    ("SELECT * FROM employees LIMIT 10", True),
+    ("SELECT first_name, last_name, salary FROM employees WHERE salary > 10000 ORDER BY salary DESC", True),
+    ("SELECT d.department_name, COUNT(*) AS cnt, AVG(e.salary) AS avg_salary\n"
+     "FROM employees e JOIN departments d ON e.department_id = d.department_id\n"
+     "GROUP BY d.department_name HAVING COUNT(*) > 5 ORDER BY avg_salary DESC", True),
+    ("SELECT j.job_title, MIN(e.salary), MAX(e.salary) FROM jobs j LEFT JOIN employees e ON e.job_id = j.job_id "
+     "GROUP BY j.job_title", True),
+    ("SELECT l.city, c.country_name FROM locations l JOIN countries c ON l.country_id = c.country_id "
+     "WHERE c.region_id = 2", True),
+    ("WITH dept_avg AS (SELECT department_id, AVG(salary) AS avg_salary FROM employees GROUP BY department_id)\n"
+     "SELECT e.first_name, e.salary FROM employees e JOIN dept_avg a ON e.department_id = a.department_id "
+     "WHERE e.salary > a.avg_salary", True),
+    ("WITH RECURSIVE chain AS (SELECT employee_id, manager_id FROM employees WHERE manager_id IS NULL "
+     "UNION ALL SELECT e.employee_id, e.manager_id FROM employees e JOIN chain c ON e.manager_id = c.employee_id) "
+     "SELECT COUNT(*) FROM chain", True),
+    ("(SELECT first_name FROM employees WHERE department_id = 1) UNION (SELECT first_name FROM employees "
+     "WHERE department_id = 2)", True),
+    ("SELECT REPLACE(phone_number, '.', '-') AS phone FROM employees", True),
+    ("SELECT TRUNCATE(salary / 12, 2) AS monthly FROM employees", True),
+    ("SELECT INSERT(email, 1, 0, 'mailto:') FROM employees", True),
+    ("SELECT * FROM employees WHERE first_name = 'Update' OR last_name = 'Drop; Delete'", True),
+    ("SELECT `update`, `delete` FROM `jobs`", True),
+    ("SELECT hire_date, update_time, created_by FROM employees", True),
+    ("SELECT CONVERT(first_name USING utf8mb4) FROM employees", True),
+    ("SELECT CAST(first_name AS CHAR CHARACTER SET utf8mb4) FROM employees", True),
+    ("SELECT salary--1 FROM employees", True),
+    ("-- 按部门统计\nSELECT department_id, COUNT(*) FROM employees GROUP BY department_id", True),
+    ("/* 薪资最高的员工 */ SELECT * FROM employees ORDER BY salary DESC LIMIT 1;", True),
+    ("SELECT * FROM employees WHERE last_name = 'O''Brien'", True),
+    ("SELECT * FROM employees WHERE last_name = 'O\\'Brien'", True),
+    ("SELECT * FROM employees WHERE email LIKE \"%\\\"%\"", True),
+    ("SHOW TABLES", True),
+    ("SHOW CREATE TABLE employees", True),
+    ("DESCRIBE employees", True),
+    ("EXPLAIN SELECT * FROM employees WHERE department_id = 3", True),
+    ("TABLE departments", True),
+    ("VALUES ROW(1, 2), ROW(3, 4)", True),
+
+    ("DELETE FROM employees", False),
+    ("delete\nfrom employees", False),
+    ("  UPDATE employees SET salary = 0", False),
+    ("/* 注释 */ DROP TABLE employees", False),
+    ("-- 注释\nTRUNCATE TABLE employees", False),
+    ("SELECT 1;DROP TABLE employees", False),
+    ("SELECT 1;\nDELETE FROM employees", False),
+    ("WITH x AS (SELECT employee_id FROM employees) DELETE FROM employees WHERE employee_id IN "
+     "(SELECT employee_id FROM x)", False),
+    ("SELECT * FROM employees INTO OUTFILE '/tmp/employees.csv'", False),
+    ("SELECT first_name INTO @name FROM employees LIMIT 1", False),
+    ("SELECT * FROM employees FOR UPDATE", False),
+    ("SELECT * FROM employees LOCK IN SHARE MODE", False),
+    ("LOCK TABLES employees WRITE", False),
+    ("SET GLOBAL read_only = 0", False),
+    ("CALL reset_salaries()", False),
+    ("EXPLAIN UPDATE employees SET salary = 0", False),
+    ("SELECT /*! 1; DROP TABLE employees */", False),
+    ("SELECT SLEEP(60)", False),
+    ("SELECT BENCHMARK(100000000, MD5('x'))", False),
+    ("SELECT LOAD_FILE('/etc/passwd')", False),
+    ("SELECT * FROM employees WHERE first_name = 'unterminated", False),
+    ("SELECT * FROM employees WHERE first_name = \"a\\\"; DROP TABLE employees; -- \"", False),
+    ("GRANT ALL ON *.* TO 'u'@'%'", False),
+    ("HANDLER employees OPEN", False),
+    ("", False),
+]
+
+
+def legacy_is_readonly(query):
+    """原 MySQLMCPServer._is_readonly_query 的实现，用于对比"""
+    query_lower = query.lower().strip()
+    modifying_keywords = [
+        'insert', 'update', 'delete', 'drop', 'alter', 'create',
+        'truncate', 'replace', 'rename', 'grant', 'revoke'
+    ]
+    for keyword in modifying_keywords:
+        if query_lower.startswith(keyword):
+            return False
+        if f"; {keyword} " in query_lower:
+            return False
+    return True
+
+
+def measure(check, rounds):
+    """返回每条语句的平均耗时（纳秒）"""
+    start = time.perf_counter_ns()
+    for _ in range(rounds):
+        for sql, _ in CORPUS:
+            check(sql)
+    return (time.perf_counter_ns() - start) / (rounds * len(CORPUS))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="对比只读SQL检查的正确性与耗时")
+    parser.add_argument("--rounds", type=int, default=500, help="计时轮数")
+    parser.add_argument("--show-errors", action="store_true", help="列出误判的语句")
+    args = parser.parse_args()
+
+    checks = [
+        ("旧关键字检查", legacy_is_readonly),
+        ("词法分类器", lambda sql: classify_sql.__wrapped__(sql).readonly),
+        ("词法分类器(缓存)", lambda sql: classify_sql(sql).readonly),
+    ]
+
+    print(f"语句数: {len(CORPUS)}  计时轮数: {args.rounds}")
+    print(f"{'检查方式':<16}{'误放行':>8}{'误拒绝':>8}{'ns/语句':>12}")
+    for name, check in checks:
+        allowed = [sql for sql, readonly in CORPUS if check(sql) and not readonly]
+        rejected = [sql for sql, readonly in CORPUS if not check(sql) and readonly]
+        print(f"{name:<16}{len(allowed):>8}{len(rejected):>8}{measure(check, args.rounds):>12.0f}")
+        if args.show_errors:
+            for sql in allowed:
+                print(f"    误放行: {sql!r}")
+            for sql in rejected:
+                print(f"    误拒绝: {sql!r}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
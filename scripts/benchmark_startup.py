@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+测量应用启动耗时：导入、create_app 与首个请求的延迟
+
+用法:
+    python scripts/benchmark_startup.py
+    python scripts/benchmark_startup.py --runs 10
+
+每次测量都在新的Python进程中进行，分别统计两种启动方式：
+- cold: 直接导入并创建应用（python run.py 或不预加载的gunicorn工作进程）
+- preload: 先预加载重量级依赖，再fork出子进程处理首个请求（gunicorn --preload 的工作进程）
+首个请求为 GET /api/llm/providers，会创建查询服务与LLM提供商。
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 结果中检查是否已被导入的重量级依赖
+HEAVY_MODULES = ("pandas", "numpy", "pyarrow", "sqlalchemy", "anthropic", "httpx", "requests")
+
+
+def first_request(app):
+    """发送首个请求，返回 (耗时, 状态码)"""
+    start = time.perf_counter()
+    response = app.test_client().get("/api/llm/providers")
+    return time.perf_counter() - start, response.status_code
+
+
+def run_child(mode):
+    """在当前（新的）进程中测量一次，结果以JSON输出到标准输出"""
+    sys.path.insert(0, ROOT)
+    result = {}
+    start = time.perf_counter()
+
+    if mode == "preload":
+        from app.preload import preload_modules, freeze_shared_state
+        preload_modules()
+        result["preload"] = time.perf_counter() - start
+
+    from app import create_app
+    result["import"] = time.perf_counter() - start - result.get("preload", 0)
+
+    mark = time.perf_counter()
+    app = create_app()
+    result["create_app"] = time.perf_counter() - mark
+    result["loaded"] = [name for name in HEAVY_MODULES if name in sys.modules]
+
+    if mode == "preload" and hasattr(os, "fork"):
+        # 模拟gunicorn：主进程冻结共享对象后fork，首个请求在子进程中处理
+        freeze_shared_state()
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            elapsed, status = first_request(app)
+            os.write(write_fd, json.dumps([elapsed, status]).encode())
+            os._exit(0)
+        os.close(write_fd)
+        with os.fdopen(read_fd) as f:
+            elapsed, status = json.load(f)
+        os.waitpid(pid, 0)
+    else:
+        elapsed, status = first_request(app)
+
+    result["first_request"] = elapsed
+    result["status"] = status
+    result["ready"] = time.perf_counter() - start - result.get("preload", 0)
+    print(json.dumps(result))
+
+
+def measure(mode, runs):
+    """在新进程中重复测量，返回各次结果"""
+    results = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child", mode],
+            capture_output=True, text=True, check=True, cwd=ROOT
+        ).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="测量应用启动耗时")
+    parser.add_argument("--runs", type=int, default=5, help="每种方式的测量次数")
+    parser.add_argument("--child", choices=("cold", "preload"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child)
+        return 0
+
+    print(f"每种方式测量 {args.runs} 次，取中位数（毫秒）")
+    print(f"{'方式':<10}{'预加载':>10}{'导入':>10}{'create_app':>12}{'首个请求':>10}{'就绪':>10}")
+    for mode in ("cold", "preload"):
+        results = measure(mode, args.runs)
+        median = {
+            key: statistics.median(r.get(key, 0) for r in results) * 1000
+            for key in ("preload", "import", "create_app", "first_request", "ready")
+        }
+        print(f"{mode:<10}{median['preload']:>10.0f}{median['import']:>10.0f}{median['create_app']:>12.0f}"
+              f"{median['first_request']:>10.0f}{median['ready']:>10.0f}")
+        statuses = {r["status"] for r in results}
+        print(f"{'':<10}create_app后已导入: {', '.join(results[-1]['loaded']) or '无'}  首个请求状态码: {statuses}")
+    print("\n就绪 = 工作进程从开始到处理完首个请求的耗时（preload方式不含主进程的预加载时间）")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+统计各结构描述格式在给定数据库结构上的token数
+
+用法:
+    python scripts/measure_schema_tokens.py metadata.json
+    python scripts/measure_schema_tokens.py --host localhost --user root --password password --database wenshu
+
+metadata.json 为 /api/connect 返回的 metadata 字段内容；未提供文件时使用命令行参数
+（或 DB_HOST/DB_USER/DB_PASSWORD/DB_NAME/DB_PORT 环境变量）连接数据库读取结构。
+"""
+
+import os
+import sys
+import json
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.schema_formatter import SCHEMA_FORMATS, format_schema
+from app.services.tokenizer import estimate_tokens
+
+
+def load_metadata(args):
+    """从文件或数据库加载元数据"""
+    if args.metadata:
+        with open(args.metadata, encoding="utf-8") as f:
+            data = json.load(f)
+        # 兼容直接保存的 /api/connect 响应
+        return data.get("metadata", data)
+
+    from app.mcp.servers.mysql_server import MySQLMCPServer
+    server = MySQLMCPServer(
+        host=args.host,
+        user=args.user,
+        password=args.password,
+        database=args.database,
+        port=args.port
+    )
+    return json.loads(server.get_database_metadata())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="统计各结构描述格式的token数")
+    parser.add_argument("metadata", nargs="?", help="元数据JSON文件")
+    parser.add_argument("--host", default=os.environ.get("DB_HOST", "localhost"))
+    parser.add_argument("--user", default=os.environ.get("DB_USER", "root"))
+    parser.add_argument("--password", default=os.environ.get("DB_PASSWORD", ""))
+    parser.add_argument("--database", default=os.environ.get("DB_NAME", "wenshu"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("DB_PORT", 3306)))
+    parser.add_argument("--show", choices=SCHEMA_FORMATS, help="同时输出指定格式的结构描述文本")
+    args = parser.parse_args()
+
+    metadata = load_metadata(args)
+    if "error" in metadata:
+        print(f"获取元数据失败: {metadata['error']}")
+        return 1
+
+    baseline = None
+    print(f"{'格式':<10}{'字符数':>10}{'tokens':>10}{'相对verbose':>14}")
+    for schema_format in SCHEMA_FORMATS:
+        text = format_schema(metadata, schema_format)
+        tokens = estimate_tokens(text)
+        baseline = baseline or tokens
+        ratio = f"{tokens / baseline:.0%}" if baseline else "-"
+        print(f"{schema_format:<10}{len(text):>10}{tokens:>10}{ratio:>14}")
+
+    if args.show:
+        print()
+        print(format_schema(metadata, args.show))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+结果缓冲区落盘测试：写入磁盘再读回的结果应与保存在内存中时一致
+"""
+
+from decimal import Decimal
+
+import pytest
+
+from app.services.result_buffer import ResultBufferStore
+
+pytest.importorskip("pyarrow")
+
+COLUMNS = ["id", "amount", "ratio", "total"]
+ROWS = [
+    (18446744073709551615, Decimal("12.34"), Decimal("0.500"), Decimal("99999999.99")),
+    (1, Decimal("0.50"), None, Decimal("-0.01")),
+    (2, None, Decimal("1.250"), Decimal("0.00")),
+]
+
+
+def _fill(store, column_types):
+    buffer = store.create("c1")
+    buffer.start(COLUMNS, column_types)
+    for row in ROWS:
+        assert buffer.append(row)
+    return buffer
+
+
+@pytest.mark.parametrize("column_types", [
+    # 列描述带精度（如PyMySQL）或取自表结构
+    ["BIGINT UNSIGNED", "DECIMAL(10,2)", "DECIMAL(6,3)", "DECIMAL(10,2)"],
+    # mysql-connector的列描述不含DECIMAL精度，按数据确定小数位数
+    ["BIGINT UNSIGNED", "DECIMAL", "DECIMAL", "DECIMAL"],
+])
+def test_spilled_decimal_round_trip(tmp_path, column_types):
+    store = ResultBufferStore(directory=str(tmp_path))
+    in_memory = _fill(store, column_types)
+    in_memory.finish()
+    spilled = _fill(store, column_types)
+    spilled.spill()
+    spilled.finish()
+
+    assert spilled.info()["storage"] == "disk"
+    assert spilled.read(0, 10) == in_memory.read(0, 10) == ROWS
+
+
+def test_spill_before_finish_keeps_decimal_scale(tmp_path):
+    store = ResultBufferStore(directory=str(tmp_path))
+    buffer = store.create("c1")
+    buffer.start(COLUMNS, ["BIGINT UNSIGNED", "DECIMAL", "DECIMAL", "DECIMAL"])
+    buffer.append(ROWS[0])
+    buffer.spill()
+    for row in ROWS[1:]:
+        buffer.append(row)
+    buffer.finish()
+
+    assert buffer.read(0, 10) == ROWS